@@ -0,0 +1,106 @@
+import os, sys, time, argparse
+
+import numpy as np
+import scipy.sparse as sp
+import torch
+
+# the preprocessing modules of the drivers import utils.* from src
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), 'src'))
+
+from src.utils.benchmark import synthetic_signed_digraph, run_case, write_report
+from src.utils.edge_data import in_out_degree
+from src.layer.src2 import laplacian
+from src.layer.src2.incremental import IncrementalSigMaNet
+from src.layer.Signum import SigMaNet_link_prediction_one_laplacian
+
+
+def ball_size(patterns, nodes, hops):
+    # the number of nodes within hops of nodes in the union of the patterns, by full-size products (the reference)
+    reached = np.zeros(patterns[0].shape[0], dtype=bool)
+    reached[nodes] = True
+    for _ in range(hops):
+        step = reached.copy()
+        for pattern in patterns:
+            step |= pattern.T @ reached.astype(np.float64) > 0
+        reached = step
+    return int(reached.sum())
+
+
+def incremental_case(args, num_nodes, rng):
+    edge_index, edge_weight = synthetic_signed_digraph(num_nodes, args.degree, args.antiparallel, args.undirected, args.negative, args.seed)
+    X = in_out_degree(edge_index, num_nodes, edge_weight)
+    index, norm_real, norm_imag = laplacian.process_magnetic_laplacian(edge_index=edge_index, gcn=args.gcn, net_flow=True, x_real=X,
+                                                                       edge_weight=edge_weight, normalization='sym', return_lambda_max=False)
+    torch.manual_seed(args.seed)
+    model = SigMaNet_link_prediction_one_laplacian(K=args.K, num_features=2, hidden=args.hidden, label_dim=2, i_complex=False,
+                                                   layer=args.layers, follow_math=True, gcn=args.gcn, net_flow=True, unwind=True,
+                                                   edge_index=index, norm_real=norm_real, norm_imag=norm_imag)
+    incremental = IncrementalSigMaNet(model, edge_index, edge_weight, num_nodes, X, X.clone(), gcn=args.gcn, net_flow=True)
+    start = time.perf_counter()
+    incremental.refresh(X, X.clone())
+    full = time.perf_counter() - start
+    radius = sum(incremental._hops(conv) for conv in model.Chebs) + 1
+
+    seconds, nodes, ball, errors = [], [], [], []
+    for _ in range(args.updates):
+        current, _ = incremental.edge_index()
+        insert = torch.from_numpy(rng.integers(0, num_nodes, (2, args.batch)))
+        delete = current[:, rng.integers(0, current.size(1), args.batch)]
+        old_pattern = incremental.M.astype(bool)
+        start = time.perf_counter()
+        incremental.update(insert, torch.ones(args.batch), delete)
+        seconds.append(time.perf_counter() - start)
+        # every layer only runs on nodes within the receptive field of the updated edges, whatever the graph size
+        touched = np.unique(torch.cat([insert, delete], dim=1).numpy())
+        bound = ball_size([old_pattern, incremental.M.astype(bool)], touched, radius)
+        used = max([work['nodes'] for work in incremental.work] + [0])
+        assert used <= bound, 'A layer ran on %d nodes, beyond the %d nodes of the receptive field' % (used, bound)
+        nodes.append(used)
+        ball.append(bound)
+        if num_nodes <= args.check_max_nodes:
+            laplacian_error, embedding_error, ok = incremental.check_against_full()
+            assert ok, 'The incremental Laplacian (error %.1e) or embeddings (error %.1e) differ from a full recomputation' % (
+                laplacian_error, embedding_error)
+            errors.append(max(laplacian_error, embedding_error))
+    return {'full_seconds': full, 'update_seconds': float(np.mean(seconds)), 'speedup': full / float(np.mean(seconds)),
+            'layer_nodes': float(np.mean(nodes)), 'receptive_field': float(np.mean(ball)),
+            'max_error': max(errors) if errors else None}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="benchmark of the incremental SigMaNet refresh against a full forward")
+    parser.add_argument('--nodes', type=lambda s: [int(item) for item in s.split(',')], default="2000,20000,200000", help='graph sizes')
+    parser.add_argument('--degree', type=float, default=2.0, help='mean number of edges drawn per node')
+    parser.add_argument('--antiparallel', type=float, default=0.1, help='fraction of edges with a reverse edge of opposite sign')
+    parser.add_argument('--undirected', type=float, default=0.1, help='fraction of edges with a reverse edge of the same sign')
+    parser.add_argument('--negative', type=float, default=0.2, help='fraction of negative edges')
+    parser.add_argument('--batch', type=int, default=4, help='edges inserted and deleted per update')
+    parser.add_argument('--updates', type=int, default=5, help='updates per graph')
+    parser.add_argument('--K', type=int, default=1, help='order of the SigMaNet convolutions')
+    parser.add_argument('--layers', type=int, default=2, help='SigMaNet layers')
+    parser.add_argument('--hidden', type=int, default=64, help='hidden units')
+    parser.add_argument('--gcn', action='store_true', help='self-loops in the Laplacian')
+    parser.add_argument('--check_max_nodes', type=int, default=20000, help='largest graph whose updates are checked against a full recomputation')
+    parser.add_argument('--seed', type=int, default=0, help='random seed of the graphs and updates')
+    parser.add_argument('--output', type=str, default='benchmark_incremental.json', help='json report')
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    rng = np.random.default_rng(args.seed)
+    results = []
+    for num_nodes in args.nodes:
+        result = run_case('incremental', lambda: incremental_case(args, num_nodes, rng), 0, nodes=num_nodes)
+        results.append(result)
+        if result['status'] == 'done':
+            print('%8d nodes: update %.4fs, full forward %.4fs (x%.1f), layers on %.0f nodes, receptive field %.0f nodes, max error %s' % (
+                num_nodes, result['update_seconds'], result['full_seconds'], result['speedup'], result['layer_nodes'],
+                result['receptive_field'], 'n/a' if result['max_error'] is None else '%.1e' % result['max_error']))
+        else:
+            print('%8d nodes failed: %s' % (num_nodes, result['error'].strip().splitlines()[-1]))
+    write_report(args.output, results, vars(args))
+    failed = sum(result['status'] != 'done' for result in results)
+    print('%d cases, %d failed, report in %s' % (len(results), failed, args.output))
+    if failed > 0:
+        sys.exit(1)
@@ -0,0 +1,96 @@
+import os, sys, argparse
+
+import torch
+
+# the preprocessing modules of the drivers import utils.* from src
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), 'src'))
+
+from src.utils.benchmark import synthetic_signed_digraph, run_case, write_report
+from src.utils.hermitian import hermitian_decomp_sparse, cheb_poly_sparse
+from src.utils.edge_data import get_appr_directed_adj
+from src.utils.preprocess import F_in_out
+from src.layer.src2 import laplacian, quaternion_laplacian
+from src.layer.MSGNN import get_magnetic_signed_Laplacian
+
+
+def sign_magnetic(net_flow):
+    return lambda edge_index, edge_weight, size: laplacian.get_Sign_Magnetic_Laplacian(
+        edge_index, gcn=False, net_flow=net_flow, edge_weight=edge_weight, normalization='sym', num_nodes=size)
+
+
+def quaternion(edge_index, edge_weight, size):
+    return quaternion_laplacian.get_Quaternion_Laplacian(edge_index, edge_weight, normalization='sym', num_nodes=size)
+
+
+def hermitian_cheb(edge_index, edge_weight, size, q=0.25, K=2):
+    row, col = edge_index.numpy()
+    L = hermitian_decomp_sparse(row, col, size, q, norm=True, laplacian=True, max_eigen=2.0, gcn_appr=False,
+                                edge_weight=edge_weight.numpy())
+    return cheb_poly_sparse(L, K)
+
+
+def magnetic_signed(edge_index, edge_weight, size, q=0.25):
+    return get_magnetic_signed_Laplacian(edge_index, edge_weight, normalization='sym', num_nodes=size, q=q)
+
+
+def appr_directed_adj(edge_index, edge_weight, size, alpha=0.1):
+    # the pagerank of DiGCN needs non-negative weights
+    return get_appr_directed_adj(alpha, edge_index, size, torch.float32, edge_weight=edge_weight.abs())
+
+
+def in_out(edge_index, edge_weight, size):
+    return F_in_out(edge_index, size, edge_weight.abs())
+
+
+# name: (builder(edge_index, edge_weight, num_nodes), whether it is dense in the number of nodes)
+BUILDERS = {
+    'sign_magnetic_netflow': (sign_magnetic(True), False),
+    'sign_magnetic': (sign_magnetic(False), False),
+    'quaternion': (quaternion, False),
+    'hermitian_cheb': (hermitian_cheb, False),
+    'magnetic_signed': (magnetic_signed, False),
+    'appr_directed_adj': (appr_directed_adj, True),
+    'F_in_out': (in_out, True),
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="benchmark of the laplacian builders on synthetic signed directed graphs")
+    parser.add_argument('--nodes', type=lambda s: [int(item) for item in s.split(',')], default="500,2000,10000", help='graph sizes')
+    parser.add_argument('--degree', type=float, default=8.0, help='mean number of edges drawn per node')
+    parser.add_argument('--antiparallel', type=lambda s: [float(item) for item in s.split(',')], default="0.0,0.2", help='fractions of edges with a reverse edge of opposite sign')
+    parser.add_argument('--undirected', type=lambda s: [float(item) for item in s.split(',')], default="0.0,0.2", help='fractions of edges with a reverse edge of the same sign')
+    parser.add_argument('--negative', type=float, default=0.2, help='fraction of negative edges')
+    parser.add_argument('--builders', type=lambda s: s.split(','), default=','.join(BUILDERS), help='laplacian builders to run')
+    parser.add_argument('--max_dense_nodes', type=int, default=2000, help='largest graph given to the builders dense in the number of nodes')
+    parser.add_argument('--repeat', type=int, default=3, help='timed calls per case')
+    parser.add_argument('--seed', type=int, default=0, help='random seed of the graphs')
+    parser.add_argument('--output', type=str, default='benchmark_laplacian.json', help='json report')
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    for name in args.builders:
+        assert name in BUILDERS, 'Unknown builder %s, choose among %s' % (name, ', '.join(BUILDERS))
+
+    results = []
+    for num_nodes in args.nodes:
+        for antiparallel in args.antiparallel:
+            for undirected in args.undirected:
+                edge_index, edge_weight = synthetic_signed_digraph(num_nodes, args.degree, antiparallel, undirected, args.negative, args.seed)
+                for name in args.builders:
+                    builder, dense = BUILDERS[name]
+                    if dense and num_nodes > args.max_dense_nodes:
+                        continue
+                    result = run_case(name, lambda: builder(edge_index, edge_weight, num_nodes), args.repeat, nodes=num_nodes,
+                                      edges=edge_index.size(1), antiparallel=antiparallel, undirected=undirected)
+                    results.append(result)
+                    if result['status'] == 'done':
+                        print('%-22s %7d nodes %8d edges anti=%.2f undir=%.2f %9.4fs rss +%.1fMB py %.1fMB' % (
+                            name, num_nodes, result['edges'], antiparallel, undirected, result['seconds'],
+                            result['rss_growth'] / 2**20, result['tracemalloc_peak'] / 2**20))
+                    else:
+                        print('%-22s %7d nodes failed: %s' % (name, num_nodes, result['error'].strip().splitlines()[-1]))
+    write_report(args.output, results, vars(args))
+    print('%d cases, %d failed, report in %s' % (len(results), sum(result['status'] != 'done' for result in results), args.output))
@@ -0,0 +1,229 @@
+import os, sys, json, argparse
+
+import numpy as np
+import torch
+
+# the layers and the preprocessing of the drivers import layer.* and utils.* from src
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), 'src'))
+
+from torch_geometric_signed_directed.data import SignedData
+from src.utils.benchmark import synthetic_signed_digraph, link_queries, train_throughput, run_case, \
+    scaling_exponents, regressions, write_report
+from src.utils.edge_data import in_out_degree, get_appr_directed_adj
+from src.utils.hermitian import hermitian_decomp_sparse, cheb_poly_sparse
+from src.utils.preprocess import F_in_out
+from src.layer.src2 import laplacian, quaternion_laplacian
+from src.layer.Signum import SigMaNet_link_prediction_one_laplacian
+from src.layer.Signum_quaternion import QuaNet_link_prediction_one_laplacian
+from src.layer.MSGNN import MSGNN_link_prediction
+from src.layer.sparse_magnet import ChebNet_Edge
+from src.layer.DiGCN import DiGCNet
+from src.layer.DGCN import Sym_Link
+from src.layer.quaternion_baseline import QGNN_Link
+from src.layer.SSSNET_link_prediction import SSSNET_link_prediction
+from src.layer.geometric_baselines import GCN_Link, GAT_Link, SAGE_Link, GIN_Link, Cheb_Link, APPNP_Link
+from src.Edge_QGNN import quaternion_preprocess_features, normalize_adj
+
+device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
+
+
+def sparse_mx_to_torch_sparse_tensor(sparse_mx):
+    sparse_mx = sparse_mx.tocoo().astype(np.float32)
+    indices = torch.from_numpy(np.vstack((sparse_mx.row, sparse_mx.col)).astype(np.int64))
+    return torch.sparse_coo_tensor(indices, torch.from_numpy(sparse_mx.data), sparse_mx.shape)
+
+
+# every model family builds its model on a graph as its link driver does, and returns it with its forward on query edges
+def sigmanet(edge_index, edge_weight, size, args):
+    X_real = in_out_degree(edge_index, size, edge_weight).to(device)
+    X_img = X_real.clone()
+    edge_index, norm_real, norm_imag = laplacian.process_magnetic_laplacian(edge_index=edge_index, gcn=True, net_flow=True, x_real=X_real,
+                                                                          edge_weight=edge_weight, normalization='sym', return_lambda_max=False)
+    model = SigMaNet_link_prediction_one_laplacian(K=args.K, num_features=2, hidden=args.hidden, label_dim=2, i_complex=False, layer=2,
+                                                   follow_math=True, gcn=True, net_flow=True, unwind=True, edge_index=edge_index,
+                                                   norm_real=norm_real, norm_imag=norm_imag).to(device)
+    return model, lambda q: model(X_real, X_img, q)
+
+
+def quanet(edge_index, edge_weight, size, args):
+    X_real = in_out_degree(edge_index, size, edge_weight).to(device)
+    edge_index, norm_real, norm_imag_i, norm_imag_j, norm_imag_k = quaternion_laplacian.process_quaternion_laplacian(
+        edge_index=edge_index, x_real=X_real, edge_weight=edge_weight, normalization='sym', return_lambda_max=False)
+    model = QuaNet_link_prediction_one_laplacian(K=args.K, num_features=2, hidden=args.hidden, label_dim=2, layer=2, unwind=True,
+                                                 edge_index=edge_index, norm_real=norm_real, norm_imag_i=norm_imag_i,
+                                                 norm_imag_j=norm_imag_j, norm_imag_k=norm_imag_k).to(device)
+    X_img_i, X_img_j, X_img_k = X_real.clone(), X_real.clone(), X_real.clone()
+    return model, lambda q: model(X_real, X_img_i, X_img_j, X_img_k, q)
+
+
+def msgnn(edge_index, edge_weight, size, args):
+    X_real = in_out_degree(edge_index, size, edge_weight).to(device)
+    X_img = X_real.clone()
+    model = MSGNN_link_prediction(q=args.q, K=args.K, num_features=2, hidden=args.hidden, label_dim=2, trainable_q=False, layer=2,
+                                  dropout=0.5, normalization='sym', cached=True).to(device)
+    edge_index, edge_weight = edge_index.to(device), edge_weight.to(device)
+    return model, lambda q: model(X_real, X_img, edge_index=edge_index, query_edges=q, edge_weight=edge_weight)
+
+
+def magnet(edge_index, edge_weight, size, args):
+    row, col = edge_index.numpy()
+    L = cheb_poly_sparse(hermitian_decomp_sparse(row, col, size, args.q, norm=True, laplacian=True, max_eigen=2.0, gcn_appr=True,
+                                                 edge_weight=edge_weight.numpy()), args.K)
+    L_real = [sparse_mx_to_torch_sparse_tensor(L_k.real).to(device) for L_k in L]
+    L_img = [sparse_mx_to_torch_sparse_tensor(L_k.imag).to(device) for L_k in L]
+    X_real = in_out_degree(edge_index, size, edge_weight).to(device)
+    X_img = torch.zeros(X_real.size()).to(device)
+    model = ChebNet_Edge(X_real.size(-1), L_real, L_img, K=args.K, label_dim=2, layer=2, activation=True, num_filter=args.hidden,
+                         dropout=0.5).to(device)
+    return model, lambda q: model(X_real, X_img, q)
+
+
+def digcn(edge_index, edge_weight, size, args):
+    x = in_out_degree(edge_index, size, edge_weight).to(device)
+    # the pagerank of DiGCN needs non-negative weights
+    edge_index, edge_weight = get_appr_directed_adj(0.1, edge_index, size, x.dtype, edge_weight.abs())
+    edge_index, edge_weight = edge_index.to(device), edge_weight.to(device)
+    model = DiGCNet(x.size(-1), 2, hidden=args.hidden).to(device)
+    return model, lambda q: model(x, edge_index, q, edge_weight)
+
+
+def sym_digcn(edge_index, edge_weight, size, args):
+    x = in_out_degree(edge_index, size, edge_weight).to(device)
+    graph = [tensor.to(device) for tensor in F_in_out(edge_index, size, edge_weight=edge_weight.abs())]
+    edge_index, edge_weight, edge_in, in_weight, edge_out, out_weight = graph
+    model = Sym_Link(x.size(-1), 2, filter_num=args.hidden, dropout=0.5).to(device)
+    return model, lambda q: model(x, edge_index, edge_in, in_weight, edge_out, out_weight, q, edge_weight)
+
+
+def qgnn(edge_index, edge_weight, size, args):
+    X_real = in_out_degree(edge_index, size, edge_weight)
+    features = quaternion_preprocess_features(X_real).to(device)
+    adj = sparse_mx_to_torch_sparse_tensor(normalize_adj(edge_index, edge_weight.abs(), X_real)).to(device)
+    model = QGNN_Link(nfeat=X_real.size(-1)*4, nhid=args.hidden, nclass=2, dropout=0.5).to(device)
+    return model, lambda q: model(features, adj, q)
+
+
+def sssnet(edge_index, edge_weight, size, args):
+    X_real = in_out_degree(edge_index, size, edge_weight).to(device)
+    data = SignedData(edge_index=edge_index, edge_weight=edge_weight).to(device)
+    data.separate_positive_negative()
+    model = SSSNET_link_prediction(nfeat=2, hidden=args.hidden, nclass=2, dropout=0.5, hop=2, fill_value=0.5, directed=True).to(device)
+    return model, lambda q: model(data.edge_index_p, data.edge_weight_p, data.edge_index_n, data.edge_weight_n, X_real, q)
+
+
+def baseline(name):
+    # the geometric baselines of the unsigned link drivers, on the absolute weights
+    def build(edge_index, edge_weight, size, args):
+        x = in_out_degree(edge_index, size, edge_weight).to(device)
+        edge_index, edge_weight = edge_index.to(device), edge_weight.abs().to(device)
+        if name == 'GCN':
+            model = GCN_Link(x.size(-1), 2, filter_num=args.hidden, dropout=0.5).to(device)
+            return model, lambda q: model(x, edge_index, edge_weight, q)
+        if name == 'Cheb':
+            model = Cheb_Link(x.size(-1), 2, filter_num=args.hidden, K=args.K+1, dropout=0.5).to(device)
+            return model, lambda q: model(x, edge_index, edge_weight, q)
+        if name == 'APPNP':
+            model = APPNP_Link(x.size(-1), 2, filter_num=args.hidden, alpha=0.1, dropout=0.5, K=10).to(device)
+            return model, lambda q: model(x, edge_index, edge_weight, q)
+        if name == 'GAT':
+            model = GAT_Link(x.size(-1), 2, heads=8, filter_num=args.hidden, dropout=0.5).to(device)
+        elif name == 'SAGE':
+            model = SAGE_Link(x.size(-1), 2, filter_num=args.hidden, dropout=0.5).to(device)
+        else:
+            model = GIN_Link(x.size(-1), 2, filter_num=args.hidden, dropout=0.5).to(device)
+        return model, lambda q: model(x, edge_index, q)
+    return build
+
+
+# name: (builder(edge_index, edge_weight, num_nodes, args) -> (model, forward), whether its preprocessing is dense in the number of nodes)
+MODELS = {
+    'SigMaNet': (sigmanet, False),
+    'QuaNet': (quanet, False),
+    'MSGNN': (msgnn, False),
+    'MagNet': (magnet, False),
+    'DiGCN': (digcn, True),
+    'Sym_DiGCN': (sym_digcn, True),
+    'QGNN': (qgnn, False),
+    'SSSNET': (sssnet, False),
+    'GCN': (baseline('GCN'), False),
+    'GAT': (baseline('GAT'), False),
+    'SAGE': (baseline('SAGE'), False),
+    'GIN': (baseline('GIN'), False),
+    'Cheb': (baseline('Cheb'), False),
+    'APPNP': (baseline('APPNP'), False),
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="training throughput of the link prediction models on synthetic signed directed graphs")
+    parser.add_argument('--models', type=lambda s: s.split(','), default=','.join(MODELS), help='models to run')
+    parser.add_argument('--nodes', type=lambda s: [int(item) for item in s.split(',')], default="1000,4000,16000", help='graph sizes')
+    parser.add_argument('--degree', type=lambda s: [float(item) for item in s.split(',')], default="8", help='mean numbers of edges drawn per node')
+    parser.add_argument('--antiparallel', type=float, default=0.1, help='fraction of edges with a reverse edge of opposite sign')
+    parser.add_argument('--undirected', type=float, default=0.1, help='fraction of edges with a reverse edge of the same sign')
+    parser.add_argument('--negative', type=float, default=0.2, help='fraction of negative edges')
+    parser.add_argument('--queries', type=float, default=0.8, help='training query edges, as a fraction of the edges (the evaluation queries are a quarter of them)')
+    parser.add_argument('--epochs', type=int, default=20, help='measured epochs per run')
+    parser.add_argument('--warmup', type=int, default=2, help='epochs run before the measure')
+    parser.add_argument('--hidden', type=int, default=16, help='hidden units of every model')
+    parser.add_argument('--K', type=int, default=1, help='K for cheb series')
+    parser.add_argument('--q', type=float, default=0.25, help='phase of MagNet and MSGNN')
+    parser.add_argument('--max_dense_nodes', type=int, default=4000, help='largest graph given to the models with a preprocessing dense in the number of nodes')
+    parser.add_argument('--seed', type=int, default=0, help='random seed of the graphs, queries and models')
+    parser.add_argument('--output', type=str, default='benchmark_models.json', help='json report')
+    parser.add_argument('--baseline', type=str, default=None, help='json report to compare with: exit with an error on a regression')
+    parser.add_argument('--metrics', type=lambda s: s.split(','), default="epoch_seconds", help='metrics compared with the baseline, e.g. epoch_seconds,rss_peak')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='relative increase over the baseline that is a regression')
+    return parser.parse_args()
+
+
+def throughput(name, edge_index, edge_weight, num_nodes, args):
+    torch.manual_seed(args.seed)
+    model, forward = MODELS[name][0](edge_index, edge_weight, num_nodes, args)
+    count = int(args.queries * edge_index.size(1))
+    queries, labels = link_queries(edge_index, count, seed=args.seed)
+    eval_queries, _ = link_queries(edge_index, max(count // 4, 1), seed=args.seed + 1)
+    result = train_throughput(model, forward, queries.to(device), labels.to(device), eval_queries.to(device), args.epochs, args.warmup)
+    result['edges_per_second'] = edge_index.size(1) * result['epochs_per_second']
+    result['parameters'] = sum(parameter.numel() for parameter in model.parameters())
+    return result
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    for name in args.models:
+        assert name in MODELS, 'Unknown model %s, choose among %s' % (name, ', '.join(MODELS))
+
+    results = []
+    for num_nodes in args.nodes:
+        for degree in args.degree:
+            edge_index, edge_weight = synthetic_signed_digraph(num_nodes, degree, args.antiparallel, args.undirected, args.negative, args.seed)
+            for name in args.models:
+                if MODELS[name][1] and num_nodes > args.max_dense_nodes:
+                    continue
+                result = run_case(name, lambda: throughput(name, edge_index, edge_weight, num_nodes, args), 0,
+                                  nodes=num_nodes, degree=degree, edges=edge_index.size(1))
+                results.append(result)
+                if result['status'] == 'done':
+                    print('%-10s %7d nodes %8d edges fwd %.4fs bwd %.4fs eval %.4fs %8.2f epochs/s %11.0f edges/s rss %.0fMB' % (
+                        name, num_nodes, result['edges'], result['forward'], result['backward'], result['evaluation'],
+                        result['epochs_per_second'], result['edges_per_second'], result['rss_peak'] / 2**20))
+                else:
+                    print('%-10s %7d nodes failed: %s' % (name, num_nodes, result['error'].strip().splitlines()[-1]))
+
+    scaling = {'nodes': scaling_exponents(results, 'nodes'), 'edges': scaling_exponents(results, 'edges')}
+    write_report(args.output, results, vars(args), scaling=scaling)
+    print('%d runs, %d failed, report in %s' % (len(results), sum(result['status'] != 'done' for result in results), args.output))
+    for name in scaling['edges']:
+        if scaling['edges'][name] is not None:
+            print('%-10s epoch time ~ nodes^%.2f, edges^%.2f' % (name, scaling['nodes'][name] or float('nan'), scaling['edges'][name]))
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            found = regressions(results, json.load(f)['results'], ['name', 'nodes', 'edges'], args.metrics, args.tolerance)
+        for regression in found:
+            change = '%s -> %s' % (regression['baseline'], regression['value']) if regression['ratio'] is None else \
+                '%.4g -> %.4g (x%.2f)' % (regression['baseline'], regression['value'], regression['ratio'])
+            print('REGRESSION %s %d nodes %d edges: %s %s' % (regression['name'], regression['nodes'], regression['edges'], regression['metric'], change))
+        if len(found) > 0:
+            sys.exit(1)
@@ -0,0 +1,148 @@
+import os, sys, glob, random, argparse, tempfile, subprocess, importlib.util
+
+import numpy as np
+import torch
+import pickle as pk
+from scipy.sparse import coo_matrix
+from torch_geometric.data import Data
+
+# the split cache would time the loading of the splits of the previous repetitions
+os.environ['SPLIT_CACHE'] = ''
+ROOT = os.path.dirname(os.path.realpath(__file__))
+# the preprocessing modules of the drivers import utils.* from src
+sys.path.append(os.path.join(ROOT, 'src'))
+
+from src.utils.benchmark import synthetic_signed_digraph, run_case, write_report
+from src.utils import edge_data
+from src.utils.edge_data import load_signed_real_data_no_negative
+from torch_geometric_signed_directed.data import load_signed_real_data
+
+LABELERS = ['undirected_label2directed_label', 'noisy_undirected_label2directed_label']
+TASKS = ["existence", "direction", "all", "sign"]
+
+
+def reference_module(revision):
+    r"""The :obj:`src/utils/edge_data.py` of the git :obj:`revision`, imported in :obj:`src.utils` so that its relative
+    imports resolve."""
+    source = subprocess.run(['git', 'show', '%s:src/utils/edge_data.py' % revision], cwd=ROOT, capture_output=True,
+                            text=True, check=True).stdout
+    path = os.path.join(tempfile.mkdtemp(prefix='edge_data_'), 'edge_data.py')
+    with open(path, 'w') as f:
+        f.write(source)
+    spec = importlib.util.spec_from_file_location('src.utils._reference_edge_data', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def load_graphs(args):
+    # name: Data of the dataset_nodes500_* graphs of the drivers, or synthetic ones of the same size, and the real signed datasets
+    graphs = []
+    paths = sorted(glob.glob(os.path.join(args.fake_root, 'dataset_nodes500_*.pk')))[:args.max_fake]
+    for path in paths:
+        graphs.append((os.path.basename(path)[:-3], lambda path=path: pk.load(open(path, 'rb'))))
+    if len(paths) == 0:
+        print('no dataset_nodes500_* graph in %s, synthetic graphs of 500 nodes instead' % args.fake_root)
+        for undirected in args.undirected:
+            def synthetic(undirected=undirected):
+                edge_index, edge_weight = synthetic_signed_digraph(500, args.degree, args.antiparallel, undirected, args.negative, args.seed)
+                return Data(edge_index=edge_index, edge_weight=edge_weight, num_nodes=500)
+            graphs.append(('synthetic_nodes500_undirected%g' % undirected, synthetic))
+    for name in args.real:
+        graphs.append((name, lambda name=name: load_signed_real_data(dataset=name, root=args.real_root)))
+        graphs.append((name + '_no_negative', lambda name=name: load_signed_real_data_no_negative(dataset=name, root=args.real_root)))
+    return graphs
+
+
+def adjacency(data):
+    edge_index = data.edge_index.cpu()
+    size = int(edge_index.max()) + 1
+    weight = data.edge_weight.cpu() if getattr(data, 'edge_weight', None) is not None else torch.ones(edge_index.size(1))
+    return coo_matrix((weight.numpy(), (edge_index[0].numpy(), edge_index[1].numpy())), shape=(size, size), dtype=np.float32).tocsr()
+
+
+def label_queries(data, seed):
+    # as the queries of a training set: the edges in both directions and as many random pairs of nodes
+    edges = data.edge_index.cpu().numpy().T
+    rng = np.random.default_rng(seed)
+    pairs = np.concatenate([edges, edges[:, ::-1], rng.integers(0, int(edges.max()) + 1, (len(edges), 2))])
+    return pairs[rng.permutation(len(pairs))]
+
+
+def same_labels(first, second):
+    return bool(np.array_equal(np.asarray(first[0]).reshape(-1, 2), np.asarray(second[0]).reshape(-1, 2)) and
+                np.array_equal(first[1], second[1]))
+
+
+def split(module, data, task, noisy, args):
+    random.seed(args.seed)
+    np.random.seed(args.seed)
+    torch.manual_seed(args.seed)
+    return module.link_class_split(data, splits=args.splits, prob_test=args.split_prob[1], prob_val=args.split_prob[0],
+                                   task=task, seed=args.seed, noisy=noisy)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="benchmark of the label generation and splits of edge_data.link_class_split")
+    parser.add_argument('--fake_root', type=str, default='./data/fake', help='folder of the dataset_nodes500_*.pk graphs')
+    parser.add_argument('--max_fake', type=int, default=4, help='dataset_nodes500_* graphs to run')
+    parser.add_argument('--real', type=lambda s: [item for item in s.split(',') if item], default="bitcoin_alpha,bitcoin_otc", help='real signed datasets, e.g. bitcoin_alpha,bitcoin_otc,slashdot,epinions')
+    parser.add_argument('--real_root', type=str, default='./tmp_data/', help='download folder of the real datasets')
+    parser.add_argument('--degree', type=float, default=8.0, help='mean number of edges drawn per node of the synthetic graphs')
+    parser.add_argument('--antiparallel', type=float, default=0.1, help='fraction of edges with a reverse edge of opposite sign')
+    parser.add_argument('--undirected', type=lambda s: [float(item) for item in s.split(',')], default="0.2,0.5,0.7", help='fractions of edges with a reverse edge of the same sign')
+    parser.add_argument('--negative', type=float, default=0.2, help='fraction of negative edges')
+    parser.add_argument('--tasks', type=lambda s: s.split(','), default=','.join(TASKS), help='tasks of the splits')
+    parser.add_argument('--splits', type=int, default=2, help='splits per call of link_class_split')
+    parser.add_argument('--split_prob', type=lambda s: [float(item) for item in s.split(',')], default="0.05,0.15", help='validation and test probabilities')
+    parser.add_argument('--reference', type=str, default=None, help='git revision whose edge_data.py is run too, e.g. the one before the vectorized labels')
+    parser.add_argument('--repeat', type=int, default=3, help='timed calls per case')
+    parser.add_argument('--seed', type=int, default=0, help='random seed of the graphs, queries and splits')
+    parser.add_argument('--output', type=str, default='benchmark_splits.json', help='json report')
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    for task in args.tasks:
+        assert task in TASKS, 'Unknown task %s, choose among %s' % (task, ', '.join(TASKS))
+    implementations = [('current', edge_data)]
+    if args.reference is not None:
+        implementations.append((args.reference, reference_module(args.reference)))
+
+    results = []
+    for graph, load in load_graphs(args):
+        try:
+            data = load()
+        except Exception as error:
+            results.append({'name': 'load', 'graph': graph, 'status': 'failed', 'error': repr(error)})
+            print('%-40s failed to load: %r' % (graph, error))
+            continue
+        A = adjacency(data)
+        pairs = label_queries(data, args.seed)
+        pair_list = [tuple(pair) for pair in pairs.tolist()]
+        for task in args.tasks:
+            for noisy in [False, True]:
+                labeler = LABELERS[noisy]
+                outputs = {}
+                for implementation, module in implementations:
+                    # the previous implementations loop over lists of tuples
+                    queries = pairs if module is edge_data else pair_list
+                    outputs[implementation] = getattr(module, labeler)(A, queries, task)
+                    cases = [('label', lambda: getattr(module, labeler)(A, queries, task)),
+                             ('link_class_split', lambda: split(module, data, task, noisy, args))]
+                    for name, function in cases:
+                        result = run_case(name, function, args.repeat, graph=graph, nodes=A.shape[0], edges=int(data.edge_index.size(1)),
+                                          task=task, noisy=noisy, implementation=implementation)
+                        if name == 'label' and implementation != 'current':
+                            result['same_labels'] = same_labels(outputs['current'], outputs[implementation])
+                        results.append(result)
+                        if result['status'] == 'done':
+                            print('%-40s %-9s noisy=%-5s %-16s %-10s %9.4fs rss +%.1fMB%s' % (
+                                graph, task, noisy, name, implementation, result['seconds'], result['rss_growth'] / 2**20,
+                                '' if 'same_labels' not in result else ' same labels: %s' % result['same_labels']))
+                        else:
+                            print('%-40s %-9s noisy=%-5s %-16s %-10s failed: %s' % (
+                                graph, task, noisy, name, implementation, result['error'].strip().splitlines()[-1]))
+    write_report(args.output, results, vars(args))
+    print('%d cases, %d failed, report in %s' % (len(results), sum(result['status'] != 'done' for result in results), args.output))
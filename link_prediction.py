@@ -1,5 +1,7 @@
 import os, sys
+from src.utils.sweep import run_commands
 
+commands = []
 epochs = '3000'
 for data in [#'bitcoin_otc', 'bitcoin_alpha','telegram/telegram' 
 #'dataset_nodes150_alpha0.6_beta0.1_undirected-percentage0.2_opposite-signFalse_negative-edgesFalse_directedTrue.pk',
@@ -46,7 +48,7 @@ for data in [#'bitcoin_otc', 'bitcoin_alpha','telegram/telegram'
                                 +' --noisy')
 
                     print(command)
-                    os.system(command)
+                    commands.append(command)
 #
             log_path = 'Edge_'+data[:-1]+'_SymDiGCN'
             for num_filter in [#5, 15, 
@@ -63,7 +65,7 @@ for data in [#'bitcoin_otc', 'bitcoin_alpha','telegram/telegram'
                             +' --epochs='+epochs
                             +' --noisy')
                 print(command)
-                os.system(command)
+                commands.append(command)
 ##
             log_path = 'Edge_'+data[:-1]+'_Cheb'
             for num_filter in [#16, 32, 
@@ -81,7 +83,7 @@ for data in [#'bitcoin_otc', 'bitcoin_alpha','telegram/telegram'
                                 +' --epochs='+epochs
                                 +' --noisy')
                     print(command)
-                    os.system(command)
+                    commands.append(command)
 ##
             log_path = 'Edge_'+data[:-1]+'_GCN'
             for num_filter in [#16, 32, 
@@ -99,7 +101,7 @@ for data in [#'bitcoin_otc', 'bitcoin_alpha','telegram/telegram'
                                 +' -tud'
                                 +' --noisy')
                     print(command)
-                    os.system(command)
+                    commands.append(command)
 #
             log_path = 'Edge_'+data[:-1]+'_SAGE'
             for num_filter in [#16, 32, 
@@ -115,7 +117,7 @@ for data in [#'bitcoin_otc', 'bitcoin_alpha','telegram/telegram'
                                 +' --epochs='+epochs
                                 +' --noisy')
                     print(command)
-                    os.system(command)
+                    commands.append(command)
                     #command = ('python3 src/Edge_SAGE.py ' 
                     #        +' --dataset='+data
                     #        +' --task='+ task
@@ -234,4 +236,8 @@ for data in [#'bitcoin_otc', 'bitcoin_alpha','telegram/telegram'
 #                               +' --epochs='+epochs
 #                               +' --noisy')
 #                   print(command)
-#                   os.system(command)
\ No newline at end of file
+#                   os.system(command)
+
+# every command runs in a persistent pool of workers instead of its own python process
+if __name__ == "__main__":
+    run_commands(commands)
@@ -1,5 +1,7 @@
 import os, sys
+from src.utils.sweep import run_commands
 
+commands = []
 epochs = '3000'
 for data in [#'bitcoin_alpha', 'bitcoin_otc', 
      #'telegram/telegram' 
@@ -40,7 +42,7 @@ for data in [#'bitcoin_alpha', 'bitcoin_otc',
                                 +' --noisy'
                                 +' --method_name=DiGib')
                     print(command)
-                    os.system(command)
+                    commands.append(command)
             
         ##
             log_path = 'Edge_'+data[:-1]+'_APPNP'
@@ -64,7 +66,7 @@ for data in [#'bitcoin_alpha', 'bitcoin_otc',
                                     +' --epochs='+epochs
                                     +' --noisy')
                         print(command)
-                        os.system(command)
+                        commands.append(command)
             #            command = ('python3 Edge_APPNP.py ' 
             ##                        +' --dataset='+data
             ##                        +' -D'
@@ -102,7 +104,7 @@ for data in [#'bitcoin_alpha', 'bitcoin_otc',
                             +' --drop_feature_rate_2=0.4'
                             + ' --tau=0.4')
                     print(command)
-                    os.system(command)
+                    commands.append(command)
 
                     command = ('python3 src/Edge_DiGCL.py ' 
                             +' --dataset='+data
@@ -121,4 +123,8 @@ for data in [#'bitcoin_alpha', 'bitcoin_otc',
                             +' --drop_feature_rate_2=0.1'
                             +' --tau=0.9')
                     print(command)
-                    os.system(command)
\ No newline at end of file
+                    commands.append(command)
+
+# every command runs in a persistent pool of workers instead of its own python process
+if __name__ == "__main__":
+    run_commands(commands)
@@ -1,6 +1,8 @@
 import os, sys
+from src.utils.sweep import run_commands
 
 
+commands = []
 epochs = '3000'
 for data in [ #'bitcoin_otc', 
      #'bitcoin_alpha', 'telegram'
@@ -44,7 +46,7 @@ for data in [ #'bitcoin_otc',
                                     +' -F'
                                     +' --noisy')
                         print(command)
-                        os.system(command)
+                        commands.append(command)
                 log_path = 'Edge_'+data[:-1]+'_GAT'
                 for heads in [2, 4, 8
                 ]:
@@ -61,7 +63,7 @@ for data in [ #'bitcoin_otc',
                                         +' --epochs='+epochs
                                         +' --noisy')
                                 print(command)
-                                os.system(command)
+                                commands.append(command)
 
                 log_path = 'Edge_'+data+'_QGNN'
                 for num_filter in [ #16, 32,  
@@ -77,7 +79,7 @@ for data in [ #'bitcoin_otc',
                                     +' --task='+ task
                                     +' --noisy')
                         print(command)
-                        os.system(command)
+                        commands.append(command)
 
                 
                 log_path = 'Edge_'+data[:-1]+'_Digraph'
@@ -98,7 +100,7 @@ for data in [ #'bitcoin_otc',
                                 +' --epochs='+epochs
                                 +' --noisy')
                                 print(command)
-                                os.system(command)
+                                commands.append(command)
                 log_path = 'Edge_'+data[:-1]+'_GIN'
                 for num_filter in [#16, 32, 
                 64]:
@@ -113,4 +115,8 @@ for data in [ #'bitcoin_otc',
                                 +' --epochs='+epochs
                                 +' --noisy')
                         print(command)
-                        os.system(command)
\ No newline at end of file
+                        commands.append(command)
+
+# every command runs in a persistent pool of workers instead of its own python process
+if __name__ == "__main__":
+    run_commands(commands)
@@ -1,6 +1,8 @@
 import os, sys
+from src.utils.sweep import run_commands
 
 
+commands = []
 epochs = '3000'
 for data in [ #'bitcoin_otc', 'bitcoin_alpha', 'telegram/telegram' 
     #'dataset_nodes150_alpha0.6_beta0.1_undirected-percentage0.2_opposite-signFalse_negative-edgesFalse_directedTrue.pk',
@@ -37,4 +39,8 @@ for data in [ #'bitcoin_otc', 'bitcoin_alpha', 'telegram/telegram'
                                     +' --task='+ task
                                     +' --noisy')
                         print(command)
-                        os.system(command)
\ No newline at end of file
+                        commands.append(command)
+
+# every command runs in a persistent pool of workers instead of its own python process
+if __name__ == "__main__":
+    run_commands(commands)
@@ -1,6 +1,8 @@
 import os, sys
+from src.utils.sweep import run_commands
 
 
+commands = []
 epochs = '3000'
 for data in [#'dataset_nodes500_alpha1_beta0.95_undirected-percentage0.8_opposite-signFalse_negative-edgesFalse_directedTrue'] 
     #'bitcoin_otc', 'bitcoin_alpha', 
@@ -60,4 +62,8 @@ for data in [#'dataset_nodes500_alpha1_beta0.95_undirected-percentage0.8_opposit
                                     +' --task='+ task
                                     +' --noisy')
                         print(command)
-                        os.system(command)
\ No newline at end of file
+                        commands.append(command)
+
+# every command runs in a persistent pool of workers instead of its own python process
+if __name__ == "__main__":
+    run_commands(commands)
@@ -1,5 +1,7 @@
 import os, sys
+from src.utils.sweep import run_commands
 
+commands = []
 epochs = '3000'
 for data in [#'telegram',  'dataset_nodes500_alpha0.05_beta0.2', 'dataset_nodes500_alpha0.08_beta0.2', 'dataset_nodes500_alpha0.1_beta0.2'
     #'dataset_nodes500_alpha0.1_beta0.2_undirected-percentage0.7_opposite-signFalse_negative-edgesFalse_directedTrue.pk',
@@ -28,7 +30,7 @@ for data in [#'telegram',  'dataset_nodes500_alpha0.05_beta0.2', 'dataset_nodes5
                             +' --lr='+str(lr)
                             +' -a')
                 print(command)
-                os.system(command)
+                commands.append(command)
         # DGCN
         log_path = 'Sym_' + data
         for num_filter in [#5, 15, 
@@ -41,7 +43,7 @@ for data in [#'telegram',  'dataset_nodes500_alpha0.05_beta0.2', 'dataset_nodes5
                         +' --lr='+str(lr)
                         +' --epochs='+epochs)
             print(command)
-            os.system(command)
+            commands.append(command)
                 
         log_path = 'GCN_' + data
         for num_filter in [#16, 32, 
@@ -55,7 +57,7 @@ for data in [#'telegram',  'dataset_nodes500_alpha0.05_beta0.2', 'dataset_nodes5
                         +' --lr='+str(lr)
                         +' -tud')
             print(command)
-            os.system(command)
+            commands.append(command)
 
         log_path = 'Cheb_' + data
         for num_filter in [#16, 32, 
@@ -70,7 +72,7 @@ for data in [#'telegram',  'dataset_nodes500_alpha0.05_beta0.2', 'dataset_nodes5
                         +' --epochs='+epochs
                         +' -tud')
             print(command)
-            os.system(command)
+            commands.append(command)
 #
         log_path = 'SAGE_' + data
         for num_filter in [#16, 32, 
@@ -83,7 +85,7 @@ for data in [#'telegram',  'dataset_nodes500_alpha0.05_beta0.2', 'dataset_nodes5
                         +' --lr='+str(lr)
                         +' --epochs='+epochs)
             print(command)
-            os.system(command)
+            commands.append(command)
 
         log_path = 'GAT_' + data
         for heads in [2, 4, 
@@ -99,7 +101,7 @@ for data in [#'telegram',  'dataset_nodes500_alpha0.05_beta0.2', 'dataset_nodes5
                             +' --lr='+str(lr)
                             +' --epochs='+epochs)
                 print(command)
-                os.system(command)
+                commands.append(command)
 
 
         log_path = 'GIN_' + data
@@ -113,7 +115,7 @@ for data in [#'telegram',  'dataset_nodes500_alpha0.05_beta0.2', 'dataset_nodes5
                         +' --lr='+str(lr)
                         +' --epochs='+epochs)
             print(command)
-            os.system(command)
+            commands.append(command)
 
         
         log_path = 'SSSNet_' + data
@@ -127,7 +129,7 @@ for data in [#'telegram',  'dataset_nodes500_alpha0.05_beta0.2', 'dataset_nodes5
                             +' --direction'
                             +' --weight_decay=0.0005')
             print(command)
-            os.system(command)
+            commands.append(command)
         
             command = ('python3 src/SSSNET.py ' 
                             +' --dataset='+data
@@ -139,8 +141,12 @@ for data in [#'telegram',  'dataset_nodes500_alpha0.05_beta0.2', 'dataset_nodes5
                             +' --weight_decay=0.0005'
                             +' --w_pbrc=1')
             print(command)
-            os.system(command)
+            commands.append(command)
 
 
         
-    
\ No newline at end of file
+    
+
+# every command runs in a persistent pool of workers instead of its own python process
+if __name__ == "__main__":
+    run_commands(commands)
@@ -1,5 +1,7 @@
 import os, sys
+from src.utils.sweep import run_commands
 
+commands = []
 epochs = '3000'
 for data in [#'telegram',  
     'dataset_nodes150_alpha0.6_beta0.2_undirected-percentage0.2_opposite-signFalse_negative-edgesFalse_directedTrue',
@@ -27,7 +29,7 @@ for data in [#'telegram',
                             +' --drop_feature_rate_2=0.4'
                             + ' --tau=0.4')
                 print(command)
-                os.system(command)
+                commands.append(command)
 
                 command = ('python3 src/DiGCL.py ' 
                             +' --dataset='+data
@@ -42,7 +44,7 @@ for data in [#'telegram',
                             +' --drop_feature_rate_2=0.1'
                             +' --tau=0.9')
                 print(command)
-                os.system(command)
+                commands.append(command)
 
         log_path = 'DiGraph_' + data
         for num_filter in [#16, 32, 
@@ -59,7 +61,7 @@ for data in [#'telegram',
                             +' --epochs='+epochs
                             +' --method_name=DiGib')
                 print(command)
-                os.system(command)
+                commands.append(command)
 
         log_path = 'QGNN_' + data
         for num_filter in [64]:
@@ -71,8 +73,12 @@ for data in [#'telegram',
                         +' --lr='+str(lr)
                         +' --epochs='+epochs)
             print(command)
-            os.system(command)
+            commands.append(command)
 
 
             
-    
\ No newline at end of file
+    
+
+# every command runs in a persistent pool of workers instead of its own python process
+if __name__ == "__main__":
+    run_commands(commands)
@@ -1,5 +1,7 @@
 import os, sys
+from src.utils.sweep import run_commands
 
+commands = []
 epochs = '3000'
 for data in [#'telegram/telegram' #,  'dataset_nodes500_alpha0.05_beta0.2', 'dataset_nodes500_alpha0.08_beta0.2', 'dataset_nodes500_alpha0.1_beta0.2'
     'dataset_nodes150_alpha0.6_beta0.2_undirected-percentage0.2_opposite-signFalse_negative-edgesFalse_directedTrue',
@@ -26,7 +28,7 @@ for data in [#'telegram/telegram' #,  'dataset_nodes500_alpha0.05_beta0.2', 'dat
                             +' -N'
                             +' -F' )
                 print(command)
-                os.system(command)
+                commands.append(command)
         # K=10 following the original paper
         log_path = 'APPNP_' + data
         for num_filter in [#16, 32, 
@@ -42,7 +44,7 @@ for data in [#'telegram/telegram' #,  'dataset_nodes500_alpha0.05_beta0.2', 'dat
                             +' --lr='+str(lr)
                             +' --epochs='+epochs)
                 print(command)
-                os.system(command)
+                commands.append(command)
 
         
         log_path = 'DiGraph_' + data
@@ -59,6 +61,10 @@ for data in [#'telegram/telegram' #,  'dataset_nodes500_alpha0.05_beta0.2', 'dat
                             +' --lr='+str(lr)
                             +' --epochs='+epochs)
                 print(command)
-                os.system(command)
+                commands.append(command)
         
-        
\ No newline at end of file
+        
+
+# every command runs in a persistent pool of workers instead of its own python process
+if __name__ == "__main__":
+    run_commands(commands)
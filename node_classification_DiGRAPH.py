@@ -1,5 +1,7 @@
 import os, sys
+from src.utils.sweep import run_commands
 
+commands = []
 epochs = '3000'
 #for data in ['dataset_nodes500_alpha0.1_beta0.05', 'dataset_nodes500_alpha0.1_beta0.1', 
 #            'dataset_nodes500_alpha0.1_beta0.15', 'dataset_nodes500_alpha0.1_beta0.25',
@@ -26,5 +28,9 @@ for data in [#'telegram',
                             +' --epochs='+epochs
                             +' --method_name=DiGib')
                 print(command)
-                os.system(command)
-    
\ No newline at end of file
+                commands.append(command)
+    
+
+# every command runs in a persistent pool of workers instead of its own python process
+if __name__ == "__main__":
+    run_commands(commands)
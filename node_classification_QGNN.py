@@ -1,5 +1,7 @@
 import os
+from src.utils.sweep import run_commands
 
+commands = []
 epochs = '3000'
 for data in ['telegram/telegram', 'dataset_nodes500_alpha0.08_beta0.2', 'dataset_nodes500_alpha0.1_beta0.2', 'dataset_nodes500_alpha0.05_beta0.2'
             ]:
@@ -15,5 +17,9 @@ for data in ['telegram/telegram', 'dataset_nodes500_alpha0.08_beta0.2', 'dataset
                         +' --lr='+str(lr)
                         +' --epochs='+epochs)
             print(command)
-            os.system(command)
-     
\ No newline at end of file
+            commands.append(command)
+     
+
+# every command runs in a persistent pool of workers instead of its own python process
+if __name__ == "__main__":
+    run_commands(commands)
@@ -1,5 +1,7 @@
 import os, sys
+from src.utils.sweep import run_commands
 
+commands = []
 epochs = '3000'
 for data in [ #'dataset_nodes100_alpha0.1_beta0.2_undirected-percentage0.1_opposite-signFalse_negative-edgesFalse_directedTrue'
      
@@ -34,5 +36,9 @@ for data in [ #'dataset_nodes100_alpha0.1_beta0.2_undirected-percentage0.1_oppos
                             +' -W'
                             +' -B')
                 print(command)
-                os.system(command)
-        
\ No newline at end of file
+                commands.append(command)
+        
+
+# every command runs in a persistent pool of workers instead of its own python process
+if __name__ == "__main__":
+    run_commands(commands)
@@ -1,5 +1,7 @@
 import os, sys
+from src.utils.sweep import run_commands
 
+commands = []
 epochs = '3000'
 for data in [#'telegram',
     #'dataset_nodes500_alpha0.05_beta0.2', 'dataset_nodes500_alpha0.08_beta0.2', 'dataset_nodes500_alpha0.1_beta0.2'  
@@ -23,7 +25,7 @@ for data in [#'telegram',
                             +' --direction'
                             +' --weight_decay=0.0005')
             print(command)
-            os.system(command)
+            commands.append(command)
 
             command = ('python3 src/SSSNET.py ' 
                             +' --dataset='+data
@@ -34,7 +36,7 @@ for data in [#'telegram',
                             #+' --direction'
                             +' --weight_decay=0.0005')
             print(command)
-            os.system(command)
+            commands.append(command)
 
             command = ('python3 src/SSSNET.py ' 
                             +' --dataset='+data
@@ -46,7 +48,7 @@ for data in [#'telegram',
                             +' --weight_decay=0.0005'
                             +' --w_pbrc=1')
             print(command)
-            os.system(command)
+            commands.append(command)
             command = ('python3 src/SSSNET.py ' 
                             +' --dataset='+data
                             +' --num_filter='+str(num_filter)
@@ -57,5 +59,9 @@ for data in [#'telegram',
                             +' --weight_decay=0.0005'
                             +' --w_pbrc=1')
             print(command)
-            os.system(command)
-    
\ No newline at end of file
+            commands.append(command)
+    
+
+# every command runs in a persistent pool of workers instead of its own python process
+if __name__ == "__main__":
+    run_commands(commands)
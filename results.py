@@ -0,0 +1,56 @@
+import json, argparse
+
+from src.utils.results_store import ResultsStore
+from src.utils.sweep import DEFAULT_STORE
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="query and aggregate the sweep results store")
+    parser.add_argument('command', type=str, choices=['list', 'aggregate', 'best'], help='list the trials, aggregate their metrics over the splits, or the best hyperparameters per dataset/method/task')
+    parser.add_argument('--store', type=str, default=DEFAULT_STORE, help='sqlite results store')
+    parser.add_argument('--dataset', type=str, default=None, help='only this dataset')
+    parser.add_argument('--method', type=str, default=None, help='only this method')
+    parser.add_argument('--task', type=str, default=None, help='only this task')
+    parser.add_argument('--status', type=str, default=None, help='only the trials with this status (list)')
+    parser.add_argument('--metric', type=str, default='test_acc', help='the metric of aggregate (all if empty) and best')
+    parser.add_argument('--json', action='store_true', help='print json lines instead of a table')
+    return parser.parse_args()
+
+
+def short_params(params):
+    ignore = ['dataset', 'method_name', 'method', 'task', 'log_path']
+    return ' '.join('%s=%s' % (key, value) for key, value in sorted(params.items()) if key not in ignore)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    store = ResultsStore(args.store)
+
+    if args.command == 'list':
+        rows = store.trials(dataset=args.dataset, method=args.method, task=args.task, status=args.status)
+        for row in rows:
+            if args.json:
+                print(json.dumps(row, default=str))
+                continue
+            timings = ' '.join('%s=%.1fs' % (stage, seconds) for stage, seconds in sorted(row['timings'].items()))
+            memory = ' '.join('%s=%.0fMB' % (stage, peaks['rss_peak'] / 2**20) for stage, peaks in sorted(row['memory'].items())
+                              if peaks['rss_peak'] is not None)
+            print('%-8s %-20s %-12s %-24s %8.1fs rss=%s %s %s | %s' % (row['status'], row['dataset'], row['method'], row['task'],
+                                                                 row['seconds'] or 0.0, row['peak_rss'], timings, memory,
+                                                                 short_params(row['params'])))
+    else:
+        rows = store.aggregate(dataset=args.dataset, method=args.method, task=args.task, metric=args.metric or None)
+        if args.command == 'best':
+            best = {}
+            for row in rows:
+                group = (row['dataset'], row['method'], row['task'], row['metric'])
+                if group not in best or row['mean'] > best[group]['mean']:
+                    best[group] = row
+            rows = list(best.values())
+        for row in rows:
+            if args.json:
+                print(json.dumps(row, default=str))
+                continue
+            print('%-20s %-12s %-24s %-16s %.4f +- %.4f (%d splits) | %s' % (row['dataset'], row['method'], row['task'], row['metric'],
+                                                                       row['mean'], row['std'], row['splits'], short_params(row['params'])))
+    store.close()
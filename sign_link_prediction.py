@@ -15,11 +15,15 @@ from torch_geometric_signed_directed.utils import link_class_split, in_out_degre
 from torch_geometric_signed_directed.data import load_signed_real_data, SignedData
 from torch_geometric_signed_directed.nn.signed import SGCN, SDGNN, SiGAT, SNEA
 #from torch_geometric_signed_directed.utils.signed import link_sign_prediction_logistic_function
-from src.utils.edge_data_new import link_class_split_new
+from src.utils.edge_data_new import link_class_split_new, temporal_link_class_split, graph_changes
 import random
 from scipy.sparse import coo_matrix
 import torch.nn.functional as F
-from src.utils.edge_data import read_edge_list_2
+from src.utils.edge_data import read_edge_list_2, read_edge_list_temporal
+from src.utils.embedding_store import export_embeddings
+from src.utils.instrument import timed, start_run, set_split, end_run, peak_memory
+from src.utils.profiling import EpochProfiler
+from src.utils.negative_sampler import NegativeSampler, NegativeResampler, NEGATIVE_LABELS, held_out_negatives
 
 
 from src.layer.MSGNN import MSGNN_link_prediction
@@ -30,6 +34,7 @@ sys.path.append(os.path.join(os.path.dirname(os.path.realpath(
         __file__)), 'SigMaNet'))
 from src.layer.Signum import SigMaNet_link_prediction_one_laplacian
 from src.layer.src2 import laplacian
+from src.layer.src2.incremental import IncrementalLaplacian
 import argparse
 
 def parameter_parser():
@@ -37,7 +42,12 @@ def parameter_parser():
     parser.add_argument('--dataset', type=str, default='bitcoin_otc')
     parser.add_argument('--epochs', type=int, default=1000)
     parser.add_argument('--lr', type=float, default=1e-2)
-    parser.add_argument('--year', type=int, default=2000)
+    parser.add_argument('--year', type=float, default=0,
+                        help='time of the first test window of --temporal, one year long each, 0 to cut the last --split_prob test fraction of the edges into --runs windows')
+    parser.add_argument('--temporal', action='store_true',
+                        help='chronological splits of the timestamped wikirfa votes, one test window per run, the SigMaNet laplacian of a window being updated from that of the previous one')
+    parser.add_argument('--time_column', type=str, default='year', help='column of the times of the votes of --temporal')
+    parser.add_argument('--history', type=float, default=0, help='years of edges before the validation edges in the graph of --temporal, 0 for all')
 
     parser.add_argument('--split_prob', type=lambda s: [float(item) for item in s.split(',')], default="0.00,0.20", help='random drop for testing/validation/training edges (for 3-class classification only)')
     parser.add_argument('--task', type=str, default='four_class_signed_digraph', help='Task')
@@ -67,6 +77,14 @@ def parameter_parser():
                         help='Number of hops to consider for the random walk.') 
     parser.add_argument('--tau', type=float, default=0.5,
                         help='the regularization parameter when adding self-loops to the positive part of adjacency matrix, i.e. A -> A + tau * I, where I is the identity matrix.')
+    parser.add_argument('--export_embeddings', action='store_true',
+                        help='export the node embeddings of SigMaNet, MSGNN and QuaterGCN to result_arrays_sign/.../embeddings')
+    parser.add_argument('--profile', action='store_true',
+                        help='profile a window of epochs and the laplacian of every split with torch.profiler (traces in result_arrays_sign/.../profile)')
+    parser.add_argument('--profile_schedule', type=lambda s: [int(item) for item in s.split(',')], default="1,1,3,1",
+                        help='wait, warmup, active and repeat epochs of --profile')
+    parser.add_argument('--resample_negatives', type=int, default=0,
+                        help='draw new negative training edges every n epochs in a background thread (MSGNN, SSSNET, SigMaNet and QuaterGCN on the existence, three_class_digraph and five_class_signed_digraph tasks), 0 to keep those of the split')
     return parser.parse_args()
 
 # torch.autograd.detect_anomaly()
@@ -141,16 +159,20 @@ def in_out_degree_2(edge_index:torch.LongTensor, size:int, weight=None) -> torch
 
 def train_MSGNN(X_real, X_img, y, edge_index, edge_weight, query_edges):
     model.train()
-    out = model(X_real, X_img, edge_index=edge_index, 
-                    query_edges=query_edges, 
-                    edge_weight=edge_weight)
+    with timed('forward'):
+        out = model(X_real, X_img, edge_index=edge_index, 
+                        query_edges=query_edges, 
+                        edge_weight=edge_weight)
     loss = criterion(out, y)
     optimizer.zero_grad()
-    loss.backward()
-    optimizer.step()
+    with timed('backward'):
+        loss.backward()
+    with timed('step'):
+        optimizer.step()
     train_acc = metrics.accuracy_score(y.cpu(), out.max(dim=1)[1].cpu())
     return loss.detach().item(), train_acc
 
+@timed('evaluation')
 def test_MSGNN(X_real, X_img, y, edge_index, edge_weight, query_edges):
     model.eval()
     with torch.no_grad():
@@ -170,15 +192,19 @@ def test_MSGNN(X_real, X_img, y, edge_index, edge_weight, query_edges):
 def train_SSSNET(features, edge_index_p, edge_weight_p,
                 edge_index_n, edge_weight_n, query_edges, y):
     model.train()
-    out = model(edge_index_p, edge_weight_p,
-            edge_index_n, edge_weight_n, features, query_edges)
+    with timed('forward'):
+        out = model(edge_index_p, edge_weight_p,
+                edge_index_n, edge_weight_n, features, query_edges)
     loss = criterion(out, y)
     optimizer.zero_grad()
-    loss.backward()
-    optimizer.step()
+    with timed('backward'):
+        loss.backward()
+    with timed('step'):
+        optimizer.step()
     train_acc = metrics.accuracy_score(y.cpu(), out.max(dim=1)[1].cpu())
     return loss.detach().item(), train_acc
 
+@timed('evaluation')
 def test_SSSNET(features, edge_index_p, edge_weight_p,
                 edge_index_n, edge_weight_n, query_edges, y):
     model.eval()
@@ -195,6 +221,7 @@ def test_SSSNET(features, edge_index_p, edge_weight_p,
     #auc_score =  metrics.roc_auc_score(test_y, pred_p[:, 1])
     return test_acc, f1, f1_macro, f1_micro#, auc_score
 
+@timed('evaluation')
 def test(train_X, test_X, train_y, test_y):
     model.eval()
     with torch.no_grad():
@@ -207,22 +234,29 @@ def test(train_X, test_X, train_y, test_y):
 def train():
     model.train()
     optimizer.zero_grad()
-    loss = model.loss()
-    loss.backward()
-    optimizer.step()
+    with timed('forward'):
+        loss = model.loss()
+    with timed('backward'):
+        loss.backward()
+    with timed('step'):
+        optimizer.step()
     return loss.item()
 
 
 def train_QuaterGCN(X_real, X_img_i, X_img_j, X_img_k, y, query_edges):
     model.train()
-    out = model(X_real, X_img_i, X_img_j, X_img_k, query_edges)
+    with timed('forward'):
+        out = model(X_real, X_img_i, X_img_j, X_img_k, query_edges)
     loss = criterion(out, y)
     optimizer.zero_grad()
-    loss.backward()
-    optimizer.step()
+    with timed('backward'):
+        loss.backward()
+    with timed('step'):
+        optimizer.step()
     train_acc = metrics.accuracy_score(y.cpu(), out.max(dim=1)[1].cpu())
     return loss.detach().item(), train_acc
 
+@timed('evaluation')
 def test_QuaterGCN(X_real, X_img_i, X_img_j, X_img_k, y, query_edges):
     model.eval()
     with torch.no_grad():
@@ -240,14 +274,18 @@ def test_QuaterGCN(X_real, X_img_i, X_img_j, X_img_k, y, query_edges):
 
 def train_SigMaNet(X_real, X_img, y, query_edges):
     model.train()
-    out = model(X_real, X_img, query_edges)
+    with timed('forward'):
+        out = model(X_real, X_img, query_edges)
     loss = criterion(out, y)
     optimizer.zero_grad()
-    loss.backward()
-    optimizer.step()
+    with timed('backward'):
+        loss.backward()
+    with timed('step'):
+        optimizer.step()
     train_acc = metrics.accuracy_score(y.cpu(), out.max(dim=1)[1].cpu())
     return loss.detach().item(), train_acc
 
+@timed('evaluation')
 def test_SigMaNet(X_real, X_img, y, query_edges):
     model.eval()
     with torch.no_grad():
@@ -268,10 +306,15 @@ device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
 assert args.method in ['SSSNET', 'SigMaNet', 'MSGNN', 'QuaterGCN', 'SGCN', 'SDGNN', 'SiGAT', 'SNEA'], 'Method not implemented'
 # Download Dataset
 
-if args.dataset in ['bitcoin_alpha', 'bitcoin_otc', 'slashdot', 'epinions']:
-    data = load_signed_real_data(dataset=args.dataset).to(device)
-else:
-    data = read_edge_list_2(path = f"./data/wikirfa/edges.csv")
+with timed('dataset'):
+    if args.temporal:
+        # the signed datasets of torch_geometric_signed_directed have no timestamps
+        assert args.dataset not in ['bitcoin_alpha', 'bitcoin_otc', 'slashdot', 'epinions'], 'No edge times in %s for --temporal' % args.dataset
+        data = read_edge_list_temporal(path = f"./data/wikirfa/edges.csv", time_column=args.time_column)
+    elif args.dataset in ['bitcoin_alpha', 'bitcoin_otc', 'slashdot', 'epinions']:
+        data = load_signed_real_data(dataset=args.dataset).to(device)
+    else:
+        data = read_edge_list_2(path = f"./data/wikirfa/edges.csv")
 
 sub_dir_name = 'runs' + str(args.runs) + 'epochs' + str(args.epochs) + \
        '1000lr' + str(int(1000*args.lr)) + '1000weight_decay' + \
@@ -302,8 +345,21 @@ save_data_path_dir = os.path.join(os.path.dirname(os.path.realpath(
         __file__)), '../result_arrays', args.dataset)
 save_data_path = os.path.join(save_data_path_dir, 'link_sign' + str(device) + 'seed' + str(args.seed) + 'split' + str(args.runs) + '.pt')
 
+dir_name = os.path.join(os.path.dirname(os.path.realpath(
+        __file__)), './result_arrays_sign/'+ args.dataset)
+# the stages timed below are written next to the result arrays
+start_run(os.path.join(dir_name, sub_dir_name, args.method), args)
+
 
-link_data =  link_class_split_new(data, prob_val=args.split_prob[0], prob_test=args.split_prob[1], splits = args.runs, task = args.task)
+assert args.resample_negatives == 0 or (args.task in NEGATIVE_LABELS and args.method in ['MSGNN', 'SSSNET', 'SigMaNet', 'QuaterGCN']), \
+    'The negative edges of %s on the task %s cannot be resampled' % (args.method, args.task)
+if args.temporal:
+    link_data = temporal_link_class_split(data, prob_val=args.split_prob[0], prob_test=args.split_prob[1], windows=args.runs, task=args.task,
+                                          start=args.year or None, window=1.0, history=args.history or None, seed=args.seed)
+else:
+    link_data =  link_class_split_new(data, prob_val=args.split_prob[0], prob_test=args.split_prob[1], splits = args.runs, task = args.task)
+# the splits that run (the temporal windows may be fewer than args.runs), whose rows of res_array are kept by a sweep
+args.splits = list(link_data.keys())
 
 nodes_num = data.num_nodes
 in_dim = args.in_dim
@@ -313,6 +369,9 @@ criterion = nn.NLLLoss()
 start = time.time()
 res_array = np.zeros((args.runs, 4))
 for split in list(link_data.keys()):
+    set_split(split)
+    profiler = EpochProfiler(os.path.join(os.path.dirname(os.path.realpath(__file__)), './result_arrays_sign/'+ args.dataset,
+                                          sub_dir_name, args.method, 'profile', suffix, 'split'+str(split)), args.profile_schedule, args.profile)
     edge_index = link_data[split]['graph']
     edge_weight = link_data[split]['weights']
 
@@ -342,14 +401,24 @@ for split in list(link_data.keys()):
         data1 = SignedData(edge_index=edge_index, edge_weight=edge_weight).to(device)
         data1.separate_positive_negative()
     elif args.method == 'SigMaNet':
-        edge_index, norm_real, norm_imag = laplacian.process_magnetic_laplacian(edge_index=edge_index, gcn=False, net_flow=True, x_real=X_real, edge_weight=edge_weight, \
-         normalization = 'sym', return_lambda_max = False)
+        with profiler.region('laplacian'), timed('laplacian'):
+            if not args.temporal:
+                edge_index, norm_real, norm_imag = laplacian.process_magnetic_laplacian(edge_index=edge_index, gcn=False, net_flow=True, x_real=X_real, edge_weight=edge_weight, \
+                 normalization = 'sym', return_lambda_max = False)
+            else:
+                # the graph of a window is that of the previous one with the edges in between
+                if split == 0:
+                    incremental = IncrementalLaplacian(edge_index, edge_weight, nodes_num, gcn=False, net_flow=True)
+                else:
+                    incremental.update(*graph_changes(link_data[split-1], link_data[split]))
+                edge_index, norm_real, norm_imag = incremental.laplacian(X_real.dtype, device)
         model = SigMaNet_link_prediction_one_laplacian(K=1, num_features=num_input_feat, hidden=args.hidden, label_dim=args.num_classes,
                             i_complex = False,  layer=args.num_layers, follow_math=False, gcn =False, net_flow=True, unwind = True, edge_index=edge_index,\
                             norm_real=norm_real, norm_imag=norm_imag,  dropout=args.dropout).to(device)
     elif args.method == 'QuaterGCN':
-        edge_index, norm_real, norm_imag_i, norm_imag_j, norm_imag_k  = quaternion_laplacian.process_quaternion_laplacian(edge_index=edge_index, x_real=X_real, edge_weight=edge_weight, \
-         normalization = 'sym', return_lambda_max = False)
+        with profiler.region('laplacian'), timed('laplacian'):
+            edge_index, norm_real, norm_imag_i, norm_imag_j, norm_imag_k  = quaternion_laplacian.process_quaternion_laplacian(edge_index=edge_index, x_real=X_real, edge_weight=edge_weight, \
+             normalization = 'sym', return_lambda_max = False)
         model = QuaNet_link_prediction_one_laplacian(K=args.K, num_features=num_input_feat, hidden=args.hidden, label_dim=args.num_classes,
                             layer=args.num_layers, unwind = True, edge_index=edge_index,\
                             norm_real=norm_real, norm_imag_i=norm_imag_i, norm_imag_j=norm_imag_j, norm_imag_k=norm_imag_k, \
@@ -362,9 +431,23 @@ for split in list(link_data.keys()):
 
     query_test_edges = link_data[split]['test']['edges']
     y_test = link_data[split]['test']['label']  
+    resampler = None
+    if args.resample_negatives > 0:
+        held_out = held_out_negatives(link_data[split], NEGATIVE_LABELS[args.task])
+        graph = data.edge_index
+        if args.temporal:
+            # the graph of a window only holds the past edges: the later edges of its validation and test sets are held out
+            graph = edge_index.cpu()
+            held_out = torch.cat([held_out] + [link_data[split][name]['edges'].cpu().T for name in ['val', 'test']], dim=1)
+        resampler = NegativeResampler(NegativeSampler(graph, nodes_num, seed=args.seed + split, held_out=held_out), query_edges, y,
+                                      NEGATIVE_LABELS[args.task], args.resample_negatives)
+    profiler.start()
     if args.method == 'MSGNN':
         for epoch in range(args.epochs):
+            if resampler is not None:
+                query_edges, y = resampler.training_set(epoch)
             train_loss, train_acc = train_MSGNN(X_real, X_img, y, edge_index, edge_weight, query_edges)
+            profiler.step()
             #print(f'Split: {split:02d}, Epoch: {epoch:03d}, Train_Loss: {train_loss:.4f}, Train_Acc: {train_acc:.4f}')
             #best_run(train_loss, best_traion_err, log_path, early_stopping):
 
@@ -375,8 +458,11 @@ for split in list(link_data.keys()):
         #    F1 micro: {f1_micro:.4f}, AUC: {auc:.4f}')
     elif args.method == 'SSSNET':
         for epoch in range(args.epochs):
+            if resampler is not None:
+                query_edges, y = resampler.training_set(epoch)
             train_loss, train_acc = train_SSSNET(X_real, data1.edge_index_p, data1.edge_weight_p,
                                         data1.edge_index_n, data1.edge_weight_n, query_edges, y)
+            profiler.step()
             #print(f'Split: {split:02d}, Epoch: {epoch:03d}, Train_Loss: {train_loss:.4f}, Train_Acc: {train_acc:.4f}')
             #writer.add_scalar('train_loss_'+str(split), train_loss, epoch)
 
@@ -386,7 +472,10 @@ for split in list(link_data.keys()):
         #    F1 micro: {f1_micro:.4f}, AUC: {auc:.4f}')
     elif args.method == 'SigMaNet':
         for epoch in range(args.epochs):
+            if resampler is not None:
+                query_edges, y = resampler.training_set(epoch)
             train_loss, train_acc = train_SigMaNet(X_real, X_img, y, query_edges)
+            profiler.step()
             #print(f'Split: {split:02d}, Epoch: {epoch:03d}, Train_Loss: {train_loss:.4f}, Train_Acc: {train_acc:.4f}')
             #writer.add_scalar('train_loss_'+str(split), train_loss, epoch)
 
@@ -395,7 +484,10 @@ for split in list(link_data.keys()):
         #    F1 micro: {f1_micro:.4f}, AUC: {auc:.4f}')
     elif args.method == 'QuaterGCN':
         for epoch in range(args.epochs):
+            if resampler is not None:
+                query_edges, y = resampler.training_set(epoch)
             train_loss, train_acc = train_QuaterGCN(X_real, X_img_i, X_img_j, X_img_k, y, query_edges)
+            profiler.step()
             #print(f'Split: {split:02d}, Epoch: {epoch:03d}, Train_Loss: {train_loss:.4f}, Train_Acc: {train_acc:.4f}')
             #writer.add_scalar('train_loss_'+str(split), train_loss, epoch)
 
@@ -405,20 +497,35 @@ for split in list(link_data.keys()):
     else:
         for epoch in range(args.epochs):
             loss = train()
+            profiler.step()
             #print(f'Split: {split:02d}, Epoch: {epoch:03d}, Loss: {loss:.4f}.')
             #writer.add_scalar('train_loss_'+str(split), loss, epoch)
         f1,  f1_macro, f1_micro, accuracy = test(query_edges.cpu(), query_test_edges.cpu(), y.cpu(), y_test.cpu())
         #print(f'Split: {split:02d}, '
         #    f'AUC: {auc:.4f}, F1: {f1:.4f}, MacroF1: {f1_macro:.4f}, MicroF1: {f1_micro:.4f}')
+    profiler.stop()
+    if resampler is not None:
+        resampler.close()
     res_array[split] = [accuracy, f1, f1_macro, f1_micro]
+    if args.export_embeddings and args.method in ['SigMaNet', 'MSGNN', 'QuaterGCN']:
+        model.eval()
+        with torch.no_grad():
+            if args.method == 'MSGNN':
+                embeddings = model.embed(X_real, X_img, edge_index, edge_weight)
+            elif args.method == 'SigMaNet':
+                embeddings = model.embed(X_real, X_img)
+            else:
+                embeddings = model.embed(X_real, X_img_i, X_img_j, X_img_k)
+        export_embeddings(os.path.join(os.path.dirname(os.path.realpath(__file__)), './result_arrays_sign/'+ args.dataset,
+                                       sub_dir_name, args.method, 'embeddings', suffix, 'split'+str(split)), embeddings, model,
+                          names=('real', 'imag_i', 'imag_j', 'imag_k') if args.method == 'QuaterGCN' else None,
+                          meta={'dataset': args.dataset, 'task': args.task, 'split': split, 'args': vars(args)})
 end = time.time()
-memory_usage = torch.cuda.max_memory_allocated(device)*1e-6
+# the peak of the CUDA allocator when CUDA is used, of the resident size of the process otherwise
+memory_usage = peak_memory()*1e-6
 print("Average Accuracy, F1, MacroF1 and MicroF1: {}".format(res_array.mean(0)))
 print("{}'s total training and testing time: {}s, memory usage: {}M.".format(args.method, end-start, memory_usage))
 
-dir_name = os.path.join(os.path.dirname(os.path.realpath(
-        __file__)), './result_arrays_sign/'+ args.dataset)
-
 
 if os.path.isdir(os.path.join(dir_name, sub_dir_name, args.method)) == False:
     try:
@@ -428,4 +535,5 @@ if os.path.isdir(os.path.join(dir_name, sub_dir_name, args.method)) == False:
         print('Folder exists for {}!'.format(sub_dir_name, args.method))
 #print(os.path.join(dir_name, sub_dir_name, args.method))
 np.save(os.path.join(dir_name, sub_dir_name, args.method, suffix), res_array)
-np.save(os.path.join(dir_name, sub_dir_name, args.method, 'memory/runtime_memory_' + suffix), np.array([end-start, memory_usage]))
\ No newline at end of file
+np.save(os.path.join(dir_name, sub_dir_name, args.method, 'memory/runtime_memory_' + suffix), np.array([end-start, memory_usage]))
+end_run()
\ No newline at end of file
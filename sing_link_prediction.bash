@@ -1,5 +1,7 @@
 #!/bin/bash
 
+commands=()
+
 epochs=('300' '500' '1000')
 datasets=(
     'bitcoin_alpha' 'bitcoin_otc' 'slashdot' 'epinions'
@@ -18,17 +20,19 @@ for epochs in "${epochs[@]}"; do
         for q in "${q_values[@]}"; do
             command=("python3 sign_link_prediction.py --dataset=$data --num_classes=$num_classes --q=$q --hidden=$num_filters --task=$task --K=2 --num_layers=2 --epochs=$epochs --dropout=0.5 --lr=$lr --method=MSGNN")
             echo "${command}"
-            $command
+            commands+=("${command}")
         done
 
 # SigMaNet
         command=("python3 sign_link_prediction.py --dataset=$data --task=$task --num_classes=$num_classes --hidden=$num_filters --K=1 --num_layers=2 --epochs=$epochs --dropout=0.5 --lr=$lr --method=SigMaNet")
         echo "${command}"
-        $command
-
+        commands+=("${command}")
 # QuaterGCN
         command=("python3 sign_link_prediction.py --dataset=$data --task=$task  --num_classes=$num_classes --hidden=$num_filters --K=1 --num_layers=2 --epochs=$epochs --dropout=0.5 --lr=$lr")
         echo "${command}"
-        $command
+        commands+=("${command}")
     done
-done
\ No newline at end of file
+done
+
+# all the commands run in a persistent pool of workers instead of one python process each
+printf '%s\n' "${commands[@]}" | python3 sweep.py --commands -
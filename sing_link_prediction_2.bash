@@ -1,5 +1,7 @@
 #!/bin/bash
 
+commands=()
+
 epochs=('300' '500' '1000')
 epochs_1='300'
 datasets=(
@@ -16,7 +18,7 @@ for epochs in "${epochs[@]}"; do
     #SGCN
         command=("python3 sign_link_prediction.py --dataset=$data --task=$task --num_classes=$num_classes --num_layers=2 --epochs=$epochs --dropout=0.5 --lr=$lr --method SGCN")
         echo "${command}"
-        $command
+        commands+=("${command}")
     done
 done
 
@@ -25,7 +27,9 @@ for epochs in "${epochs[@]}"; do
     # SDGNN
         command=("python3 sign_link_prediction.py --dataset=$data --task=$task --num_classes=$num_classes --num_layers=2 --epochs=$epochs_1 --dropout=0.5 --lr=$lr --method SDGNN")
         echo "${command}"
-        $command
+        commands+=("${command}")
     done
 done
 
+# all the commands run in a persistent pool of workers instead of one python process each
+printf '%s\n' "${commands[@]}" | python3 sweep.py --commands -
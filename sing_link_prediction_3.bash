@@ -1,5 +1,7 @@
 #!/bin/bash
 
+commands=()
+
 epochs=('300' '500' '1000')
 datasets=(
     'bitcoin_alpha' 'bitcoin_otc' 
@@ -15,11 +17,11 @@ for epochs in "${epochs[@]}"; do
     # SSSNET
         command=("python3 sign_link_prediction.py --dataset=$data --task=$task --num_classes=$num_classes --hidden=64 --K=1 --num_layers=2 --epochs=$epochs --dropout=0.5 --lr=$lr --method SSSNET")
         echo "${command}"
-        $command
+        commands+=("${command}")
 # SNEA
         command=("python3 sign_link_prediction.py --dataset=$data --task=$task --num_classes=$num_classes --num_layers=2 --epochs=$epochs --dropout=0.5 --lr=$lr --method SNEA")
         echo "${command}"
-        $command
+        commands+=("${command}")
     done
 done
 
@@ -29,6 +31,9 @@ for epochs in "${epochs[@]}"; do
 # SiGAT
         command=("python3 sign_link_prediction.py --dataset=$data --task=$task --num_classes=$num_classes--num_layers=2 --epochs=$epochs --dropout=0.5 --lr=$lr --method SiGAT")
         echo "${command}"
-        $command
+        commands+=("${command}")
     done
 done
+
+# all the commands run in a persistent pool of workers instead of one python process each
+printf '%s\n' "${commands[@]}" | python3 sweep.py --commands -
@@ -22,6 +22,9 @@ from utils.edge_data import in_out_degree,  load_signed_real_data_no_negative
 from utils.save_settings import write_log
 from torch_geometric.utils import to_undirected
 from utils.edge_data_new import link_class_split_new
+from utils.link_inference import evaluate_query_sets
+from utils.checkpoint import CheckpointManager
+from utils.instrument import timed, start_run, set_split, end_run
 
 
 # select cuda device if available
@@ -112,23 +115,26 @@ def main(args):
 
     if os.path.isdir(log_path) == False:
         os.makedirs(log_path)
+    checkpoints = CheckpointManager(log_path)
+    start_run(log_path, args)
     
     
     dataset_name = args.dataset.split('/')
-    if len(dataset_name) == 1:
-        if args.dataset in ['bitcoin_alpha', 'bitcoin_otc']:
-            data = load_signed_real_data_no_negative(dataset=args.dataset).to(device)
+    with timed('dataset'):
+        if len(dataset_name) == 1:
+            if args.dataset in ['bitcoin_alpha', 'bitcoin_otc']:
+                data = load_signed_real_data_no_negative(dataset=args.dataset).to(device)
+            else:
+                try:
+                    data = pk.load(open(f'./data/fake/{args.dataset}.pk','rb'))
+                except:
+                    data = pk.load(open(f'./data/fake_for_quaternion_new/{args.dataset}.pk','rb'))
+                data = data.to(device)
+            subset = args.dataset
         else:
-            try:
-                data = pk.load(open(f'./data/fake/{args.dataset}.pk','rb'))
-            except:
-                data = pk.load(open(f'./data/fake_for_quaternion_new/{args.dataset}.pk','rb'))
-            data = data.to(device)
-        subset = args.dataset
-    else:
-        load_func, subset = args.dataset.split('/')[0], args.dataset.split('/')[1]
-     #save_name = args.method_name + '_' + 'Layer' + str(args.layer) + '_' + 'lr' + str(args.lr) + 'num_filters' + str(int(args.num_filter))+ '_' + 'task' + str((args.task))
-        data = load_directed_real_data(dataset=dataset_name[0], name=dataset_name[1]).to(device)
+            load_func, subset = args.dataset.split('/')[0], args.dataset.split('/')[1]
+         #save_name = args.method_name + '_' + 'Layer' + str(args.layer) + '_' + 'lr' + str(args.lr) + 'num_filters' + str(int(args.num_filter))+ '_' + 'task' + str((args.task))
+            data = load_directed_real_data(dataset=dataset_name[0], name=dataset_name[1]).to(device)
     edge_index = data.edge_index
 
 
@@ -147,6 +153,7 @@ def main(args):
     #else:
     #    results = np.zeros((10, 4, 5))
     for i in range(10):
+        set_split(i)
         log_str_full = ''
         edges = datasets[i]['graph']
         edge_weight = datasets[i]['weights']
@@ -164,8 +171,9 @@ def main(args):
         edge_weight = edge_weight.to(device)
 
        
-        features = quaternion_preprocess_features(X_real).to(device)
-        adj = sparse_mx_to_torch_sparse_tensor(normalize_adj(edges, edge_weight, X_real).tocoo()).to(device)
+        with timed('laplacian'):
+            features = quaternion_preprocess_features(X_real).to(device)
+            adj = sparse_mx_to_torch_sparse_tensor(normalize_adj(edges, edge_weight, X_real).tocoo()).to(device)
 
         model = QGNN_Link(nfeat=X_real.size(-1)*4, nhid=args.num_filter, nclass=args.num_class_link, dropout=args.dropout).to(device)
         #model = nn.DataParallel(graphmodel)
@@ -196,28 +204,31 @@ def main(args):
             ####################
             train_loss, train_acc = 0.0, 0.0
             model.train()
-            out = model(features, adj, train_index)
+            with timed('forward'):
+                out = model(features, adj, train_index)
 
             train_loss =  F.nll_loss(out, y_train)
             pred_label = out.max(dim = 1)[1]            
             train_acc  = acc(pred_label, y_train)
             
             opt.zero_grad()
-            train_loss.backward()
-            opt.step()
+            with timed('backward'):
+                train_loss.backward()
+            with timed('step'):
+                opt.step()
             outstrtrain = 'Train loss: %.6f, acc: %.3f' % (train_loss.detach().item(), train_acc)
             
             ####################
             # Validation
             ####################
             train_loss, train_acc = 0.0, 0.0
-            model.eval()
-            out = model(features, adj, val_index)
+            with timed('evaluation'):
+                out, = evaluate_query_sets(model, lambda q: model(features, adj, q), [val_index])
 
 
-            test_loss  = F.nll_loss(out, y_val)
-            pred_label = out.max(dim = 1)[1]            
-            test_acc   = acc(pred_label, y_val)
+                test_loss  = F.nll_loss(out, y_val)
+                pred_label = out.max(dim = 1)[1]            
+                test_acc   = acc(pred_label, y_val)
 
             outstrval = ' Test loss: %.6f, acc: %.3f' % (test_loss.detach().item(), test_acc)            
             duration = "--- %.4f seconds ---" % (time.time() - start_time)
@@ -232,33 +243,31 @@ def main(args):
             if save_perform <= best_test_err:
                 early_stopping = 0
                 best_test_err = save_perform
-                torch.save(model.state_dict(), log_path + '/model'+str(i)+'.t7')
+                checkpoints.update('model'+str(i), model)
             else:
                 early_stopping += 1
         write_log(vars(args), log_path)
-        torch.save(model.state_dict(), log_path + '/model_latest'+str(i)+'.t7')
+        checkpoints.update('model_latest'+str(i), model)
         #if args.task == 'existence':
         ####################
         # Testing
         ####################
-        model.load_state_dict(torch.load(log_path + '/model'+str(i)+'.t7'))
-        model.eval()
-        out = model(features, adj, val_index)
-        pred_label = out.max(dim = 1)[1]
-        val_acc = acc(pred_label, y_val)
-        out = model(features, adj, test_index)
-        pred_label = out.max(dim = 1)[1]
-        test_acc = acc(pred_label, y_test)
+        checkpoints.persist()
+        with timed('evaluation'):
+            checkpoints.load('model'+str(i), model)
+            out_val, out_test = evaluate_query_sets(model, lambda q: model(features, adj, q), [val_index, test_index])
+            pred_label = out_val.max(dim = 1)[1]
+            val_acc = acc(pred_label, y_val)
+            pred_label = out_test.max(dim = 1)[1]
+            test_acc = acc(pred_label, y_test)
     
-        model.load_state_dict(torch.load(log_path + '/model_latest'+str(i)+'.t7'))
-        model.eval()
-        out =model(features, adj, val_index)
-        pred_label = out.max(dim = 1)[1]
-        val_acc_latest = acc(pred_label, y_val)
+            checkpoints.load('model_latest'+str(i), model)
+            out_val, out_test = evaluate_query_sets(model, lambda q: model(features, adj, q), [val_index, test_index])
+            pred_label = out_val.max(dim = 1)[1]
+            val_acc_latest = acc(pred_label, y_val)
     
-        out = model(features, adj, test_index)
-        pred_label = out.max(dim = 1)[1]
-        test_acc_latest = acc(pred_label, y_test)
+            pred_label = out_test.max(dim = 1)[1]
+            test_acc_latest = acc(pred_label, y_test)
         ####################
         # Save testing results
         ####################
@@ -274,7 +283,10 @@ def main(args):
         with open(log_path + '/log'+str(i)+'.csv', 'w') as file:
             file.write(log_str_full)
             file.write('\n')
+        checkpoints.clear()
         torch.cuda.empty_cache()
+    end_run()
+    checkpoints.close()
     return results
 
 if __name__ == "__main__":
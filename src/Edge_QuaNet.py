@@ -19,6 +19,12 @@ from layer.src2 import quaternion_laplacian
 from utils.edge_data import link_class_split, in_out_degree, load_signed_real_data_no_negative, load_signed_real_data_also_negative
 from utils.edge_data_new import link_class_split_new
 from utils.save_settings import write_log
+from utils.embedding_store import export_embeddings
+from utils.link_inference import decode_query_sets
+from utils.checkpoint import CheckpointManager
+from utils.instrument import timed, start_run, set_split, end_run
+from utils.profiling import EpochProfiler
+from utils.negative_sampler import NegativeSampler, NegativeResampler, NEGATIVE_LABELS, held_out_negatives
 
 # select cuda device if available
 cuda_device = 0
@@ -54,6 +60,10 @@ def parse_args():
     parser.add_argument('--l2', type=float, default=5e-4, help='l2 regularizer')
     parser.add_argument('--noisy',  action='store_true')
     parser.add_argument('--randomseed', type=int, default=0, help='if set random seed in training')
+    parser.add_argument('--export_embeddings', action='store_true', help='export the node embeddings of the best model to log_path/embeddings')
+    parser.add_argument('--profile', action='store_true', help='profile a window of epochs and the laplacian of every split with torch.profiler (traces in log_path/profile)')
+    parser.add_argument('--profile_schedule', type=lambda s: [int(item) for item in s.split(',')], default="1,1,3,1", help='wait, warmup, active and repeat epochs of --profile')
+    parser.add_argument('--resample_negatives', type=int, default=0, help='draw new negative training edges every n epochs in a background thread (existence, three_class_digraph and five_class_signed_digraph tasks), 0 to keep those of the split')
 
 
     return parser.parse_args()
@@ -89,12 +99,16 @@ def main(args):
     if os.path.isdir(log_path) == False:
         os.makedirs(log_path)
     
+    checkpoints = CheckpointManager(log_path)
+    start_run(log_path, args)
+    
     
     dataset_name = args.dataset.split('/')
-    if len(dataset_name) == 1:
-        data = load_directed_real_data(dataset=dataset_name[0], name=dataset_name[0])
-    else:
-        data = load_directed_real_data(dataset=dataset_name[0], name=dataset_name[1])
+    with timed('dataset'):
+        if len(dataset_name) == 1:
+            data = load_directed_real_data(dataset=dataset_name[0], name=dataset_name[0])
+        else:
+            data = load_directed_real_data(dataset=dataset_name[0], name=dataset_name[1])
     # if args.dataset in ['telegram']:
     #     data = load_directed_real_data(dataset=dataset_name[0], name=dataset_name[0]).to(device)
     #     data = data.to(device)
@@ -119,6 +133,7 @@ def main(args):
         
     size = torch.max(edge_index).item()+1
     data.num_nodes = size
+    assert args.resample_negatives == 0 or args.task in NEGATIVE_LABELS, 'The task %s has no negative edges to resample' % args.task
     # save_file = args.data_path + args.dataset + '/' + subset
     #datasets = link_class_split(data, prob_val=args.split_prob[0], prob_test=args.split_prob[1], splits = 1, task = args.task, noisy = args.noisy)
     datasets = link_class_split_new(data, prob_val=args.split_prob[0], prob_test=args.split_prob[1], splits = 10, task = args.task)
@@ -131,6 +146,8 @@ def main(args):
     #print('-------------------------------------------------------')
     #print('Sono pronto a partire con il training')
     for i in range(10):
+        set_split(i)
+        profiler = EpochProfiler(os.path.join(log_path, 'profile', 'split'+str(i)), args.profile_schedule, args.profile)
         log_str_full = ''
 
         ########################################
@@ -158,8 +175,9 @@ def main(args):
         ########################################
 
 
-        edge_index, norm_real, norm_imag_i, norm_imag_j, norm_imag_k  = quaternion_laplacian.process_quaternion_laplacian(edge_index=edge_index, x_real=X_real, edge_weight=edge_weight, \
-         normalization = 'sym', return_lambda_max = False)
+        with profiler.region('laplacian'), timed('laplacian'):
+            edge_index, norm_real, norm_imag_i, norm_imag_j, norm_imag_k  = quaternion_laplacian.process_quaternion_laplacian(edge_index=edge_index, x_real=X_real, edge_weight=edge_weight, \
+             normalization = 'sym', return_lambda_max = False)
         model = QuaNet_link_prediction_one_laplacian(K=args.K, num_features=2, hidden=args.num_filter, label_dim=args.num_class_link,
                             layer=args.layer, unwind = True, edge_index=edge_index,\
                             norm_real=norm_real, norm_imag_i=norm_imag_i, norm_imag_j=norm_imag_j, norm_imag_k=norm_imag_k, \
@@ -187,37 +205,48 @@ def main(args):
         best_test_err = 1000.0
         best_test_acc = 0.0
         early_stopping = 0
+        resampler = None
+        if args.resample_negatives > 0:
+            held_out = held_out_negatives(datasets[i], NEGATIVE_LABELS[args.task])
+            resampler = NegativeResampler(NegativeSampler(data.edge_index, size, seed=args.randomseed + i, held_out=held_out), train_index, y_train,
+                                          NEGATIVE_LABELS[args.task], args.resample_negatives)
+        profiler.start()
         for epoch in range(args.epochs):
             start_time = time.time()
             if early_stopping > 500:
                 break
+            if resampler is not None:
+                train_index, y_train = resampler.training_set(epoch)
             ####################
             # Train
             ####################
             train_loss, train_acc = 0.0, 0.0
             model.train()
         
-            out = model(X_real, X_img_i, X_img_j, X_img_k, train_index)
+            with timed('forward'):
+                out = model(X_real, X_img_i, X_img_j, X_img_k, train_index)
 
             train_loss = F.nll_loss(out, y_train)
             pred_label = out.max(dim = 1)[1]            
             train_acc  = acc(pred_label, y_train)
             
             opt.zero_grad()
-            train_loss.backward()
-            opt.step()
+            with timed('backward'):
+                train_loss.backward()
+            with timed('step'):
+                opt.step()
             outstrtrain = 'Train loss: %.6f, acc: %.3f' % (train_loss.detach().item(), train_acc)
             
             ####################
             # Validation
             ####################
             train_loss, train_acc = 0.0, 0.0
-            model.eval()
-            out = model(X_real, X_img_i, X_img_j, X_img_k,  val_index)
+            with timed('evaluation'):
+                out, = decode_query_sets(model, lambda: model.embed(X_real, X_img_i, X_img_j, X_img_k), [val_index])
 
-            test_loss  = F.nll_loss(out, y_val)
-            pred_label = out.max(dim = 1)[1]            
-            test_acc   = acc(pred_label, y_val)
+                test_loss  = F.nll_loss(out, y_val)
+                pred_label = out.max(dim = 1)[1]            
+                test_acc   = acc(pred_label, y_val)
 
             outstrval = ' Test loss: %.6f, acc: %.3f' % (test_loss.detach().item(), test_acc)            
             duration = "--- %.4f seconds ---" % (time.time() - start_time)
@@ -232,56 +261,62 @@ def main(args):
             if save_perform_err <= best_test_err:
                 early_stopping = 0
                 best_test_err = save_perform_err
-                torch.save(model.state_dict(), log_path + '/model_err'+str(i)+'.t7')
+                checkpoints.update('model_err'+str(i), model)
             if save_perform_acc >= best_test_acc:
                 #early_stopping = 0
                 best_test_acc = save_perform_acc
-                torch.save(model.state_dict(), log_path + '/model_acc'+str(i)+'.t7')
+                checkpoints.update('model_acc'+str(i), model)
             else:
                 early_stopping += 0
-        torch.save(model.state_dict(), log_path + '/model_latest'+str(i)+'.t7')
+            profiler.step()
+        profiler.stop()
+        if resampler is not None:
+            resampler.close()
+        checkpoints.update('model_latest'+str(i), model)
         write_log(vars(args), log_path)
 
         #if args.task == 'existence':
             ####################
             # Testing
             ####################
-        model.load_state_dict(torch.load(log_path + '/model_err'+str(i)+'.t7'))
-        model.eval()
-        out = model(X_real, X_img_i, X_img_j, X_img_k, val_index)
-        pred_label = out.max(dim = 1)[1]
-        val_err = acc(pred_label, y_val)
-        out = model(X_real, X_img_i, X_img_j, X_img_k, test_index)
-        pred_label = out.max(dim = 1)[1]
-        test_err = acc(pred_label, y_test)
-
-        model.load_state_dict(torch.load(log_path + '/model_acc'+str(i)+'.t7'))
-        model.eval()
-        out = model(X_real, X_img_i, X_img_j, X_img_k, val_index)
-        pred_label = out.max(dim = 1)[1]
-        val_acc_err = acc(pred_label, y_val)
-        out = model(X_real, X_img_i, X_img_j, X_img_k, test_index)
-        pred_label = out.max(dim = 1)[1]
-        test_acc_err = acc(pred_label, y_test)
-        #print('loss', test_err)
-        #print('accuracy', test_acc_err)
-        #if test_err >= test_acc_err:
-        test_acc = test_err
-        val_acc = val_err
-        #else:
-        #    test_acc = test_acc_err
-        #    val_acc = val_acc_err
+        checkpoints.persist()
+        with timed('evaluation'):
+            checkpoints.load('model_err'+str(i), model)
+            if args.export_embeddings:
+                model.eval()
+                with torch.no_grad():
+                    export_embeddings(os.path.join(log_path, 'embeddings', 'split'+str(i)), model.embed(X_real, X_img_i, X_img_j, X_img_k), model,
+                                      names=('real', 'imag_i', 'imag_j', 'imag_k'),
+                                      meta={'dataset': args.dataset, 'task': args.task, 'split': i, 'checkpoint': 'model_err'+str(i)+'.t7'})
+            out_val, out_test = decode_query_sets(model, lambda: model.embed(X_real, X_img_i, X_img_j, X_img_k), [val_index, test_index])
+            pred_label = out_val.max(dim = 1)[1]
+            val_err = acc(pred_label, y_val)
+            pred_label = out_test.max(dim = 1)[1]
+            test_err = acc(pred_label, y_test)
+
+            checkpoints.load('model_acc'+str(i), model)
+            out_val, out_test = decode_query_sets(model, lambda: model.embed(X_real, X_img_i, X_img_j, X_img_k), [val_index, test_index])
+            pred_label = out_val.max(dim = 1)[1]
+            val_acc_err = acc(pred_label, y_val)
+            pred_label = out_test.max(dim = 1)[1]
+            test_acc_err = acc(pred_label, y_test)
+            #print('loss', test_err)
+            #print('accuracy', test_acc_err)
+            #if test_err >= test_acc_err:
+            test_acc = test_err
+            val_acc = val_err
+            #else:
+            #    test_acc = test_acc_err
+            #    val_acc = val_acc_err
 
    
-        model.load_state_dict(torch.load(log_path + '/model_latest'+str(i)+'.t7'))
-        model.eval()
-        out = model(X_real, X_img_i, X_img_j, X_img_k, val_index)
-        pred_label = out.max(dim = 1)[1]
-        val_acc_latest = acc(pred_label, y_val)
+            checkpoints.load('model_latest'+str(i), model)
+            out_val, out_test = decode_query_sets(model, lambda: model.embed(X_real, X_img_i, X_img_j, X_img_k), [val_index, test_index])
+            pred_label = out_val.max(dim = 1)[1]
+            val_acc_latest = acc(pred_label, y_val)
     
-        out = model(X_real, X_img_i, X_img_j, X_img_k, test_index)
-        pred_label = out.max(dim = 1)[1]
-        test_acc_latest = acc(pred_label, y_test)
+            pred_label = out_test.max(dim = 1)[1]
+            test_acc_latest = acc(pred_label, y_test)
         ####################
         # Save testing results
         ####################
@@ -343,8 +378,11 @@ def main(args):
         with open(log_path + '/log'+str(i)+'.csv', 'w') as file:
             file.write(log_str_full)
             file.write('\n')
+        checkpoints.clear()
         torch.cuda.empty_cache()
 
+    end_run()
+    checkpoints.close()
     return results
 
 if __name__ == "__main__":
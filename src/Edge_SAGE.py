@@ -17,6 +17,9 @@ from layer.geometric_baselines import *
 from utils.edge_data import in_out_degree, load_signed_real_data_no_negative
 from utils.save_settings import write_log
 from utils.edge_data_new import link_class_split_new
+from utils.link_inference import evaluate_query_sets
+from utils.checkpoint import CheckpointManager
+from utils.instrument import timed, start_run, set_split, end_run
 
 
 # select cuda device if available
@@ -70,14 +73,17 @@ def main(args):
 
     if os.path.isdir(log_path) == False:
         os.makedirs(log_path)
+    checkpoints = CheckpointManager(log_path)
+    start_run(log_path, args)
     
     
     
     dataset_name = args.dataset.split('/')
-    if len(dataset_name) == 1:
-        data = load_directed_real_data(dataset=dataset_name[0], name=dataset_name[0])
-    else:
-        data = load_directed_real_data(dataset=dataset_name[0], name=dataset_name[1])
+    with timed('dataset'):
+        if len(dataset_name) == 1:
+            data = load_directed_real_data(dataset=dataset_name[0], name=dataset_name[0])
+        else:
+            data = load_directed_real_data(dataset=dataset_name[0], name=dataset_name[1])
 #     if args.dataset in ['telegram']:
 #         data = load_directed_real_data(dataset=dataset_name[0], name=dataset_name[0]).to(device)
 #         data = data.to(device)
@@ -123,6 +129,7 @@ def main(args):
     #    results = np.zeros((10, 4, 5))
 
     for i in range(10):
+        set_split(i)
         log_str_full = ''
         edges = datasets[i]['graph']
         edge_weight = datasets[i]['weights']
@@ -167,27 +174,30 @@ def main(args):
             ####################
             train_loss, train_acc = 0.0, 0.0
             model.train()
-            out = model(x, edges, train_index)
+            with timed('forward'):
+                out = model(x, edges, train_index)
 
             train_loss = F.nll_loss(out, y_train)
             pred_label = out.max(dim = 1)[1]            
             train_acc  = acc(pred_label, y_train)
             
             opt.zero_grad()
-            train_loss.backward()
-            opt.step()
+            with timed('backward'):
+                train_loss.backward()
+            with timed('step'):
+                opt.step()
             outstrtrain = 'Train loss: %.6f, acc: %.3f' % (train_loss.detach().item(), train_acc)
             
             ####################
             # Validation
             ####################
             train_loss, train_acc = 0.0, 0.0
-            model.eval()
-            out = model(x, edges, val_index)
+            with timed('evaluation'):
+                out, = evaluate_query_sets(model, lambda q: model(x, edges, q), [val_index])
 
-            test_loss  = F.nll_loss(out, y_val)
-            pred_label = out.max(dim = 1)[1]            
-            test_acc   = acc(pred_label, y_val)
+                test_loss  = F.nll_loss(out, y_val)
+                pred_label = out.max(dim = 1)[1]            
+                test_acc   = acc(pred_label, y_val)
 
             outstrval = ' Test loss: %.6f, acc: %.3f' % (test_loss.detach().item(), test_acc)            
             duration = "--- %.4f seconds ---" % (time.time() - start_time)
@@ -201,33 +211,31 @@ def main(args):
             if save_perform <= best_test_err:
                 early_stopping = 0
                 best_test_err = save_perform
-                torch.save(model.state_dict(), log_path + '/model'+str(i)+'.t7')
+                checkpoints.update('model'+str(i), model)
             else:
                 early_stopping += 1
 
         write_log(vars(args), log_path)
-        torch.save(model.state_dict(), log_path + '/model_latest'+str(i)+'.t7')
+        checkpoints.update('model_latest'+str(i), model)
         #if args.task != 'direction':
             ####################
             # Testing
             ####################
-        model.load_state_dict(torch.load(log_path + '/model'+str(i)+'.t7'))
-        model.eval()
-        out = model(x, edges, val_index)
-        pred_label = out.max(dim = 1)[1]
-        val_acc = acc(pred_label, y_val)
+        checkpoints.persist()
+        with timed('evaluation'):
+            checkpoints.load('model'+str(i), model)
+            out_val, out_test = evaluate_query_sets(model, lambda q: model(x, edges, q), [val_index, test_index])
+            pred_label = out_val.max(dim = 1)[1]
+            val_acc = acc(pred_label, y_val)
     
-        out = model(x, edges, test_index)
-        pred_label = out.max(dim = 1)[1]
-        test_acc = acc(pred_label, y_test)
-        model.load_state_dict(torch.load(log_path + '/model_latest'+str(i)+'.t7'))
-        model.eval()
-        out = model(x, edges, val_index)
-        pred_label = out.max(dim = 1)[1]
-        val_acc_latest = acc(pred_label, y_val)
-        out = model(x, edges, test_index)
-        pred_label = out.max(dim = 1)[1]
-        test_acc_latest = acc(pred_label, y_test)
+            pred_label = out_test.max(dim = 1)[1]
+            test_acc = acc(pred_label, y_test)
+            checkpoints.load('model_latest'+str(i), model)
+            out_val, out_test = evaluate_query_sets(model, lambda q: model(x, edges, q), [val_index, test_index])
+            pred_label = out_val.max(dim = 1)[1]
+            val_acc_latest = acc(pred_label, y_val)
+            pred_label = out_test.max(dim = 1)[1]
+            test_acc_latest = acc(pred_label, y_test)
         ####################
         # Save testing results
         ####################
@@ -290,7 +298,10 @@ def main(args):
         with open(log_path + '/log'+str(i)+'.csv', 'w') as file:
             file.write(log_str_full)
             file.write('\n')
+        checkpoints.clear()
         torch.cuda.empty_cache()
+    end_run()
+    checkpoints.close()
     return results
 
 if __name__ == "__main__":
@@ -15,6 +15,9 @@ from utils.edge_data import link_class_split, in_out_degree, load_signed_real_da
 from utils.save_settings import write_log
 from utils.hermitian import hermitian_decomp_sparse
 from utils.edge_data_new import link_class_split_new
+from utils.link_inference import evaluate_query_sets
+from utils.checkpoint import CheckpointManager
+from utils.instrument import timed, start_run, set_split, end_run
 
 
 # select cuda device if available
@@ -81,10 +84,11 @@ def main(args):
 
     
     dataset_name = args.dataset.split('/')
-    if len(dataset_name) == 1:
-        data = load_directed_real_data(dataset=dataset_name[0], name=dataset_name[0])
-    else:
-        data = load_directed_real_data(dataset=dataset_name[0], name=dataset_name[1])
+    with timed('dataset'):
+        if len(dataset_name) == 1:
+            data = load_directed_real_data(dataset=dataset_name[0], name=dataset_name[0])
+        else:
+            data = load_directed_real_data(dataset=dataset_name[0], name=dataset_name[1])
 #     if args.dataset in ['telegram']:
 #         data = load_directed_real_data(dataset=dataset_name[0], name=dataset_name[0]).to(device)
 #         data = data.to(device)
@@ -112,6 +116,9 @@ def main(args):
     
     if os.path.isdir(log_path) == False:
         os.makedirs(log_path)
+    
+    checkpoints = CheckpointManager(log_path)
+    start_run(log_path, args)
         
     # load dataset
     #if 'dataset' in locals():
@@ -137,6 +144,7 @@ def main(args):
     #else:
     #    results = np.zeros((10, 4, 5))
     for i in range(10):
+        set_split(i)
         log_str_full = ''
         ########################################
         # get hermitian laplacian
@@ -144,8 +152,9 @@ def main(args):
         edges = datasets[i]['graph']
         #L = to_edge_dataset_sparse(args.q, edges, args.K, i, size, root=args.data_path+args.dataset, laplacian=True, norm=args.not_norm, gcn_appr = False)
         f_node, e_node = edges[0], edges[1]
-        L = hermitian_decomp_sparse(f_node, e_node, size, args.q, norm=args.not_norm, laplacian=True,  max_eigen = 2.0, gcn_appr = True, edge_weight = datasets[i]['weights'])       
-        L = cheb_poly_sparse(L, args.K)
+        with timed('laplacian'):
+            L = hermitian_decomp_sparse(f_node, e_node, size, args.q, norm=args.not_norm, laplacian=True,  max_eigen = 2.0, gcn_appr = True, edge_weight = datasets[i]['weights'])       
+            L = cheb_poly_sparse(L, args.K)
         #print(len(L))
         # convert dense laplacian to sparse matrix
         L_img = []
@@ -207,28 +216,30 @@ def main(args):
             ####################
             train_loss, train_acc = 0.0, 0.0
             model.train()
-            out = model(X_real, X_img, train_index)
+            with timed('forward'):
+                out = model(X_real, X_img, train_index)
 
             train_loss = F.nll_loss(out, y_train)
             pred_label = out.max(dim = 1)[1]            
             train_acc  = acc(pred_label, y_train)
             
             opt.zero_grad()
-            train_loss.backward()
-            opt.step()
+            with timed('backward'):
+                train_loss.backward()
+            with timed('step'):
+                opt.step()
             outstrtrain = 'Train loss: %.6f, acc: %.3f' % (train_loss.detach().item(), train_acc)
             
             ####################
             # Validation
             ####################
             train_loss, train_acc = 0.0, 0.0
-            model.eval()
-            out = model(X_real, X_img, 
-                        val_index)
+            with timed('evaluation'):
+                out, = evaluate_query_sets(model, lambda q: model(X_real, X_img, q), [val_index])
 
-            test_loss  = F.nll_loss(out, y_val)
-            pred_label = out.max(dim = 1)[1]            
-            test_acc   = acc(pred_label, y_val)
+                test_loss  = F.nll_loss(out, y_val)
+                pred_label = out.max(dim = 1)[1]            
+                test_acc   = acc(pred_label, y_val)
 
             outstrval = ' Test loss: %.6f, acc: %.3f' % (test_loss.detach().item(), test_acc)            
             duration = "--- %.4f seconds ---" % (time.time() - start_time)
@@ -243,56 +254,52 @@ def main(args):
             if save_perform_err <= best_test_err:
                 early_stopping = 0
                 best_test_err = save_perform_err
-                torch.save(model.state_dict(), log_path + '/model_err'+str(i)+'.t7')
+                checkpoints.update('model_err'+str(i), model)
             if save_perform_acc >= best_test_acc:
                 #early_stopping = 0
                 best_test_acc = save_perform_acc
-                torch.save(model.state_dict(), log_path + '/model_acc'+str(i)+'.t7')
+                checkpoints.update('model_acc'+str(i), model)
             else:
                 early_stopping += 1
-        torch.save(model.state_dict(), log_path + '/model_latest'+str(i)+'.t7')
+        checkpoints.update('model_latest'+str(i), model)
         write_log(vars(args), log_path)
 
         #if args.task == 'existence':
             ####################
             # Testing
             ####################
-        model.load_state_dict(torch.load(log_path + '/model_err'+str(i)+'.t7'))
-        model.eval()
-        out = model(X_real, X_img, val_index)
-        pred_label = out.max(dim = 1)[1]
-        val_err = acc(pred_label, y_val)
-        out = model(X_real, X_img, test_index)
-        pred_label = out.max(dim = 1)[1]
-        test_err = acc(pred_label, y_test)
+        checkpoints.persist()
+        with timed('evaluation'):
+            checkpoints.load('model_err'+str(i), model)
+            out_val, out_test = evaluate_query_sets(model, lambda q: model(X_real, X_img, q), [val_index, test_index])
+            pred_label = out_val.max(dim = 1)[1]
+            val_err = acc(pred_label, y_val)
+            pred_label = out_test.max(dim = 1)[1]
+            test_err = acc(pred_label, y_test)
         
-        model.load_state_dict(torch.load(log_path + '/model_acc'+str(i)+'.t7'))
-        model.eval()
-        out = model(X_real, X_img, val_index)
-        pred_label = out.max(dim = 1)[1]
-        val_acc_err = acc(pred_label, y_val)
-        out = model(X_real, X_img, test_index)
-        pred_label = out.max(dim = 1)[1]
-        test_acc_err = acc(pred_label, y_test)
-        print('loss', test_err)
-        print('accuracy', test_acc_err)
-        #if test_err >= test_acc_err:
-        test_acc = test_err
-        val_acc = val_err
-        #else:
-        #    test_acc = test_acc_err
-        #    val_acc = val_acc_err
+            checkpoints.load('model_acc'+str(i), model)
+            out_val, out_test = evaluate_query_sets(model, lambda q: model(X_real, X_img, q), [val_index, test_index])
+            pred_label = out_val.max(dim = 1)[1]
+            val_acc_err = acc(pred_label, y_val)
+            pred_label = out_test.max(dim = 1)[1]
+            test_acc_err = acc(pred_label, y_test)
+            print('loss', test_err)
+            print('accuracy', test_acc_err)
+            #if test_err >= test_acc_err:
+            test_acc = test_err
+            val_acc = val_err
+            #else:
+            #    test_acc = test_acc_err
+            #    val_acc = val_acc_err
 
    
-        model.load_state_dict(torch.load(log_path + '/model_latest'+str(i)+'.t7'))
-        model.eval()
-        out = model(X_real, X_img, val_index)
-        pred_label = out.max(dim = 1)[1]
-        val_acc_latest = acc(pred_label, y_val)
+            checkpoints.load('model_latest'+str(i), model)
+            out_val, out_test = evaluate_query_sets(model, lambda q: model(X_real, X_img, q), [val_index, test_index])
+            pred_label = out_val.max(dim = 1)[1]
+            val_acc_latest = acc(pred_label, y_val)
     
-        out = model(X_real, X_img, test_index)
-        pred_label = out.max(dim = 1)[1]
-        test_acc_latest = acc(pred_label, y_test)
+            pred_label = out_test.max(dim = 1)[1]
+            test_acc_latest = acc(pred_label, y_test)
         ####################
         # Save testing results
         ####################
@@ -354,8 +361,11 @@ def main(args):
         with open(log_path + '/log'+str(i)+'.csv', 'w') as file:
             file.write(log_str_full)
             file.write('\n')
+        checkpoints.clear()
         torch.cuda.empty_cache()
 
+    end_run()
+    checkpoints.close()
     return results
 
 if __name__ == "__main__":
@@ -26,6 +26,8 @@ from utils.save_settings import write_log
 from utils.hermitian import hermitian_decomp_sparse
 from utils.edge_data import in_out_degree
 from utils.preprocess import load_syn
+from utils.checkpoint import CheckpointManager
+from utils.instrument import timed, start_run, set_split, end_run
 
 
 
@@ -85,12 +87,15 @@ def main(args):
     log_path = os.path.join(args.log_root, args.log_path, args.save_name, date_time)
     if os.path.isdir(log_path) == False:
         os.makedirs(log_path)
+    checkpoints = CheckpointManager(log_path)
+    start_run(log_path, args)
 
     dataset_name = args.dataset.split('/')
-    if len(dataset_name) == 1:
-        data = load_directed_real_data(dataset=dataset_name[0], name=dataset_name[0])
-    else:
-        data = load_directed_real_data(dataset=dataset_name[0], name=dataset_name[1])
+    with timed('dataset'):
+        if len(dataset_name) == 1:
+            data = load_directed_real_data(dataset=dataset_name[0], name=dataset_name[0])
+        else:
+            data = load_directed_real_data(dataset=dataset_name[0], name=dataset_name[1])
     # if len(dataset_name) == 1:
     #     try:
     #         data = pk.load(open(f'./data/fake/{args.dataset}.pk','rb'))
@@ -135,8 +140,9 @@ def main(args):
         X_img_k = torch.FloatTensor(X).to(device)
 
     criterion = nn.NLLLoss()
-    edge_index, norm_real, norm_imag_i, norm_imag_j, norm_imag_k  = quaternion_laplacian.process_quaternion_laplacian(edge_index=dataset.edge_index, x_real=X_real, edge_weight=dataset.edge_weight, \
-        normalization = 'sym', return_lambda_max = False)
+    with timed('laplacian'):
+        edge_index, norm_real, norm_imag_i, norm_imag_j, norm_imag_k  = quaternion_laplacian.process_quaternion_laplacian(edge_index=dataset.edge_index, x_real=X_real, edge_weight=dataset.edge_weight, \
+            normalization = 'sym', return_lambda_max = False)
 
     splits = train_mask.shape[1]
     if len(test_mask.shape) == 1:
@@ -144,6 +150,7 @@ def main(args):
 
     results = np.zeros((splits, 4))
     for split in range(splits):
+        set_split(split)
         log_str_full = ''
 
         model = QuaNet_node_prediction_one_laplacian(K=args.K, num_features=X_real.size(-1), hidden=args.num_filter, label_dim=cluster_dim,
@@ -173,14 +180,17 @@ def main(args):
             count += np.sum(train_index)
 
             model.train()
-            preds = model(X_real, X_img_i, X_img_j, X_img_k)
+            with timed('forward'):
+                preds = model(X_real, X_img_i, X_img_j, X_img_k)
             train_loss = criterion(preds[train_index], label[train_index])
             pred_label = preds.max(dim = 1)[1]
             #train_acc = 1.0*((pred_label[:,train_index] == label[:,train_index])).sum().detach().item()/count
             train_acc = acc(pred_label, label, train_index)
             opt.zero_grad()
-            train_loss.backward()
-            opt.step()
+            with timed('backward'):
+                train_loss.backward()
+            with timed('step'):
+                opt.step()
 
             outstrtrain = 'Train loss:, %.6f, acc:, %.3f,' % (train_loss.detach().item(), train_acc)
             #scheduler.step()
@@ -191,13 +201,14 @@ def main(args):
             count, test_loss, test_acc = 0.0, 0.0, 0.0
 
             # for loop for batch loading
-            count += np.sum(val_index)
-            preds = model(X_real, X_img_i, X_img_j, X_img_k)
-            pred_label = preds.max(dim = 1)[1]
-
-            test_loss = criterion(preds[val_index], label[val_index])
-            #test_acc = 1.0*((pred_label[:,val_index] == label[:,val_index])).sum().detach().item()/count
-            test_acc = acc(pred_label, label, val_index)
+            with timed('evaluation'):
+                count += np.sum(val_index)
+                preds = model(X_real, X_img_i, X_img_j, X_img_k)
+                pred_label = preds.max(dim = 1)[1]
+
+                test_loss = criterion(preds[val_index], label[val_index])
+                #test_acc = 1.0*((pred_label[:,val_index] == label[:,val_index])).sum().detach().item()/count
+                test_acc = acc(pred_label, label, val_index)
             outstrval = ' Test loss:, %.6f, acc:, %.3f,' % (test_loss.detach().item(), test_acc)
 
             duration = "---, %.4f, seconds ---" % (time.time() - start_time)
@@ -213,11 +224,11 @@ def main(args):
             if save_perform_err <= best_test_err:
                 early_stopping = 0
                 best_test_err = save_perform_err
-                torch.save(model.state_dict(), log_path + '/model_err'+str(split)+'.t7')
+                checkpoints.update('model_err'+str(split), model)
             else:
                 early_stopping += 1
             if early_stopping > 500 or epoch == (args.epochs-1):
-                torch.save(model.state_dict(), log_path + '/model_latest'+str(split)+'.t7')
+                checkpoints.update('model_latest'+str(split), model)
                 break
 
         write_log(vars(args), log_path)
@@ -225,22 +236,24 @@ def main(args):
         ####################
         # Testing
         ####################
-        model.load_state_dict(torch.load(log_path + '/model_err'+str(split)+'.t7'))
-        model.eval()
-        preds = model(X_real, X_img_i, X_img_j, X_img_k,)
-        pred_label = preds.max(dim = 1)[1]
-        np.save(log_path + '/pred_err' + str(split), pred_label.to('cpu'))
-        acc_train = acc(pred_label, label, val_index)
-        acc_test = acc(pred_label, label, test_index)
-
-
-        model.load_state_dict(torch.load(log_path + '/model_latest'+str(split)+'.t7'))
-        model.eval()
-        preds = model(X_real, X_img_i, X_img_j, X_img_k,)
-        pred_label = preds.max(dim = 1)[1]
-        np.save(log_path + '/pred_latest' + str(split), pred_label.to('cpu'))
-        acc_train_latest = acc(pred_label, label, val_index)
-        acc_test_latest = acc(pred_label, label, test_index)
+        checkpoints.persist()
+        with timed('evaluation'):
+            checkpoints.load('model_err'+str(split), model)
+            model.eval()
+            preds = model(X_real, X_img_i, X_img_j, X_img_k,)
+            pred_label = preds.max(dim = 1)[1]
+            np.save(log_path + '/pred_err' + str(split), pred_label.to('cpu'))
+            acc_train = acc(pred_label, label, val_index)
+            acc_test = acc(pred_label, label, test_index)
+
+
+            checkpoints.load('model_latest'+str(split), model)
+            model.eval()
+            preds = model(X_real, X_img_i, X_img_j, X_img_k,)
+            pred_label = preds.max(dim = 1)[1]
+            np.save(log_path + '/pred_latest' + str(split), pred_label.to('cpu'))
+            acc_train_latest = acc(pred_label, label, val_index)
+            acc_test_latest = acc(pred_label, label, test_index)
 
         ####################
         # Save testing results
@@ -252,7 +265,10 @@ def main(args):
         with open(log_path + '/log'+str(split)+'.csv', 'w') as file:
             file.write(log_str_full)
             file.write('\n')
+        checkpoints.clear()
         torch.cuda.empty_cache()
+    end_run()
+    checkpoints.close()
     return results
 
 if __name__ == "__main__":
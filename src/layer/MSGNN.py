@@ -420,28 +420,60 @@ class MSGNN_link_prediction(nn.Module):
             cheb.reset_parameters()
         self.linear.reset_parameters()
 
-    def forward(self, real: torch.FloatTensor, imag: torch.FloatTensor, edge_index: torch.LongTensor, \
-        query_edges: torch.LongTensor, edge_weight: Optional[torch.LongTensor]=None) -> torch.FloatTensor:
+    def embed(self, real: torch.FloatTensor, imag: torch.FloatTensor, edge_index: torch.LongTensor, \
+        edge_weight: Optional[torch.LongTensor]=None):
         """
-        Making a forward pass of the MagNet node classification model.
-        
+        Node embeddings produced by the MSConv layers, computed once and reusable for any set of query edges.
+
         Arg types:
             * real, imag (PyTorch Float Tensor) - Node features.
             * edge_index (PyTorch Long Tensor) - Edge indices.
-            * query_edges (PyTorch Long Tensor) - Edge indices for querying labels.
             * edge_weight (PyTorch Float Tensor, optional) - Edge weights corresponding to edge indices.
         Return types:
-            * log_prob (PyTorch Float Tensor) - Logarithmic class probabilities for all nodes, with shape (num_nodes, num_classes).
+            * real, imag (PyTorch Float Tensor) - Node embeddings, with shape (num_nodes, hidden).
         """
         for cheb in self.Chebs:
             real, imag = cheb(real, imag, edge_index, edge_weight)
             if self.activation:
                 real, imag = self.complex_relu(real, imag)
+        return real, imag
 
+    def _edge_features(self, embeddings, query_edges: torch.LongTensor) -> torch.FloatTensor:
+        real, imag = embeddings
         x = torch.cat((real[query_edges[:,0]], real[query_edges[:,1]], imag[query_edges[:,0]], imag[query_edges[:,1]]), dim = -1)
         if self.dropout > 0:
             x = F.dropout(x, self.dropout, training=self.training)
+        return x
+
+    def decode(self, embeddings, query_edges: torch.LongTensor) -> torch.FloatTensor:
+        """
+        Decodes the query edges from precomputed node embeddings, without changing the model (so that chunks of
+        query edges can be decoded concurrently).
+
+        Arg types:
+            * embeddings (tuple of PyTorch Float Tensor) - The output of :obj:`embed`.
+            * query_edges (PyTorch Long Tensor) - Edge indices for querying labels.
+        Return types:
+            * log_prob (PyTorch Float Tensor) - Logarithmic class probabilities for all query edges, with shape (num_edges, num_classes).
+        """
+        x = self.linear(self._edge_features(embeddings, query_edges))
+        x = F.log_softmax(x, dim=1)
+        return x
 
+    def forward(self, real: torch.FloatTensor, imag: torch.FloatTensor, edge_index: torch.LongTensor, \
+        query_edges: torch.LongTensor, edge_weight: Optional[torch.LongTensor]=None) -> torch.FloatTensor:
+        """
+        Making a forward pass of the MagNet node classification model.
+        
+        Arg types:
+            * real, imag (PyTorch Float Tensor) - Node features.
+            * edge_index (PyTorch Long Tensor) - Edge indices.
+            * query_edges (PyTorch Long Tensor) - Edge indices for querying labels.
+            * edge_weight (PyTorch Float Tensor, optional) - Edge weights corresponding to edge indices.
+        Return types:
+            * log_prob (PyTorch Float Tensor) - Logarithmic class probabilities for all nodes, with shape (num_nodes, num_classes).
+        """
+        x = self._edge_features(self.embed(real, imag, edge_index, edge_weight), query_edges)
         self.z = x.clone()
         x = self.linear(x)
         x = F.log_softmax(x, dim=1)
@@ -11,6 +11,7 @@ import torch
 import torch.nn as nn
 import torch.nn.functional as F
 from .src2 import laplacian
+from .src2.graph_operator import GraphOperator
 
 class complex_relu_layer(nn.Module):
     """The complex ReLU layer from the `MagNet: A Neural Network for Directed Graphs. <https://arxiv.org/pdf/2102.11391.pdf>`_ paper.
@@ -48,7 +49,7 @@ class SigMaNetConv(MessagePassing):
     
 
     def __init__(self, in_channels:int, out_channels:int, K:int, i_complex:bool=False, follow_math:bool=True, gcn:bool=False, net_flow:bool=True,
-                 normalization:str='sym', bias:bool=True, edge_index=None, norm_real=None, norm_imag=None,**kwargs):
+                 normalization:str='sym', bias:bool=True, edge_index=None, norm_real=None, norm_imag=None, operator=None, **kwargs):
         kwargs.setdefault('aggr', 'add')
         super(SigMaNetConv, self).__init__(**kwargs)
 
@@ -79,6 +80,8 @@ class SigMaNetConv(MessagePassing):
         self.edge_index=edge_index
         self.norm_real = norm_real
         self.norm_imag = norm_imag
+        # operatore condiviso tra i layer del modello (pesi gia' negati se follow_math)
+        self.operator = operator
 
         self.reset_parameters()
 
@@ -123,14 +126,18 @@ class SigMaNetConv(MessagePassing):
         
         self.n_dim = x_real.shape[0]
 
-        norm_imag = self.norm_imag
-        norm_real = self.norm_real
-        edge_index = self.edge_index
-
+        if self.operator is not None:
+            edge_index = None
+            norm_real = 'real'
+            norm_imag = 'imag'
+        else:
+            norm_imag = self.norm_imag
+            norm_real = self.norm_real
+            edge_index = self.edge_index
 
-        if self.follow_math:
-            norm_imag = - norm_imag
-            norm_real = - norm_real
+            if self.follow_math:
+                norm_imag = - norm_imag
+                norm_real = - norm_real
 
 
         if not self.gcn:
@@ -149,39 +156,39 @@ class SigMaNetConv(MessagePassing):
       
 
                 if self.weight.size(0) > 1:
-                    Tx_1_real_real = self.propagate(edge_index, x=x_real, norm=norm_real, size=None).to(torch.float) # x_real - norm_real
+                    Tx_1_real_real = self._propagate(edge_index, x=x_real, norm=norm_real).to(torch.float) # x_real - norm_real
                     #print("Tx_1_real_real", Tx_1_real_real)
                     #out_real_real = out_real_real + torch.matmul(Tx_1_real_real, self.weight[0])
                     out_real_real = out_real_real + torch.matmul(Tx_1_real_real, self.weight[1])
                     #print("output_real_real", out_real_real)
-                    Tx_1_imag_imag = self.propagate(edge_index, x=x_imag, norm=norm_imag, size=None).to(torch.float) # x_imag - norm_imag
+                    Tx_1_imag_imag = self._propagate(edge_index, x=x_imag, norm=norm_imag).to(torch.float) # x_imag - norm_imag
                     #print("Tx_1_imag_imag", Tx_1_imag_imag)
                     out_imag_imag = out_imag_imag + torch.matmul(Tx_1_imag_imag, self.weight[1])
                     #print("output_imag_imag", out_imag_imag)
-                    Tx_1_imag_real = self.propagate(edge_index, x=x_imag, norm=norm_real, size=None).to(torch.float) # x_imag - norm_real
+                    Tx_1_imag_real = self._propagate(edge_index, x=x_imag, norm=norm_real).to(torch.float) # x_imag - norm_real
                     out_imag_real = out_imag_real + torch.matmul(Tx_1_imag_real, self.weight[1])
-                    Tx_1_real_imag = self.propagate(edge_index, x=x_real, norm=norm_imag, size=None).to(torch.float) # x_real - norm_imag
+                    Tx_1_real_imag = self._propagate(edge_index, x=x_real, norm=norm_imag).to(torch.float) # x_real - norm_imag
                     out_real_imag = out_real_imag + torch.matmul(Tx_1_real_imag, self.weight[1])
             
 
                 #for k in range(1, self.weight.size(0)): # Polinomio di Cheb (Corretto!)
                 for k in range(2, self.weight.size(0)): # Polinomio di Cheb (Corretto!)
-                    Tx_2_real_real = self.propagate(edge_index, x=Tx_1_real_real, norm=norm_real, size=None) # x_real - norm_real
+                    Tx_2_real_real = self._propagate(edge_index, x=Tx_1_real_real, norm=norm_real) # x_real - norm_real
                     Tx_2_real_real = 2. * Tx_2_real_real - Tx_0_real_real
                     out_real_real = out_real_real + torch.matmul(Tx_2_real_real, self.weight[k])
                     Tx_0_real_real, Tx_1_real_real = Tx_1_real_real, Tx_2_real_real
 
-                    Tx_2_imag_imag = self.propagate(edge_index, x=Tx_1_imag_imag, norm=norm_imag, size=None) # x_imag - norm_imag
+                    Tx_2_imag_imag = self._propagate(edge_index, x=Tx_1_imag_imag, norm=norm_imag) # x_imag - norm_imag
                     Tx_2_imag_imag = 2. * Tx_2_imag_imag - Tx_0_imag_imag
                     out_imag_imag = out_imag_imag + torch.matmul(Tx_2_imag_imag, self.weight[k])
                     Tx_0_imag_imag, Tx_1_imag_imag = Tx_1_imag_imag, Tx_2_imag_imag
 
-                    Tx_2_imag_real = self.propagate(edge_index, x=Tx_1_imag_real, norm=norm_real, size=None) # x_imag - norm_real
+                    Tx_2_imag_real = self._propagate(edge_index, x=Tx_1_imag_real, norm=norm_real) # x_imag - norm_real
                     Tx_2_imag_real = 2. * Tx_2_imag_real - Tx_0_imag_real
                     out_imag_real = out_imag_real + torch.matmul(Tx_2_imag_real, self.weight[k])
                     Tx_0_imag_real, Tx_1_imag_real = Tx_1_imag_real, Tx_2_imag_real
 
-                    Tx_2_real_imag = self.propagate(edge_index, x=Tx_1_real_imag, norm=norm_imag, size=None) # x_real - norm_imag
+                    Tx_2_real_imag = self._propagate(edge_index, x=Tx_1_real_imag, norm=norm_imag) # x_real - norm_imag
                     Tx_2_real_imag = 2. * Tx_2_real_imag - Tx_0_real_imag
                     out_real_imag = out_real_imag + torch.matmul(Tx_2_real_imag, self.weight[k])
                     Tx_0_real_imag, Tx_1_real_imag = Tx_1_real_imag, Tx_2_real_imag
@@ -203,37 +210,37 @@ class SigMaNetConv(MessagePassing):
 
                 # Nuovo codice con i cambi opportuni
                 if self.weight.size(0) > 1:
-                    Tx_1_real_real = self.propagate(edge_index, x=x_real, norm=norm_real, size=None).to(torch.float) # x_real - norm_real
+                    Tx_1_real_real = self._propagate(edge_index, x=x_real, norm=norm_real).to(torch.float) # x_real - norm_real
                     #print("Tx_1_real_real", Tx_1_real_real)
                     out_real_real = out_real_real + torch.matmul(Tx_1_real_real, self.weight[1])
                    #print("output_real_real", out_real_real)
-                    Tx_1_imag_imag = self.propagate(edge_index, x=x_imag, norm=norm_imag, size=None).to(torch.float) # x_imag - norm_imag
+                    Tx_1_imag_imag = self._propagate(edge_index, x=x_imag, norm=norm_imag).to(torch.float) # x_imag - norm_imag
                     #print("Tx_1_imag_imag", Tx_1_imag_imag)
                     out_imag_imag = out_imag_imag + torch.matmul(Tx_1_imag_imag, self.weight[1])
                     #print("output_imag_imag", out_imag_imag)
-                    Tx_1_imag_real = self.propagate(edge_index, x=x_imag, norm=norm_real, size=None).to(torch.float) # x_imag - norm_real
+                    Tx_1_imag_real = self._propagate(edge_index, x=x_imag, norm=norm_real).to(torch.float) # x_imag - norm_real
                     out_imag_real = out_imag_real + torch.matmul(Tx_1_imag_real, self.weight[1])
-                    Tx_1_real_imag = self.propagate(edge_index, x=x_real, norm=norm_imag, size=None).to(torch.float) # x_real - norm_imag
+                    Tx_1_real_imag = self._propagate(edge_index, x=x_real, norm=norm_imag).to(torch.float) # x_real - norm_imag
                     out_real_imag = out_real_imag + torch.matmul(Tx_1_real_imag, self.weight[1])
             
 
                 for k in range(2, self.weight.size(0)): # Polinomio di Cheb (Corretto!)
-                    Tx_2_real_real = self.propagate(edge_index, x=Tx_1_real_real, norm=norm_real, size=None) # x_real - norm_real
+                    Tx_2_real_real = self._propagate(edge_index, x=Tx_1_real_real, norm=norm_real) # x_real - norm_real
                     Tx_2_real_real = 2. * Tx_2_real_real - Tx_0_real_real
                     out_real_real = out_real_real + torch.matmul(Tx_2_real_real, self.weight[k])
                     Tx_0_real_real, Tx_1_real_real = Tx_1_real_real, Tx_2_real_real
 
-                    Tx_2_imag_imag = self.propagate(edge_index, x=Tx_1_imag_imag, norm=norm_imag, size=None) # x_imag - norm_imag
+                    Tx_2_imag_imag = self._propagate(edge_index, x=Tx_1_imag_imag, norm=norm_imag) # x_imag - norm_imag
                     Tx_2_imag_imag = 2. * Tx_2_imag_imag - Tx_0_imag_imag
                     out_imag_imag = out_imag_imag + torch.matmul(Tx_2_imag_imag, self.weight[k])
                     Tx_0_imag_imag, Tx_1_imag_imag = Tx_1_imag_imag, Tx_2_imag_imag
 
-                    Tx_2_imag_real = self.propagate(edge_index, x=Tx_1_imag_real, norm=norm_real, size=None) # x_imag - norm_real
+                    Tx_2_imag_real = self._propagate(edge_index, x=Tx_1_imag_real, norm=norm_real) # x_imag - norm_real
                     Tx_2_imag_real = 2. * Tx_2_imag_real - Tx_0_imag_real
                     out_imag_real = out_imag_real + torch.matmul(Tx_2_imag_real, self.weight[k])
                     Tx_0_imag_real, Tx_1_imag_real = Tx_1_imag_real, Tx_2_imag_real
 
-                    Tx_2_real_imag = self.propagate(edge_index, x=Tx_1_real_imag, norm=norm_imag, size=None) # x_real - norm_imag
+                    Tx_2_real_imag = self._propagate(edge_index, x=Tx_1_real_imag, norm=norm_imag) # x_real - norm_imag
                     Tx_2_real_imag = 2. * Tx_2_real_imag - Tx_0_real_imag
                     out_real_imag = out_real_imag + torch.matmul(Tx_2_real_imag, self.weight[k])
                     Tx_0_real_imag, Tx_1_real_imag = Tx_1_real_imag, Tx_2_real_imag
@@ -243,17 +250,17 @@ class SigMaNetConv(MessagePassing):
         
         else:
             # Nuovo codice con i cambi opportuni
-            Tx_1_real_real = self.propagate(edge_index, x=x_real, norm=norm_real, size=None).to(torch.float) # x_real - norm_real
+            Tx_1_real_real = self._propagate(edge_index, x=x_real, norm=norm_real).to(torch.float) # x_real - norm_real
             #print("Tx_1_real_real", Tx_1_real_real)
             out_real_real = torch.matmul(Tx_1_real_real, self.weight[0])
             #print("output_real_real", out_real_real)
-            Tx_1_imag_imag = self.propagate(edge_index, x=x_imag, norm=norm_imag, size=None).to(torch.float) # x_imag - norm_imag
+            Tx_1_imag_imag = self._propagate(edge_index, x=x_imag, norm=norm_imag).to(torch.float) # x_imag - norm_imag
             #print("Tx_1_imag_imag", Tx_1_imag_imag)
             out_imag_imag = torch.matmul(Tx_1_imag_imag, self.weight[0])
             #print("output_imag_imag", out_imag_imag)
-            Tx_1_imag_real = self.propagate(edge_index, x=x_imag, norm=norm_real, size=None).to(torch.float) # x_imag - norm_real
+            Tx_1_imag_real = self._propagate(edge_index, x=x_imag, norm=norm_real).to(torch.float) # x_imag - norm_real
             out_imag_real = torch.matmul(Tx_1_imag_real, self.weight[0])
-            Tx_1_real_imag = self.propagate(edge_index, x=x_real, norm=norm_imag, size=None).to(torch.float) # x_real - norm_imag
+            Tx_1_real_imag = self._propagate(edge_index, x=x_real, norm=norm_imag).to(torch.float) # x_real - norm_imag
             out_real_imag = torch.matmul(Tx_1_real_imag, self.weight[0])
 
             out_real = out_real_real - out_imag_imag
@@ -267,6 +274,12 @@ class SigMaNetConv(MessagePassing):
         return out_real, out_imag
 
 
+    def _propagate(self, edge_index, x, norm):
+        # con un operatore condiviso norm e' il nome dei pesi (fused sparse-dense product, compatibile con vmap)
+        if isinstance(norm, str):
+            return self.operator.matmul(norm, x)
+        return self.propagate(edge_index, x=x, norm=norm, size=None)
+
     def message(self, x_j, norm):
         return norm.view(-1, 1) * x_j
 
@@ -299,11 +312,16 @@ class SigMaNet_link_prediction_one_laplacian(nn.Module):
         edge_index=None, norm_real=None, norm_imag=None):
         super(SigMaNet_link_prediction_one_laplacian, self).__init__()
 
+        # il Laplaciano viene negato e convertito in CSR una sola volta e condiviso da tutti i layer
+        self.operator = None
+        if edge_index is not None:
+            self.operator = GraphOperator(edge_index, negate=follow_math, real=norm_real, imag=norm_imag)
+
         chebs = nn.ModuleList()
         chebs.append(SigMaNetConv(in_channels=num_features, out_channels=hidden, K=K,\
                                   i_complex=i_complex, follow_math=follow_math,\
             gcn=gcn, net_flow=net_flow, normalization=normalization, edge_index=edge_index,\
-            norm_real=norm_real, norm_imag=norm_imag))
+            norm_real=norm_real, norm_imag=norm_imag, operator=self.operator))
         self.normalization = normalization
         self.activation = activation
         if self.activation:
@@ -313,7 +331,7 @@ class SigMaNet_link_prediction_one_laplacian(nn.Module):
             chebs.append(SigMaNetConv(in_channels=hidden, out_channels=hidden, K=K, \
             i_complex=i_complex, follow_math=follow_math,\
             gcn=gcn, net_flow=net_flow, normalization=normalization, \
-            edge_index=edge_index, norm_real=norm_real, norm_imag=norm_imag))
+            edge_index=edge_index, norm_real=norm_real, norm_imag=norm_imag, operator=self.operator))
 
         self.Chebs = chebs
         self.linear = nn.Linear(hidden*4, label_dim)      
@@ -327,7 +345,8 @@ class SigMaNet_link_prediction_one_laplacian(nn.Module):
             print('no unwind!!!')
             chebs[-1] = SigMaNetConv(in_channels=hidden, out_channels=label_dim, K=K, \
             i_complex=i_complex, follow_math=follow_math,\
-            gcn=gcn, net_flow=net_flow, normalization=normalization)
+            gcn=gcn, net_flow=net_flow, normalization=normalization, \
+            edge_index=edge_index, norm_real=norm_real, norm_imag=norm_imag, operator=self.operator)
             #chebs.append(SignumConv(in_channels=hidden, out_channels=label_dim, K=K, \
             #i_complex=i_complex, follow_math=follow_math,\
             #gcn=gcn, net_flow=net_flow, normalization=normalization))
@@ -337,22 +356,32 @@ class SigMaNet_link_prediction_one_laplacian(nn.Module):
             cheb.reset_parameters()
         self.linear.reset_parameters()
 
-    def forward(self, real: torch.FloatTensor, imag: torch.FloatTensor, \
-        query_edges: torch.LongTensor) -> torch.FloatTensor:
+    def embed(self, real: torch.FloatTensor, imag: torch.FloatTensor):
         """
-      
+        Node embeddings produced by the SigMaNetConv layers, computed once and reusable for any set of query edges.
+
         Arg types:
             * real, imag (PyTorch Float Tensor) - Node features.
-            * edge_index (PyTorch Long Tensor) - Edge indices.
-            * query_edges (PyTorch Long Tensor) - Edge indices for querying labels.
-            * edge_weight (PyTorch Float Tensor, optional) - Edge weights corresponding to edge indices.
         Return types:
-            * log_prob (PyTorch Float Tensor) - Logarithmic class probabilities for all nodes, with shape (num_nodes, num_classes).
+            * real, imag (PyTorch Float Tensor) - Node embeddings, with shape (num_nodes, hidden).
         """
         for cheb in self.Chebs:
             real, imag = cheb(real, imag)
             if self.activation:
                 real, imag = self.complex_relu(real, imag)
+        return real, imag
+
+    def decode(self, embeddings, query_edges: torch.LongTensor) -> torch.FloatTensor:
+        """
+        Decodes the query edges from precomputed node embeddings.
+
+        Arg types:
+            * embeddings (tuple of PyTorch Float Tensor) - The output of :obj:`embed`.
+            * query_edges (PyTorch Long Tensor) - Edge indices for querying labels.
+        Return types:
+            * log_prob (PyTorch Float Tensor) - Logarithmic class probabilities for all query edges, with shape (num_edges, num_classes).
+        """
+        real, imag = embeddings
         if not self.unwind:
             real = real[query_edges[:,0]] + real[query_edges[:,1]]
             imag = imag[query_edges[:,0]] + imag[query_edges[:,1]]
@@ -366,6 +395,20 @@ class SigMaNet_link_prediction_one_laplacian(nn.Module):
             x = F.log_softmax(x, dim=1)
         return x
 
+    def forward(self, real: torch.FloatTensor, imag: torch.FloatTensor, \
+        query_edges: torch.LongTensor) -> torch.FloatTensor:
+        """
+      
+        Arg types:
+            * real, imag (PyTorch Float Tensor) - Node features.
+            * edge_index (PyTorch Long Tensor) - Edge indices.
+            * query_edges (PyTorch Long Tensor) - Edge indices for querying labels.
+            * edge_weight (PyTorch Float Tensor, optional) - Edge weights corresponding to edge indices.
+        Return types:
+            * log_prob (PyTorch Float Tensor) - Logarithmic class probabilities for all nodes, with shape (num_nodes, num_classes).
+        """
+        return self.decode(self.embed(real, imag), query_edges)
+
 
 class SigMaNet_node_prediction_one_laplacian(nn.Module):
     r"""The SigMaNet model for node classification 
@@ -391,11 +434,16 @@ class SigMaNet_node_prediction_one_laplacian(nn.Module):
         edge_index=None, norm_real=None, norm_imag=None):
         super(SigMaNet_node_prediction_one_laplacian, self).__init__()
 
+        # il Laplaciano viene negato e convertito in CSR una sola volta e condiviso da tutti i layer
+        self.operator = None
+        if edge_index is not None:
+            self.operator = GraphOperator(edge_index, negate=follow_math, real=norm_real, imag=norm_imag)
+
         chebs = nn.ModuleList()
         chebs.append(SigMaNetConv(in_channels=num_features, out_channels=hidden, K=K,\
                                   i_complex=i_complex, follow_math=follow_math,\
             gcn=gcn, net_flow=net_flow, normalization=normalization, edge_index=edge_index,\
-            norm_real=norm_real, norm_imag=norm_imag))
+            norm_real=norm_real, norm_imag=norm_imag, operator=self.operator))
         self.normalization = normalization
         self.activation = activation
         if self.activation:
@@ -405,7 +453,7 @@ class SigMaNet_node_prediction_one_laplacian(nn.Module):
             chebs.append(SigMaNetConv(in_channels=hidden, out_channels=hidden, K=K, \
             i_complex=i_complex, follow_math=follow_math,\
             gcn=gcn, net_flow=net_flow, normalization=normalization, \
-            edge_index=edge_index, norm_real=norm_real, norm_imag=norm_imag))
+            edge_index=edge_index, norm_real=norm_real, norm_imag=norm_imag, operator=self.operator))
 
         self.Chebs = chebs
         last_dim = 2
@@ -418,7 +466,8 @@ class SigMaNet_node_prediction_one_laplacian(nn.Module):
             print('no unwind!!!')
             chebs[-1] = SigMaNetConv(in_channels=hidden, out_channels=label_dim, K=K, \
             i_complex=i_complex, follow_math=follow_math,\
-            gcn=gcn, net_flow=net_flow, normalization=normalization)
+            gcn=gcn, net_flow=net_flow, normalization=normalization, \
+            edge_index=edge_index, norm_real=norm_real, norm_imag=norm_imag, operator=self.operator)
             #chebs.append(SignumConv(in_channels=hidden, out_channels=label_dim, K=K, \
             #i_complex=i_complex, follow_math=follow_math,\
             #gcn=gcn, net_flow=net_flow, normalization=normalization))
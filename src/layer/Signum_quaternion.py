@@ -10,7 +10,9 @@ import numpy as np
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
+from torch_sparse import SparseTensor, matmul
 from .src2 import laplacian
+from .src2.graph_operator import GraphOperator, promote
 
 
 
@@ -117,7 +119,7 @@ class complex_Leaky_relu_layer_different(nn.Module):
 
 class QuaNetConv(MessagePassing):    
     def __init__(self, in_channels:int, out_channels:int, K:int, normalization:str='sym', bias:bool=True, edge_index=None, 
-                norm_real=None, norm_imag_i=None, norm_imag_j=None, norm_imag_k=None, quaternion_weights=False, quaternion_bias=False, **kwargs): #norm_imag_3=None, 
+                norm_real=None, norm_imag_i=None, norm_imag_j=None, norm_imag_k=None, quaternion_weights=False, quaternion_bias=False, operator=None, **kwargs): #norm_imag_3=None, 
         kwargs.setdefault('aggr', 'add')
         super(QuaNetConv, self).__init__(**kwargs)
 
@@ -156,6 +158,8 @@ class QuaNetConv(MessagePassing):
         self.norm_imag_1 = norm_imag_i
         self.norm_imag_2 = norm_imag_j
         self.norm_imag_3 = norm_imag_k
+        # operatore condiviso tra i layer del modello (pesi gia' negati)
+        self.operator = operator
 
         self.reset_parameters()
 
@@ -209,26 +213,33 @@ class QuaNetConv(MessagePassing):
         self.n_dim = X_real.shape[0]
        
        # Operazione credo inutile.. ma vediamo
-        norm_imag_1 = - self.norm_imag_1
-        norm_imag_2 = - self.norm_imag_2
-        norm_imag_3 = - self.norm_imag_3
-        norm_real = - self.norm_real
+        if self.operator is not None:
+            edge_index = None
+            norm_real = self.operator.adj_t('real')
+            norm_imag_1 = self.operator.adj_t('imag_i')
+            norm_imag_2 = self.operator.adj_t('imag_j')
+            norm_imag_3 = self.operator.adj_t('imag_k')
+        else:
+            norm_imag_1 = - self.norm_imag_1
+            norm_imag_2 = - self.norm_imag_2
+            norm_imag_3 = - self.norm_imag_3
+            norm_real = - self.norm_real
 
-        edge_index = self.edge_index
+            edge_index = self.edge_index
 
         # Propagazione dell'informazione
         # First-step
-        Tx_0_real_real_1 = self.propagate(edge_index, x=X_real, norm=norm_real, size=None).to(torch.float) - self.propagate(edge_index, x=X_imag_1, norm=norm_imag_1, size=None).to(torch.float) - \
-        self.propagate(edge_index, x=X_imag_2, norm=norm_imag_2, size=None).to(torch.float) - self.propagate(edge_index, x=X_imag_3, norm=norm_imag_3, size=None).to(torch.float)
+        Tx_0_real_real_1 = self._propagate(edge_index, x=X_real, norm=norm_real).to(torch.float) - self._propagate(edge_index, x=X_imag_1, norm=norm_imag_1).to(torch.float) - \
+        self._propagate(edge_index, x=X_imag_2, norm=norm_imag_2).to(torch.float) - self._propagate(edge_index, x=X_imag_3, norm=norm_imag_3).to(torch.float)
         
-        Tx_0_imag_imag_1 = self.propagate(edge_index, x=X_imag_1, norm=norm_real, size=None).to(torch.float) + self.propagate(edge_index, x=X_real, norm=norm_imag_1, size=None).to(torch.float) + \
-        self.propagate(edge_index, x=X_imag_3, norm=norm_imag_2, size=None).to(torch.float) - self.propagate(edge_index, x=X_imag_2, norm=norm_imag_3, size=None).to(torch.float)
+        Tx_0_imag_imag_1 = self._propagate(edge_index, x=X_imag_1, norm=norm_real).to(torch.float) + self._propagate(edge_index, x=X_real, norm=norm_imag_1).to(torch.float) + \
+        self._propagate(edge_index, x=X_imag_3, norm=norm_imag_2).to(torch.float) - self._propagate(edge_index, x=X_imag_2, norm=norm_imag_3).to(torch.float)
         
-        Tx_0_imag_imag_2 = self.propagate(edge_index, x=X_imag_2, norm=norm_real, size=None).to(torch.float) - self.propagate(edge_index, x=X_imag_3, norm=norm_imag_1, size=None).to(torch.float) + \
-        self.propagate(edge_index, x=X_real, norm=norm_imag_2, size=None).to(torch.float) + self.propagate(edge_index, x=X_imag_1, norm=norm_imag_3, size=None).to(torch.float)
+        Tx_0_imag_imag_2 = self._propagate(edge_index, x=X_imag_2, norm=norm_real).to(torch.float) - self._propagate(edge_index, x=X_imag_3, norm=norm_imag_1).to(torch.float) + \
+        self._propagate(edge_index, x=X_real, norm=norm_imag_2).to(torch.float) + self._propagate(edge_index, x=X_imag_1, norm=norm_imag_3).to(torch.float)
 
-        Tx_0_imag_imag_3 = self.propagate(edge_index, x=X_imag_3, norm=norm_real, size=None).to(torch.float) + self.propagate(edge_index, x=X_imag_2, norm=norm_imag_1, size=None).to(torch.float) - \
-        self.propagate(edge_index, x=X_imag_1, norm=norm_imag_2, size=None).to(torch.float) + self.propagate(edge_index, x=X_real, norm=norm_imag_3, size=None).to(torch.float)
+        Tx_0_imag_imag_3 = self._propagate(edge_index, x=X_imag_3, norm=norm_real).to(torch.float) + self._propagate(edge_index, x=X_imag_2, norm=norm_imag_1).to(torch.float) - \
+        self._propagate(edge_index, x=X_imag_1, norm=norm_imag_2).to(torch.float) + self._propagate(edge_index, x=X_real, norm=norm_imag_3).to(torch.float)
 
         # Second-step: multiplication with the weight of the neural network
         # Versione One (i pesi sono uguali per tutte le componenti)
@@ -262,9 +273,19 @@ class QuaNetConv(MessagePassing):
         return out_real, out_imag_1, out_imag_2, out_imag_3
 
 
+    def _propagate(self, edge_index, x, norm):
+        # con un operatore condiviso norm e' gia' la matrice sparsa trasposta (fused sparse-dense product)
+        if isinstance(norm, SparseTensor):
+            return self.propagate(norm, x=x, size=None)
+        return self.propagate(edge_index, x=x, norm=norm, size=None)
+
     def message(self, x_j, norm):
         return norm.view(-1, 1) * x_j
 
+    def message_and_aggregate(self, adj_t, x):
+        adj_t, x = promote(adj_t, x)
+        return matmul(adj_t, x, reduce=self.aggr)
+
     def __repr__(self):
         return '{}({}, {}, K={}, normalization={})'.format(
             self.__class__.__name__, self.in_channels, self.out_channels,
@@ -294,12 +315,19 @@ class QuaNet_link_prediction_one_laplacian(nn.Module):
         quaternion_weights:bool=True, quaternion_bias:bool=True):
         super(QuaNet_link_prediction_one_laplacian, self).__init__()
 
+        # il Laplaciano viene negato e convertito in CSR una sola volta e condiviso da tutti i layer
+        self.operator = None
+        if edge_index is not None:
+            self.operator = GraphOperator(edge_index, negate=True, real=norm_real, imag_i=norm_imag_i,
+                                          imag_j=norm_imag_j, imag_k=norm_imag_k)
+
         chebs = nn.ModuleList()
         chebs.append(QuaNetConv(in_channels=num_features, out_channels=hidden, K=K,\
                                  normalization=normalization, edge_index=edge_index,\
                                  norm_real=norm_real, norm_imag_i=norm_imag_i, \
                                  norm_imag_j=norm_imag_j, norm_imag_k=norm_imag_k, \
-                                 quaternion_weights=quaternion_weights, quaternion_bias=quaternion_bias))
+                                 quaternion_weights=quaternion_weights, quaternion_bias=quaternion_bias, \
+                                 operator=self.operator))
         self.normalization = normalization
         self.activation = activation
         if self.activation:
@@ -311,7 +339,8 @@ class QuaNet_link_prediction_one_laplacian(nn.Module):
                                  normalization=normalization, edge_index=edge_index,\
                                  norm_real=norm_real, norm_imag_i=norm_imag_i, \
                                  norm_imag_j=norm_imag_j, norm_imag_k=norm_imag_k, \
-                                 quaternion_weights=quaternion_weights, quaternion_bias=quaternion_bias))
+                                 quaternion_weights=quaternion_weights, quaternion_bias=quaternion_bias, \
+                                 operator=self.operator))
 
         self.Chebs = chebs 
         self.linear = nn.Linear(hidden*8, label_dim)   
@@ -327,23 +356,33 @@ class QuaNet_link_prediction_one_laplacian(nn.Module):
         self.linear.reset_parameters()
         
 
-    def forward(self, real: torch.FloatTensor, imag_1: torch.FloatTensor, imag_2: torch.FloatTensor, \
-        imag_3: torch.FloatTensor, query_edges: torch.LongTensor) -> torch.FloatTensor:
+    def embed(self, real: torch.FloatTensor, imag_1: torch.FloatTensor, imag_2: torch.FloatTensor, \
+        imag_3: torch.FloatTensor):
         """
-      
+        Node embeddings produced by the QuaNetConv layers, computed once and reusable for any set of query edges.
+
         Arg types:
             * real, imag_1, imag_2, imag_3 (PyTorch Float Tensor) - Node features.
-            * edge_index (PyTorch Long Tensor) - Edge indices.
-            * query_edges (PyTorch Long Tensor) - Edge indices for querying labels.
-            * edge_weight (PyTorch Float Tensor, optional) - Edge weights corresponding to edge indices.
         Return types:
-            * log_prob (PyTorch Float Tensor) - Logarithmic class probabilities for all nodes, with shape (num_nodes, num_classes).
+            * real, imag_1, imag_2, imag_3 (PyTorch Float Tensor) - Node embeddings, with shape (num_nodes, hidden).
         """
         for cheb in self.Chebs:           
             real, imag_1, imag_2, imag_3 = cheb(real, imag_1, imag_2, imag_3)
             if self.activation:
                 real, imag_1, imag_2, imag_3 = self.complex_relu(real, imag_1, imag_2, imag_3)
+        return real, imag_1, imag_2, imag_3
 
+    def decode(self, embeddings, query_edges: torch.LongTensor) -> torch.FloatTensor:
+        """
+        Decodes the query edges from precomputed node embeddings.
+
+        Arg types:
+            * embeddings (tuple of PyTorch Float Tensor) - The output of :obj:`embed`.
+            * query_edges (PyTorch Long Tensor) - Edge indices for querying labels.
+        Return types:
+            * log_prob (PyTorch Float Tensor) - Logarithmic class probabilities for all query edges, with shape (num_edges, num_classes).
+        """
+        real, imag_1, imag_2, imag_3 = embeddings
         # Unwind operation
         x = torch.cat((real[query_edges[:,0]], real[query_edges[:,1]], imag_1[query_edges[:,0]], imag_1[query_edges[:,1]], \
         imag_2[query_edges[:,0]], imag_2[query_edges[:,1]], imag_3[query_edges[:,0]], imag_3[query_edges[:,1]]), dim = -1)
@@ -353,6 +392,20 @@ class QuaNet_link_prediction_one_laplacian(nn.Module):
         x = F.log_softmax(x, dim=1)
         return x
 
+    def forward(self, real: torch.FloatTensor, imag_1: torch.FloatTensor, imag_2: torch.FloatTensor, \
+        imag_3: torch.FloatTensor, query_edges: torch.LongTensor) -> torch.FloatTensor:
+        """
+      
+        Arg types:
+            * real, imag_1, imag_2, imag_3 (PyTorch Float Tensor) - Node features.
+            * edge_index (PyTorch Long Tensor) - Edge indices.
+            * query_edges (PyTorch Long Tensor) - Edge indices for querying labels.
+            * edge_weight (PyTorch Float Tensor, optional) - Edge weights corresponding to edge indices.
+        Return types:
+            * log_prob (PyTorch Float Tensor) - Logarithmic class probabilities for all nodes, with shape (num_nodes, num_classes).
+        """
+        return self.decode(self.embed(real, imag_1, imag_2, imag_3), query_edges)
+
 
 class QuaNet_node_prediction_one_laplacian(nn.Module):
     r"""The QuaNet model for node classification 
@@ -378,12 +431,19 @@ class QuaNet_node_prediction_one_laplacian(nn.Module):
         quaternion_weights:bool=False, quaternion_bias:bool=False):
         super(QuaNet_node_prediction_one_laplacian, self).__init__()
 
+        # il Laplaciano viene negato e convertito in CSR una sola volta e condiviso da tutti i layer
+        self.operator = None
+        if edge_index is not None:
+            self.operator = GraphOperator(edge_index, negate=True, real=norm_real, imag_i=norm_imag_i,
+                                          imag_j=norm_imag_j, imag_k=norm_imag_k)
+
         chebs = nn.ModuleList()
         chebs.append(QuaNetConv(in_channels=num_features, out_channels=hidden, K=K,\
                                  normalization=normalization, edge_index=edge_index,\
                                  norm_real=norm_real, norm_imag_i=norm_imag_i, \
                                  norm_imag_j=norm_imag_j, norm_imag_k=norm_imag_k,\
-                                 quaternion_weights=quaternion_weights, quaternion_bias=quaternion_bias))
+                                 quaternion_weights=quaternion_weights, quaternion_bias=quaternion_bias, \
+                                 operator=self.operator))
         self.normalization = normalization
         self.activation = activation
         if self.activation:
@@ -394,7 +454,8 @@ class QuaNet_node_prediction_one_laplacian(nn.Module):
                                  normalization=normalization, edge_index=edge_index,\
                                  norm_real=norm_real, norm_imag_i=norm_imag_i, \
                                  norm_imag_j=norm_imag_j, norm_imag_k=norm_imag_k, \
-                                 quaternion_weights=quaternion_weights, quaternion_bias=quaternion_bias))
+                                 quaternion_weights=quaternion_weights, quaternion_bias=quaternion_bias, \
+                                 operator=self.operator))
 
         self.Chebs = chebs
         last_dim = 4 # era 2.. vediamo
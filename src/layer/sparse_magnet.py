@@ -8,12 +8,13 @@ import torch, math
 import torch.nn as nn
 import torch.nn.functional as F
 from torch_sparse import SparseTensor
+from .src2.graph_operator import ChebOperator
 #from torch.nn import MultiheadAttention
 
-def process(mul_L_real, mul_L_imag, weight, X_real, X_imag):
+def process(mul_L_real, mul_L_imag, neg_mul_L_imag, weight, X_real, X_imag):
     data = torch.spmm(mul_L_real, X_real)
     real = torch.matmul(data, weight) 
-    data = -1.0*torch.spmm(mul_L_imag, X_imag)
+    data = torch.spmm(neg_mul_L_imag, X_imag)
     real += torch.matmul(data, weight) 
     
     data = torch.spmm(mul_L_imag, X_real)
@@ -30,15 +31,15 @@ class ChebConv(nn.Module):
     :param out_c: int, number of output channels.
     :param K: int, the order of Chebyshev Polynomial.
     :param L_norm_real, L_norm_imag: normalized laplacian of real and imag
+    :param operator: ChebOperator, Chebyshev basis shared with the other layers (built from L_norm_real, L_norm_imag if None)
     """
-    def __init__(self, in_c, out_c, K,  L_norm_real, L_norm_imag, bias=True):
+    def __init__(self, in_c, out_c, K,  L_norm_real, L_norm_imag, bias=True, operator=None):
         super(ChebConv, self).__init__()
 
-        L_norm_real, L_norm_imag = L_norm_real, L_norm_imag
-
-        # list of K sparsetensors, each is N by N
-        self.mul_L_real = L_norm_real   # [K, N, N]
-        self.mul_L_imag = L_norm_imag   # [K, N, N]
+        # list of K sparsetensors, each is N by N, [K, N, N]
+        if operator is None:
+            operator = ChebOperator(L_norm_real, L_norm_imag)
+        self.operator = operator
 
         self.weight = nn.Parameter(torch.Tensor(K + 1, in_c, out_c))  # [K+1, 1, in_c, out_c]
 
@@ -62,12 +63,12 @@ class ChebConv(nn.Module):
         imag = 0.0
 
         future = []
-        for i in range(len(self.mul_L_real)): # [K, B, N, D]
+        for i in range(len(self.operator)): # [K, B, N, D]
             future.append(torch.jit.fork(process, 
-                            self.mul_L_real[i], self.mul_L_imag[i], 
+                            self.operator.real(i), self.operator.imag(i), self.operator.neg_imag(i),
                             self.weight[i], X_real, X_imag))
         result = []
-        for i in range(len(self.mul_L_real)):
+        for i in range(len(self.operator)):
             result.append(torch.jit.wait(future[i]))
         result = torch.sum(torch.stack(result), dim=0)
 
@@ -103,12 +104,15 @@ class ChebNet(nn.Module):
         """
         super(ChebNet, self).__init__()
 
-        chebs = [ChebConv(in_c=in_c, out_c=num_filter, K=K, L_norm_real=L_norm_real, L_norm_imag=L_norm_imag)]
+        # the Chebyshev basis is coalesced once and shared by all the layers
+        self.operator = ChebOperator(L_norm_real, L_norm_imag)
+
+        chebs = [ChebConv(in_c=in_c, out_c=num_filter, K=K, L_norm_real=L_norm_real, L_norm_imag=L_norm_imag, operator=self.operator)]
         if activation:
             chebs.append(complex_relu_layer())
 
         for i in range(1, layer):
-            chebs.append(ChebConv(in_c=num_filter, out_c=num_filter, K=K, L_norm_real=L_norm_real, L_norm_imag=L_norm_imag))
+            chebs.append(ChebConv(in_c=num_filter, out_c=num_filter, K=K, L_norm_real=L_norm_real, L_norm_imag=L_norm_imag, operator=self.operator))
             if activation:
                 chebs.append(complex_relu_layer())
 
@@ -140,13 +144,16 @@ class ChebNet_Edge(nn.Module):
         :param L_norm_real, L_norm_imag: normalized laplacian
         """
         super(ChebNet_Edge, self).__init__()
+
+        # the Chebyshev basis is coalesced once and shared by all the layers
+        self.operator = ChebOperator(L_norm_real, L_norm_imag)
         
-        chebs = [ChebConv(in_c=in_c, out_c=num_filter, K=K, L_norm_real=L_norm_real, L_norm_imag=L_norm_imag)]
+        chebs = [ChebConv(in_c=in_c, out_c=num_filter, K=K, L_norm_real=L_norm_real, L_norm_imag=L_norm_imag, operator=self.operator)]
         if activation and (layer != 1):
             chebs.append(complex_relu_layer())
 
         for i in range(1, layer):
-            chebs.append(ChebConv(in_c=num_filter, out_c=num_filter, K=K, L_norm_real=L_norm_real, L_norm_imag=L_norm_imag))
+            chebs.append(ChebConv(in_c=num_filter, out_c=num_filter, K=K, L_norm_real=L_norm_real, L_norm_imag=L_norm_imag, operator=self.operator))
             if activation:
                 chebs.append(complex_relu_layer())
         self.Chebs = torch.nn.Sequential(*chebs)
@@ -0,0 +1,146 @@
+'''
+Graph operator shared by all the convolution layers of a model
+'''
+
+from typing import Optional
+
+import torch
+import torch.nn as nn
+from torch_sparse import SparseTensor, matmul
+from torch_geometric.utils.num_nodes import maybe_num_nodes
+
+
+def _csr(index, other, num_nodes):
+    # sort the edges by (index, other) and build the compressed row pointer
+    perm = (index * num_nodes + other).argsort()
+    count = torch.bincount(index, minlength=num_nodes)
+    rowptr = torch.cat([count.new_zeros(1), count.cumsum(0)])
+    return perm, rowptr, other[perm]
+
+
+def promote(adj: SparseTensor, x: torch.Tensor):
+    r"""The operator :obj:`adj` and the features :obj:`x` cast to their promoted dtype, as the product of
+    :obj:`MessagePassing` with the edge weights would."""
+    value = adj.storage.value()
+    if value is None or value.dtype == x.dtype:
+        return adj, x
+    dtype = torch.promote_types(value.dtype, x.dtype)
+    return adj.set_value(value.to(dtype), layout='csr'), x.to(dtype)
+
+
+class _OperatorMatmul(torch.autograd.Function):
+    # adj_t @ x with an explicit backward (adj @ grad) and vmap rule: the models stacked over the
+    # splits share the operator, so the batch is folded in the feature dimension of a single product
+    @staticmethod
+    def forward(x, adj_t, adj):
+        return matmul(adj_t, x, reduce='sum')
+
+    @staticmethod
+    def setup_context(ctx, inputs, output):
+        ctx.adj = inputs[2]
+
+    @staticmethod
+    def backward(ctx, grad):
+        return matmul(ctx.adj, grad, reduce='sum'), None, None
+
+    @staticmethod
+    def vmap(info, in_dims, x, adj_t, adj):
+        if in_dims[0] is None:
+            return _OperatorMatmul.apply(x, adj_t, adj), None
+        x = x.movedim(in_dims[0], 1)
+        shape = x.shape
+        out = _OperatorMatmul.apply(x.reshape(shape[0], -1), adj_t, adj)
+        return out.view(shape), 1
+
+
+class GraphOperator(nn.Module):
+    r"""Laplacian operator owned by a model and shared by all its convolution layers.
+
+    The edge weights are (optionally) negated once, and the CSR layout of the operator
+    and of its transpose are precomputed. Everything is registered as a non-persistent buffer,
+    so that it follows :obj:`.to(device)` without changing the :obj:`state_dict` of the model.
+
+    Arg types:
+        * **edge_index** (PyTorch LongTensor) - The edge indices of the Laplacian.
+        * **num_nodes** (int, optional) - The number of nodes. (default: :obj:`None`)
+        * **negate** (bool, optional) - Whether to store the negated edge weights. (default: :obj:`False`)
+        * **dtype** (torch.dtype, optional) - The data type of the stored edge weights, that of the given weights if None. (default: :obj:`None`)
+        * **weights** (PyTorch Float Tensor) - Named one-dimensional edge weights, e.g. :obj:`real=norm_real, imag=norm_imag`.
+    """
+    def __init__(self, edge_index: torch.LongTensor, num_nodes: Optional[int] = None, negate: bool = False,
+                 dtype: Optional[torch.dtype] = None, **weights):
+        super(GraphOperator, self).__init__()
+        edge_index = edge_index.long()
+        num_nodes = maybe_num_nodes(edge_index, num_nodes)
+        self.num_nodes = num_nodes
+        self.negate = negate
+        self.names = list(weights.keys())
+
+        row, col = edge_index
+        # adj: rows are source nodes; adj_t: rows are target nodes (used for the aggregation)
+        perm, rowptr, csr_col = _csr(row, col, num_nodes)
+        perm_t, rowptr_t, csr_col_t = _csr(col, row, num_nodes)
+        self.register_buffer('edge_index', edge_index, persistent=False)
+        self.register_buffer('rowptr', rowptr, persistent=False)
+        self.register_buffer('col', csr_col, persistent=False)
+        self.register_buffer('rowptr_t', rowptr_t, persistent=False)
+        self.register_buffer('col_t', csr_col_t, persistent=False)
+
+        sign = -1.0 if negate else 1.0
+        for name, weight in weights.items():
+            weight = sign * weight.to(device=edge_index.device, dtype=dtype or weight.dtype)
+            self.register_buffer(name, weight, persistent=False)
+            self.register_buffer(name + '_csr', weight[perm], persistent=False)
+            self.register_buffer(name + '_csr_t', weight[perm_t], persistent=False)
+
+    def adj(self, name: str) -> SparseTensor:
+        r"""The operator with the :obj:`name` edge weights, in CSR layout."""
+        return SparseTensor(rowptr=self.rowptr, col=self.col, value=getattr(self, name + '_csr'),
+                            sparse_sizes=(self.num_nodes, self.num_nodes), is_sorted=True, trust_data=True)
+
+    def adj_t(self, name: str) -> SparseTensor:
+        r"""The transposed operator with the :obj:`name` edge weights, in CSR layout."""
+        return SparseTensor(rowptr=self.rowptr_t, col=self.col_t, value=getattr(self, name + '_csr_t'),
+                            sparse_sizes=(self.num_nodes, self.num_nodes), is_sorted=True, trust_data=True)
+
+    def matmul(self, name: str, x: torch.Tensor) -> torch.Tensor:
+        r"""Aggregate :obj:`norm * x_j` at the target nodes, i.e. :obj:`adj_t(name) @ x` (also under :obj:`torch.func.vmap`)."""
+        adj_t, x = promote(self.adj_t(name), x)
+        adj, _ = promote(self.adj(name), x)
+        return _OperatorMatmul.apply(x, adj_t, adj)
+
+    def __repr__(self):
+        return '{}(num_nodes={}, num_edges={}, weights={}, negate={})'.format(
+            self.__class__.__name__, self.num_nodes, self.edge_index.size(1), self.names, self.negate)
+
+
+class ChebOperator(nn.Module):
+    r"""Chebyshev basis of the magnetic Laplacian shared by all the ChebConv layers of a MagNet model.
+
+    The real and imaginary parts of every order are coalesced once and the imaginary part is
+    also stored negated, as needed by the real component of the complex product.
+
+    Arg types:
+        * **L_norm_real, L_norm_imag** (list of PyTorch sparse Tensor) - Real and imaginary parts of the K+1 Chebyshev terms.
+    """
+    def __init__(self, L_norm_real, L_norm_imag):
+        super(ChebOperator, self).__init__()
+        self.K = len(L_norm_real)
+        for k in range(self.K):
+            real = L_norm_real[k].coalesce()
+            imag = L_norm_imag[k].coalesce()
+            self.register_buffer('real_%d' % k, real, persistent=False)
+            self.register_buffer('imag_%d' % k, imag, persistent=False)
+            self.register_buffer('neg_imag_%d' % k, -imag, persistent=False)
+
+    def __len__(self):
+        return self.K
+
+    def real(self, k: int):
+        return getattr(self, 'real_%d' % k)
+
+    def imag(self, k: int):
+        return getattr(self, 'imag_%d' % k)
+
+    def neg_imag(self, k: int):
+        return getattr(self, 'neg_imag_%d' % k)
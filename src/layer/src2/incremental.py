@@ -0,0 +1,421 @@
+'''
+Incremental refresh of the Sign-Magnetic Laplacian and of the SigMaNet embeddings after edge updates
+'''
+
+from contextlib import contextmanager
+from typing import Optional
+
+import numpy as np
+import scipy.sparse as sp
+import torch
+
+from .graph_operator import GraphOperator
+from . import laplacian
+
+
+def _adjacency(edge_index, edge_weight, num_nodes):
+    # same adjacency as get_Sign_Magnetic_Laplacian: no self-loops, duplicated edges summed
+    row, col = np.asarray(edge_index[0]), np.asarray(edge_index[1])
+    if edge_weight is None:
+        edge_weight = np.ones(row.shape[0])
+    edge_weight = np.asarray(edge_weight, dtype=np.float64)
+    mask = row != col
+    A = sp.coo_matrix((edge_weight[mask], (row[mask], col[mask])), shape=(num_nodes, num_nodes)).tocsr()
+    A.eliminate_zeros()
+    return A
+
+
+def _positions(start, counts):
+    # the positions start[k], ..., start[k] + counts[k] - 1 of every k, concatenated
+    return np.arange(counts.sum()) + np.repeat(start - (np.cumsum(counts) - counts), counts)
+
+
+def _row_entries(matrix, rows):
+    # the (row, col, value) entries of the rows of a CSR matrix, read from its arrays without visiting the other rows
+    start, end = matrix.indptr[rows], matrix.indptr[rows + 1]
+    counts = end - start
+    positions = _positions(start, counts)
+    return np.repeat(rows, counts), matrix.indices[positions], matrix.data[positions]
+
+
+def _isin_sorted(values, nodes):
+    # whether each value is in the sorted array nodes
+    position = np.minimum(np.searchsorted(nodes, values), max(len(nodes) - 1, 0))
+    return (nodes[position] == values) if len(nodes) > 0 else np.zeros(len(values), dtype=bool)
+
+
+def _replace_rows(matrix, rows, row, col, value):
+    # the CSR matrix whose rows (sorted, unique) are replaced by the entries (row, col, value), all in rows: only
+    # the positions of the entries of those rows are computed, the arrays of the others are moved by one compress and
+    # one insert (memory copies), and the row pointer shifted
+    order = np.lexsort((col, row))
+    row, col, value = row[order], col[order], value[order]
+    start, end = matrix.indptr[rows].astype(np.int64), matrix.indptr[rows + 1].astype(np.int64)
+    old_counts = end - start
+    counts = np.searchsorted(row, rows, side='right') - np.searchsorted(row, rows, side='left')
+
+    kept = np.ones(matrix.nnz, dtype=bool)
+    kept[_positions(start, old_counts)] = False
+    # the new entries of a row go where its old ones were, once those of the previous replaced rows are removed
+    position = np.repeat(start - (np.cumsum(old_counts) - old_counts), counts)
+    indices = np.insert(matrix.indices[kept], position, col.astype(matrix.indices.dtype))
+    data = np.insert(matrix.data[kept].astype(np.result_type(matrix.dtype, value.dtype), copy=False), position, value)
+    shift = np.zeros(matrix.shape[0] + 1, dtype=np.int64)
+    shift[rows + 1] = counts - old_counts
+    indptr = (matrix.indptr + np.cumsum(shift)).astype(matrix.indptr.dtype)
+    return sp.csr_matrix((data, indices, indptr), shape=matrix.shape)
+
+
+def sign_magnetic_rows(A, At, rows, gcn: bool, net_flow: bool):
+    r"""Entries of the selected rows of the symmetrized adjacency and of the phase matrix of the Sign-Magnetic Laplacian.
+    The net flow and the antiparallel edges only depend on the pair (A[i,j], A[j,i]), so the rows of the selected
+    nodes are computed from the rows of A and A^T alone, in time linear in their number of entries.
+
+    Arg types:
+        * **A, At** (scipy.sparse.csr_matrix) - The adjacency matrix (without self-loops nor explicit zeros) and its transpose.
+        * **rows** (np.ndarray) - The selected nodes, sorted.
+        * **gcn** (bool) - Whether the self-loops are added to the adjacency matrix.
+        * **net_flow** (bool) - Whether the antiparallel edges are replaced by their net flow.
+    Return types:
+        * **row, col** (np.ndarray) - The positions of the entries.
+        * **A_sym** (np.ndarray) - The entries of 0.5*(A + A^T).
+        * **operation** (np.ndarray) - The entries of the complex phase matrix.
+    """
+    num_nodes = A.shape[0]
+    rows = np.asarray(rows, dtype=np.int64)
+    row_a, col_a, a = _row_entries(A, rows)
+    row_b, col_b, b = _row_entries(At, rows)
+    keys_a, keys_b = row_a * num_nodes + col_a, row_b * num_nodes + col_b
+    keys = np.union1d(keys_a, keys_b)
+    weight, inversed_weight = np.zeros(len(keys)), np.zeros(len(keys))
+    weight[np.searchsorted(keys, keys_a)] = a
+    inversed_weight[np.searchsorted(keys, keys_b)] = b
+    a, b = weight, inversed_weight
+    row, col = keys // num_nodes, keys % num_nodes
+    both = (a != 0) & (b != 0)
+
+    if net_flow:
+        # antiparallel pair (i, j), i < j: (i, j) becomes A[i,j] - A[j,i] and (j, i) is removed
+        P = np.where(both, np.where(col > row, a - b, 0.0), a)
+        Pt = np.where(both, np.where(col < row, b - a, 0.0), b)
+        A_double = np.zeros(len(keys))
+    else:
+        # antiparallel pairs with the same weight
+        P, Pt = a, b
+        A_double = (both & (a == b)).astype(np.float64)
+    identity = np.zeros(len(keys))
+
+    if gcn:
+        ones = np.ones(len(rows))
+        row, col = np.concatenate([row, rows]), np.concatenate([col, rows])
+        P, Pt = np.concatenate([P, ones]), np.concatenate([Pt, ones])
+        A_double, identity = np.concatenate([A_double, np.zeros(len(rows))]), np.concatenate([identity, ones])
+
+    A_sym = 0.5*(P + Pt)
+    operation = identity + A_double + 1j*np.sign(np.abs(P) - np.abs(Pt))
+    return row, col, A_sym, operation
+
+
+class IncrementalLaplacian(object):
+    r"""The Sign-Magnetic Laplacian M (the operator used by the convolution of SigMaNet, self-loops included) of a
+    graph that gains or loses edges, kept as a sparse matrix.
+
+    An update only recomputes the rows of M of the touched nodes (the endpoints of the updated edges, whose degree
+    normalization changes) and of their neighbours (whose entries in the columns of the touched nodes change), e.g.
+    to evaluate consecutive time windows from the Laplacian of the previous one instead of building it again. The
+    arithmetic is linear in the entries of those rows; the arrays of A, A^T and M are spliced in one vectorized pass.
+
+    Arg types:
+        * **edge_index** (PyTorch LongTensor) - The edges of the graph.
+        * **edge_weight** (PyTorch Tensor, optional) - The edge weights. (default: :obj:`None`)
+        * **num_nodes** (int) - The number of nodes, fixed across the updates.
+        * **gcn, net_flow** (bool) - The options of :obj:`laplacian.process_magnetic_laplacian`.
+    """
+    def __init__(self, edge_index: torch.LongTensor, edge_weight: Optional[torch.Tensor], num_nodes: int,
+                 gcn: bool = True, net_flow: bool = True):
+        self.num_nodes = num_nodes
+        self.gcn = gcn
+        self.net_flow = net_flow
+
+        edge_weight = edge_weight.cpu().numpy() if edge_weight is not None else None
+        self.A = _adjacency(edge_index.cpu().numpy(), edge_weight, num_nodes)
+        self.At = self.A.T.tocsr()
+        self.deg = np.zeros(num_nodes)
+        row, col, value = self._laplacian_rows(np.arange(num_nodes, dtype=np.int64), np.arange(num_nodes, dtype=np.int64))
+        self.M = sp.csr_matrix((value, (row, col)), shape=(num_nodes, num_nodes))
+        self.M.sort_indices()
+
+    def _deg_inv_sqrt(self, nodes):
+        deg = self.deg[nodes]
+        return np.power(np.where(deg == 0, 1.0, deg), -0.5)
+
+    def _laplacian_rows(self, touched, rows):
+        # entries of the rows of M = -(D^-1/2 A_sym D^-1/2) * operation, the diagonal included, once the degrees of the
+        # touched nodes (sorted, among the sorted rows) are updated: the degrees of the other nodes do not change
+        row, col, A_sym, operation = sign_magnetic_rows(self.A, self.At, rows, self.gcn, self.net_flow)
+        degree = np.bincount(np.searchsorted(rows, row), weights=np.abs(A_sym), minlength=len(rows))
+        self.deg[touched] = degree[np.searchsorted(rows, touched)]
+        value = -(self._deg_inv_sqrt(row) * A_sym * self._deg_inv_sqrt(col)) * operation
+        keep = value != 0
+        return row[keep], col[keep], value[keep]
+
+    def _splice_adjacency(self, matrix, rows, changed, row, col, weight):
+        # replace the entries changed (keys) of the rows (sorted) by the inserted ones (row, col, weight)
+        old_row, old_col, old_weight = _row_entries(matrix, rows)
+        kept = ~np.isin(old_row * self.num_nodes + old_col, changed)
+        row = np.concatenate([old_row[kept], row])
+        col = np.concatenate([old_col[kept], col])
+        weight = np.concatenate([old_weight[kept], weight])
+        nonzero = weight != 0
+        return _replace_rows(matrix, rows, row[nonzero], col[nonzero], weight[nonzero])
+
+    def update(self, insert_edges: Optional[torch.LongTensor] = None, insert_weight: Optional[torch.Tensor] = None,
+               delete_edges: Optional[torch.LongTensor] = None) -> np.ndarray:
+        r"""Apply a batch of edge updates.
+        Arg types:
+            * **insert_edges** (PyTorch LongTensor, optional) - Inserted edges, with shape (2, num_inserted). The weight of an existing edge is replaced.
+            * **insert_weight** (PyTorch Tensor, optional) - The weights of the inserted edges, ones if None.
+            * **delete_edges** (PyTorch LongTensor, optional) - Deleted edges, with shape (2, num_deleted).
+        Return types:
+            * **changed** (np.ndarray) - The sorted nodes whose row (and, M being Hermitian, column) of M changed:
+              the endpoints of the updated edges and their neighbours.
+        """
+        N = self.num_nodes
+        empty = np.zeros(0, dtype=np.int64)
+        deleted_row, deleted_col = delete_edges.cpu().numpy() if delete_edges is not None and delete_edges.numel() > 0 else (empty, empty)
+        row, col = insert_edges.cpu().numpy() if insert_edges is not None and insert_edges.numel() > 0 else (empty, empty)
+        weight = np.ones(len(row)) if insert_weight is None else insert_weight.cpu().numpy().astype(np.float64)
+        mask = row != col
+        row, col, weight = row[mask], col[mask], weight[mask]
+        # the duplicated insertions are summed, as in _adjacency
+        keys, inverse = np.unique(row * N + col, return_inverse=True)
+        weight = np.bincount(inverse, weights=weight, minlength=len(keys))
+        row, col = keys // N, keys % N
+        changed_row, changed_col = np.concatenate([deleted_row, row]), np.concatenate([deleted_col, col])
+        touched = np.union1d(changed_row, changed_col)
+        if len(touched) == 0:
+            return empty
+
+        # the old neighbours of the touched nodes, whose entries in the columns of the touched nodes change
+        _, old_neighbors, _ = _row_entries(self.M, touched)
+        self.A = self._splice_adjacency(self.A, np.unique(changed_row), changed_row * N + changed_col, row, col, weight)
+        self.At = self._splice_adjacency(self.At, np.unique(changed_col), changed_col * N + changed_row, col, row, weight)
+
+        row, col, value = self._laplacian_rows(touched, touched)
+        changed = np.union1d(touched, np.union1d(old_neighbors, col))
+        neighbors = np.setdiff1d(changed, touched, assume_unique=True)
+        neighbor_row, neighbor_col, neighbor_value = self._laplacian_rows(touched[:0], neighbors)
+        self.M = _replace_rows(self.M, changed, np.concatenate([row, neighbor_row]), np.concatenate([col, neighbor_col]),
+                               np.concatenate([value, neighbor_value]))
+        return changed
+
+    def laplacian(self, dtype: torch.dtype = torch.float32, device: Optional[torch.device] = None):
+        r"""The Laplacian in the format of :obj:`laplacian.process_magnetic_laplacian` (normalization sym), to build a model.
+        Return types:
+            * **edge_index** (PyTorch LongTensor) - The indices of the entries of the Laplacian.
+            * **norm_real, norm_imag** (PyTorch Tensor) - Their real and imaginary parts.
+        """
+        M = self.M.tocoo()
+        edge_index = torch.from_numpy(np.vstack((M.row, M.col)).astype(np.int64)).to(device)
+        return edge_index, torch.from_numpy(M.data.real).to(dtype).to(device), torch.from_numpy(M.data.imag).to(dtype).to(device)
+
+    def edge_index(self):
+        A = self.A.tocoo()
+        edge_index = torch.from_numpy(np.vstack((A.row, A.col)).astype(np.int64))
+        return edge_index, torch.from_numpy(A.data).float()
+
+
+class IncrementalSigMaNet(object):
+    r"""Incremental inference for a trained SigMaNet model on a graph that gains or loses edges.
+
+    The Sign-Magnetic Laplacian M is kept by an :obj:`IncrementalLaplacian`. An update recomputes the rows of M around
+    the touched nodes and then the output of each layer only on the rows that can change: their ball, grown by a
+    frontier search over the rows of M (whose pattern is symmetric), is cut out of M as a small operator on which
+    the convolution runs, and the cached activations are kept everywhere else. :obj:`work` records, for each layer
+    of the last update, the recomputed rows, the nodes of the small operator and its entries.
+
+    Arg types:
+        * **model** (torch.nn.Module) - A SigMaNet model built with :obj:`edge_index` (SigMaNet_link_prediction_one_laplacian
+            or SigMaNet_node_prediction_one_laplacian).
+        * **edge_index** (PyTorch LongTensor) - The edges of the current graph.
+        * **edge_weight** (PyTorch Tensor, optional) - The edge weights. (default: :obj:`None`)
+        * **num_nodes** (int) - The number of nodes, fixed across the updates.
+        * **x_real, x_imag** (PyTorch Float Tensor) - The node features.
+        * **gcn, net_flow** (bool) - The options used to build the Laplacian of the model.
+    """
+    def __init__(self, model: torch.nn.Module, edge_index: torch.LongTensor, edge_weight: Optional[torch.Tensor], num_nodes: int,
+                 x_real: torch.FloatTensor, x_imag: torch.FloatTensor, gcn: bool = True, net_flow: bool = True):
+        assert model.operator is not None, 'The model must be built with edge_index'
+        self.model = model
+        self.num_nodes = num_nodes
+        self.gcn = gcn
+        self.net_flow = net_flow
+        self.device = x_real.device
+        self.dtype = model.operator.real.dtype
+        self.laplacian = IncrementalLaplacian(edge_index, edge_weight, num_nodes, gcn, net_flow)
+        self.work = []
+
+        self.refresh(x_real, x_imag)
+
+    @property
+    def A(self):
+        return self.laplacian.A
+
+    @property
+    def M(self):
+        return self.laplacian.M
+
+    def _hops(self, conv):
+        return 1 if conv.gcn else max(conv.weight.size(0) - 1, 0)
+
+    def _operator(self, nodes=None, targets=None):
+        # the operator of the whole graph, or that of the entries of M from the sorted nodes into the sorted targets
+        # (among the nodes), renumbered by their position in nodes
+        if nodes is None:
+            M = self.M.tocoo()
+            row, col, value, size = M.row, M.col, M.data, self.num_nodes
+        else:
+            row, col, value = _row_entries(self.M, nodes)
+            keep = _isin_sorted(col, targets)
+            row, col, value = np.searchsorted(nodes, row[keep]), np.searchsorted(nodes, col[keep]), value[keep]
+            size = len(nodes)
+        edge_index = torch.from_numpy(np.vstack((row, col)).astype(np.int64)).to(self.device)
+        return GraphOperator(edge_index, num_nodes=size, negate=self.model.operator.negate, dtype=self.dtype,
+                             real=torch.from_numpy(value.real.copy()), imag=torch.from_numpy(value.imag.copy()))
+
+    @contextmanager
+    def _using(self, operator):
+        convs = list(self.model.Chebs)
+        previous = [conv.operator for conv in convs]
+        for conv in convs:
+            conv.operator = operator
+        try:
+            yield
+        finally:
+            for conv, op in zip(convs, previous):
+                conv.operator = op
+
+    def _ball(self, nodes, hops):
+        # the sorted nodes within hops of the sorted nodes, by a frontier search over the rows of M
+        ball, frontier = nodes, nodes
+        for _ in range(hops):
+            if len(frontier) == 0:
+                break
+            _, reached, _ = _row_entries(self.M, frontier)
+            frontier = np.setdiff1d(reached, ball)
+            ball = np.union1d(ball, frontier)
+        return ball
+
+    def _layer(self, conv, real, imag):
+        real, imag = conv(real, imag)
+        if self.model.activation:
+            real, imag = self.model.complex_relu(real, imag)
+        return real, imag
+
+    def refresh(self, x_real: torch.FloatTensor, x_imag: torch.FloatTensor):
+        r"""Full recomputation of the cached activations with the current Laplacian."""
+        self.model.eval()
+        self.layers = [(x_real.clone(), x_imag.clone())]
+        with torch.no_grad(), self._using(self._operator()):
+            real, imag = x_real, x_imag
+            for conv in self.model.Chebs:
+                real, imag = self._layer(conv, real, imag)
+                self.layers.append((real, imag))
+        return self.embeddings
+
+    @property
+    def embeddings(self):
+        return self.layers[-1]
+
+    def update(self, insert_edges: Optional[torch.LongTensor] = None, insert_weight: Optional[torch.Tensor] = None,
+               delete_edges: Optional[torch.LongTensor] = None, x_real: Optional[torch.FloatTensor] = None,
+               x_imag: Optional[torch.FloatTensor] = None):
+        r"""Apply a batch of edge updates and refresh the embeddings, whose changed rows are written in place.
+        Arg types:
+            * **insert_edges** (PyTorch LongTensor, optional) - Inserted edges, with shape (2, num_inserted). The weight of an existing edge is replaced.
+            * **insert_weight** (PyTorch Tensor, optional) - The weights of the inserted edges, ones if None.
+            * **delete_edges** (PyTorch LongTensor, optional) - Deleted edges, with shape (2, num_deleted).
+            * **x_real, x_imag** (PyTorch Float Tensor, optional) - The new node features, e.g. the updated degrees, unchanged if None.
+        Return types:
+            * **embeddings** (tuple of PyTorch Float Tensor) - The refreshed output of the last layer.
+            * **recomputed** (list of int) - The number of rows recomputed in each layer.
+        """
+        # the rows whose operator column changed
+        operator_changed = self.laplacian.update(insert_edges, insert_weight, delete_edges)
+
+        # the rows whose input changed
+        input_changed = np.zeros(0, dtype=np.int64)
+        if x_real is not None:
+            cached_real, cached_imag = self.layers[0]
+            input_changed = np.flatnonzero(((x_real != cached_real).any(dim=1) | (x_imag != cached_imag).any(dim=1)).cpu().numpy())
+            index = torch.from_numpy(input_changed).to(self.device)
+            cached_real[index], cached_imag[index] = x_real[index], x_imag[index]
+
+        recomputed = []
+        self.work = []
+        self.model.eval()
+        with torch.no_grad():
+            for l, conv in enumerate(self.model.Chebs):
+                hops = self._hops(conv)
+                # the k-th propagation changes on the operator changes and on the neighbours of the changes of the (k-1)-th
+                targets = input_changed
+                for _ in range(hops):
+                    targets = np.union1d(operator_changed, self._ball(targets, 1))
+                recomputed.append(len(targets))
+                if len(targets) == 0:
+                    self.work.append({'targets': 0, 'nodes': 0, 'entries': 0})
+                    input_changed = targets
+                    continue
+                # the intermediate propagations are needed on the ball of radius hops-1 around the targets,
+                # which reads its inputs on the ball of radius hops
+                inner = self._ball(targets, max(hops - 1, 0))
+                nodes = self._ball(inner, 1) if hops > 0 else inner
+                operator = self._operator(nodes, inner)
+                self.work.append({'targets': len(targets), 'nodes': len(nodes), 'entries': operator.edge_index.size(1)})
+
+                local = torch.from_numpy(nodes).to(self.device)
+                real, imag = self.layers[l]
+                with self._using(operator):
+                    real, imag = self._layer(conv, real[local], imag[local])
+                position = torch.from_numpy(np.searchsorted(nodes, targets)).to(self.device)
+                index = torch.from_numpy(targets).to(self.device)
+                cached_real, cached_imag = self.layers[l+1]
+                cached_real[index], cached_imag[index] = real[position], imag[position]
+                input_changed = targets
+        return self.embeddings, recomputed
+
+    def sync_model(self):
+        r"""Rebuild the shared operator of the model from the current Laplacian, for a later full forward."""
+        operator = self._operator()
+        self.model.operator = operator
+        for conv in self.model.Chebs:
+            conv.operator = operator
+
+    def edge_index(self):
+        return self.laplacian.edge_index()
+
+    def check_against_full(self, atol: float = 1e-5):
+        r"""Compare the incremental Laplacian with the one built from the current edges by
+        :obj:`laplacian.process_magnetic_laplacian`, and the embeddings with a full forward over the incremental
+        Laplacian. The forward does not use the rebuilt Laplacian, whose duplicate entries are summed in another order:
+        a rounding of 1e-7 there flips the sign of the pre-activations that are exactly 0 in complex_relu.
+        Return types:
+            * **laplacian_error** (float) - The largest absolute difference between the Laplacians.
+            * **embedding_error** (float) - The largest absolute difference between the embeddings and those of a full forward.
+            * **ok** (bool) - Whether both errors are below :obj:`atol`.
+        """
+        edge_index, edge_weight = self.edge_index()
+        x_real, x_imag = self.layers[0]
+        index, norm_real, norm_imag = laplacian.process_magnetic_laplacian(edge_index=edge_index, gcn=self.gcn, net_flow=self.net_flow,
+                                                                           x_real=x_real.cpu(), edge_weight=edge_weight, normalization='sym')
+        index = index.cpu().numpy()
+        full = sp.coo_matrix((norm_real.cpu().numpy() + 1j*norm_imag.cpu().numpy(), (index[0], index[1])),
+                             shape=(self.num_nodes, self.num_nodes)).tocsr()
+        laplacian_error = abs(full - self.M).max() if full.nnz + self.M.nnz > 0 else 0.0
+
+        with torch.no_grad(), self._using(self._operator()):
+            real, imag = x_real, x_imag
+            for conv in self.model.Chebs:
+                real, imag = self._layer(conv, real, imag)
+        embedding_error = max((real - self.embeddings[0]).abs().max().item(), (imag - self.embeddings[1]).abs().max().item())
+        return float(laplacian_error), embedding_error, bool(laplacian_error <= atol and embedding_error <= atol)
@@ -21,6 +21,10 @@ from utils.save_settings import write_log
 from utils.hermitian import hermitian_decomp_sparse
 from utils.edge_data import in_out_degree
 from utils.preprocess import load_syn
+from utils.checkpoint import CheckpointManager
+from utils.instrument import timed, start_run, set_split, end_run
+from utils.profiling import EpochProfiler
+from utils.parallel_splits import StackedModels
 
 
 
@@ -41,7 +45,7 @@ def parse_args():
 
     parser.add_argument('--K', type=int, default=1, help='K for cheb series')
     parser.add_argument('--layer', type=int, default=2, help='How many layers of gcn in the model, default 2 layers.')
-    parser.add_argument('--dropout', type=float, default=0.0, help='dropout prob')
+    parser.add_argument('--dropout', type=float, default=None, help='dropout prob (the default of the model if not set)')
     parser.add_argument('--netflow', '-N', action='store_false', help='if use net flow')
     parser.add_argument('--follow_math', '-F', action='store_false', help='if follow math')
 
@@ -53,6 +57,9 @@ def parse_args():
 
     parser.add_argument('--num_filter', type=int, default=32, help='num of filters')
     parser.add_argument('--randomseed', type=int, default=0, help='if set random seed in training')
+    parser.add_argument('--parallel_splits', action='store_true', help='train all the splits simultaneously (stacked models sharing the graph operator); requires --dropout 0 (the model has dropout 0.5 by default), with which the results are those of the sequential loop')
+    parser.add_argument('--profile', action='store_true', help='profile a window of epochs of every split and the laplacian with torch.profiler (traces in log_path/profile)')
+    parser.add_argument('--profile_schedule', type=lambda s: [int(item) for item in s.split(',')], default="1,1,3,1", help='wait, warmup, active and repeat epochs of --profile')
     return parser.parse_args()
 
 
@@ -70,6 +77,153 @@ def sparse_mx_to_torch_sparse_tensor(sparse_mx):
     shape = torch.Size(sparse_mx.shape)
     return torch.sparse.FloatTensor(indices, values, shape)
 
+def train_split(args, model, X_real, X_img, label, train_index, val_index, checkpoints, split, profiler):
+    criterion = nn.NLLLoss()
+    opt = optim.Adam(model.parameters(), lr=args.lr, weight_decay=args.l2)
+    log_str_full = ''
+
+    #################################
+    # Train/Validation/Test
+    #################################
+    best_test_err = 1000.0
+    early_stopping = 0
+    profiler.start()
+    for epoch in range(args.epochs):
+        start_time = time.time()
+        ####################
+        # Train
+        ####################
+        count, train_loss, train_acc = 0.0, 0.0, 0.0
+
+        # for loop for batch loading
+        count += np.sum(train_index)
+
+        model.train()
+        with timed('forward'):
+            preds = model(X_real, X_img)
+        train_loss = criterion(preds[train_index], label[train_index])
+        pred_label = preds.max(dim = 1)[1]
+        #train_acc = 1.0*((pred_label[:,train_index] == label[:,train_index])).sum().detach().item()/count
+        train_acc = acc(pred_label, label, train_index)
+        opt.zero_grad()
+        with timed('backward'):
+            train_loss.backward()
+        with timed('step'):
+            opt.step()
+
+        outstrtrain = 'Train loss:, %.6f, acc:, %.3f,' % (train_loss.detach().item(), train_acc)
+        #scheduler.step()
+        ####################
+        # Validation
+        ####################
+        model.eval()
+        count, test_loss, test_acc = 0.0, 0.0, 0.0
+
+        # for loop for batch loading
+        with timed('evaluation'):
+            count += np.sum(val_index)
+            preds = model(X_real, X_img)
+            pred_label = preds.max(dim = 1)[1]
+
+            test_loss = criterion(preds[val_index], label[val_index])
+            #test_acc = 1.0*((pred_label[:,val_index] == label[:,val_index])).sum().detach().item()/count
+            test_acc = acc(pred_label, label, val_index)
+        outstrval = ' Test loss:, %.6f, acc:, %.3f,' % (test_loss.detach().item(), test_acc)
+
+        duration = "---, %.4f, seconds ---" % (time.time() - start_time)
+        log_str = ("%d ,/, %d ,epoch," % (epoch, args.epochs))+outstrtrain+outstrval+duration
+        log_str_full += log_str + '\n'
+        #print(log_str)
+
+        ####################
+        # Save weights
+        ####################
+        save_perform_err = test_loss.detach().item()
+        save_perform_acc = test_acc
+        if save_perform_err <= best_test_err:
+            early_stopping = 0
+            best_test_err = save_perform_err
+            checkpoints.update('model_err'+str(split), model)
+        else:
+            early_stopping += 1
+        profiler.step()
+        if early_stopping > 500 or epoch == (args.epochs-1):
+            checkpoints.update('model_latest'+str(split), model)
+            break
+    profiler.stop()
+    return log_str_full
+
+
+def train_stacked_splits(args, models, X_real, X_img, label, train_mask, val_mask, checkpoints, profiler):
+    # all the splits share the graph: their models are stacked and trained together, one vmapped forward per epoch
+    stacked = StackedModels(models)
+    opt = optim.Adam(stacked.parameters(), lr=args.lr, weight_decay=args.l2)
+    splits = len(models)
+    train_mask = torch.from_numpy(train_mask.T).to(device)
+    val_mask = torch.from_numpy(val_mask.T).to(device)
+    labels = label.unsqueeze(0).expand(splits, -1)
+
+    def split_loss_acc(preds, mask):
+        # per split mean nll and accuracy over its own nodes, shape (splits,)
+        count = mask.sum(dim=1)
+        loss = -(preds.gather(2, labels.unsqueeze(2)).squeeze(2) * mask).sum(dim=1) / count
+        correct = ((preds.max(dim = 2)[1] == labels) & mask).sum(dim=1)
+        return loss, correct.double() / count
+
+    log_str_full = [''] * splits
+    best_test_err = [1000.0] * splits
+    early_stopping = [0] * splits
+    running = list(range(splits))
+    profiler.start()
+    for epoch in range(args.epochs):
+        start_time = time.time()
+        ####################
+        # Train
+        ####################
+        stacked.train()
+        with timed('forward'):
+            train_loss, train_acc = split_loss_acc(stacked(X_real, X_img), train_mask)
+        opt.zero_grad()
+        # the splits are independent, so the sum of the losses gives each model its own gradient
+        with timed('backward'):
+            train_loss.sum().backward()
+        with timed('step'):
+            opt.step()
+
+        ####################
+        # Validation
+        ####################
+        with timed('evaluation'):
+            stacked.eval()
+            with torch.no_grad():
+                test_loss, test_acc = split_loss_acc(stacked(X_real, X_img), val_mask)
+        duration = "---, %.4f, seconds ---" % (time.time() - start_time)
+
+        for split in list(running):
+            outstrtrain = 'Train loss:, %.6f, acc:, %.3f,' % (train_loss[split].item(), train_acc[split].item())
+            outstrval = ' Test loss:, %.6f, acc:, %.3f,' % (test_loss[split].item(), test_acc[split].item())
+            log_str_full[split] += ("%d ,/, %d ,epoch," % (epoch, args.epochs))+outstrtrain+outstrval+duration + '\n'
+
+            ####################
+            # Save weights
+            ####################
+            save_perform_err = test_loss[split].item()
+            if save_perform_err <= best_test_err[split]:
+                early_stopping[split] = 0
+                best_test_err[split] = save_perform_err
+                checkpoints.update('model_err'+str(split), stacked.state_dict(split))
+            else:
+                early_stopping[split] += 1
+            if early_stopping[split] > 500 or epoch == (args.epochs-1):
+                checkpoints.update('model_latest'+str(split), stacked.state_dict(split))
+                # a stopped split keeps being updated with the others, but it is not recorded anymore
+                running.remove(split)
+        profiler.step()
+        if len(running) == 0:
+            break
+    profiler.stop()
+    return log_str_full
+
 def main(args):
 
     random.seed(args.randomseed)
@@ -81,12 +235,15 @@ def main(args):
     log_path = os.path.join(args.log_root, args.log_path, args.save_name, date_time)
     if os.path.isdir(log_path) == False:
         os.makedirs(log_path)
+    checkpoints = CheckpointManager(log_path)
+    start_run(log_path, args)
 
     dataset_name = args.dataset.split('/')
-    if len(dataset_name) == 1:
-        data = load_directed_real_data(dataset=dataset_name[0], name=dataset_name[0])
-    else:
-        data = load_directed_real_data(dataset=dataset_name[0], name=dataset_name[1])
+    with timed('dataset'):
+        if len(dataset_name) == 1:
+            data = load_directed_real_data(dataset=dataset_name[0], name=dataset_name[0])
+        else:
+            data = load_directed_real_data(dataset=dataset_name[0], name=dataset_name[1])
     dataset = data
 
     if not data.__contains__('edge_weight'):
@@ -116,114 +273,70 @@ def main(args):
         X_img  = torch.FloatTensor(X).to(device)
         X_real = torch.FloatTensor(X).to(device)
 
-    criterion = nn.NLLLoss()
-
-    edge_index, norm_real, norm_imag = laplacian.process_magnetic_laplacian(edge_index=dataset.edge_index, gcn=gcn, net_flow=args.netflow, x_real=X_real, edge_weight=dataset.edge_weight, \
-         normalization = 'sym', return_lambda_max = False)
+    profile_path = os.path.join(log_path, 'profile')
+    with EpochProfiler(profile_path, args.profile_schedule, args.profile).region('laplacian'), timed('laplacian'):
+        edge_index, norm_real, norm_imag = laplacian.process_magnetic_laplacian(edge_index=dataset.edge_index, gcn=gcn, net_flow=args.netflow, x_real=X_real, edge_weight=dataset.edge_weight, \
+             normalization = 'sym', return_lambda_max = False)
       
 
     splits = train_mask.shape[1]
     if len(test_mask.shape) == 1:
         test_mask = np.repeat(test_mask[:,np.newaxis], splits, 1)
 
-    results = np.zeros((splits, 4))
-    for split in range(splits):
-        log_str_full = ''
+    # the dropout of the model is only changed by --dropout, the default runs keep their own
+    dropout = {} if args.dropout is None else {'dropout': args.dropout}
 
-        model = SigMaNet_node_prediction_one_laplacian(K=args.K, num_features=X_real.size(-1), hidden=args.num_filter, label_dim=cluster_dim,
+    def build_model(split):
+        return SigMaNet_node_prediction_one_laplacian(K=args.K, num_features=X_real.size(-1), hidden=args.num_filter, label_dim=cluster_dim,
                             i_complex = False,  layer=args.layer, follow_math=args.follow_math, gcn =gcn, net_flow=args.netflow, unwind = True, edge_index=edge_index,\
-                            norm_real=norm_real, norm_imag=norm_imag).to(device)
+                            norm_real=norm_real, norm_imag=norm_imag, **dropout).to(device)
 
-        opt = optim.Adam(model.parameters(), lr=args.lr, weight_decay=args.l2)
+    if args.parallel_splits:
+        # without dropout the training draws no random numbers, so the models built here in a row get the
+        # initializations of the sequential loop, which builds each one after training the previous ones
+        models = [build_model(split) for split in range(splits)]
+        assert all(model.dropout == 0 for model in models), \
+            'The stacked splits only reproduce the sequential loop without dropout, run --parallel_splits with --dropout 0'
+        profiler = EpochProfiler(os.path.join(profile_path, 'stacked'), args.profile_schedule, args.profile)
+        logs = train_stacked_splits(args, models, X_real, X_img, label, train_mask, val_mask, checkpoints, profiler)
 
+    results = np.zeros((splits, 4))
+    for split in range(splits):
+        set_split(split)
         train_index = train_mask[:,split]
         val_index = val_mask[:,split]
         test_index = test_mask[:,split]
 
-        #################################
-        # Train/Validation/Test
-        #################################
-        best_test_err = 1000.0
-        early_stopping = 0
-        for epoch in range(args.epochs):
-            start_time = time.time()
-            ####################
-            # Train
-            ####################
-            count, train_loss, train_acc = 0.0, 0.0, 0.0
-
-            # for loop for batch loading
-            count += np.sum(train_index)
-
-            model.train()
-            preds = model(X_real, X_img)
-            train_loss = criterion(preds[train_index], label[train_index])
-            pred_label = preds.max(dim = 1)[1]
-            #train_acc = 1.0*((pred_label[:,train_index] == label[:,train_index])).sum().detach().item()/count
-            train_acc = acc(pred_label, label, train_index)
-            opt.zero_grad()
-            train_loss.backward()
-            opt.step()
-
-            outstrtrain = 'Train loss:, %.6f, acc:, %.3f,' % (train_loss.detach().item(), train_acc)
-            #scheduler.step()
-            ####################
-            # Validation
-            ####################
-            model.eval()
-            count, test_loss, test_acc = 0.0, 0.0, 0.0
-
-            # for loop for batch loading
-            count += np.sum(val_index)
-            preds = model(X_real, X_img)
-            pred_label = preds.max(dim = 1)[1]
-
-            test_loss = criterion(preds[val_index], label[val_index])
-            #test_acc = 1.0*((pred_label[:,val_index] == label[:,val_index])).sum().detach().item()/count
-            test_acc = acc(pred_label, label, val_index)
-            outstrval = ' Test loss:, %.6f, acc:, %.3f,' % (test_loss.detach().item(), test_acc)
-
-            duration = "---, %.4f, seconds ---" % (time.time() - start_time)
-            log_str = ("%d ,/, %d ,epoch," % (epoch, args.epochs))+outstrtrain+outstrval+duration
-            log_str_full += log_str + '\n'
-            #print(log_str)
-
-            ####################
-            # Save weights
-            ####################
-            save_perform_err = test_loss.detach().item()
-            save_perform_acc = test_acc
-            if save_perform_err <= best_test_err:
-                early_stopping = 0
-                best_test_err = save_perform_err
-                torch.save(model.state_dict(), log_path + '/model_err'+str(split)+'.t7')
-            else:
-                early_stopping += 1
-            if early_stopping > 500 or epoch == (args.epochs-1):
-                torch.save(model.state_dict(), log_path + '/model_latest'+str(split)+'.t7')
-                break
+        if args.parallel_splits:
+            model, log_str_full = models[split], logs[split]
+        else:
+            model = build_model(split)
+            profiler = EpochProfiler(os.path.join(profile_path, 'split'+str(split)), args.profile_schedule, args.profile)
+            log_str_full = train_split(args, model, X_real, X_img, label, train_index, val_index, checkpoints, split, profiler)
 
         write_log(vars(args), log_path)
 
         ####################
         # Testing
         ####################
-        model.load_state_dict(torch.load(log_path + '/model_err'+str(split)+'.t7'))
-        model.eval()
-        preds = model(X_real, X_img)
-        pred_label = preds.max(dim = 1)[1]
-        np.save(log_path + '/pred_err' + str(split), pred_label.to('cpu'))
-        acc_train = acc(pred_label, label, val_index)
-        acc_test = acc(pred_label, label, test_index)
+        checkpoints.persist()
+        with timed('evaluation'):
+            checkpoints.load('model_err'+str(split), model)
+            model.eval()
+            preds = model(X_real, X_img)
+            pred_label = preds.max(dim = 1)[1]
+            np.save(log_path + '/pred_err' + str(split), pred_label.to('cpu'))
+            acc_train = acc(pred_label, label, val_index)
+            acc_test = acc(pred_label, label, test_index)
 
 
-        model.load_state_dict(torch.load(log_path + '/model_latest'+str(split)+'.t7'))
-        model.eval()
-        preds = model(X_real, X_img)
-        pred_label = preds.max(dim = 1)[1]
-        np.save(log_path + '/pred_latest' + str(split), pred_label.to('cpu'))
-        acc_train_latest = acc(pred_label, label, val_index)
-        acc_test_latest = acc(pred_label, label, test_index)
+            checkpoints.load('model_latest'+str(split), model)
+            model.eval()
+            preds = model(X_real, X_img)
+            pred_label = preds.max(dim = 1)[1]
+            np.save(log_path + '/pred_latest' + str(split), pred_label.to('cpu'))
+            acc_train_latest = acc(pred_label, label, val_index)
+            acc_test_latest = acc(pred_label, label, test_index)
 
         ####################
         # Save testing results
@@ -235,7 +348,10 @@ def main(args):
         with open(log_path + '/log'+str(split)+'.csv', 'w') as file:
             file.write(log_str_full)
             file.write('\n')
+        checkpoints.clear()
         torch.cuda.empty_cache()
+    end_run()
+    checkpoints.close()
     return results
 
 if __name__ == "__main__":
@@ -20,6 +20,8 @@ from utils.hermitian import hermitian_decomp_sparse
 from torch_geometric_signed_directed.data import load_directed_real_data
 from utils.edge_data import in_out_degree
 from utils.preprocess import load_syn
+from utils.checkpoint import CheckpointManager
+from utils.instrument import timed, start_run, set_split, end_run
 
 
 
@@ -78,6 +80,8 @@ def main(args):
     log_path = os.path.join(args.log_root, args.log_path, args.save_name, date_time)
     if os.path.isdir(log_path) == False:
         os.makedirs(log_path)
+    checkpoints = CheckpointManager(log_path)
+    start_run(log_path, args)
 
 
     _file_ = args.data_path+args.dataset+'/data'+str(args.q)+'_'+str(args.K)+'_sparse.pk'
@@ -98,18 +102,20 @@ def main(args):
 #     else:
 #         load_func, subset = args.dataset.split('/')[0], args.dataset.split('/')[1]
 #      #save_name = args.method_name + '_' + 'Layer' + str(args.layer) + '_' + 'lr' + str(args.lr) + 'num_filters' + str(int(args.num_filter))+ '_' + 'task' + str((args.task))
-    if len(dataset_name) == 1:
-        data = load_directed_real_data(dataset=dataset_name[0], name=dataset_name[0])
-    else:
-        data = load_directed_real_data(dataset=dataset_name[0], name=dataset_name[1])
+    with timed('dataset'):
+        if len(dataset_name) == 1:
+            data = load_directed_real_data(dataset=dataset_name[0], name=dataset_name[0])
+        else:
+            data = load_directed_real_data(dataset=dataset_name[0], name=dataset_name[1])
     dataset = data
     size = dataset.y.size(-1)
     f_node, e_node = dataset.edge_index[0], dataset.edge_index[1]
 
     #exit()
     #L = to_edge_dataset_sparse(args.q,  dataset.edge_index, args.K, 0, size, root=args.data_path+args.dataset, laplacian=True, norm=args.not_norm, gcn_appr = False)
-    L = hermitian_decomp_sparse(f_node, e_node, size, args.q, norm=args.not_norm, laplacian=True,  max_eigen = 2.0, gcn_appr = False, edge_weight = dataset.edge_weight)
-    L = cheb_poly_sparse(L, args.K)
+    with timed('laplacian'):
+        L = hermitian_decomp_sparse(f_node, e_node, size, args.q, norm=args.not_norm, laplacian=True,  max_eigen = 2.0, gcn_appr = False, edge_weight = dataset.edge_weight)
+        L = cheb_poly_sparse(L, args.K)
 
 
     label = dataset.y.data.numpy().astype('int')
@@ -146,6 +152,7 @@ def main(args):
 
     results = np.zeros((splits, 4))
     for split in range(splits):
+        set_split(split)
         log_str_full = ''
 
         model = ChebNet(X_real.size(-1), L_real, L_img, K = args.K, label_dim=cluster_dim, layer = args.layer,
@@ -174,13 +181,16 @@ def main(args):
             count += np.sum(train_index)
 
             model.train()
-            preds = model(X_real, X_img)
+            with timed('forward'):
+                preds = model(X_real, X_img)
             train_loss = criterion(preds[:,:,train_index], label[:,train_index])
             pred_label = preds.max(dim = 1)[1]
             train_acc = 1.0*((pred_label[:,train_index] == label[:,train_index])).sum().detach().item()/count
             opt.zero_grad()
-            train_loss.backward()
-            opt.step()
+            with timed('backward'):
+                train_loss.backward()
+            with timed('step'):
+                opt.step()
 
             outstrtrain = 'Train loss:, %.6f, acc:, %.3f,' % (train_loss.detach().item(), train_acc)
             #scheduler.step()
@@ -191,12 +201,13 @@ def main(args):
             count, test_loss, test_acc = 0.0, 0.0, 0.0
 
             # for loop for batch loading
-            count += np.sum(val_index)
-            preds = model(X_real, X_img)
-            pred_label = preds.max(dim = 1)[1]
+            with timed('evaluation'):
+                count += np.sum(val_index)
+                preds = model(X_real, X_img)
+                pred_label = preds.max(dim = 1)[1]
 
-            test_loss = criterion(preds[:,:,val_index], label[:,val_index])
-            test_acc = 1.0*((pred_label[:,val_index] == label[:,val_index])).sum().detach().item()/count
+                test_loss = criterion(preds[:,:,val_index], label[:,val_index])
+                test_acc = 1.0*((pred_label[:,val_index] == label[:,val_index])).sum().detach().item()/count
 
             outstrval = ' Test loss:, %.6f, acc:, %.3f,' % (test_loss.detach().item(), test_acc)
 
@@ -212,11 +223,11 @@ def main(args):
             if save_perform <= best_test_err:
                 early_stopping = 0
                 best_test_err = save_perform
-                torch.save(model.state_dict(), log_path + '/model'+str(split)+'.t7')
+                checkpoints.update('model'+str(split), model)
             else:
                 early_stopping += 1
             if early_stopping > 500 or epoch == (args.epochs-1):
-                torch.save(model.state_dict(), log_path + '/model_latest'+str(split)+'.t7')
+                checkpoints.update('model_latest'+str(split), model)
                 break
 
         write_log(vars(args), log_path)
@@ -224,29 +235,31 @@ def main(args):
         ####################
         # Testing
         ####################
-        model.load_state_dict(torch.load(log_path + '/model'+str(split)+'.t7'))
-        model.eval()
-        preds = model(X_real, X_img)
-        pred_label = preds.max(dim = 1)[1]
-        np.save(log_path + '/pred' + str(split), pred_label.to('cpu'))
+        checkpoints.persist()
+        with timed('evaluation'):
+            checkpoints.load('model'+str(split), model)
+            model.eval()
+            preds = model(X_real, X_img)
+            pred_label = preds.max(dim = 1)[1]
+            np.save(log_path + '/pred' + str(split), pred_label.to('cpu'))
 
-        count = np.sum(val_index)
-        acc_train = (1.0*((pred_label[:,val_index] == label[:,val_index])).sum().detach().item())/count
+            count = np.sum(val_index)
+            acc_train = (1.0*((pred_label[:,val_index] == label[:,val_index])).sum().detach().item())/count
 
-        count = np.sum(test_index)
-        acc_test = (1.0*((pred_label[:,test_index] == label[:,test_index])).sum().detach().item())/count
+            count = np.sum(test_index)
+            acc_test = (1.0*((pred_label[:,test_index] == label[:,test_index])).sum().detach().item())/count
 
-        model.load_state_dict(torch.load(log_path + '/model_latest'+str(split)+'.t7'))
-        model.eval()
-        preds = model(X_real, X_img)
-        pred_label = preds.max(dim = 1)[1]
-        np.save(log_path + '/pred_latest' + str(split), pred_label.to('cpu'))
+            checkpoints.load('model_latest'+str(split), model)
+            model.eval()
+            preds = model(X_real, X_img)
+            pred_label = preds.max(dim = 1)[1]
+            np.save(log_path + '/pred_latest' + str(split), pred_label.to('cpu'))
 
-        count = np.sum(val_index)
-        acc_train_latest = (1.0*((pred_label[:,val_index] == label[:,val_index])).sum().detach().item())/count
+            count = np.sum(val_index)
+            acc_train_latest = (1.0*((pred_label[:,val_index] == label[:,val_index])).sum().detach().item())/count
 
-        count = np.sum(test_index)
-        acc_test_latest = (1.0*((pred_label[:,test_index] == label[:,test_index])).sum().detach().item())/count
+            count = np.sum(test_index)
+            acc_test_latest = (1.0*((pred_label[:,test_index] == label[:,test_index])).sum().detach().item())/count
 
         ####################
         # Save testing results
@@ -258,7 +271,10 @@ def main(args):
         with open(log_path + '/log'+str(split)+'.csv', 'w') as file:
             file.write(log_str_full)
             file.write('\n')
+        checkpoints.clear()
         torch.cuda.empty_cache()
+    end_run()
+    checkpoints.close()
     return results
 
 if __name__ == "__main__":
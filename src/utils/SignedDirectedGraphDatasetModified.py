@@ -1,7 +1,8 @@
 from typing import Optional, Callable
 import os
-import json
 
+import numpy as np
+import pandas as pd
 import torch
 from torch_geometric.data import (InMemoryDataset, download_url, Data)
 
@@ -12,6 +13,8 @@ dataset_name_url_dic = {
     "epinions": 'https://github.com/SherylHYX/pytorch_geometric_signed_directed/raw/main/datasets/epinions.csv',
     'slashdot': 'https://github.com/SherylHYX/pytorch_geometric_signed_directed/raw/main/datasets/slashdot.csv'
 }
+# the lines of the edge file read at once by process
+CHUNK_SIZE = 1000000
 
 
 class SignedDirectedGraphDataset(InMemoryDataset):
@@ -72,32 +75,34 @@ class SignedDirectedGraphDataset(InMemoryDataset):
     #    download_url(self.url, self.raw_dir)
 
     def process(self):
-        data = []
-        edge_weight = []
-        edge_index = []
-        node_map = {}
         print(self.url)
-        with open(self.url, 'r', encoding='utf-8-sig') as f:
-            for line in f:
-                x = line.strip().split(',')
-                assert len(x) == 3
-                a, b = x[0], x[1]
-                if a not in node_map:
-                    node_map[a] = len(node_map)
-                if b not in node_map:
-                    node_map[b] = len(node_map)
-                a, b = node_map[a], node_map[b]
-                data.append([a, b])
-
-                edge_weight.append(float(x[2]))
-
-            edge_index = [[i[0], int(i[1])] for i in data]
-            edge_index = torch.tensor(edge_index, dtype=torch.long)
-            edge_index = edge_index.t().contiguous()
-            edge_weight = torch.FloatTensor(edge_weight)
-        map_file = os.path.join(self.processed_dir, 'node_id_map.json')
-        with open(map_file, 'w') as f:
-            f.write(json.dumps(node_map))
+        node_ids = pd.Index([], dtype=object)
+        edge_index, edge_weight = [], []
+        # the lines "source,target,weight" in chunks, the node ids kept as the strings of the file
+        reader = pd.read_csv(self.url, header=None, names=['source', 'target', 'weight'], encoding='utf-8-sig',
+                             dtype={'source': str, 'target': str, 'weight': np.float64}, chunksize=CHUNK_SIZE)
+        for chunk in reader:
+            assert not chunk.isnull().values.any(), 'Expected lines source,target,weight in %s' % self.url
+            # the nodes are numbered in their order of first appearance, source before target
+            ids = chunk[['source', 'target']].to_numpy(dtype=object).reshape(-1)
+            codes, uniques = pd.factorize(ids)
+            known = node_ids.get_indexer(uniques)
+            new = known < 0
+            known[new] = len(node_ids) + np.arange(new.sum())
+            node_ids = node_ids.append(pd.Index(uniques[new], dtype=object))
+            edge_index.append(known[codes].reshape(-1, 2))
+            edge_weight.append(chunk['weight'].to_numpy())
+
+        edge_index = torch.from_numpy(np.concatenate(edge_index).astype(np.int64)).t().contiguous()
+        edge_weight = torch.from_numpy(np.concatenate(edge_weight).astype(np.float32))
+        # node i is node_id_map[i] in the file, integers if all the ids are
+        node_map = node_ids.to_numpy(dtype=str)
+        try:
+            if np.array_equal(node_map.astype(np.int64).astype(str), node_map):
+                node_map = node_map.astype(np.int64)
+        except (ValueError, OverflowError):
+            pass
+        np.save(os.path.join(self.processed_dir, 'node_id_map.npy'), node_map)
 
         data = Data(edge_index=edge_index, edge_weight=edge_weight)
         data, slices = self.collate([data])
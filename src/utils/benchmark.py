@@ -0,0 +1,224 @@
+import os
+import sys
+import json
+import time
+import platform
+import traceback
+import subprocess
+import tracemalloc
+from collections import OrderedDict
+from typing import Callable, List, Optional
+
+import numpy as np
+import scipy
+import torch
+import torch.nn.functional as F
+
+from .instrument import Recorder, timed, _max_memory
+
+# one recorder for all the measures, so that they share its memory sampling thread
+_RECORDER = Recorder(measure=True)
+
+
+def synthetic_signed_digraph(num_nodes: int, avg_degree: float = 8.0, antiparallel: float = 0.1,
+                             undirected: float = 0.1, negative: float = 0.2, seed: int = 0):
+    r"""A random signed directed graph without self-loops.
+
+    :obj:`num_nodes * avg_degree` edges are drawn uniformly. A fraction :obj:`undirected` of them get the reverse edge
+    with the same weight (an undirected edge) and a fraction :obj:`antiparallel` the reverse edge with the opposite
+    weight (a pair of antiparallel edges), the others being one-way; a fraction :obj:`negative` of the weights is -1.
+
+    Arg types:
+        * **num_nodes** (int) - The number of nodes.
+        * **avg_degree** (float, optional) - The mean number of edges drawn per node, before the reverse edges. (default: 8.0)
+        * **antiparallel** (float, optional) - The fraction of edges with a reverse edge of opposite weight. (default: 0.1)
+        * **undirected** (float, optional) - The fraction of edges with a reverse edge of the same weight. (default: 0.1)
+        * **negative** (float, optional) - The fraction of negative weights. (default: 0.2)
+        * **seed** (int, optional) - The random seed. (default: 0)
+    Return types:
+        * **edge_index** (PyTorch LongTensor) - The edges, shape (2, num_edges).
+        * **edge_weight** (PyTorch FloatTensor) - The weights, 1 or -1.
+    """
+    assert antiparallel + undirected <= 1, 'The antiparallel and undirected fractions add up to more than 1'
+    rng = np.random.default_rng(seed)
+    num_edges = int(num_nodes * avg_degree)
+    row = rng.integers(0, num_nodes, num_edges, dtype=np.int64)
+    col = rng.integers(0, num_nodes - 1, num_edges, dtype=np.int64)
+    col += col >= row
+    # one edge per unordered pair, so that the reverse edges added below are the only ones
+    low, high = np.minimum(row, col), np.maximum(row, col)
+    _, first = np.unique(low * num_nodes + high, return_index=True)
+    row, col = row[first], col[first]
+    weight = np.where(rng.random(len(row)) < negative, -1.0, 1.0)
+
+    kind = rng.random(len(row))
+    same = kind < undirected
+    opposite = (kind >= undirected) & (kind < undirected + antiparallel)
+    edge_index = np.concatenate([np.stack([row, col]), np.stack([col[same], row[same]]), np.stack([col[opposite], row[opposite]])], axis=1)
+    edge_weight = np.concatenate([weight, weight[same], -weight[opposite]])
+    return torch.from_numpy(edge_index).long(), torch.from_numpy(edge_weight).float()
+
+
+def measure(function: Callable, repeat: int = 3) -> dict:
+    r"""Time :obj:`function()` over :obj:`repeat` calls and measure its memory.
+
+    The resident size and its growth come from the timed calls, the peak of the python allocations from one more
+    call traced by :obj:`tracemalloc` (which slows it down, so it is not timed).
+
+    Return types:
+        * **measure** (dict) - seconds (mean, min, max), rss_peak, rss_growth, tracemalloc_peak and cuda_peak in bytes.
+    """
+    _RECORDER.reset()
+    for _ in range(repeat):
+        with timed('run', _RECORDER):
+            function()
+    tracing = tracemalloc.is_tracing()
+    if not tracing:
+        tracemalloc.start()
+    try:
+        with timed('traced', _RECORDER):
+            function()
+    finally:
+        if not tracing:
+            tracemalloc.stop()
+    count, total, low, high = _RECORDER.stats[(None, 'run')]
+    memory = _RECORDER.memory[(None, 'run')]
+    return OrderedDict([('seconds', total / count), ('seconds_min', low), ('seconds_max', high),
+                        ('rss_peak', memory['rss_peak']), ('rss_growth', memory['rss_growth']),
+                        ('tracemalloc_peak', _RECORDER.memory[(None, 'traced')]['tracemalloc_peak']),
+                        ('cuda_peak', memory['cuda_peak'])])
+
+
+def link_queries(edge_index: torch.LongTensor, count: int, num_classes: int = 2, seed: int = 0):
+    r"""Query edges drawn from the graph with random labels, for throughput measures (which do not depend on what
+    is learnt).
+    Return types:
+        * **queries** (PyTorch LongTensor) - The query edges, shape (count, 2).
+        * **labels** (PyTorch LongTensor) - Their labels, in [0, num_classes).
+    """
+    generator = torch.Generator().manual_seed(seed)
+    index = torch.randint(0, edge_index.size(1), (count,), generator=generator)
+    return edge_index[:, index].t().contiguous(), torch.randint(0, num_classes, (count,), generator=generator)
+
+
+def train_throughput(model: torch.nn.Module, forward: Callable, queries: torch.LongTensor, labels: torch.LongTensor,
+                     eval_queries: torch.LongTensor, epochs: int = 20, warmup: int = 2, lr: float = 5e-3) -> dict:
+    r"""Train :obj:`model` for :obj:`epochs` full-batch epochs, each one evaluated, as the link drivers do.
+
+    The first :obj:`warmup` epochs (allocator and caches warming up) are not measured.
+
+    Arg types:
+        * **model** (torch.nn.Module) - The model, whose parameters are optimized with Adam.
+        * **forward** (callable) - The log-probabilities of the model for a tensor of query edges.
+        * **queries, labels** (PyTorch LongTensor) - The training queries and their labels.
+        * **eval_queries** (PyTorch LongTensor) - The queries of the evaluation.
+    Return types:
+        * **throughput** (dict) - mean seconds per epoch of the forward, backward, step and evaluation and in total,
+          epochs per second, and rss_peak, rss_growth, tracemalloc_peak and cuda_peak in bytes.
+    """
+    opt = torch.optim.Adam(model.parameters(), lr=lr)
+    for epoch in range(warmup + epochs):
+        if epoch == warmup:
+            _RECORDER.reset()
+        model.train()
+        with timed('forward', _RECORDER):
+            out = forward(queries)
+        loss = F.nll_loss(out, labels)
+        opt.zero_grad()
+        with timed('backward', _RECORDER):
+            loss.backward()
+        with timed('step', _RECORDER):
+            opt.step()
+        model.eval()
+        with timed('evaluation', _RECORDER), torch.no_grad():
+            forward(eval_queries)
+    seconds = _RECORDER.totals()
+    memory = None
+    for peaks in _RECORDER.memory_peaks().values():
+        memory = _max_memory(memory, peaks)
+    result = OrderedDict((stage, seconds[stage] / epochs) for stage in ['forward', 'backward', 'step', 'evaluation'])
+    result['epoch_seconds'] = sum(result.values())
+    result['epochs_per_second'] = 1.0 / result['epoch_seconds']
+    result.update(memory)
+    return result
+
+
+def scaling_exponents(results: List[dict], x: str, y: str = 'epoch_seconds') -> dict:
+    r"""The exponent b of the fit :obj:`y ~ x^b` of every benchmark case name, over its completed results (e.g. 1 for
+    a cost linear in the number of edges), None with less than two values of :obj:`x`."""
+    exponents = OrderedDict()
+    for name in OrderedDict.fromkeys(result['name'] for result in results):
+        points = [(result[x], result[y]) for result in results if result['name'] == name and result['status'] == 'done']
+        if len(set(point[0] for point in points)) < 2:
+            exponents[name] = None
+            continue
+        points = np.log(np.array(points, dtype=np.float64))
+        exponents[name] = float(np.polyfit(points[:, 0], points[:, 1], 1)[0])
+    return exponents
+
+
+def regressions(results: List[dict], baseline: List[dict], keys: List[str], metrics: List[str],
+                tolerance: float = 0.2) -> List[dict]:
+    r"""The metrics of :obj:`results` more than :obj:`tolerance` (relative) above those of the :obj:`baseline` result
+    with the same :obj:`keys` (the lower the better, as seconds or bytes). The cases missing from the baseline are
+    not compared, those that fail but completed in the baseline are a regression of their :obj:`status`.
+    Return types:
+        * **regressions** (list of dict) - keys, metric, value, baseline value and ratio of every regression.
+    """
+    reference = {tuple(result.get(key) for key in keys): result for result in baseline if result.get('status') == 'done'}
+    found = []
+    for result in results:
+        base = reference.get(tuple(result.get(key) for key in keys))
+        if base is None:
+            continue
+        if result['status'] != 'done':
+            found.append(OrderedDict([(key, result[key]) for key in keys] +
+                                     [('metric', 'status'), ('value', result['status']), ('baseline', 'done'), ('ratio', None)]))
+            continue
+        for metric in metrics:
+            if result.get(metric) is None or not base.get(metric):
+                continue
+            ratio = result[metric] / base[metric]
+            if ratio > 1 + tolerance:
+                found.append(OrderedDict([(key, result[key]) for key in keys] +
+                                         [('metric', metric), ('value', result[metric]), ('baseline', base[metric]), ('ratio', ratio)]))
+    return found
+
+
+def run_case(name: str, function: Callable, repeat: int = 3, **case) -> dict:
+    r"""The result of one benchmark case: its name and parameters :obj:`case`, then its measure, or the error that
+    stopped it with :obj:`status` "failed". :obj:`repeat` = 0 calls :obj:`function()` once and takes its result (a
+    dict) as the measure."""
+    result = OrderedDict([('name', name)], **case)
+    try:
+        result.update(measure(function, repeat) if repeat > 0 else function())
+        result['status'] = 'done'
+    except Exception:
+        result['status'] = 'failed'
+        result['error'] = traceback.format_exc(limit=-3)
+    return result
+
+
+def environment() -> dict:
+    r"""What a benchmark report depends on besides the code: versions, machine and commit."""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.realpath(__file__)),
+                                capture_output=True, text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return OrderedDict([('time', time.strftime('%Y-%m-%d %H:%M:%S')), ('commit', commit), ('host', platform.node()),
+                        ('platform', platform.platform()), ('python', sys.version.split()[0]), ('torch', torch.__version__),
+                        ('numpy', np.__version__), ('scipy', scipy.__version__), ('cpus', os.cpu_count()),
+                        ('threads', torch.get_num_threads()),
+                        ('cuda', torch.cuda.get_device_name() if torch.cuda.is_available() else None)])
+
+
+def write_report(path: str, results: List[dict], settings: Optional[dict] = None, **sections):
+    r"""Save the :obj:`results` of a benchmark to the JSON report :obj:`path`, with the :obj:`settings` it was run
+    with, its :obj:`environment` and any other :obj:`sections`."""
+    report = OrderedDict([('environment', environment()), ('settings', settings or {})], **sections)
+    report['results'] = results
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as file:
+        json.dump(report, file, indent=1)
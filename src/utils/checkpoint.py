@@ -0,0 +1,123 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Mapping, Optional, Union
+
+import torch
+
+
+def _copy_state(model: Union[torch.nn.Module, Mapping[str, torch.Tensor]], device: Optional[torch.device] = None):
+    # detached copies, so that the next optimizer steps do not change the stored state
+    state = model.state_dict() if isinstance(model, torch.nn.Module) else model
+    return OrderedDict((key, value.detach().to(device).clone() if device is not None else value.detach().clone())
+                       for key, value in state.items())
+
+
+class CheckpointManager(object):
+    r"""Keeps the best-so-far model states as in-memory tensor copies instead of writing them at every improvement.
+
+    :obj:`update` replaces the stored state of a name, :obj:`load` restores it into a model and :obj:`persist`
+    writes the final artifacts to :obj:`log_path/<name>.t7`. With :obj:`async_write` the files are written by a
+    background thread, which always writes the most recent state of each name (older pending states are dropped).
+
+    Arg types:
+        * **log_path** (str) - The folder of the :obj:`.t7` files.
+        * **async_write** (bool, optional) - Whether the files are written by a background thread. (default: :obj:`True`)
+        * **write_every_update** (bool, optional) - Whether every update is also written to disk (asynchronously with
+            :obj:`async_write`), as the previous behaviour. (default: :obj:`False`)
+        * **device** (torch.device, optional) - Where the copies are kept, e.g. :obj:`'cpu'` to save GPU memory,
+            the device of the model if None. (default: :obj:`None`)
+    """
+    def __init__(self, log_path: str, async_write: bool = True, write_every_update: bool = False,
+                 device: Optional[torch.device] = None):
+        self.log_path = log_path
+        self.async_write = async_write
+        self.write_every_update = write_every_update
+        self.device = device
+        self.states = {}
+        self._pending = OrderedDict()
+        self._condition = threading.Condition()
+        self._closed = False
+        self._writing = 0
+        self._error = None
+        self._thread = None
+        if async_write:
+            self._thread = threading.Thread(target=self._writer, daemon=True)
+            self._thread.start()
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.log_path, name + '.t7')
+
+    def update(self, name: str, model: Union[torch.nn.Module, Mapping[str, torch.Tensor]]):
+        r"""Store a copy of the current state of :obj:`model` (a module or a state dict) under :obj:`name`."""
+        self.states[name] = _copy_state(model, self.device)
+        if self.write_every_update:
+            self._write(name)
+
+    def load(self, name: str, model: torch.nn.Module):
+        r"""Restore the state stored under :obj:`name`, from disk if it is not in memory."""
+        if name in self.states:
+            model.load_state_dict(self.states[name])
+        else:
+            self.flush()
+            model.load_state_dict(torch.load(self.path(name)))
+
+    def persist(self, *names: str):
+        r"""Write the stored states to disk, all of them if no name is given."""
+        for name in (names if len(names) > 0 else list(self.states.keys())):
+            self._write(name)
+
+    def _write(self, name: str):
+        if not self.async_write:
+            torch.save(self.states[name], self.path(name))
+            return
+        with self._condition:
+            self._raise()
+            self._pending[name] = self.states[name]
+            self._pending.move_to_end(name)
+            self._condition.notify_all()
+
+    def _writer(self):
+        while True:
+            with self._condition:
+                while len(self._pending) == 0 and not self._closed:
+                    self._condition.wait()
+                if len(self._pending) == 0 and self._closed:
+                    return
+                name, state = self._pending.popitem(last=False)
+                self._writing += 1
+            try:
+                torch.save(state, self.path(name))
+            except Exception as error:
+                self._error = error
+            finally:
+                with self._condition:
+                    self._writing -= 1
+                    self._condition.notify_all()
+
+    def _raise(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def flush(self):
+        r"""Wait until all the pending files are written."""
+        if self.async_write:
+            with self._condition:
+                while len(self._pending) > 0 or self._writing > 0:
+                    self._condition.wait()
+        self._raise()
+
+    def close(self):
+        r"""Write the pending files and stop the background thread."""
+        self.flush()
+        if self._thread is not None:
+            with self._condition:
+                self._closed = True
+                self._condition.notify_all()
+            self._thread.join()
+            self._thread = None
+
+    def clear(self):
+        r"""Drop the in-memory states, e.g. between two splits."""
+        self.states = {}
@@ -19,11 +19,14 @@ from typing import Union, List
 import torch
 import scipy
 import numpy as np
-from networkx.algorithms import tree
 import torch_geometric
 from scipy.sparse import coo_matrix
 import pandas as pd
 
+from .split_cache import cached_split, default_edge_weight
+from .edge_index import EdgeIndex, edge_keys
+from .edge_data_new import spanning_forest
+
 
 from typing import Optional, Callable, Union, List
 
@@ -229,37 +232,27 @@ def in_out_degree(edge_index, size, weight=None):
     degree = torch.from_numpy(np.c_[in_degree, out_degree]).float()
     return degree
 
-def undirected_label2directed_label(adj, edge_pairs, task):
-    labels = np.zeros(len(edge_pairs), dtype=np.int32)
-    new_edge_pairs = edge_pairs.copy()
-    counter = 0
-    for i, e in enumerate(edge_pairs): # directed edges
-        if adj[e[0], e[1]] + adj[e[1], e[0]]  > 0: # exists an edge
-            if adj[e[0], e[1]] > 0:
-                if adj[e[1], e[0]] == 0: # rule out undirected edges
-                    if counter%2 == 0:
-                        labels[i] = 0
-                        new_edge_pairs[i] = [e[0], e[1]]
-                        counter += 1
-                    else:
-                        labels[i] = 1
-                        new_edge_pairs[i] = [e[1], e[0]]
-                        counter += 1
-                else:
-                    new_edge_pairs[i] = [e[0], e[1]]
-                    labels[i] = -1
-            else: # the other direction, and not an undirected edge
-                if counter%2 == 0:
-                    labels[i] = 0
-                    new_edge_pairs[i] = [e[1], e[0]]
-                    counter += 1
-                else:
-                    labels[i] = 1
-                    new_edge_pairs[i] = [e[0], e[1]]
-                    counter += 1
-        else: # negative edges
-            labels[i] = 2
-            new_edge_pairs[i] = [e[0], e[1]]
+def _directed_labels(adj, edge_pairs, task, noisy, index=None):
+    # the labels of the query edges: the one-way edges, in the order in which they are counted, alternate between
+    # label 0 in their direction and 1 in the reverse one, the non-edges get 2 and the undirected edges -1 (0 if noisy)
+    if index is None:
+        index = EdgeIndex(adj)
+    edge_pairs = np.asarray(edge_pairs, dtype=np.int64).reshape(-1, 2)
+    weight, inversed_weight = index.pair_weights(edge_pairs[:, 0], edge_pairs[:, 1])
+    exists = weight + inversed_weight > 0
+    forward = exists & (weight > 0)
+    backward = exists & (weight <= 0)
+    if noisy and task != 'existence':
+        counted = exists
+    else: # rule out undirected edges
+        counted = (forward & (inversed_weight == 0)) | backward
+    odd = (np.cumsum(counted) - 1) % 2 == 1
+
+    labels = np.full(len(edge_pairs), 2, dtype=np.int32)
+    labels[counted] = odd[counted]
+    labels[exists & ~counted] = 0 if noisy else -1
+    flip = (forward & counted & odd) | (backward & ~odd)
+    new_edge_pairs = np.where(flip[:, None], edge_pairs[:, ::-1], edge_pairs)
 
     if task == 'existence':
         # existence prediction
@@ -268,86 +261,41 @@ def undirected_label2directed_label(adj, edge_pairs, task):
         rng = np.random.default_rng(1000)
         neg_half = rng.choice(neg, size=len(neg)-np.sum(labels==0), replace=False)
         labels[neg_half] = -1
+    return new_edge_pairs[labels >= 0], labels[labels >= 0]
 
-    return np.array(new_edge_pairs)[labels >= 0], labels[labels >= 0]
-
-
-def noisy_undirected_label2directed_label(adj, edge_pairs, task):
-    labels = np.zeros(len(edge_pairs), dtype=np.int32)
-    new_edge_pairs = edge_pairs.copy()
-    counter = 0
-    if task != 'existence':
-      for i, e in enumerate(edge_pairs): # directed edges
-          if adj[e[0], e[1]] + adj[e[1], e[0]]  > 0: # exists an edge
-              if adj[e[0], e[1]] > 0:
-                  #if adj[e[1], e[0]] == 0: # rule out undirected edges
-                  if counter%2 == 0:
-                      labels[i] = 0
-                      new_edge_pairs[i] = [e[0], e[1]]
-                      counter += 1
-                  else:
-                      labels[i] = 1
-                      new_edge_pairs[i] = [e[1], e[0]]
-                      counter += 1
-                  #else:
-                  #    new_edge_pairs[i] = [e[0], e[1]]
-                  #    labels[i] = 0
-              else: # the other direction, and not an undirected edge
-                  if counter%2 == 0:
-                      labels[i] = 0
-                      new_edge_pairs[i] = [e[1], e[0]]
-                      counter += 1
-                  else:
-                      labels[i] = 1
-                      new_edge_pairs[i] = [e[0], e[1]]
-                      counter += 1
-          else: # negative edges
-              labels[i] = 2
-              new_edge_pairs[i] = [e[0], e[1]]
-          
-    else: # in existence the undirected connection are always 0 (exist)!
-        for i, e in enumerate(edge_pairs): # directed edges
-          if adj[e[0], e[1]] + adj[e[1], e[0]]  > 0: # exists an edge
-              if adj[e[0], e[1]] > 0:
-                  if adj[e[1], e[0]] == 0: # rule out undirected edges
-                    if counter%2 == 0:
-                        labels[i] = 0
-                        new_edge_pairs[i] = [e[0], e[1]]
-                        counter += 1
-                    else:
-                        labels[i] = 1
-                        new_edge_pairs[i] = [e[1], e[0]]
-                        counter += 1
-                  else:
-                      new_edge_pairs[i] = [e[0], e[1]]
-                      labels[i] = 0
-              else: # the other direction, and not an undirected edge
-                  if counter%2 == 0:
-                      labels[i] = 0
-                      new_edge_pairs[i] = [e[1], e[0]]
-                      counter += 1
-                  else:
-                      labels[i] = 1
-                      new_edge_pairs[i] = [e[0], e[1]]
-                      counter += 1
-          else: # negative edges
-              labels[i] = 2
-              new_edge_pairs[i] = [e[0], e[1]]
 
+def undirected_label2directed_label(adj, edge_pairs, task, index=None):
+    r"""Label the query edges of :obj:`link_class_split`.
 
+    The weights of both directions of all the query edges are looked up at once (:obj:`EdgeIndex`). A one-way edge is
+    labelled 0 in its direction or 1 in the reverse one, alternately in the order of :obj:`edge_pairs`, a pair of
+    nodes without edge 2 (1 in the existence task, where some are dropped to balance the classes) and the undirected
+    edges are dropped.
+
+    Arg types:
+        * **adj** (scipy.sparse.csr_matrix) - The adjacency matrix.
+        * **edge_pairs** (List[Tuple] or np.array) - The query edges.
+        * **task** (str) - existence, direction, all or sign.
+        * **index** (EdgeIndex, optional) - The index of the edges of :obj:`adj`, built from it if None. (default: None)
+    Return types:
+        * **new_edge_pairs** (np.array) - The query edges in the direction of their label, shape (num_labelled, 2).
+        * **labels** (np.array) - Their labels.
+    """
+    return _directed_labels(adj, edge_pairs, task, False, index)
 
-    if task == 'existence':
-        # existence prediction
-        labels[labels == 2] = 1
-        neg = np.where(labels == 1)[0]
-        rng = np.random.default_rng(1000)
-        neg_half = rng.choice(neg, size=len(neg)-np.sum(labels==0), replace=False)
-        labels[neg_half] = -1
-    return np.array(new_edge_pairs)[labels >= 0], labels[labels >= 0]
+
+def noisy_undirected_label2directed_label(adj, edge_pairs, task, index=None):
+    r"""Label the query edges of :obj:`link_class_split` as :obj:`undirected_label2directed_label`, but keeping the
+    undirected edges: they are labelled 0 in the existence task, and as the one-way edges in the other ones."""
+    return _directed_labels(adj, edge_pairs, task, True, index)
 
 def removeDuplicates(lst):
-  return [t for t in (set(tuple(i) for i in lst))]
+  # the distinct edges, in the order of their first occurrence
+  lst = np.asarray(lst, dtype=np.int64).reshape(-1, 2)
+  keys = edge_keys(lst[:, 0], lst[:, 1], int(lst.max(initial=-1)) + 1)
+  return [tuple(e) for e in lst[np.sort(np.unique(keys, return_index=True)[1])].tolist()]
 
+@cached_split(prepare=default_edge_weight)
 def link_class_split(data:torch_geometric.data.Data, size:int=None, splits:int=10, prob_test:float= 0.15, 
                      prob_val:float= 0.05, task:str= 'direction', seed:int= 0, maintain_connect:bool=True, 
                      ratio:float= 1.0, device:str= 'cpu', noisy:bool = True) -> dict:
@@ -383,10 +331,7 @@ def link_class_split(data:torch_geometric.data.Data, size:int=None, splits:int=1
     row, col = edge_index[0], edge_index[1]
     if size is None:
         size = int(max(torch.max(row), torch.max(col))+1)
-    if not hasattr(data, "edge_weight"):
-        data.edge_weight = torch.ones(len(row))
-    if data.edge_weight is None:
-        data.edge_weight = torch.ones(len(row))
+    default_edge_weight(data)
 
 
     if hasattr(data, "A"):
@@ -398,10 +343,11 @@ def link_class_split(data:torch_geometric.data.Data, size:int=None, splits:int=1
             A = coo_matrix((data.edge_weight, (row, col)), shape=(size, size), dtype=np.float32).tocsr()
            
 
+    index = EdgeIndex(A)
     len_val = int(prob_val*len(row))
     len_test = int(prob_test*len(row))
     if task not in ["existence", "direction", 'all']:
-        pos_ratio = (A.toarray()>0).sum()/(A.toarray()!=0).sum()
+        pos_ratio = (index.weights>0).sum()/(index.weights!=0).sum()
         neg_ratio = 1 - pos_ratio
         len_val_pos = int(prob_val*len(row)*pos_ratio)
         len_val_neg = int(prob_val*len(row)*neg_ratio)
@@ -411,23 +357,20 @@ def link_class_split(data:torch_geometric.data.Data, size:int=None, splits:int=1
     undirect_edge_index = to_undirected(edge_index)
     neg_edges = negative_sampling(undirect_edge_index, num_neg_samples=len(
         edge_index.T), force_undirected=False).numpy().T
-    neg_edges = map(tuple, neg_edges)
-    neg_edges = list(neg_edges)
 
-    undirect_edge_index = undirect_edge_index.T.tolist()
     if maintain_connect:
         assert ratio == 1, "ratio should be 1.0 if maintain_connect=True"
-        G = nx.from_scipy_sparse_matrix(
-            A, create_using=nx.Graph, edge_attribute='weight')
-        mst = list(tree.minimum_spanning_edges(G, algorithm="kruskal", data=False))
-        all_edges = list(map(tuple, undirect_edge_index))
-        nmst = list(set(all_edges) - set(mst))
+        mst, _ = spanning_forest(edge_index, size)
+        # the edges in both directions (to_undirected coalesces them) but those of the forest in its direction
+        undirect_edge_index = undirect_edge_index.numpy().T
+        forest_index = EdgeIndex.from_edges(mst.T, size)
+        nmst = undirect_edge_index[~forest_index.exists(undirect_edge_index[:, 0], undirect_edge_index[:, 1])]
         if len(nmst) < (len_val+len_test):
             raise ValueError(
                 "There are no enough edges to be removed for validation/testing. Please use a smaller prob_test or prob_val.")
     else:
-        mst = []
-        nmst = edge_index.T.tolist()
+        mst = np.zeros((0, 2), dtype=np.int64)
+        nmst = edge_index.numpy().T.copy()
 
     rs = np.random.RandomState(seed)
     datasets = {}
@@ -436,121 +379,84 @@ def link_class_split(data:torch_geometric.data.Data, size:int=None, splits:int=1
     max_samples = int(ratio*len(edge_index.T))+1
     assert ratio <= 1.0 and ratio > 0, "ratio should be smaller than 1.0 and larger than 0"
     assert ratio > prob_val + prob_test, "ratio should be larger than prob_val + prob_test"
+    label = noisy_undirected_label2directed_label if noisy else undirected_label2directed_label
     for ind in range(splits):
         rs.shuffle(nmst)
         rs.shuffle(neg_edges)
 
         if task == 'sign':
-            nmst = np.array(nmst)
-            exist = np.array(np.abs(A[nmst[:, 0], nmst[:, 1]]) > 0).flatten()
+            exist, weight, sign = index.lookup(nmst[:, 0], nmst[:, 1])
             if np.sum(exist) < len(nmst):
-                nmst = nmst[exist]
-
-            pos_val_edges = nmst[np.array(A[nmst[:, 0], nmst[:, 1]] > 0).squeeze()].tolist()
-            neg_val_edges = nmst[np.array(A[nmst[:, 0], nmst[:, 1]] < 0).squeeze()].tolist()
-
-            ids_test = np.array(pos_val_edges[:len_test_pos].copy() + neg_val_edges[:len_test_neg].copy())
-            ids_val = np.array(pos_val_edges[len_test_pos:len_test_pos+len_val_pos].copy() + \
-                neg_val_edges[len_test_neg:len_test_neg+len_val_neg].copy())
-            ids_train = np.array(pos_val_edges[len_test_pos+len_val_pos:max_samples] + \
-                neg_val_edges[len_test_neg+len_val_neg:max_samples] + mst)
-
-            labels_test = 1.0 * \
-                np.array(A[ids_test[:, 0], ids_test[:, 1]] > 0).flatten()
-            try:
-                labels_val = 1.0 * \
-                np.array(A[ids_val[:, 0], ids_val[:, 1]] > 0).flatten()
-            except:
-                labels_val = []
-            labels_train = 1.0 * \
-                np.array(A[ids_train[:, 0], ids_train[:, 1]] > 0).flatten()
+                nmst, sign = nmst[exist], sign[exist]
+
+            pos_val_edges = nmst[sign > 0]
+            neg_val_edges = nmst[sign < 0]
+
+            ids_test = np.concatenate([pos_val_edges[:len_test_pos], neg_val_edges[:len_test_neg]])
+            ids_val = np.concatenate([pos_val_edges[len_test_pos:len_test_pos+len_val_pos],
+                                      neg_val_edges[len_test_neg:len_test_neg+len_val_neg]])
+            ids_train = np.concatenate([pos_val_edges[len_test_pos+len_val_pos:max_samples],
+                                        neg_val_edges[len_test_neg+len_val_neg:max_samples], mst])
+
+            labels_test = 1.0 * (index.sign(ids_test[:, 0], ids_test[:, 1]) > 0)
+            labels_val = 1.0 * (index.sign(ids_val[:, 0], ids_val[:, 1]) > 0)
+            labels_train = 1.0 * (index.sign(ids_train[:, 0], ids_train[:, 1]) > 0)
             undirected_train = np.array([])
         else:
-            ids_test = nmst[:len_test]+neg_edges[:len_test]
-            ids_val = nmst[len_test:len_test+len_val]+neg_edges[len_test:len_test+len_val]
+            ids_test = np.concatenate([nmst[:len_test], neg_edges[:len_test]])
+            ids_val = np.concatenate([nmst[len_test:len_test+len_val], neg_edges[len_test:len_test+len_val]])
             if len_test+len_val < len(nmst):
-                ids_train = nmst[len_test+len_val:max_samples]+neg_edges[len_test+len_val:max_samples]+mst
+                ids_train = np.concatenate([nmst[len_test+len_val:max_samples], neg_edges[len_test+len_val:max_samples], mst])
             else:
-                ids_train = mst+neg_edges[len_test+len_val:max_samples]
-
-          
-
-        #ids_train = removeDuplicates(ids_train)
-            if noisy:
-                ids_test, labels_test = noisy_undirected_label2directed_label(A, ids_test, task)
-            else:
-                ids_test, labels_test = undirected_label2directed_label(A, ids_test, task)
-            if noisy:
-                ids_val, labels_val = noisy_undirected_label2directed_label(A, ids_val, task)
-            else:
-                ids_val, labels_val = undirected_label2directed_label(A, ids_val, task)
-            if noisy:
-                ids_train, labels_train = noisy_undirected_label2directed_label(A, ids_train, task)#, is_directed)
-            else:
-                ids_train, labels_train = undirected_label2directed_label(A, ids_train, task)
+                ids_train = np.concatenate([mst, neg_edges[len_test+len_val:max_samples]])
 
+            ids_test, labels_test = label(A, ids_test, task, index)
+            ids_val, labels_val = label(A, ids_val, task, index)
+            ids_train, labels_train = label(A, ids_train, task, index)
 
         # convert back to directed graph
         if task == 'direction':
             ids_train = ids_train[labels_train < 2]
-            #label_train_w = label_train_w[labels_train <2]
             labels_train = labels_train[labels_train <2]
 
             ids_test = ids_test[labels_test < 2]
-            #label_test_w = label_test_w[labels_test <2]
             labels_test = labels_test[labels_test <2]
 
             ids_val = ids_val[labels_val < 2]
-            #label_val_w = label_val_w[labels_val <2]
             labels_val = labels_val[labels_val <2]
-        # set up the observed graph and weights after splitting
+        # set up the observed graph and weights after splitting, an edge in the direction of the graph (the reverse
+        # one for a pair of reverse edges)
         oberved_edges    = -np.ones((len(ids_train),2), dtype=np.int32)
         oberved_weight = np.zeros((len(ids_train),1), dtype=np.float32)
 
-        
-
-        direct = (np.abs(A[ids_train[:, 0], ids_train[:, 1]].data) > 0).flatten()
-        oberved_edges[direct,0] = ids_train[direct,0]
-        oberved_edges[direct,1] = ids_train[direct,1]
-        oberved_weight[direct,0] = np.array(A[ids_train[direct,0], ids_train[direct,1]])#.flatten()
+        weight, inversed_weight = index.pair_weights(ids_train[:, 0], ids_train[:, 1])
+        direct = weight != 0
+        oberved_edges[direct] = ids_train[direct]
+        oberved_weight[direct,0] = weight[direct]
 
-        direct = (np.abs(A[ids_train[:, 1], ids_train[:, 0]].data) > 0)[0]
-        oberved_edges[direct,0] = ids_train[direct,1]
-        oberved_edges[direct,1] = ids_train[direct,0]
-        oberved_weight[direct,0] = np.array(A[ids_train[direct,1], ids_train[direct,0]])#.flatten()
+        direct = inversed_weight != 0
+        oberved_edges[direct] = ids_train[direct][:, ::-1]
+        oberved_weight[direct,0] = inversed_weight[direct]
 
         valid = (np.sum(oberved_edges, axis=-1) > 0)
         oberved_edges = oberved_edges[valid]
         oberved_weight = oberved_weight[valid]
-        
-        #oberved_edges = np.array(list(map(list,removeDuplicates(oberved_edges))))
-        #oberved_weight = []
-        #oberved_weight = [np.array(A[e[0], e[1]]) for i, e in enumerate(oberved_edges) if np.abs(A[e[0], e[1]]) > 0 ]    
-
 
         datasets[ind] = {}
         datasets[ind]['graph'] = torch.from_numpy(oberved_edges.T).long().to(device)
         datasets[ind]['weights'] = torch.from_numpy(oberved_weight.flatten()).float().to(device)
-        #datasets[ind]['weights'] = torch.from_numpy(np.array(oberved_weight)).float().to(device)
-
 
         datasets[ind]['train'] = {}
         datasets[ind]['train']['edges'] = torch.from_numpy(ids_train).long().to(device)
         datasets[ind]['train']['label'] = torch.from_numpy(labels_train).long().to(device)
-        #datasets[ind]['train']['weight'] = torch.from_numpy(label_train_w).float().to(device)
 
         datasets[ind]['val'] = {}
         datasets[ind]['val']['edges'] = torch.from_numpy(ids_val).long().to(device)
-        try:
-            datasets[ind]['val']['label'] = torch.from_numpy(labels_val).long().to(device)
-        except:
-            datasets[ind]['val']['label'] = []
-        #datasets[ind]['val']['weight'] = torch.from_numpy(label_val_w).float().to(device)
+        datasets[ind]['val']['label'] = torch.from_numpy(labels_val).long().to(device)
 
         datasets[ind]['test'] = {}
         datasets[ind]['test']['edges'] = torch.from_numpy(ids_test).long().to(device)
         datasets[ind]['test']['label'] = torch.from_numpy(labels_test).long().to(device)
-        #datasets[ind]['test']['weight'] = torch.from_numpy(label_test_w).float().to(device)
     return datasets
 
 #################################################################################
@@ -764,4 +670,23 @@ def read_edge_list_2(path):
     indices = np.vstack((coo.row, coo.col))
     indices = torch.from_numpy(indices).long()
     data = Data(edge_index=indices, edge_weight=torch.from_numpy(coo.data), num_nodes =  max(G.nodes) + 1)
-    return data
\ No newline at end of file
+    return data
+
+def read_edge_list_temporal(path, time_column='year'):
+    """
+    Load the timestamped votes of a csv file (e.g. data/wikirfa/edges.csv), one edge per vote, for temporal_link_class_split.
+    The weight of an edge is its vote (the votes of a pair being summed by the split) and its time the column time_column,
+    numeric (e.g. a year) or a date converted to decimal years.
+    """
+    edges = pd.read_csv(path, skipinitialspace=True, encoding='utf-8')
+    edges.columns = [column.strip() for column in edges.columns]
+    time = edges[time_column]
+    if not pd.api.types.is_numeric_dtype(time):
+        time = pd.to_datetime(time, errors='coerce')
+        time = time.dt.year + (time.dt.dayofyear - 1) / 365.25
+    edges = edges.assign(time=time.astype(float)).dropna(subset=['source', 'target', 'vote', 'time'])
+    edges = edges[edges['vote'] != 0]
+    indices = torch.from_numpy(edges[['source', 'target']].to_numpy(dtype=np.int64, copy=True).T)
+    data = Data(edge_index=indices, edge_weight=torch.from_numpy(edges['vote'].to_numpy(dtype=np.float32, copy=True)),
+                edge_time=torch.from_numpy(edges['time'].to_numpy(dtype=np.float64, copy=True)), num_nodes=int(indices.max()) + 1)
+    return data
@@ -1,18 +1,63 @@
-from typing import Union, List, Tuple
+from typing import Union, List, Tuple, Optional, Iterator
 
 import torch
 import scipy
 import numpy as np
-import networkx as nx
-from networkx.algorithms import tree
 import torch_geometric
-from torch_geometric.utils import negative_sampling, to_undirected, to_scipy_sparse_matrix
+from torch_geometric.utils import negative_sampling, to_undirected
 from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import minimum_spanning_tree
+
+from .instrument import timed
+from .split_cache import cached_split, default_edge_weight
+from .negative_sampler import NegativeSampler
+from .edge_index import EdgeIndex, edge_keys
+
+
+def _first_occurrences(keys: np.ndarray, mask: np.ndarray) -> np.ndarray:
+    # the indices of the first occurrence of every distinct key where mask is True, in the order of the input
+    index = np.flatnonzero(mask)
+    _, first = np.unique(keys[index], return_index=True)
+    return index[np.sort(first)]
+
+
+def spanning_forest(edge_index: torch.LongTensor, num_nodes: int) -> Tuple[np.ndarray, np.ndarray]:
+    r"""A spanning forest of the graph taken as undirected, from :obj:`scipy.sparse.csgraph.minimum_spanning_tree`
+    (every edge weighing 1), and the edges of the graph outside of it.
+
+    An edge of the forest is an edge of the graph, in its direction in :obj:`edge_index` (in either one for a pair of
+    reverse edges). The edges outside of the forest are the distinct edges of :obj:`edge_index` whose nodes are not
+    linked by the forest in any direction, in the order of their first occurrence.
+
+    Arg types:
+        * **edge_index** (PyTorch LongTensor) - The edges of the graph.
+        * **num_nodes** (int) - The number of nodes.
+    Return types:
+        * **mst** (np.array) - The edges of the spanning forest, shape (num_nodes - num_components, 2).
+        * **nmst** (np.array) - The other edges, shape (num_other_edges, 2).
+    """
+    row, col = edge_index.cpu().numpy().astype(np.int64)
+    adj = coo_matrix((np.ones(len(row), dtype=np.float32), (row, col)), shape=(num_nodes, num_nodes)).tocsr()
+    # the duplicate edges are summed: all the edges weigh the same again
+    adj.data[:] = 1
+    forest = minimum_spanning_tree(adj).tocoo()
+    mst = np.stack([forest.row, forest.col], axis=1).astype(np.int64)
+
+    forest_index = EdgeIndex.from_edges(np.concatenate([mst.T, mst.T[::-1]], axis=1), num_nodes)
+    keys = edge_keys(row, col, num_nodes)
+    nmst = _first_occurrences(keys, forest_index.search(keys) == 0)
+    return mst, np.stack([row[nmst], col[nmst]], axis=1)
 
 
 def undirected_label2directed_label(adj: scipy.sparse.csr_matrix, edge_pairs: List[Tuple],
-                                    task: str, directed_graph: bool = True, signed_directed: bool = False) -> Union[List, List]:
+                                    task: str, directed_graph: bool = True, signed_directed: bool = False,
+                                    index: EdgeIndex = None) -> Union[List, List]:
     r"""Generate edge labels based on the task.
+
+    The weights of both directions of the edges are looked up at once in the index of the edges of :obj:`adj`
+    (:obj:`EdgeIndex`). The query edges of a class are distinct and in the order of their first occurrence in
+    :obj:`edge_pairs`, so that the output only depends on the input.
+
     Arg types:
         * **adj** (scipy.sparse.csr_matrix) - Scipy sparse undirected adjacency matrix. 
         * **edge_pairs** (List[Tuple]) - The edge list for the link dataset querying. Each element 
@@ -20,6 +65,7 @@ def undirected_label2directed_label(adj: scipy.sparse.csr_matrix, edge_pairs: Li
         * **edge_weight** (List[Tuple]) - The edge weights list for sign graphs.
         * **task** (str): three_class_digraph (three-class link prediction); direction (direction prediction); existence (existence prediction); sign (sign prediction); 
             four_class_signed_digraph (directed sign prediction); five_class_signed_digraph (directed sign and existence prediction) 
+        * **index** (EdgeIndex, optional) - The index of the edges of :obj:`adj`, built from it if None, to share it between calls (default: None).
     Return types:
         * **new_edge_pairs** (List) - A list of edges.
         * **labels** (List) - The labels for new_edge_pairs. 
@@ -41,128 +87,298 @@ def undirected_label2directed_label(adj: scipy.sparse.csr_matrix, edge_pairs: Li
             * If task == "sign": 0 (negative edge), 1 (positive edge). 
         * **label_weight** (List) - The weight list of the query edges. The weight is zero if the directed edge 
             doesn't exist in both directions.
-        * **undirected** (List) - The undirected edges list within the input graph.
+        * **undirected** (np.array) - The undirected edges within the input graph, shape (num_undirected, 2).
     """
     if len(edge_pairs) == 0:
         return np.array([]), np.array([]), np.array([]), np.array([])
+    if index is None:
+        index = EdgeIndex(adj)
 
-    labels = -np.ones(len(edge_pairs), dtype=np.int32)
-    new_edge_pairs = np.array(list(map(list, edge_pairs)))
+    edge_pairs = np.asarray(edge_pairs, dtype=np.int64).reshape(-1, 2)
+    keys = edge_keys(edge_pairs[:, 0], edge_pairs[:, 1], index.num_nodes)
+    if signed_directed or directed_graph:
+        weight, inversed_weight = index.pair_weights(edge_pairs[:, 0], edge_pairs[:, 1])
+        undirected = edge_pairs[(weight != 0) & (inversed_weight != 0)]
+        negative = edge_pairs[_first_occurrences(keys, (weight == 0) & (inversed_weight == 0))]
 
-    # get directed edges
-    edge_pairs = np.array(list(map(list, edge_pairs)))
     if signed_directed:
-        directed_pos = (
-            np.array(adj[edge_pairs[:, 0], edge_pairs[:, 1]]).flatten() > 0).tolist()
-        directed_neg = (
-            np.array(adj[edge_pairs[:, 0], edge_pairs[:, 1]]).flatten() < 0).tolist()
-        inversed_pos = (
-            np.array(adj[edge_pairs[:, 1], edge_pairs[:, 0]]).flatten() > 0).tolist()
-        inversed_neg = (
-            np.array(adj[edge_pairs[:, 1], edge_pairs[:, 0]]).flatten() < 0).tolist()
-        undirected_pos = np.logical_and(directed_pos, inversed_pos)
-        undirected_neg = np.logical_and(directed_neg, inversed_neg)
-        undirected_pos_neg = np.logical_and(directed_pos, inversed_neg)
-        undirected_neg_pos = np.logical_and(directed_neg, inversed_pos)
-
-        directed_pos = list(map(tuple, edge_pairs[directed_pos].tolist()))
-        directed_neg = list(map(tuple, edge_pairs[directed_neg].tolist()))
-        inversed_pos = list(map(tuple, edge_pairs[inversed_pos].tolist()))
-        inversed_neg = list(map(tuple, edge_pairs[inversed_neg].tolist()))
-        undirected = np.logical_or(np.logical_or(np.logical_or(undirected_pos, undirected_neg), undirected_pos_neg), undirected_neg_pos)
-        undirected = list(map(tuple, edge_pairs[np.array(undirected)].tolist()))
-
-        edge_pairs = list(map(tuple, edge_pairs.tolist()))
-        negative = np.array(
-            list(set(edge_pairs) - set(directed_pos) - set(inversed_pos) - set(directed_neg) - set(inversed_neg)))
-        directed_pos = np.array(list(set(directed_pos) - set(undirected)))
-        inversed_pos = np.array(list(set(inversed_pos) - set(undirected)))
-        directed_neg = np.array(list(set(directed_neg) - set(undirected)))
-        inversed_neg = np.array(list(set(inversed_neg) - set(undirected)))
-
-        directed = np.vstack([directed_pos, directed_neg])
-        undirected = np.array(undirected)
-        new_edge_pairs = directed
-        new_edge_pairs = np.vstack([new_edge_pairs, new_edge_pairs[:, [1, 0]]])
-        new_edge_pairs = np.vstack([new_edge_pairs, negative])
-
-        labels = np.vstack([np.zeros((len(directed_pos), 1), dtype=np.int32),
-                            np.ones((len(directed_neg), 1), dtype=np.int32)])
-
-        labels = np.vstack([labels, 2 * np.ones((len(directed_pos), 1), dtype=np.int32),
-                            3 * np.ones((len(directed_neg), 1), dtype=np.int32)])
-
-        labels = np.vstack(
-            [labels, 4*np.ones((len(negative), 1), dtype=np.int32)])
-
-        label_weight = np.vstack([np.array(adj[directed_pos[:, 0], directed_pos[:, 1]]).flatten()[:, None],
-                                np.array(adj[directed_neg[:, 0], directed_neg[:, 1]]).flatten()[:, None]])
-        label_weight = np.vstack([label_weight, label_weight])
-        label_weight = np.vstack(
-            [label_weight, np.zeros((len(negative), 1), dtype=np.int32)])
-        assert label_weight[labels==0].min() > 0
-        assert label_weight[labels==1].max() < 0
-        assert label_weight[labels==2].min() > 0
-        assert label_weight[labels==3].max() < 0
-        assert label_weight[labels==4].mean() == 0
+        directed_pos = _first_occurrences(keys, (weight > 0) & (inversed_weight == 0))
+        directed_neg = _first_occurrences(keys, (weight < 0) & (inversed_weight == 0))
+        directed = edge_pairs[np.concatenate([directed_pos, directed_neg])]
+        new_edge_pairs = np.vstack([directed, directed[:, [1, 0]], negative])
+
+        labels = np.concatenate([np.zeros(len(directed_pos), dtype=np.int32), np.ones(len(directed_neg), dtype=np.int32),
+                                 2 * np.ones(len(directed_pos), dtype=np.int32), 3 * np.ones(len(directed_neg), dtype=np.int32),
+                                 4 * np.ones(len(negative), dtype=np.int32)])
+
+        label_weight = weight[np.concatenate([directed_pos, directed_neg])]
+        label_weight = np.concatenate([label_weight, label_weight, np.zeros(len(negative), dtype=weight.dtype)])
+        assert label_weight[labels==0].min(initial=1) > 0
+        assert label_weight[labels==1].max(initial=-1) < 0
+        assert label_weight[labels==2].min(initial=1) > 0
+        assert label_weight[labels==3].max(initial=-1) < 0
+        assert (label_weight[labels==4] == 0).all()
     elif directed_graph:
-        directed = (np.abs(
-            np.array(adj[edge_pairs[:, 0], edge_pairs[:, 1]]).flatten()) > 0).tolist()
-        inversed = (np.abs(
-            np.array(adj[edge_pairs[:, 1], edge_pairs[:, 0]]).flatten()) > 0).tolist()
-        undirected = np.logical_and(directed, inversed)
-
-        directed = list(map(tuple, edge_pairs[directed].tolist()))
-        inversed = list(map(tuple, edge_pairs[inversed].tolist()))
-        undirected = list(map(tuple, edge_pairs[undirected].tolist()))
-
-        edge_pairs = list(map(tuple, edge_pairs.tolist()))
-        negative = np.array(
-            list(set(edge_pairs) - set(directed) - set(inversed)))
-        directed = np.array(list(set(directed) - set(undirected)))
-        inversed = np.array(list(set(inversed) - set(undirected)))
-
-        new_edge_pairs = directed
-        new_edge_pairs = np.vstack([new_edge_pairs, new_edge_pairs[:, [1, 0]]])
-        new_edge_pairs = np.vstack([new_edge_pairs, negative])
-
-        labels = np.zeros((len(directed), 1), dtype=np.int32)
-        labels = np.vstack([labels, np.ones((len(directed), 1), dtype=np.int32)])
-        labels = np.vstack(
-            [labels, 2*np.ones((len(negative), 1), dtype=np.int32)])
-
-        label_weight = np.array(adj[directed[:, 0], directed[:, 1]]).flatten()[:, None]
-        label_weight = np.vstack([label_weight, label_weight])
-        label_weight = np.vstack(
-            [label_weight, np.zeros((len(negative), 1), dtype=np.int32)])
-        assert abs(label_weight[labels==0]).min() > 0
-        assert abs(label_weight[labels==1]).min() > 0
-        assert label_weight[labels==2].mean() == 0
+        directed = _first_occurrences(keys, (weight != 0) & (inversed_weight == 0))
+        new_edge_pairs = np.vstack([edge_pairs[directed], edge_pairs[directed][:, [1, 0]], negative])
+
+        labels = np.concatenate([np.zeros(len(directed), dtype=np.int32), np.ones(len(directed), dtype=np.int32),
+                                 2 * np.ones(len(negative), dtype=np.int32)])
+
+        label_weight = np.concatenate([weight[directed], weight[directed], np.zeros(len(negative), dtype=weight.dtype)])
+        assert (label_weight[labels==0] != 0).all()
+        assert (label_weight[labels==1] != 0).all()
+        assert (label_weight[labels==2] == 0).all()
     else:
-        undirected = []
-        neg_edges = (
-            np.abs(np.array(adj[edge_pairs[:, 0], edge_pairs[:, 1]]).flatten()) == 0)
+        weight = index.weight(edge_pairs[:, 0], edge_pairs[:, 1])
+        undirected = np.zeros((0, 2), dtype=np.int64)
         labels = np.ones(len(edge_pairs), dtype=np.int32)
-        labels[neg_edges] = 2
+        labels[weight == 0] = 2
+        labels[weight < 0] = 0
         new_edge_pairs = edge_pairs
-        label_weight = np.array(
-            adj[edge_pairs[:, 0], edge_pairs[:, 1]]).flatten()
-        labels[label_weight < 0] = 0
-        if adj.data.min() < 0: # signed graph
-            assert label_weight[labels==0].max() < 0
-        assert label_weight[labels==1].min() > 0
-        assert label_weight[labels==2].mean() == 0
+        label_weight = weight
+        assert (label_weight[labels==1] > 0).all()
+        assert (label_weight[labels==2] == 0).all()
 
     if task == 'existence':
         labels[labels == 1] = 0
         labels[labels == 2] = 1
-        assert label_weight[labels == 1].mean() == 0
-        assert abs(label_weight[labels == 0]).min() > 0
-        
+        assert (label_weight[labels == 1] == 0).all()
+        assert (label_weight[labels == 0] != 0).all()
+
+    return new_edge_pairs, labels, label_weight, undirected
+
+
+def _split_setup(data: torch_geometric.data.Data, size: Optional[int], prob_test: float, prob_val: float, task: str,
+                 maintain_connect: bool, ratio: float, negative_seed: Optional[int] = None) -> dict:
+    # what the splits share: the adjacency matrix, the split sizes, the spanning forest, the edges that can be
+    # removed and the negative edges (drawn by negative_sampling with the global generators, or by a NegativeSampler
+    # seeded with negative_seed)
+    assert task in ["existence", "direction", "three_class_digraph", "four_class_signed_digraph", "five_class_signed_digraph", 
+                    "sign"], "Please select a valid task from 'existence', 'direction', 'three_class_digraph', 'four_class_signed_digraph', 'five_class_signed_digraph', and 'sign'!"
+    edge_index = data.edge_index.cpu()
+    row, col = edge_index[0], edge_index[1]
+    if size is None:
+        size = int(max(torch.max(row), torch.max(col))+1)
+    default_edge_weight(data)
+
+
+    if hasattr(data, "A"):
+        A = data.A.tocsr()
+    else:
+        A = coo_matrix((data.edge_weight, (row, col)),
+                       shape=(size, size), dtype=np.float32).tocsr()
+    index = EdgeIndex(A)
+
+    
+    len_val = int(prob_val*len(row))
+    len_test = int(prob_test*len(row))
+    len_val_pos = len_val_neg = len_test_pos = len_test_neg = None
+    if task not in ["existence", "direction", 'three_class_digraph']:
+        pos_ratio = (index.weights>0).sum()/len(index.weights)
+        neg_ratio = 1 - pos_ratio
+        len_val_pos = int(np.around(prob_val*len(row)*pos_ratio))
+        len_val_neg = int(np.around(prob_val*len(row)*neg_ratio))
+        len_test_pos = int(np.around(prob_test*len(row)*pos_ratio))
+        len_test_neg = int(np.around(prob_test*len(row)*neg_ratio))
 
-    return new_edge_pairs, labels.flatten(), label_weight.flatten(), undirected
+    undirect_edge_index = to_undirected(edge_index)
+    if negative_seed is None:
+        neg_edges = negative_sampling(undirect_edge_index, num_neg_samples=len(
+            edge_index.T), force_undirected=False).numpy().T
+    else:
+        neg_edges = NegativeSampler(edge_index, size, seed=negative_seed).sample(len(edge_index.T))
+    neg_edges = np.asarray(neg_edges, dtype=np.int64).reshape(-1, 2)
 
+    if maintain_connect:
+        assert ratio == 1, "ratio should be 1.0 if maintain_connect=True"
+        mst, nmst = spanning_forest(edge_index, size)
+        mst, nmst = mst.astype(np.int64), nmst.astype(np.int64)
+        if len(nmst) < (len_val+len_test):
+            raise ValueError(
+                "There are no enough edges to be removed for validation/testing. Please use a smaller prob_test or prob_val.")
+    else:
+        mst = np.zeros((0, 2), dtype=np.int64)
+        nmst = edge_index.T.numpy().astype(np.int64)
 
+    assert ratio <= 1.0 and ratio > 0, "ratio should be smaller than 1.0 and larger than 0"
+    assert ratio > prob_val + prob_test, "ratio should be larger than prob_val + prob_test"
+    return dict(A=A, index=index, num_edges=len(edge_index.T), max_samples=int(ratio*len(edge_index.T))+1, mst=mst, nmst=nmst,
+                neg_edges=neg_edges, len_val=len_val, len_test=len_test, len_val_pos=len_val_pos, len_val_neg=len_val_neg,
+                len_test_pos=len_test_pos, len_test_neg=len_test_neg)
+
+
+def _make_split(setup: dict, nmst: np.ndarray, neg_edges: np.ndarray, task: str, device: str) -> dict:
+    # one split, from the removable and the negative edges (arrays of shape (num_edges, 2)) in the order in which
+    # they are drawn
+    A, index, mst, num_edges, max_samples = setup['A'], setup['index'], setup['mst'], setup['num_edges'], setup['max_samples']
+    len_val, len_test = setup['len_val'], setup['len_test']
+    len_val_pos, len_val_neg = setup['len_val_pos'], setup['len_val_neg']
+    len_test_pos, len_test_neg = setup['len_test_pos'], setup['len_test_neg']
+
+    if task in ["direction", 'three_class_digraph']:
+        ids_test = np.concatenate([nmst[:len_test], neg_edges[:len_test]])
+        ids_val = np.concatenate([nmst[len_test:len_test+len_val],
+                                  neg_edges[len_test:len_test+len_val]])
+        if len_test+len_val < len(nmst):
+            ids_train = np.concatenate([nmst[len_test+len_val:max_samples],
+                                        mst, neg_edges[len_test+len_val:max_samples]])
+        else:
+            ids_train = np.concatenate([mst, neg_edges[len_test+len_val:max_samples]])
+
+        ids_test, labels_test, _, _ = undirected_label2directed_label(
+            A, ids_test, task, True, index=index)
+        ids_val, labels_val, _, _ = undirected_label2directed_label(
+            A, ids_val, task, True, index=index)
+        ids_train, labels_train, _, undirected_train = undirected_label2directed_label(
+            A, ids_train, task, True, index=index)
+    elif task == "existence":
+        ids_test = np.concatenate([nmst[:len_test], neg_edges[:len_test]])
+        ids_val = np.concatenate([nmst[len_test:len_test+len_val],
+                                  neg_edges[len_test:len_test+len_val]])
+        if len_test+len_val < len(nmst):
+            ids_train = np.concatenate([nmst[len_test+len_val:max_samples],
+                                        mst, neg_edges[len_test+len_val:max_samples]])
+        else:
+            ids_train = np.concatenate([mst, neg_edges[len_test+len_val:max_samples]])
+
+        ids_test, labels_test, _, _ = undirected_label2directed_label(
+            A, ids_test, task, False, index=index)
+        ids_val, labels_val, _, _ = undirected_label2directed_label(
+            A, ids_val, task, False, index=index)
+        ids_train, labels_train, _, undirected_train = undirected_label2directed_label(
+            A, ids_train, task, False, index=index)
+        weights = index.weight(ids_val[:, 0], ids_val[:, 1])
+        assert (weights[labels_val == 1] == 0).all()
+    elif task == 'sign':
+        nmst_weight = index.weight(nmst[:, 0], nmst[:, 1])
+        pos_val_edges = nmst[nmst_weight > 0]
+        neg_val_edges = nmst[nmst_weight < 0]
+
+        ids_test = np.concatenate([pos_val_edges[:len_test_pos], neg_val_edges[:len_test_neg],
+                                   neg_edges[:len_test]])
+        ids_val = np.concatenate([pos_val_edges[len_test_pos:len_test_pos+len_val_pos],
+                                  neg_val_edges[len_test_neg:len_test_neg+len_val_neg],
+                                  neg_edges[len_test:len_test+len_val]])
+        
+        if len_test+len_val < len(nmst):
+            ids_train = np.concatenate([pos_val_edges[len_test_pos+len_val_pos:max_samples],
+                                        neg_val_edges[len_test_neg+len_val_neg:max_samples], mst,
+                                        neg_edges[len_test+len_val:max_samples]])
+        else:
+            ids_train = np.concatenate([mst, neg_edges[len_test+len_val:max_samples]])
+
+        ids_test, labels_test, _, _ = undirected_label2directed_label(
+            A, ids_test, task, False, False, index=index)
+        ids_val, labels_val, _, _ = undirected_label2directed_label(
+            A, ids_val, task, False, False, index=index)
+        ids_train, labels_train, _, undirected_train = undirected_label2directed_label(
+            A, ids_train, task, False, False, index=index)
+    else:
+        nmst_weight = index.weight(nmst[:, 0], nmst[:, 1])
+        pos_val_edges = nmst[nmst_weight > 0]
+        neg_val_edges = nmst[nmst_weight < 0]
+
+        ids_test = np.concatenate([pos_val_edges[:len_test_pos], neg_val_edges[:len_test_neg],
+                                   neg_edges[:len_test]])
+        ids_val = np.concatenate([pos_val_edges[len_test_pos:len_test_pos+len_val_pos],
+                                  neg_val_edges[len_test_neg:len_test_neg+len_val_neg],
+                                  neg_edges[len_test:len_test+len_val]])
+        
+        if len_test+len_val < len(nmst):
+            ids_train = np.concatenate([pos_val_edges[len_test_pos+len_val_pos:max_samples],
+                                        neg_val_edges[len_test_neg+len_val_neg:max_samples], mst,
+                                        neg_edges[len_test+len_val:max_samples]])
+        else:
+            ids_train = np.concatenate([mst, neg_edges[len_test+len_val:max_samples]])
+
+        ids_test, labels_test, _, _ = undirected_label2directed_label(
+            A, ids_test, task, True, True, index=index)
+        ids_val, labels_val, _, _ = undirected_label2directed_label(
+            A, ids_val, task, True, True, index=index)
+        ids_train, labels_train, _, undirected_train = undirected_label2directed_label(
+            A, ids_train, task, True, True, index=index)
+
+    # convert back to directed graph
+    if task in ['direction', 'sign']:
+        ids_train = ids_train[labels_train < 2]
+        #label_train_w = label_train_w[labels_train <2]
+        labels_train = labels_train[labels_train < 2]
+
+        ids_test = ids_test[labels_test < 2]
+        #label_test_w = label_test_w[labels_test <2]
+        labels_test = labels_test[labels_test < 2]
+
+        ids_val = ids_val[labels_val < 2]
+        #label_val_w = label_val_w[labels_val <2]
+        labels_val = labels_val[labels_val < 2]
+    elif task == 'four_class_signed_digraph':
+        ids_train = ids_train[labels_train < 4]
+        labels_train = labels_train[labels_train < 4]
+
+        ids_test = ids_test[labels_test < 4]
+        labels_test = labels_test[labels_test < 4]
+
+        ids_val = ids_val[labels_val < 4]
+        labels_val = labels_val[labels_val < 4]
+        
+    # set up the observed graph and weights after splitting
+    observed_edges = -np.ones((len(ids_train), 2), dtype=np.int32)
+    observed_weight = np.zeros((len(ids_train), 1), dtype=np.float32)
+
+    train_weight = index.weight(ids_train[:, 0], ids_train[:, 1])
+    direct = train_weight != 0
+    observed_edges[direct, 0] = ids_train[direct, 0]
+    observed_edges[direct, 1] = ids_train[direct, 1]
+    observed_weight[direct, 0] = train_weight[direct]
+
+    valid = (np.sum(observed_edges, axis=-1) >= 0)
+    observed_edges = observed_edges[valid]
+    observed_weight = observed_weight[valid]
+    
+    # add undirected edges back
+    if len(undirected_train) > 0:
+        undirected_train = np.array(undirected_train)
+        observed_edges = np.vstack(
+            (observed_edges, undirected_train))
+        observed_weight = np.vstack((observed_weight, index.weight(undirected_train[:, 0],
+                                                             undirected_train[:, 1])[:, None]))
+
+    assert(num_edges >= len(observed_edges)), 'The original edge number is {} \
+        while the observed graph has {} edges!'.format(num_edges, len(observed_edges))
+
+    dataset = {}
+    dataset['graph'] = torch.from_numpy(
+        observed_edges.T).long().to(device)
+    dataset['weights'] = torch.from_numpy(
+        observed_weight.flatten()).float().to(device)
+    #print('----- Pesi ---')
+    #print(dataset['weights'] )
+    dataset['train'] = {}
+    dataset['train']['edges'] = torch.from_numpy(
+        ids_train).long().to(device)
+    dataset['train']['label'] = torch.from_numpy(
+        labels_train).long().to(device)
+    #dataset['train']['weight'] = torch.from_numpy(label_train_w).float().to(device)
+
+    dataset['val'] = {}
+    dataset['val']['edges'] = torch.from_numpy(
+        ids_val).long().to(device)
+    dataset['val']['label'] = torch.from_numpy(
+        labels_val).long().to(device)
+    #dataset['val']['weight'] = torch.from_numpy(label_val_w).float().to(device)
+
+    dataset['test'] = {}
+    dataset['test']['edges'] = torch.from_numpy(
+        ids_test).long().to(device)
+    dataset['test']['label'] = torch.from_numpy(
+        labels_test).long().to(device)
+    #dataset['test']['weight'] = torch.from_numpy(label_test_w).float().to(device)
+    return dataset
+
+
+@timed('split')
+@cached_split(prepare=default_edge_weight)
 def link_class_split_new(data: torch_geometric.data.Data, size: int = None, splits: int = 2, prob_test: float = 0.05,
                      prob_val: float = 0.05, task: str = 'existence', seed: int = 0, maintain_connect: bool = True,
                      ratio: float = 1.0, device: str = 'cpu') -> dict:
@@ -198,224 +414,185 @@ def link_class_split_new(data: torch_geometric.data.Data, size: int = None, spli
                 
                 * If task == "sign": 0 (negative edge), 1 (positive edge). This is the link sign prediction task for signed networks.
     """
-    assert task in ["existence", "direction", "three_class_digraph", "four_class_signed_digraph", "five_class_signed_digraph", 
-                    "sign"], "Please select a valid task from 'existence', 'direction', 'three_class_digraph', 'four_class_signed_digraph', 'five_class_signed_digraph', and 'sign'!"
-    edge_index = data.edge_index.cpu()
-    row, col = edge_index[0], edge_index[1]
-    if size is None:
-        size = int(max(torch.max(row), torch.max(col))+1)
-    if not hasattr(data, "edge_weight"):
-        data.edge_weight = torch.ones(len(row))
-    if data.edge_weight is None:
-        data.edge_weight = torch.ones(len(row))
+    setup = _split_setup(data, size, prob_test, prob_val, task, maintain_connect, ratio)
+    nmst, neg_edges = setup['nmst'], setup['neg_edges']
 
+    rs = np.random.RandomState(seed)
+    datasets = {}
+    for ind in range(splits):
+        # the rows are shuffled as rs.shuffle shuffles a list: each split shuffles the order of the split before it
+        nmst = nmst[rs.permutation(len(nmst))]
+        neg_edges = neg_edges[rs.permutation(len(neg_edges))]
+        datasets[ind] = _make_split(setup, nmst, neg_edges, task, device)
+    return datasets
 
-    if hasattr(data, "A"):
-        A = data.A.tocsr()
-    else:
-        A = coo_matrix((data.edge_weight, (row, col)),
-                       shape=(size, size), dtype=np.float32).tocsr()
 
-    
-    len_val = int(prob_val*len(row))
-    len_test = int(prob_test*len(row))
-    if task not in ["existence", "direction", 'three_class_digraph']:
-        pos_ratio = (A>0).sum()/len(A.data)
-        neg_ratio = 1 - pos_ratio
-        len_val_pos = int(np.around(prob_val*len(row)*pos_ratio))
-        len_val_neg = int(np.around(prob_val*len(row)*neg_ratio))
-        len_test_pos = int(np.around(prob_test*len(row)*pos_ratio))
-        len_test_neg = int(np.around(prob_test*len(row)*neg_ratio))
+def iter_link_class_splits(data: torch_geometric.data.Data, size: int = None, splits: int = 2, prob_test: float = 0.05,
+                           prob_val: float = 0.05, task: str = 'existence', seed: int = 0, maintain_connect: bool = True,
+                           ratio: float = 1.0, device: str = 'cpu', indices: Optional[List[int]] = None) -> Iterator[Tuple[int, dict]]:
+    r"""Generate the train/val/test datasets of :obj:`link_class_split_new` one split at a time.
 
-    undirect_edge_index = to_undirected(edge_index)
-    neg_edges = negative_sampling(undirect_edge_index, num_neg_samples=len(
-        edge_index.T), force_undirected=False).numpy().T
-    neg_edges = map(tuple, neg_edges)
-    neg_edges = list(neg_edges)
+    The negative edges are drawn with :obj:`seed` and split i is shuffled with its own seed :obj:`seed + i` (as
+    :obj:`utils.parallel_splits.seed_split`), so a split is the same whichever splits are generated before it, e.g.
+    :obj:`next(iter_link_class_splits(data, task=task, indices=[3]))` in a worker. A split is built when the loop
+    asks for it, so only the tensors of the splits kept by the caller stay in memory. These splits differ from those
+    of :obj:`link_class_split_new`, whose splits share one random stream.
 
-    all_edge_index = edge_index.T.tolist()
-    A_undirected = to_scipy_sparse_matrix(undirect_edge_index)
-    if maintain_connect:
-        assert ratio == 1, "ratio should be 1.0 if maintain_connect=True"
-        G = nx.from_scipy_sparse_matrix(
-            A_undirected, create_using=nx.Graph, edge_attribute='weight')
-        mst = list(tree.minimum_spanning_edges(
-            G, algorithm="kruskal", data=False))
-        all_edges = list(map(tuple, all_edge_index))
-        mst_r = [t[::-1] for t in mst]
-        nmst = list(set(all_edges) - set(mst) - set(mst_r))
-        if len(nmst) < (len_val+len_test):
-            raise ValueError(
-                "There are no enough edges to be removed for validation/testing. Please use a smaller prob_test or prob_val.")
-    else:
-        mst = []
-        nmst = edge_index.T.tolist()
+    Arg types:
+        * **data**, **size**, **prob_test**, **prob_val**, **task**, **maintain_connect**, **ratio**, **device** - As :obj:`link_class_split_new`.
+        * **splits** (int, optional) - The number of splits (Default: 2).
+        * **seed** (int, optional) - The random seed of the negative edges and of the splits (Default: 0).
+        * **indices** (List[int], optional) - The splits to generate, all of them if None (Default: None).
+    Return types:
+        * **split** (Iterator[Tuple[int, dict]]) - The index of each split and its dataset, as :obj:`datasets[i]` of :obj:`link_class_split_new`.
+    """
+    with timed('split'):
+        setup = _split_setup(data, size, prob_test, prob_val, task, maintain_connect, ratio, negative_seed=seed)
+    for ind in (range(splits) if indices is None else indices):
+        with timed('split'):
+            rs = np.random.RandomState(seed + ind)
+            nmst = setup['nmst'][rs.permutation(len(setup['nmst']))]
+            neg_edges = setup['neg_edges'][rs.permutation(len(setup['neg_edges']))]
+            dataset = _make_split(setup, nmst, neg_edges, task, device)
+        yield ind, dataset
+
+
+# the arguments directed_graph and signed_directed of undirected_label2directed_label for each task, and the number
+# of classes kept
+TASK_LABELS = {'existence': (False, False, 2), 'direction': (True, False, 2), 'three_class_digraph': (True, False, 3),
+               'four_class_signed_digraph': (True, True, 4), 'five_class_signed_digraph': (True, True, 5),
+               'sign': (False, False, 2)}
+
+
+def _time_index(time: np.ndarray, cut: float) -> int:
+    # the number of edges before the time cut, the edges of a same time staying together
+    return int(np.searchsorted(time, cut, side='left'))
+
+
+def _label_set(edges: np.ndarray, negative: np.ndarray, index: EdgeIndex, task: str, device: str) -> dict:
+    # the query edges of a set (its edges and negative edges) labelled with the graph known at its end
+    directed_graph, signed_directed, classes = TASK_LABELS[task]
+    pairs, labels, _, _ = undirected_label2directed_label(None, np.concatenate([edges, negative]), task, directed_graph,
+                                                          signed_directed, index=index)
+    pairs, labels = np.asarray(pairs, dtype=np.int64).reshape(-1, 2), np.asarray(labels, dtype=np.int64)
+    keep = labels < classes
+    return {'edges': torch.from_numpy(pairs[keep]).long().to(device), 'label': torch.from_numpy(labels[keep]).long().to(device)}
+
+
+@timed('split')
+@cached_split
+def temporal_link_class_split(data: torch_geometric.data.Data, edge_time: Union[torch.Tensor, np.ndarray, None] = None,
+                              size: int = None, windows: int = 1, prob_test: float = 0.15, prob_val: float = 0.05,
+                              task: str = 'sign', start: Optional[float] = None, window: float = 1.0,
+                              history: Optional[float] = None, seed: int = 0, device: str = 'cpu') -> dict:
+    r"""Get chronological train/val/test datasets for the link prediction task, one per time window.
+
+    The distinct edges (at the time of their first occurrence, the occurrences weighing 0 left out) are sorted by time and cut into :obj:`windows` consecutive test windows: from :obj:`start` on, each spanning
+    :obj:`window` units of time, or the last :obj:`prob_test` fraction of the edges cut into windows of as many edges
+    if :obj:`start` is None. Split i tests on the edges of window i, validates on the last :obj:`prob_val` fraction of
+    the edges before it and trains on the edges before those (the last :obj:`history` units of time of them only, if
+    given), which are the observed graph. The edges of a same time stay in the same set.
+
+    The weight of an edge at a time is the sum of the weights of its occurrences before it, and it is no edge while
+    that sum is 0: the observed graph has the weights at the start of the validation set. A set holds its edges and,
+    for the tasks with a class of non-edges, as many negative edges drawn by a :obj:`NegativeSampler` seeded with
+    :obj:`seed + i`. Its labels are those of :obj:`link_class_split_new` in the graph known at its end, so that they
+    do not depend on later occurrences. From a window to the next the observed graph gains
+    (and with :obj:`history` loses) edges, so a rolling-window evaluation can update the Laplacian of the previous
+    window from :obj:`graph_changes` instead of building it again.
 
-    rs = np.random.RandomState(seed)
+    Arg types:
+        * **data** (torch_geometric.data.Data) - The input dataset.
+        * **edge_time** (PyTorch Tensor or np.array, optional) - The times of the edges, :obj:`data.edge_time` if None (Default: None).
+        * **size** (int, optional) - The size of the input graph. If none, the graph size is the maximum index of nodes plus 1 (Default: None).
+        * **windows** (int, optional) - The number of test windows, one split each (Default: 1).
+        * **prob_test** (float, optional) - The proportion of edges in the test windows, if :obj:`start` is None (Default: 0.15).
+        * **prob_val** (float, optional) - The proportion of edges selected for validation before each test window (Default: 0.05).
+        * **task** (str, optional) - The evaluation task, as :obj:`link_class_split_new` (Default: 'sign').
+        * **start** (float, optional) - The time of the first test window (Default: None).
+        * **window** (float, optional) - The time span of a test window, if :obj:`start` is given (Default: 1.0).
+        * **history** (float, optional) - The time span of the observed graph before the validation edges, all the past if None (Default: None).
+        * **seed** (int, optional) - The random seed of the negative edges (Default: 0).
+        * **device** (int, optional) - The device to hold the return value (Default: 'cpu').
+    Return types:
+        * **datasets** - A dict of the splits in chronological order, as that of :obj:`link_class_split_new`.
+    """
+    assert task in TASK_LABELS, 'Please select a valid task from %s!' % ', '.join(TASK_LABELS)
+    if edge_time is None:
+        assert getattr(data, 'edge_time', None) is not None, 'The temporal split needs the times of the edges'
+        edge_time = data.edge_time
+    edge_time = np.asarray(edge_time.cpu() if torch.is_tensor(edge_time) else edge_time, dtype=np.float64)
+    row, col = data.edge_index.cpu().numpy().astype(np.int64)
+    if size is None:
+        size = int(max(row.max(), col.max())+1)
+    weight = np.ones(len(row), dtype=np.float32) if getattr(data, 'edge_weight', None) is None else \
+        np.asarray(data.edge_weight.cpu(), dtype=np.float32)
+
+    occurring = weight != 0
+    row, col, edge_time, weight = row[occurring], col[occurring], edge_time[occurring], weight[occurring]
+
+    def graph_before(cut):
+        # the graph known before the time cut, the weights of the occurrences of an edge summed
+        before = edge_time < cut
+        return EdgeIndex.from_edges(np.stack([row[before], col[before]]), size, weight[before])
+
+    # the distinct edges at their first time, in chronological order
+    keys = edge_keys(row, col, size)
+    order = np.lexsort((edge_time, keys))
+    first = np.flatnonzero(np.r_[True, keys[order][1:] != keys[order][:-1]])
+    keys, time = keys[order][first], edge_time[order][first]
+    order = np.argsort(time, kind='stable')
+    keys, time = keys[order], time[order]
+    edges = np.stack([keys // size, keys % size], axis=1)
+    num_edges = len(keys)
+
+    if start is None:
+        cuts = [time[min(int(num_edges*(1 - prob_test*(windows - k)/windows)), num_edges - 1)] for k in range(windows)] + [np.inf]
+    else:
+        cuts = [start + k*window for k in range(windows + 1)]
     datasets = {}
-
-    max_samples = int(ratio*len(edge_index.T))+1
-    assert ratio <= 1.0 and ratio > 0, "ratio should be smaller than 1.0 and larger than 0"
-    assert ratio > prob_val + prob_test, "ratio should be larger than prob_val + prob_test"
-    for ind in range(splits):
-        rs.shuffle(nmst)
-        rs.shuffle(neg_edges)
-
-        if task in ["direction", 'three_class_digraph']:
-            ids_test = nmst[:len_test]+neg_edges[:len_test]
-            ids_val = nmst[len_test:len_test+len_val] + \
-                neg_edges[len_test:len_test+len_val]
-            if len_test+len_val < len(nmst):
-                ids_train = nmst[len_test+len_val:max_samples] + \
-                    mst+neg_edges[len_test+len_val:max_samples]
-            else:
-                ids_train = mst+neg_edges[len_test+len_val:max_samples]
-
-            ids_test, labels_test, _, _ = undirected_label2directed_label(
-                A, ids_test, task, True)
-            ids_val, labels_val, _, _ = undirected_label2directed_label(
-                A, ids_val, task, True)
-            ids_train, labels_train, _, undirected_train = undirected_label2directed_label(
-                A, ids_train, task, True)
-        elif task == "existence":
-            ids_test = nmst[:len_test]+neg_edges[:len_test]
-            ids_val = nmst[len_test:len_test+len_val] + \
-                neg_edges[len_test:len_test+len_val]
-            if len_test+len_val < len(nmst):
-                ids_train = nmst[len_test+len_val:max_samples] + \
-                    mst+neg_edges[len_test+len_val:max_samples]
-            else:
-                ids_train = mst+neg_edges[len_test+len_val:max_samples]
-
-            ids_test, labels_test, _, _ = undirected_label2directed_label(
-                A, ids_test, task, False)
-            ids_val, labels_val, _, _ = undirected_label2directed_label(
-                A, ids_val, task, False)
-            ids_train, labels_train, _, undirected_train = undirected_label2directed_label(
-                A, ids_train, task, False)
-            weights = A[ids_val[:, 0], ids_val[:, 1]]
-            assert abs(weights[:, labels_val == 1]).mean() == 0
-        elif task == 'sign':
-            nmst = np.array(nmst)
-            pos_val_edges = nmst[np.array(A[nmst[:, 0], nmst[:, 1]] > 0).squeeze()].tolist()
-            neg_val_edges = nmst[np.array(A[nmst[:, 0], nmst[:, 1]] < 0).squeeze()].tolist()
-
-            ids_test = np.array(pos_val_edges[:len_test_pos].copy() + neg_val_edges[:len_test_neg].copy() + \
-                neg_edges[:len_test])
-            ids_val = np.array(pos_val_edges[len_test_pos:len_test_pos+len_val_pos].copy() + \
-                neg_val_edges[len_test_neg:len_test_neg+len_val_neg].copy() + \
-                neg_edges[len_test:len_test+len_val])
-            
-            if len_test+len_val < len(nmst):
-                ids_train = np.array(pos_val_edges[len_test_pos+len_val_pos:max_samples] + \
-                    neg_val_edges[len_test_neg+len_val_neg:max_samples] + mst + neg_edges[len_test+len_val:max_samples])
-            else:
-                ids_train = mst+neg_edges[len_test+len_val:max_samples]
-
-            ids_test, labels_test, _, _ = undirected_label2directed_label(
-                A, ids_test, task, False, False)
-            ids_val, labels_val, _, _ = undirected_label2directed_label(
-                A, ids_val, task, False, False)
-            ids_train, labels_train, _, undirected_train = undirected_label2directed_label(
-                A, ids_train, task, False, False)
-        else:
-            nmst = np.array(nmst)
-            pos_val_edges = nmst[np.array(A[nmst[:, 0], nmst[:, 1]] > 0).squeeze()].tolist()
-            neg_val_edges = nmst[np.array(A[nmst[:, 0], nmst[:, 1]] < 0).squeeze()].tolist()
-
-            ids_test = np.array(pos_val_edges[:len_test_pos].copy() + neg_val_edges[:len_test_neg].copy() + \
-                neg_edges[:len_test])
-            ids_val = np.array(pos_val_edges[len_test_pos:len_test_pos+len_val_pos].copy() + \
-                neg_val_edges[len_test_neg:len_test_neg+len_val_neg].copy() + \
-                neg_edges[len_test:len_test+len_val])
-            
-            if len_test+len_val < len(nmst):
-                ids_train = np.array(pos_val_edges[len_test_pos+len_val_pos:max_samples] + \
-                    neg_val_edges[len_test_neg+len_val_neg:max_samples] + mst + neg_edges[len_test+len_val:max_samples])
-            else:
-                ids_train = mst+neg_edges[len_test+len_val:max_samples]
-
-            ids_test, labels_test, _, _ = undirected_label2directed_label(
-                A, ids_test, task, True, True)
-            ids_val, labels_val, _, _ = undirected_label2directed_label(
-                A, ids_val, task, True, True)
-            ids_train, labels_train, _, undirected_train = undirected_label2directed_label(
-                A, ids_train, task, True, True)
-
-        # convert back to directed graph
-        if task in ['direction', 'sign']:
-            ids_train = ids_train[labels_train < 2]
-            #label_train_w = label_train_w[labels_train <2]
-            labels_train = labels_train[labels_train < 2]
-
-            ids_test = ids_test[labels_test < 2]
-            #label_test_w = label_test_w[labels_test <2]
-            labels_test = labels_test[labels_test < 2]
-
-            ids_val = ids_val[labels_val < 2]
-            #label_val_w = label_val_w[labels_val <2]
-            labels_val = labels_val[labels_val < 2]
-        elif task == 'four_class_signed_digraph':
-            ids_train = ids_train[labels_train < 4]
-            labels_train = labels_train[labels_train < 4]
-
-            ids_test = ids_test[labels_test < 4]
-            labels_test = labels_test[labels_test < 4]
-
-            ids_val = ids_val[labels_val < 4]
-            labels_val = labels_val[labels_val < 4]
-            
-        # set up the observed graph and weights after splitting
-        observed_edges = -np.ones((len(ids_train), 2), dtype=np.int32)
-        observed_weight = np.zeros((len(ids_train), 1), dtype=np.float32)
-
-        direct = (
-            np.abs(A[ids_train[:, 0], ids_train[:, 1]].data) > 0).flatten()
-        observed_edges[direct, 0] = ids_train[direct, 0]
-        observed_edges[direct, 1] = ids_train[direct, 1]
-        observed_weight[direct, 0] = np.array(
-            A[ids_train[direct, 0], ids_train[direct, 1]]).flatten()
-
-        valid = (np.sum(observed_edges, axis=-1) >= 0)
-        observed_edges = observed_edges[valid]
-        observed_weight = observed_weight[valid]
-        
-        # add undirected edges back
-        if len(undirected_train) > 0:
-            undirected_train = np.array(undirected_train)
-            observed_edges = np.vstack(
-                (observed_edges, undirected_train))
-            observed_weight = np.vstack((observed_weight, np.array(A[undirected_train[:, 0],
-                                                                   undirected_train[:, 1]]).flatten()[:, None]))
-
-        assert(len(edge_index.T) >= len(observed_edges)), 'The original edge number is {} \
-            while the observed graph has {} edges!'.format(len(edge_index.T), len(observed_edges))
+    for ind in range(windows):
+        test_start, test_end = _time_index(time, cuts[ind]), _time_index(time, cuts[ind + 1])
+        val_start = _time_index(time, time[max(test_start - int(prob_val*num_edges), 0)]) if prob_val > 0 else test_start
+        train_start = 0
+        if history is not None and val_start > 0:
+            train_start = _time_index(time, time[val_start - 1] - history)
+        if train_start >= val_start or test_start >= test_end:
+            raise ValueError('The window {} has {} training and {} test edges. Please use another start, window or '
+                             'prob_test.'.format(ind, val_start - train_start, test_end - test_start))
+
+        sets = {'train': (train_start, val_start), 'val': (val_start, test_start), 'test': (test_start, test_end)}
+        ends = {'train': min(time[val_start], cuts[ind]), 'val': cuts[ind], 'test': cuts[ind + 1]}
+        counts = [end - begin for begin, end in sets.values()]
+        negative = np.zeros((0, 2), dtype=np.int64)
+        if task in ['existence', 'three_class_digraph', 'five_class_signed_digraph']:
+            negative = NegativeSampler(edges.T, size, seed=seed + ind).sample(sum(counts))
+        negatives = np.split(negative, np.minimum(np.cumsum(counts)[:-1], len(negative)))
 
         datasets[ind] = {}
-        datasets[ind]['graph'] = torch.from_numpy(
-            observed_edges.T).long().to(device)
-        datasets[ind]['weights'] = torch.from_numpy(
-            observed_weight.flatten()).float().to(device)
-        #print('----- Pesi ---')
-        #print(datasets[ind]['weights'] )
-        datasets[ind]['train'] = {}
-        datasets[ind]['train']['edges'] = torch.from_numpy(
-            ids_train).long().to(device)
-        datasets[ind]['train']['label'] = torch.from_numpy(
-            labels_train).long().to(device)
-        #datasets[ind]['train']['weight'] = torch.from_numpy(label_train_w).float().to(device)
-
-        datasets[ind]['val'] = {}
-        datasets[ind]['val']['edges'] = torch.from_numpy(
-            ids_val).long().to(device)
-        datasets[ind]['val']['label'] = torch.from_numpy(
-            labels_val).long().to(device)
-        #datasets[ind]['val']['weight'] = torch.from_numpy(label_val_w).float().to(device)
-
-        datasets[ind]['test'] = {}
-        datasets[ind]['test']['edges'] = torch.from_numpy(
-            ids_test).long().to(device)
-        datasets[ind]['test']['label'] = torch.from_numpy(
-            labels_test).long().to(device)
-        #datasets[ind]['test']['weight'] = torch.from_numpy(label_test_w).float().to(device)
-    return datasets
\ No newline at end of file
+        observed = edges[train_start:val_start]
+        observed_weight = graph_before(ends['train']).weight(observed[:, 0], observed[:, 1])
+        datasets[ind]['graph'] = torch.from_numpy(observed[observed_weight != 0].T.copy()).long().to(device)
+        datasets[ind]['weights'] = torch.from_numpy(observed_weight[observed_weight != 0]).float().to(device)
+        for (name, (begin, end)), negative in zip(sets.items(), negatives):
+            datasets[ind][name] = _label_set(edges[begin:end], negative, graph_before(ends[name]), task, device)
+    return datasets
+
+
+def graph_changes(previous: dict, dataset: dict) -> Tuple[torch.LongTensor, torch.Tensor, torch.LongTensor]:
+    r"""The edge updates from the observed graph of the split :obj:`previous` to that of :obj:`dataset` (e.g. two
+    consecutive windows of :obj:`temporal_link_class_split`), for an incremental update of its Laplacian.
+    Return types:
+        * **insert_edges** (PyTorch LongTensor) - The new or reweighted edges, shape (2, num_inserted).
+        * **insert_weight** (PyTorch Tensor) - Their weights.
+        * **delete_edges** (PyTorch LongTensor) - The removed edges, shape (2, num_deleted).
+    """
+    old_edges, new_edges = previous['graph'].cpu().numpy(), dataset['graph'].cpu().numpy()
+    num_nodes = int(max(old_edges.max(initial=-1), new_edges.max(initial=-1))) + 1
+    old_index = EdgeIndex.from_edges(old_edges, num_nodes, previous['weights'])
+    new_index = EdgeIndex.from_edges(new_edges, num_nodes, dataset['weights'])
+    new_weight = new_index.weight(new_edges[0], new_edges[1])
+    insert = new_weight != old_index.weight(new_edges[0], new_edges[1])
+    delete = new_index.weight(old_edges[0], old_edges[1]) == 0
+    return torch.from_numpy(new_edges[:, insert].copy()), torch.from_numpy(new_weight[insert]), \
+        torch.from_numpy(old_edges[:, delete].copy())
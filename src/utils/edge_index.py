@@ -0,0 +1,98 @@
+from typing import Optional, Tuple, Union
+
+import numpy as np
+import scipy
+import torch
+from scipy.sparse import coo_matrix
+
+
+def edge_keys(row, col, num_nodes: int) -> np.ndarray:
+    r"""The int64 keys :obj:`row * num_nodes + col` of the edges (row, col), one per directed edge."""
+    return np.asarray(row, dtype=np.int64) * num_nodes + np.asarray(col, dtype=np.int64)
+
+
+class EdgeIndex(object):
+    r"""An index of the edges of a graph for the batched lookups of the split and label code, built once per graph.
+
+    The entries of the adjacency matrix are kept as their sorted keys (:obj:`edge_keys`) and the aligned weights, the
+    duplicate entries being summed. A batch of query edges is answered with one :obj:`np.searchsorted` of its keys,
+    searched in sorted order (consecutive binary searches then walk the same part of the index, several times faster
+    than in random order on large batches), instead of the fancy indexing :obj:`A[row, col]` of a scipy sparse matrix
+    and its intermediate :obj:`np.matrix`. An edge exists if and only if its weight is not 0, so that an explicit
+    zero of the matrix is no edge.
+
+    Arg types:
+        * **adj** (scipy.sparse matrix) - The adjacency matrix.
+    """
+    def __init__(self, adj: scipy.sparse.spmatrix):
+        adj = coo_matrix(adj)
+        adj.sum_duplicates()
+        self.num_nodes = max(adj.shape)
+        keys = edge_keys(adj.row, adj.col, self.num_nodes)
+        order = np.argsort(keys, kind='stable')
+        self.keys = keys[order]
+        self.weights = np.asarray(adj.data)[order]
+
+    @classmethod
+    def from_edges(cls, edge_index: Union[torch.LongTensor, np.ndarray], num_nodes: Optional[int] = None,
+                   edge_weight: Union[torch.Tensor, np.ndarray, None] = None) -> 'EdgeIndex':
+        r"""The index of the edges :obj:`edge_index` (shape (2, num_edges)), weighing 1 if :obj:`edge_weight` is None,
+        with :obj:`num_nodes` nodes (the largest index plus 1 if None)."""
+        if torch.is_tensor(edge_index):
+            edge_index = edge_index.cpu().numpy()
+        row, col = np.asarray(edge_index, dtype=np.int64).reshape(2, -1)
+        if num_nodes is None:
+            num_nodes = int(max(row.max(), col.max())) + 1 if len(row) > 0 else 0
+        if edge_weight is None:
+            edge_weight = np.ones(len(row), dtype=np.float32)
+        elif torch.is_tensor(edge_weight):
+            edge_weight = edge_weight.cpu().numpy()
+        return cls(coo_matrix((edge_weight, (row, col)), shape=(num_nodes, num_nodes)))
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def search(self, keys: np.ndarray) -> np.ndarray:
+        r"""The weights of the edges of int64 :obj:`keys`, 0 for the edges that are not in the graph."""
+        keys = np.asarray(keys, dtype=np.int64)
+        weights = np.zeros(len(keys), dtype=self.weights.dtype)
+        if len(self.keys) == 0 or len(keys) == 0:
+            return weights
+        order = np.argsort(keys)
+        sorted_keys = keys[order]
+        position = np.minimum(np.searchsorted(self.keys, sorted_keys), len(self.keys) - 1)
+        found = self.keys[position] == sorted_keys
+        weights[order[found]] = self.weights[position[found]]
+        return weights
+
+    def weight(self, row, col) -> np.ndarray:
+        r"""The weights of the edges (row, col), 0 for those that are not in the graph."""
+        return self.search(edge_keys(row, col, self.num_nodes))
+
+    def exists(self, row, col) -> np.ndarray:
+        r"""Whether the edges (row, col) are in the graph."""
+        return self.weight(row, col) != 0
+
+    def sign(self, row, col) -> np.ndarray:
+        r"""The signs of the weights of the edges (row, col): 1, -1, or 0 for those that are not in the graph."""
+        return np.sign(self.weight(row, col))
+
+    def lookup(self, row, col) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        r"""The existence, weight and sign of the edges (row, col), from one search.
+        Return types:
+            * **exists** (np.array) - Whether the edges are in the graph.
+            * **weight** (np.array) - Their weights, 0 for those that are not in the graph.
+            * **sign** (np.array) - The signs of their weights.
+        """
+        weight = self.weight(row, col)
+        return weight != 0, weight, np.sign(weight)
+
+    def pair_weights(self, row, col) -> Tuple[np.ndarray, np.ndarray]:
+        r"""The weights of the edges (row, col) and of their reverses (col, row), from one search.
+        Return types:
+            * **weight** (np.array) - The weights of the edges (row, col).
+            * **inversed_weight** (np.array) - The weights of the edges (col, row).
+        """
+        row, col = np.asarray(row, dtype=np.int64), np.asarray(col, dtype=np.int64)
+        weights = self.search(np.concatenate([edge_keys(row, col, self.num_nodes), edge_keys(col, row, self.num_nodes)]))
+        return weights[:len(row)], weights[len(row):]
@@ -0,0 +1,123 @@
+import os
+import json
+from datetime import datetime
+from typing import Optional, Tuple
+
+import numpy as np
+import torch
+
+STORE_FORMAT = 1
+
+
+def _versions(root: str):
+    if not os.path.isdir(root):
+        return []
+    return sorted(int(name[1:]) for name in os.listdir(root) if name.startswith('v') and name[1:].isdigit())
+
+
+def export_embeddings(root: str, embeddings: Tuple[torch.Tensor, ...], model: Optional[torch.nn.Module] = None,
+                      names: Optional[Tuple[str, ...]] = None, meta: Optional[dict] = None) -> str:
+    r"""Export the final-layer node embeddings of a link model as a new version of an on-disk store.
+    Each version is a folder :obj:`root/v<n>` with the embeddings in :obj:`embeddings.npy` (float32, shape
+    (num_components, num_nodes, hidden), readable as a memmap), the decoder weights in :obj:`decoder.npz`
+    and a :obj:`meta.json` sidecar describing the content.
+    Arg types:
+        * **root** (str) - The folder of the store.
+        * **embeddings** (tuple of PyTorch Float Tensor) - The output of :obj:`model.embed`, e.g. (real, imag)
+            or (real, imag_i, imag_j, imag_k).
+        * **model** (torch.nn.Module, optional) - The link model, whose unwind decoder is saved with the embeddings. (default: None)
+        * **names** (tuple of str, optional) - The names of the embedding components. (default: None)
+        * **meta** (dict, optional) - Extra metadata, e.g. the dataset, the split or the command line arguments. (default: None)
+    Return types:
+        * **path** (str) - The folder of the exported version.
+    """
+    versions = _versions(root)
+    version = versions[-1] + 1 if len(versions) > 0 else 0
+    path = os.path.join(root, 'v%d' % version)
+    os.makedirs(path)
+
+    num_nodes, hidden = embeddings[0].shape
+    if names is None:
+        names = ('real', 'imag') if len(embeddings) == 2 else ('real',) + tuple('imag_%d' % m for m in range(1, len(embeddings)))
+    out = np.lib.format.open_memmap(os.path.join(path, 'embeddings.npy'), mode='w+', dtype=np.float32,
+                                    shape=(len(embeddings), num_nodes, hidden))
+    for m, emb in enumerate(embeddings):
+        out[m] = emb.detach().cpu().numpy()
+    out.flush()
+    del out
+
+    decoder = None
+    if model is not None and hasattr(model, 'linear'):
+        weight = model.linear.weight.detach().cpu().numpy()
+        bias = model.linear.bias.detach().cpu().numpy() if model.linear.bias is not None else np.zeros(weight.shape[0], dtype=weight.dtype)
+        np.savez(os.path.join(path, 'decoder.npz'), weight=weight, bias=bias)
+        decoder = 'decoder.npz'
+
+    info = {'format': STORE_FORMAT, 'version': version, 'created': datetime.now().isoformat(),
+            'num_nodes': int(num_nodes), 'hidden': int(hidden), 'components': list(names), 'dtype': 'float32',
+            'model': model.__class__.__name__ if model is not None else None, 'decoder': decoder,
+            'meta': meta if meta is not None else {}}
+    with open(os.path.join(path, 'meta.json'), 'w') as f:
+        json.dump(info, f, indent=4, default=str)
+    return path
+
+
+class EmbeddingStore(object):
+    r"""Zero-copy reader of a version exported by :obj:`export_embeddings`.
+
+    The embeddings are memory-mapped in copy-on-write mode, so nothing is read before it is used and
+    :obj:`torch.from_numpy` shares the pages of the file. The edges can be scored with the saved decoder
+    without the model or the graph.
+
+    Arg types:
+        * **root** (str) - The folder of the store.
+        * **version** (int, optional) - The version to open, the latest if None. (default: None)
+    """
+    def __init__(self, root: str, version: Optional[int] = None):
+        if version is None:
+            versions = _versions(root)
+            assert len(versions) > 0, 'No embeddings exported in %s' % root
+            version = versions[-1]
+        self.path = os.path.join(root, 'v%d' % version)
+        with open(os.path.join(self.path, 'meta.json')) as f:
+            self.meta = json.load(f)
+        assert self.meta['format'] == STORE_FORMAT, 'Unsupported store format'
+        self.version = version
+        self.embeddings = np.load(os.path.join(self.path, 'embeddings.npy'), mmap_mode='c')
+        self.weight, self.bias = None, None
+        if self.meta['decoder'] is not None:
+            decoder = np.load(os.path.join(self.path, self.meta['decoder']))
+            self.weight, self.bias = decoder['weight'], decoder['bias']
+
+    @property
+    def components(self):
+        return self.meta['components']
+
+    def component(self, name: str) -> np.ndarray:
+        return self.embeddings[self.components.index(name)]
+
+    def to_torch(self, device: Optional[torch.device] = None) -> Tuple[torch.Tensor, ...]:
+        r"""The embeddings as a tuple of tensors, the same layout as :obj:`model.embed` (shared with the memmap on the cpu)."""
+        embeddings = tuple(torch.from_numpy(self.embeddings[m]) for m in range(self.embeddings.shape[0]))
+        if device is not None:
+            embeddings = tuple(emb.to(device) for emb in embeddings)
+        return embeddings
+
+    def decode(self, query_edges: np.ndarray) -> np.ndarray:
+        r"""Score the query edges with the saved unwind decoder.
+        Arg types:
+            * **query_edges** (np.ndarray) - Edge indices with shape (num_edges, 2).
+        Return types:
+            * **log_prob** (np.ndarray) - Logarithmic class probabilities, with shape (num_edges, num_classes).
+        """
+        assert self.weight is not None, 'No decoder saved with the embeddings'
+        query_edges = np.asarray(query_edges, dtype=np.int64)
+        src, dst = np.unique(query_edges[:, 0], return_inverse=True), np.unique(query_edges[:, 1], return_inverse=True)
+        hidden = self.meta['hidden']
+        logits = np.broadcast_to(self.bias, (query_edges.shape[0], self.bias.shape[0])).copy()
+        for m in range(self.embeddings.shape[0]):
+            # only the rows of the queried nodes are read from the memmap
+            logits += (self.embeddings[m][src[0]] @ self.weight[:, 2*m*hidden:(2*m+1)*hidden].T)[src[1]]
+            logits += (self.embeddings[m][dst[0]] @ self.weight[:, (2*m+1)*hidden:(2*m+2)*hidden].T)[dst[1]]
+        logits -= logits.max(axis=1, keepdims=True)
+        return logits - np.log(np.exp(logits).sum(axis=1, keepdims=True))
@@ -1,6 +1,8 @@
 import numpy as np
 from numpy import linalg as LA
 from scipy.sparse import coo_matrix
+
+from .instrument import timed
 '''
 def hermitian_decomp(A, q = 0.25):
     # this function is only tested based on the numpy array
@@ -133,6 +135,7 @@ def cheb_poly_sparse(A, K):
 
     return multi_order_laplacian
 
+@timed('laplacian')
 def hermitian_decomp_sparse(row, col, size, q = 0.25, norm = True, laplacian = True, max_eigen = 2, 
 gcn_appr = False, edge_weight = None):
     if edge_weight is None:
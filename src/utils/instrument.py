@@ -0,0 +1,343 @@
+import os
+import sys
+import json
+import time
+import resource
+import threading
+import tracemalloc
+from collections import OrderedDict
+from contextlib import ContextDecorator
+from typing import Optional
+
+import torch
+
+MEMORY_FIELDS = ['rss_peak', 'rss_growth', 'tracemalloc_peak', 'cuda_peak']
+
+
+def instrumented() -> bool:
+    # the memory of the stages and the synchronized cuda timings, given by INSTRUMENT: off unless it is set
+    return bool(os.environ.get('INSTRUMENT', ''))
+
+
+def _synchronize():
+    # the cuda kernels are asynchronous: wait for them, so that their time is charged to the stage that launched them
+    if torch.cuda.is_available() and torch.cuda.is_initialized():
+        torch.cuda.synchronize()
+
+
+def _cuda_in_use() -> bool:
+    return torch.cuda.is_available() and torch.cuda.is_initialized()
+
+
+def current_rss() -> int:
+    r"""The resident set size of the process in bytes (its peak so far where /proc is not available)."""
+    try:
+        with open('/proc/self/statm') as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class _Frame(object):
+    # the memory peaks of an open stage
+    def __init__(self, stage: str):
+        self.stage = stage
+        self.rss_start = current_rss()
+        self.rss_peak = self.rss_start
+        self.tracemalloc_peak = None
+        self.cuda_peak = None
+
+    def merge(self, other: '_Frame'):
+        self.rss_peak = max(self.rss_peak, other.rss_peak)
+        if other.tracemalloc_peak is not None:
+            self.tracemalloc_peak = max(self.tracemalloc_peak or 0, other.tracemalloc_peak)
+        if other.cuda_peak is not None:
+            self.cuda_peak = max(self.cuda_peak or 0, other.cuda_peak)
+
+
+class Recorder(object):
+    r"""Wall time and peak memory of the stages of a driver run (dataset loading, split, Laplacian construction,
+    forward, backward, optimizer step, evaluation), accumulated per split.
+
+    :obj:`start_run` points the recorder to the log folder of the run, :obj:`set_split` to the split being trained
+    and :obj:`end_run` appends to :obj:`log_path/timings.jsonl` one JSON line per split and stage, with the number of
+    calls, the total, mean, min and max seconds and the peak memory, and a last line with the total time and the
+    peak memory of the run. The stages timed before :obj:`start_run` (e.g. the dataset, when it is loaded before the
+    log folder exists) belong to the run.
+
+    By default a stage only costs two :obj:`time.perf_counter` calls. When :obj:`measure` is on (by default when the
+    environment variable :obj:`INSTRUMENT` is set, e.g. :obj:`INSTRUMENT=1`), the CUDA kernels are synchronized at the
+    boundaries of the stages, so that their time is charged to the stage that launched them, and the memory of the
+    stages is recorded: the peak resident size of the process while a stage runs (sampled by a background thread
+    every :obj:`interval` seconds, until :obj:`end_run`) and its growth over the size at the start of the stage, the
+    peak of the python allocations when :obj:`tracemalloc` is tracing (e.g. :obj:`PYTHONTRACEMALLOC=1`) and the peak
+    of the CUDA allocator when CUDA is in use, in bytes.
+
+    The recorder can be shared between threads: each thread nests its own stages, and a stage of a background
+    thread is charged to the split being trained.
+
+    Arg types:
+        * **interval** (float, optional) - The sampling period of the resident size. (default: 0.01)
+        * **measure** (bool, optional) - Whether to synchronize and record the memory, as :obj:`INSTRUMENT` if None. (default: None)
+    """
+    def __init__(self, interval: float = 0.01, measure: Optional[bool] = None):
+        self.interval = interval
+        self.measure = measure
+        self._thread = None
+        self._stop = threading.Event()
+        # the recorder is shared with the background threads of the drivers (e.g. NegativeResampler)
+        self._lock = threading.RLock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.stats = OrderedDict()
+            self.memory = OrderedDict()
+            self.completed = OrderedDict()
+            self.completed_memory = OrderedDict()
+            # the open stages of each thread: {thread: count per stage} and {thread: stack of frames}
+            self.active = {}
+            self.frames = {}
+            self.split = None
+            self.path = None
+            self.meta = OrderedDict()
+            self.started = None
+
+    def start_run(self, log_path: str, args=None):
+        r"""Record the run whose logs are in :obj:`log_path`, described by the options :obj:`args` of the driver."""
+        options = vars(args) if args is not None and not isinstance(args, dict) else (args or {})
+        with self._lock:
+            self.path = os.path.join(log_path, 'timings.jsonl')
+            self.meta = OrderedDict([('driver', os.path.splitext(os.path.basename(sys.argv[0]))[0]),
+                                     ('dataset', options.get('dataset')), ('task', options.get('task')),
+                                     ('method', options.get('method_name', options.get('method'))), ('pid', os.getpid())])
+            if self.started is None:
+                self.started = time.time()
+
+    def set_split(self, split: Optional[int]):
+        with self._lock:
+            self.split = split
+
+    def measuring(self) -> bool:
+        r"""Whether the stages are synchronized and their memory recorded."""
+        return instrumented() if self.measure is None else self.measure
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            with self._lock:
+                frames = [frame for stack in self.frames.values() for frame in stack if frame is not None]
+            if len(frames) > 0:
+                rss = current_rss()
+                for frame in frames:
+                    frame.rss_peak = max(frame.rss_peak, rss)
+
+    def _stop_sampling(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+            self._stop.clear()
+
+    def enter(self, stage: str):
+        with self._lock:
+            thread = threading.get_ident()
+            active, frames = self.active.setdefault(thread, {}), self.frames.setdefault(thread, [])
+            active[stage] = active.get(stage, 0) + 1
+            if not self.measuring():
+                frames.append(None)
+                return
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._sample, daemon=True)
+                self._thread.start()
+            # the tracemalloc and cuda peaks are global: the enclosing stage keeps its peak before they are reset
+            parent = frames[-1] if len(frames) > 0 else None
+            if tracemalloc.is_tracing() and hasattr(tracemalloc, 'reset_peak'):
+                if parent is not None:
+                    parent.tracemalloc_peak = max(parent.tracemalloc_peak or 0, tracemalloc.get_traced_memory()[1])
+                tracemalloc.reset_peak()
+            if _cuda_in_use():
+                if parent is not None:
+                    parent.cuda_peak = max(parent.cuda_peak or 0, torch.cuda.max_memory_allocated())
+                torch.cuda.reset_peak_memory_stats()
+            frames.append(_Frame(stage))
+
+    def exit(self, stage: str, seconds: float):
+        with self._lock:
+            thread = threading.get_ident()
+            active, frames = self.active[thread], self.frames[thread]
+            frame = frames.pop()
+            if frame is not None:
+                frame.rss_peak = max(frame.rss_peak, current_rss())
+                if tracemalloc.is_tracing():
+                    frame.tracemalloc_peak = max(frame.tracemalloc_peak or 0, tracemalloc.get_traced_memory()[1])
+                if _cuda_in_use():
+                    frame.cuda_peak = max(frame.cuda_peak or 0, torch.cuda.max_memory_allocated())
+                if len(frames) > 0 and frames[-1] is not None:
+                    frames[-1].merge(frame)
+            active[stage] -= 1
+            # a block nested in a block of the same stage is counted once, by the outer one
+            if active[stage] == 0:
+                self.add(stage, seconds, frame)
+            if len(frames) == 0:
+                del self.active[thread], self.frames[thread]
+
+    def add(self, stage: str, seconds: float, frame: Optional[_Frame] = None):
+        with self._lock:
+            self._add(stage, seconds, frame)
+
+    def _add(self, stage: str, seconds: float, frame: Optional[_Frame] = None):
+        if self.started is None:
+            self.started = time.time() - seconds
+        stats = self.stats.get((self.split, stage))
+        if stats is None:
+            self.stats[(self.split, stage)] = [1, seconds, seconds, seconds]
+        else:
+            stats[0] += 1
+            stats[1] += seconds
+            stats[2] = min(stats[2], seconds)
+            stats[3] = max(stats[3], seconds)
+        if frame is not None:
+            values = [frame.rss_peak, frame.rss_peak - frame.rss_start, frame.tracemalloc_peak, frame.cuda_peak]
+            key = (self.split, stage)
+            self.memory[key] = _max_memory(self.memory.get(key), dict(zip(MEMORY_FIELDS, values)))
+
+    def totals(self) -> dict:
+        r"""The seconds spent in each stage, over all the splits and the runs since :obj:`reset`."""
+        with self._lock:
+            totals = OrderedDict(self.completed)
+            for (_, stage), stats in self.stats.items():
+                totals[stage] = totals.get(stage, 0.0) + stats[1]
+            return totals
+
+    def memory_peaks(self) -> dict:
+        r"""The peak memory of each stage ({stage: {field: bytes}}), over all the splits and the runs since :obj:`reset`."""
+        with self._lock:
+            peaks = OrderedDict(self.completed_memory)
+            for (_, stage), memory in self.memory.items():
+                peaks[stage] = _max_memory(peaks.get(stage), memory)
+            return peaks
+
+    def peak_memory(self) -> int:
+        r"""The peak of the run in bytes: of the CUDA allocator when CUDA is in use, of the resident size otherwise."""
+        field = 'cuda_peak' if _cuda_in_use() else 'rss_peak'
+        values = [memory[field] for memory in self.memory_peaks().values() if memory[field] is not None]
+        if field == 'rss_peak':
+            values.append(current_rss())
+        else:
+            values.append(torch.cuda.max_memory_allocated())
+        return max(values) if len(values) > 0 else 0
+
+    def report(self) -> str:
+        r"""A one-line summary of the peak memory of every stage, in MB."""
+        items = []
+        for stage, memory in self.memory_peaks().items():
+            item = '%s rss %.1f (+%.1f)' % (stage, memory['rss_peak'] / 2**20, memory['rss_growth'] / 2**20)
+            if memory['tracemalloc_peak'] is not None:
+                item += ' py %.1f' % (memory['tracemalloc_peak'] / 2**20)
+            if memory['cuda_peak'] is not None:
+                item += ' cuda %.1f' % (memory['cuda_peak'] / 2**20)
+            items.append(item)
+        return 'Peak memory per stage (MB): ' + ', '.join(items)
+
+    def lines(self) -> list:
+        lines = []
+        for (split, stage), (count, total, low, high) in self.stats.items():
+            line = OrderedDict(self.meta, split=split, stage=stage, count=count, seconds=total,
+                               mean=total / count, min=low, max=high)
+            line.update(self.memory.get((split, stage), {}))
+            lines.append(line)
+        seconds = time.time() - self.started if self.started is not None else 0.0
+        line = OrderedDict(self.meta, split=None, stage='total', count=1, seconds=seconds)
+        run_memory = None
+        for memory in self.memory.values():
+            run_memory = _max_memory(run_memory, memory)
+        line.update(run_memory or {})
+        lines.append(line)
+        return lines
+
+    def end_run(self, verbose: bool = True) -> dict:
+        r"""Write the JSON lines of the run (if it was started with a log folder), print its peak memory per stage
+        with :obj:`verbose`, stop the sampling of the resident size and return its seconds per stage."""
+        # out of the lock, which the sampling thread takes
+        self._stop_sampling()
+        with self._lock:
+            if self.path is not None:
+                with open(self.path, 'a') as file:
+                    file.write(''.join(json.dumps(line) + '\n' for line in self.lines()))
+            if verbose and len(self.memory) > 0:
+                print(self.report())
+            run = OrderedDict()
+            for (_, stage), stats in self.stats.items():
+                run[stage] = run.get(stage, 0.0) + stats[1]
+                self.completed[stage] = self.completed.get(stage, 0.0) + stats[1]
+            for (_, stage), memory in self.memory.items():
+                self.completed_memory[stage] = _max_memory(self.completed_memory.get(stage), memory)
+            self.stats, self.memory = OrderedDict(), OrderedDict()
+            self.split, self.path, self.started = None, None, None
+            return run
+
+
+def _max_memory(a: Optional[dict], b: dict) -> dict:
+    # field by field maximum, a field being None when it is not measured
+    if a is None:
+        return dict(b)
+    return {field: b[field] if a[field] is None else a[field] if b[field] is None else max(a[field], b[field])
+            for field in MEMORY_FIELDS}
+
+
+RECORDER = Recorder()
+
+
+class timed(ContextDecorator):
+    r"""Charge the wall time and the peak memory of a block (:obj:`with timed('forward'):`) or of every call of a
+    function (:obj:`@timed('split')`) to a stage of the :obj:`RECORDER`. A block nested in another block of the same
+    stage (e.g. a decorated Laplacian builder called in a :obj:`with timed('laplacian'):`) is only counted once.
+    Arg types:
+        * **stage** (str) - The name of the stage.
+        * **recorder** (Recorder, optional) - Where the time is recorded. (default: :obj:`RECORDER`)
+    """
+    def __init__(self, stage: str, recorder: Optional[Recorder] = None):
+        self.stage = stage
+        self.recorder = recorder
+        self._starts = []
+        self._labels = []
+
+    def __enter__(self):
+        recorder = self.recorder or RECORDER
+        recorder.enter(self.stage)
+        # the stage is a labelled range in the traces of torch.profiler
+        label = torch.autograd.profiler.record_function(self.stage) if torch.autograd._profiler_enabled() else None
+        if label is not None:
+            label.__enter__()
+        self._labels.append(label)
+        if recorder.measuring():
+            _synchronize()
+        self._starts.append(time.perf_counter())
+        return self
+
+    def __exit__(self, *exc):
+        if (self.recorder or RECORDER).measuring():
+            _synchronize()
+        seconds = time.perf_counter() - self._starts.pop()
+        label = self._labels.pop()
+        if label is not None:
+            label.__exit__(*exc)
+        (self.recorder or RECORDER).exit(self.stage, seconds)
+        return False
+
+
+def start_run(log_path: str, args=None):
+    RECORDER.start_run(log_path, args)
+
+
+def set_split(split: Optional[int]):
+    RECORDER.set_split(split)
+
+
+def end_run() -> dict:
+    return RECORDER.end_run()
+
+
+def peak_memory() -> int:
+    return RECORDER.peak_memory()
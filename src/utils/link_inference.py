@@ -0,0 +1,173 @@
+'''
+Chunked scoring of candidate edges and batched decoding of query sets with the link models
+'''
+from typing import Iterable, Iterator, Optional, Tuple, Union
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+
+import numpy as np
+import torch
+
+
+def iter_candidate_chunks(candidates: Union[np.ndarray, torch.Tensor, Iterable], chunk_size: int = 65536) -> Iterator[np.ndarray]:
+    r"""Split the candidate edges in chunks of at most :obj:`chunk_size` pairs.
+    Arg types:
+        * **candidates** (np.ndarray, np.memmap, torch.LongTensor or iterable) - The candidate edges, either
+            an array with shape (num_edges, 2) (e.g. memory-mapped by :obj:`load_candidates`) or an iterable
+            of (src, dst) pairs or of arrays with shape (n, 2).
+        * **chunk_size** (int, optional) - The number of candidate edges in each chunk. (default: 65536)
+    Return types:
+        * **chunk** (np.ndarray) - An int64 array with shape (n, 2), n <= chunk_size.
+    """
+    if torch.is_tensor(candidates):
+        candidates = candidates.cpu().numpy()
+    if isinstance(candidates, np.ndarray):
+        # slicing a memmap only reads the rows of the current chunk
+        for start in range(0, candidates.shape[0], chunk_size):
+            yield np.array(candidates[start:start+chunk_size], dtype=np.int64)
+        return
+
+    buffer, size = [], 0
+    for item in candidates:
+        item = np.asarray(item.cpu() if torch.is_tensor(item) else item, dtype=np.int64).reshape(-1, 2)
+        buffer.append(item)
+        size += item.shape[0]
+        while size >= chunk_size:
+            block = np.concatenate(buffer, axis=0)
+            yield block[:chunk_size]
+            buffer, size = [block[chunk_size:]], block.shape[0] - chunk_size
+    if size > 0:
+        yield np.concatenate(buffer, axis=0)
+
+
+def load_candidates(path: str) -> np.ndarray:
+    r"""Memory-map a .npy file of candidate edges with shape (num_edges, 2) without loading it.
+    Arg types:
+        * **path** (str) - The path of the .npy file.
+    Return types:
+        * **candidates** (np.memmap) - The read-only candidate edges.
+    """
+    candidates = np.load(path, mmap_mode='r')
+    if candidates.ndim != 2 or candidates.shape[1] != 2:
+        raise ValueError('Candidates must have shape (num_edges, 2), got %s' % (candidates.shape,))
+    return candidates
+
+
+def score_links(model: torch.nn.Module, embeddings: Tuple[torch.Tensor, ...], candidates: Union[np.ndarray, torch.Tensor, Iterable],
+                chunk_size: int = 65536, num_workers: int = 0, to_cpu: bool = True) -> Iterator[Tuple[np.ndarray, torch.Tensor]]:
+    r"""Stream the candidate edges through the decoder of a link model in fixed-size chunks.
+    The node embeddings are computed once with :obj:`model.embed`, so memory is bounded by the chunk size
+    instead of the number of candidates. The chunks are yielded in the input order.
+    Arg types:
+        * **model** (torch.nn.Module) - A link model with a :obj:`decode` method (SigMaNet, QuaNet or MSGNN).
+        * **embeddings** (tuple of PyTorch Float Tensor) - The output of :obj:`model.embed`.
+        * **candidates** (np.ndarray, np.memmap, torch.LongTensor or iterable) - The candidate edges.
+        * **chunk_size** (int, optional) - The number of candidate edges decoded at once. (default: 65536)
+        * **num_workers** (int, optional) - The number of threads decoding chunks concurrently, 0 to decode
+            in the calling thread. At most 2*num_workers chunks are in flight. (default: 0)
+        * **to_cpu** (bool, optional) - Whether to move the log-probabilities to the cpu. (default: True)
+    Return types:
+        * **chunk** (np.ndarray) - The candidate edges of the chunk, with shape (n, 2).
+        * **log_prob** (PyTorch Float Tensor) - Logarithmic class probabilities of the chunk, with shape (n, num_classes).
+    """
+    device = embeddings[0].device
+    was_training = model.training
+    model.eval()
+
+    def decode(chunk):
+        with torch.no_grad():
+            out = model.decode(embeddings, torch.from_numpy(chunk).to(device))
+        return out.cpu() if to_cpu else out
+
+    try:
+        chunks = iter_candidate_chunks(candidates, chunk_size)
+        if num_workers <= 0:
+            for chunk in chunks:
+                yield chunk, decode(chunk)
+            return
+
+        with ThreadPoolExecutor(max_workers=num_workers) as executor:
+            pending = deque()
+            for chunk in chunks:
+                pending.append((chunk, executor.submit(decode, chunk)))
+                if len(pending) >= 2*num_workers:
+                    chunk, future = pending.popleft()
+                    yield chunk, future.result()
+            while pending:
+                chunk, future = pending.popleft()
+                yield chunk, future.result()
+    finally:
+        model.train(was_training)
+
+
+def score_links_to_array(model: torch.nn.Module, embeddings: Tuple[torch.Tensor, ...], candidates: Union[np.ndarray, torch.Tensor, Iterable],
+                         num_classes: int, out_path: Optional[str] = None, num_edges: Optional[int] = None,
+                         chunk_size: int = 65536, num_workers: int = 0) -> np.ndarray:
+    r"""Score all the candidate edges and gather the log-probabilities in one array.
+    Arg types:
+        * **model**, **embeddings**, **candidates**, **chunk_size**, **num_workers** - See :obj:`score_links`.
+        * **num_classes** (int) - The number of output classes of the model.
+        * **out_path** (str, optional) - If given, the output is a .npy file memory-mapped at this path
+            and filled chunk by chunk. (default: None)
+        * **num_edges** (int, optional) - The number of candidates, required with :obj:`out_path` when
+            the candidates are an iterable, which must yield exactly as many. (default: None)
+    Return types:
+        * **log_prob** (np.ndarray or np.memmap) - Logarithmic class probabilities, with shape (num_edges, num_classes).
+    """
+    if num_edges is None and hasattr(candidates, 'shape'):
+        num_edges = candidates.shape[0]
+
+    if out_path is None:
+        out = [log_prob.numpy() for _, log_prob in score_links(model, embeddings, candidates, chunk_size, num_workers)]
+        return np.concatenate(out, axis=0) if len(out) > 0 else np.zeros((0, num_classes), dtype=np.float32)
+
+    if num_edges is None:
+        raise ValueError('num_edges is required to write the output of an iterable')
+    out = np.lib.format.open_memmap(out_path, mode='w+', dtype=np.float32, shape=(num_edges, num_classes))
+    start = 0
+    for chunk, log_prob in score_links(model, embeddings, candidates, chunk_size, num_workers):
+        if start + chunk.shape[0] > num_edges:
+            raise ValueError('num_edges is %d but more candidates were given' % num_edges)
+        out[start:start+chunk.shape[0]] = log_prob.numpy()
+        start += chunk.shape[0]
+    if start != num_edges:
+        raise ValueError('num_edges is %d but %d candidates were scored' % (num_edges, start))
+    out.flush()
+    return out
+
+
+def evaluate_query_sets(model: torch.nn.Module, forward, query_sets) -> Tuple[torch.Tensor, ...]:
+    r"""Decode several query sets (e.g. validation and test edges) with a single no-grad forward.
+    The graph and the features are fixed, so the node embeddings only depend on the model weights:
+    the query sets are concatenated, decoded together in eval mode and split back.
+    Arg types:
+        * **model** (torch.nn.Module) - The link model, set to eval mode.
+        * **forward** (callable) - Maps the query edges to the model output, e.g. :obj:`lambda q: model(X_real, X_img, q)`.
+        * **query_sets** (list of PyTorch LongTensor) - The query edges, each with shape (num_edges, 2).
+    Return types:
+        * **outputs** (tuple of PyTorch Tensor) - The output of each query set, in order.
+    """
+    if len(query_sets) == 0:
+        raise ValueError('At least one query set is required')
+    sizes = [query.shape[0] for query in query_sets]
+    model.eval()
+    with torch.no_grad():
+        out = forward(torch.cat(query_sets, dim=0))
+    return torch.split(out, sizes, dim=0)
+
+
+def decode_query_sets(model: torch.nn.Module, embed, query_sets) -> Tuple[torch.Tensor, ...]:
+    r"""Decode several query sets (e.g. validation and test edges) from one no-grad computation of the node embeddings.
+    Unlike :obj:`evaluate_query_sets` with the full forward, the graph is only propagated once by :obj:`model.embed`,
+    and the query sets are then decoded together by :obj:`model.decode` through :obj:`evaluate_query_sets`.
+    Arg types:
+        * **model** (torch.nn.Module) - A link model with :obj:`embed` and :obj:`decode` methods (SigMaNet, QuaNet or MSGNN), set to eval mode.
+        * **embed** (callable) - Computes the node embeddings, e.g. :obj:`lambda: model.embed(X_real, X_img)`.
+        * **query_sets** (list of PyTorch LongTensor) - The query edges, each with shape (num_edges, 2).
+    Return types:
+        * **outputs** (tuple of PyTorch Tensor) - The output of each query set, in order.
+    """
+    model.eval()
+    with torch.no_grad():
+        embeddings = embed()
+    return evaluate_query_sets(model, lambda query: model.decode(embeddings, query), query_sets)
@@ -0,0 +1,139 @@
+from typing import Tuple, Union
+
+import torch
+import torch.nn.functional as F
+
+
+def link_projections(model: torch.nn.Module, embeddings: Tuple[torch.Tensor, ...]) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+    r"""Split the unwind decoder of a link model in a source and a target projection per node.
+    The decoder input is the concatenation [c_1[u], c_1[v], ..., c_m[u], c_m[v]] of the m embedding
+    components, so its logits are S[u] + T[v] + b with S, T computed once for all nodes.
+    Arg types:
+        * **model** (torch.nn.Module) - A trained SigMaNet, QuaNet or MSGNN link model (with unwind decoder).
+        * **embeddings** (tuple of PyTorch Float Tensor) - The output of :obj:`model.embed`.
+    Return types:
+        * **source** (PyTorch Float Tensor) - Source projections, with shape (num_nodes, num_classes).
+        * **target** (PyTorch Float Tensor) - Target projections, with shape (num_nodes, num_classes).
+        * **bias** (PyTorch Float Tensor) - The decoder bias, with shape (num_classes,).
+    """
+    assert getattr(model, 'unwind', True), 'The recommendation needs the unwind (linear) decoder'
+    weight = model.linear.weight.detach()
+    hidden = embeddings[0].shape[1]
+    assert weight.shape[1] == 2*len(embeddings)*hidden, 'The decoder does not match the embeddings'
+
+    source, target = 0, 0
+    for m, emb in enumerate(embeddings):
+        emb = emb.detach()
+        source = source + emb @ weight[:, 2*m*hidden:(2*m+1)*hidden].t()
+        target = target + emb @ weight[:, (2*m+1)*hidden:(2*m+2)*hidden].t()
+    bias = model.linear.bias.detach() if model.linear.bias is not None else weight.new_zeros(weight.shape[0])
+    return source, target, bias
+
+
+def _kmeans(x: torch.Tensor, n_lists: int, n_iter: int = 20, seed: int = 0) -> Tuple[torch.Tensor, torch.Tensor]:
+    generator = torch.Generator().manual_seed(seed)
+    centroids = x[torch.randperm(x.shape[0], generator=generator)[:n_lists].to(x.device)].clone()
+    for _ in range(n_iter):
+        assign = torch.cdist(x, centroids).argmin(dim=1)
+        count = torch.bincount(assign, minlength=centroids.shape[0]).unsqueeze(1)
+        total = torch.zeros_like(centroids).index_add_(0, assign, x)
+        # empty lists keep their previous centroid
+        centroids = torch.where(count > 0, total / count.clamp(min=1), centroids)
+    return centroids, torch.cdist(x, centroids).argmin(dim=1)
+
+
+class LinkRecommender(object):
+    r"""Top-k outgoing/incoming link recommendation over a trained link model.
+
+    The score of the directed (signed) pair (u, v) is the log-probability of class :obj:`label`,
+    i.e. log_softmax(S[u] + T[v] + b)[label], so the scores of all the candidates of a query node
+    only need the precomputed projections. Two indices are available:
+
+        1. :obj:`"exact"`: blocked brute force over all the nodes.
+        2. :obj:`"ivf"`: inverted file, the candidates are clustered with k-means on their projection and only
+        the members of the :obj:`n_probe` best scored clusters are ranked exactly.
+
+    Arg types:
+        * **model** (torch.nn.Module) - A trained SigMaNet, QuaNet or MSGNN link model.
+        * **embeddings** (tuple of PyTorch Float Tensor) - The output of :obj:`model.embed`.
+        * **label** (int, optional) - The class to rank, e.g. 0 for an existing directed edge. (default: 0)
+        * **index** (str, optional) - :obj:`"exact"` or :obj:`"ivf"`. (default: :obj:`"exact"`)
+        * **block_size** (int, optional) - The number of candidates scored at once by the exact index. (default: 65536)
+        * **n_lists** (int, optional) - The number of clusters of the ivf index. (default: 64)
+        * **n_probe** (int, optional) - The number of clusters visited per query by the ivf index. (default: 8)
+    """
+    def __init__(self, model: torch.nn.Module, embeddings: Tuple[torch.Tensor, ...], label: int = 0, index: str = 'exact',
+                 block_size: int = 65536, n_lists: int = 64, n_probe: int = 8):
+        assert index in ['exact', 'ivf'], 'Invalid index'
+        self.source, self.target, self.bias = link_projections(model, embeddings)
+        self.label = label
+        self.index = index
+        self.block_size = block_size
+        self.num_nodes = self.source.shape[0]
+        self.n_probe = n_probe
+        if index == 'ivf':
+            n_lists = min(n_lists, self.num_nodes)
+            # one inverted file per direction: targets for outgoing queries, sources for incoming ones
+            self.lists = {'out': self._build_lists(self.target, n_lists), 'in': self._build_lists(self.source, n_lists)}
+
+    def _build_lists(self, candidates: torch.Tensor, n_lists: int):
+        centroids, assign = _kmeans(candidates, n_lists)
+        order = assign.argsort()
+        ptr = torch.cat([assign.new_zeros(1), torch.bincount(assign, minlength=n_lists).cumsum(0)])
+        return centroids, order, ptr
+
+    def _score(self, query: torch.Tensor, candidates: torch.Tensor) -> torch.Tensor:
+        # query: (q, C) fixed side projections, candidates: (n, C) -> (q, n) log-probabilities of the label
+        logits = query.unsqueeze(1) + candidates.unsqueeze(0) + self.bias
+        return F.log_softmax(logits, dim=-1)[..., self.label]
+
+    def _exact(self, query: torch.Tensor, candidates: torch.Tensor, nodes: torch.Tensor, k: int, exclude_self: bool):
+        best_score = query.new_full((query.shape[0], 0), float('-inf'))
+        best_index = nodes.new_zeros((query.shape[0], 0))
+        for start in range(0, candidates.shape[0], self.block_size):
+            score = self._score(query, candidates[start:start+self.block_size])
+            index = torch.arange(start, start+score.shape[1], device=score.device).expand_as(score)
+            if exclude_self:
+                score = score.masked_fill(index == nodes.unsqueeze(1), float('-inf'))
+            best_score, pos = torch.cat([best_score, score], dim=1).topk(min(k, best_score.shape[1]+score.shape[1]), dim=1)
+            best_index = torch.cat([best_index, index], dim=1).gather(1, pos)
+        return best_score, best_index
+
+    def _ivf(self, query: torch.Tensor, candidates: torch.Tensor, nodes: torch.Tensor, k: int, exclude_self: bool, direction: str):
+        centroids, order, ptr = self.lists[direction]
+        probe = self._score(query, centroids).topk(min(self.n_probe, centroids.shape[0]), dim=1).indices
+        scores, indices = [], []
+        for i in range(query.shape[0]):
+            members = torch.cat([order[ptr[c]:ptr[c+1]] for c in probe[i].tolist()])
+            score = self._score(query[i:i+1], candidates[members])[0]
+            if exclude_self:
+                score = score.masked_fill(members == nodes[i], float('-inf'))
+            score, pos = score.topk(min(k, score.shape[0]))
+            # pad when the probed clusters hold less than k candidates
+            pad = k - score.shape[0]
+            scores.append(F.pad(score, (0, pad), value=float('-inf')))
+            indices.append(F.pad(members[pos], (0, pad), value=-1))
+        return torch.stack(scores), torch.stack(indices)
+
+    def recommend(self, nodes: Union[int, torch.LongTensor], k: int = 10, direction: str = 'out',
+                  exclude_self: bool = True) -> Tuple[torch.Tensor, torch.LongTensor]:
+        r"""Top-k neighbors of a batch of query nodes.
+        Arg types:
+            * **nodes** (int or PyTorch LongTensor) - The query nodes.
+            * **k** (int, optional) - The number of neighbors to return. (default: 10)
+            * **direction** (str, optional) - :obj:`"out"` ranks the targets v of (u, v), :obj:`"in"` ranks
+                the sources v of (v, u). (default: :obj:`"out"`)
+            * **exclude_self** (bool, optional) - Whether to exclude the self loop (u, u). (default: True)
+        Return types:
+            * **scores** (PyTorch Float Tensor) - Log-probabilities of the label, with shape (num_queries, k).
+            * **neighbors** (PyTorch LongTensor) - The recommended nodes, with shape (num_queries, k), -1 for padding.
+        """
+        assert direction in ['out', 'in'], 'Invalid direction'
+        nodes = torch.as_tensor(nodes, dtype=torch.long, device=self.source.device).view(-1)
+        if direction == 'out':
+            query, candidates = self.source[nodes], self.target
+        else:
+            query, candidates = self.target[nodes], self.source
+        if self.index == 'exact':
+            return self._exact(query, candidates, nodes, k, exclude_self)
+        return self._ivf(query, candidates, nodes, k, exclude_self, direction)
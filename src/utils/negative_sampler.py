@@ -0,0 +1,203 @@
+import queue
+import threading
+from typing import Iterator, Optional, Union
+
+import numpy as np
+import torch
+
+from .instrument import timed
+from .edge_index import EdgeIndex
+
+MODES = ['uniform', 'degree', 'reverse']
+# the label of the negative edges in the tasks of link_class_split_new that have them
+NEGATIVE_LABELS = {'existence': 1, 'three_class_digraph': 2, 'five_class_signed_digraph': 4}
+
+
+class NegativeSampler(object):
+    r"""Vectorized sampler of the negative edges (pairs of nodes that are not linked) of a graph for the link splits.
+
+    The edges of the graph are kept in an :obj:`EdgeIndex` (their sorted int64 keys :obj:`row * num_nodes + col`), so
+    that a batch of candidate pairs is checked with one :obj:`np.searchsorted`. A batch is drawn by rejection sampling
+    until it holds :obj:`count` distinct pairs, without self-loops. The modes draw the pairs:
+
+        * **uniform** - uniformly among all the pairs of nodes.
+        * **degree** - with both nodes drawn proportionally to their degree (hard negatives between hubs).
+        * **reverse** - among the reverses of the one-way edges, i.e. (v, u) for an edge (u, v) whose reverse is
+          not in the graph (hard negatives of the direction tasks). At most the number of one-way edges are drawn.
+
+    :obj:`sample` draws one batch and :obj:`stream` a new batch at every step, e.g. to resample the negative edges
+    of every epoch.
+
+    Arg types:
+        * **edge_index** (PyTorch LongTensor or np.ndarray) - The edges of the graph, shape (2, num_edges).
+        * **num_nodes** (int, optional) - The number of nodes, the largest index plus 1 if None. (default: None)
+        * **mode** (str, optional) - uniform, degree or reverse. (default: 'uniform')
+        * **undirected** (bool, optional) - Whether a pair is rejected when the graph has an edge between its nodes in
+          either direction (as the negative edges of :obj:`link_class_split_new`), or only in its direction.
+          The reverse mode always uses the direction. (default: True)
+        * **seed** (int, optional) - The seed of the random generator. (default: None)
+        * **max_tries** (int, optional) - The rejection rounds of a batch before it is returned short. (default: 10)
+        * **held_out** (PyTorch LongTensor or np.ndarray, optional) - Pairs that are never drawn although they are not
+          linked, e.g. the negative edges of the validation and test sets, shape (2, num_pairs). (default: None)
+    """
+    def __init__(self, edge_index: Union[torch.LongTensor, np.ndarray], num_nodes: Optional[int] = None,
+                 mode: str = 'uniform', undirected: bool = True, seed: Optional[int] = None, max_tries: int = 10,
+                 held_out: Union[torch.LongTensor, np.ndarray, None] = None):
+        assert mode in MODES, 'Unknown negative sampling mode %s, choose among %s' % (mode, ', '.join(MODES))
+        if torch.is_tensor(edge_index):
+            edge_index = edge_index.cpu().numpy()
+        row, col = np.asarray(edge_index, dtype=np.int64)
+        if num_nodes is None:
+            num_nodes = int(max(row.max(), col.max())) + 1 if len(row) > 0 else 0
+        self.num_nodes = num_nodes
+        self.mode = mode
+        self.max_tries = max_tries
+        self.rng = np.random.default_rng(seed)
+
+        directed = EdgeIndex.from_edges(np.stack([row, col]), num_nodes)
+        if undirected and mode != 'reverse':
+            self.index = EdgeIndex.from_edges(np.stack([np.concatenate([row, col]), np.concatenate([col, row])]), num_nodes)
+        else:
+            self.index = directed
+        self.held_out = None if held_out is None else EdgeIndex.from_edges(held_out, num_nodes)
+        if mode == 'degree':
+            self.endpoints = np.concatenate([row, col])
+        elif mode == 'reverse':
+            reverse = col * num_nodes + row
+            candidates = (row != col) & ~directed.exists(col, row)
+            _, first = np.unique(reverse[candidates], return_index=True)
+            self.candidates = reverse[candidates][np.sort(first)]
+            if self.held_out is not None:
+                self.candidates = self.candidates[self.held_out.search(self.candidates) == 0]
+
+    def is_edge(self, row, col) -> np.ndarray:
+        r"""Whether the pairs (row, col) are rejected as negative edges, i.e. linked in the graph."""
+        return self.index.exists(row, col)
+
+    def _rejected(self, keys: np.ndarray) -> np.ndarray:
+        # the pairs of int64 keys linked in the graph or held out
+        rejected = self.index.search(keys) != 0
+        if self.held_out is not None:
+            rejected |= self.held_out.search(keys) != 0
+        return rejected
+
+    def _candidates(self, size: int) -> np.ndarray:
+        # the keys of size random pairs without self-loops
+        if self.mode == 'degree':
+            row = self.endpoints[self.rng.integers(0, len(self.endpoints), size)]
+            col = self.endpoints[self.rng.integers(0, len(self.endpoints), size)]
+            keep = row != col
+            return row[keep] * self.num_nodes + col[keep]
+        row = self.rng.integers(0, self.num_nodes, size, dtype=np.int64)
+        col = self.rng.integers(0, self.num_nodes - 1, size, dtype=np.int64)
+        col += col >= row
+        return row * self.num_nodes + col
+
+    def sample(self, count: int) -> np.ndarray:
+        r"""Draw :obj:`count` distinct negative edges, fewer if the rejection rounds do not find them all.
+        Return types:
+            * **negative** (np.ndarray) - The negative edges, shape (num_negative, 2).
+        """
+        if self.mode == 'reverse':
+            keys = self.rng.permutation(self.candidates)[:count]
+        else:
+            keys = np.zeros(0, dtype=np.int64)
+            pairs = self.num_nodes * (self.num_nodes - 1)
+            taken = len(self.index) + (0 if self.held_out is None else len(self.held_out))
+            free = max(1.0 - taken / pairs, 1e-3) if pairs > 0 else 0.0
+            for _ in range(self.max_tries if free > 0 else 0):
+                missing = count - len(keys)
+                if missing <= 0:
+                    break
+                # the distinct new pairs, kept in the order in which they are drawn
+                candidates, first = np.unique(self._candidates(int(1.2 * missing / free) + 16), return_index=True)
+                keep = ~self._rejected(candidates) & ~np.isin(candidates, keys)
+                candidates = candidates[keep][np.argsort(first[keep])]
+                keys = np.concatenate([keys, candidates[:missing]])
+        return np.stack([keys // self.num_nodes, keys % self.num_nodes], axis=1)
+
+    def stream(self, count: int) -> Iterator[np.ndarray]:
+        r"""A new batch of :obj:`count` negative edges at every step (see :obj:`sample`)."""
+        while True:
+            yield self.sample(count)
+
+
+def held_out_negatives(dataset: dict, negative_label: int) -> torch.LongTensor:
+    r"""The negative edges of the validation and test sets of a link split, to hold them out of a :obj:`NegativeSampler`
+    that resamples the training ones.
+    Arg types:
+        * **dataset** (dict) - A split of :obj:`link_class_split_new`, :obj:`datasets[i]`.
+        * **negative_label** (int) - The label of the negative edges, see :obj:`NEGATIVE_LABELS`.
+    Return types:
+        * **held_out** (PyTorch LongTensor) - The negative edges, shape (2, num_negative).
+    """
+    edges = [dataset[name]['edges'][dataset[name]['label'] == negative_label].cpu() for name in ['val', 'test']]
+    return torch.cat(edges).T
+
+
+class NegativeResampler(object):
+    r"""Fresh negative edges in the training set of a link split every :obj:`every` epochs.
+
+    The positive training edges are kept and the negative ones (those labelled :obj:`negative_label`) replaced by as
+    many edges drawn by :obj:`sampler`. A background thread draws the next batch while the current epochs run, so
+    that the sampling is off the critical path: :obj:`training_set` only waits (charged to the stage "resample")
+    when the batch is not ready yet. The first epochs use the negative edges of the split.
+
+    Arg types:
+        * **sampler** (NegativeSampler) - The sampler, of the whole graph so that no edge of the validation or test sets is drawn,
+          and holding out their negative edges (:obj:`held_out_negatives`).
+        * **edges** (PyTorch LongTensor) - The training edges of the split, shape (num_edges, 2).
+        * **labels** (PyTorch LongTensor) - Their labels.
+        * **negative_label** (int) - The label of the negative edges, see :obj:`NEGATIVE_LABELS`.
+        * **every** (int, optional) - The epochs between two batches. (default: 1)
+    """
+    def __init__(self, sampler: NegativeSampler, edges: torch.LongTensor, labels: torch.LongTensor, negative_label: int,
+                 every: int = 1):
+        negative = labels == negative_label
+        self.positive_edges, self.positive_labels = edges[~negative], labels[~negative]
+        self.edges, self.labels = edges, labels
+        self.negative_label = negative_label
+        self.count = int(negative.sum())
+        self.every = every
+        self._queue = queue.Queue(maxsize=1)
+        self._closed = threading.Event()
+        self._error = None
+        self._thread = threading.Thread(target=self._prefetch, args=(sampler,), daemon=True)
+        self._thread.start()
+
+    def _put(self, item) -> bool:
+        # wait for room in the queue, False if the resampler is closed meanwhile
+        while not self._closed.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _prefetch(self, sampler: NegativeSampler):
+        try:
+            for batch in sampler.stream(self.count):
+                if not self._put(torch.from_numpy(batch)):
+                    return
+        except Exception as error:
+            self._error = error
+            self._put(None)
+
+    def training_set(self, epoch: int):
+        r"""The training edges and labels of :obj:`epoch`, with a new batch of negative edges every :obj:`every` epochs."""
+        if epoch > 0 and epoch % self.every == 0:
+            with timed('resample'):
+                batch = self._queue.get()
+            if batch is None:
+                raise RuntimeError('The negative sampling failed') from self._error
+            batch = batch.to(self.edges.device)
+            self.edges = torch.cat([self.positive_edges, batch])
+            self.labels = torch.cat([self.positive_labels, torch.full((len(batch),), self.negative_label,
+                                                                      dtype=self.labels.dtype, device=self.labels.device)])
+        return self.edges, self.labels
+
+    def close(self):
+        r"""Stop the background thread and wait for it (at most the time to draw the batch in progress)."""
+        self._closed.set()
+        self._thread.join()
@@ -0,0 +1,105 @@
+import copy
+import random
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, List, Sequence
+
+import numpy as np
+import torch
+from torch.func import functional_call, vmap
+
+
+def seed_split(seed: int, split: int):
+    r"""Seed python, numpy and torch for one split, so that the initialization and the training of a split
+    do not depend on the splits run before it. A driver run with per-split seeds (and splits drawn on their own,
+    see :obj:`utils.edge_data_new.iter_link_class_splits`) gives the same results sequentially, on a subset of the
+    splits and in :obj:`run_splits_in_pool`; by default the drivers keep the single random stream of the run.
+    Arg types:
+        * **seed** (int) - The random seed of the run.
+        * **split** (int) - The index of the split.
+    """
+    random.seed(seed + split)
+    np.random.seed(seed + split)
+    torch.manual_seed(seed + split)
+
+
+class StackedModels(object):
+    r"""Independent copies of a model (one per split) trained simultaneously with :obj:`torch.func`.
+
+    The parameters of the copies are stacked along a new leading dimension (as :obj:`torch.func.stack_module_state`,
+    but without the buffers) and the forward of the first copy is vmapped over them. The buffers, e.g. the
+    GraphOperator of a SigMaNet model, are not stacked: all the copies must share the same graph operator,
+    whose product is then computed once for all the splits.
+
+    The copies are built in the order of the sequential loop and must not draw random numbers in their forward,
+    e.g. with dropout > 0: the sequential loop draws the dropout masks of a split from the global random stream,
+    between the initializations of the models, which the vmapped forward cannot reproduce (it raises instead).
+
+    Arg types:
+        * **models** (list of torch.nn.Module) - Models with the same architecture and graph operator.
+    """
+    def __init__(self, models: List[torch.nn.Module]):
+        self.base = models[0]
+        self.num_models = len(models)
+        self.params = OrderedDict((name, torch.stack([model.get_parameter(name).detach() for model in models]).requires_grad_())
+                                  for name, _ in self.base.named_parameters())
+
+    def __len__(self):
+        return self.num_models
+
+    def parameters(self):
+        return list(self.params.values())
+
+    def train(self, mode: bool = True):
+        self.base.train(mode)
+        return self
+
+    def eval(self):
+        return self.train(False)
+
+    def __call__(self, *inputs):
+        r"""The outputs of all the copies on the same (unbatched) inputs, stacked along the first dimension."""
+        def forward(params, *inputs):
+            return functional_call(self.base, params, inputs)
+        return vmap(forward, in_dims=(0,) + (None,)*len(inputs), randomness='error')(self.params, *inputs)
+
+    def state_dict(self, index: int):
+        r"""The state dict of the :obj:`index`-th copy, as :obj:`model.state_dict()`."""
+        state = self.base.state_dict()
+        for name, param in self.params.items():
+            state[name] = param[index].detach()
+        return state
+
+
+def run_splits_in_pool(main: Callable, args, splits: Sequence[int], num_workers: int) -> np.ndarray:
+    r"""Run a driver on disjoint groups of splits in a pool of processes, e.g. when every split has its own Laplacian.
+    Each worker calls :obj:`main(args)` with :obj:`args.splits` set to its group and returns the results array
+    of the driver, whose rows of the group are gathered in the output.
+    Arg types:
+        * **main** (callable) - The main function of the driver (a module level function, pickled by reference).
+        * **args** (argparse.Namespace) - The arguments of the driver.
+        * **splits** (sequence of int) - The splits to run.
+        * **num_workers** (int) - The number of processes.
+    Return types:
+        * **results** (np.ndarray) - The results array of the driver, filled for all the splits.
+    """
+    splits = list(splits)
+    num_workers = max(1, min(num_workers, len(splits)))
+    # the cores are divided among the workers instead of being oversubscribed by the intra-op threads
+    num_threads = max(1, torch.get_num_threads() // num_workers)
+    context = multiprocessing.get_context('spawn')
+    results = None
+    with ProcessPoolExecutor(max_workers=num_workers, mp_context=context,
+                             initializer=torch.set_num_threads, initargs=(num_threads,)) as executor:
+        futures = []
+        for worker in range(num_workers):
+            worker_args = copy.copy(args)
+            worker_args.splits = splits[worker::num_workers]
+            futures.append((worker_args.splits, executor.submit(main, worker_args)))
+        for group, future in futures:
+            out = future.result()
+            if results is None:
+                results = np.zeros_like(out)
+            results[group] = out[group]
+    return results
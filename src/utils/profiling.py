@@ -0,0 +1,84 @@
+import os
+from contextlib import contextmanager
+from typing import List
+
+import torch
+
+# operators listed in the top-ops tables
+ROW_LIMIT = 30
+
+
+class EpochProfiler(object):
+    r"""Capture of a window of training epochs with :obj:`torch.profiler`, for the :obj:`--profile` mode of the drivers.
+
+    The epochs follow the :obj:`schedule` [wait, warmup, active, repeat] of :obj:`torch.profiler.schedule`: after
+    :obj:`wait` skipped and :obj:`warmup` traced but discarded epochs, :obj:`active` epochs are recorded (with the
+    input shapes and the memory of the operators), :obj:`repeat` times. Every recorded window is exported to
+    :obj:`path` as a Chrome trace (:obj:`epochs_<n>.json`, for chrome://tracing or Perfetto) and a table of the
+    top operators by self time (:obj:`epochs_<n>_top_ops.txt`, also grouped by input shape). :obj:`region` records
+    a block run once, such as the Laplacian construction, in the same way.
+
+    The stages of :obj:`utils.instrument` appear as labelled ranges in the traces. When :obj:`enabled` is False
+    every method is a no-op, so the drivers call them unconditionally.
+
+    Arg types:
+        * **path** (str) - The folder of the traces, created when the first one is exported.
+        * **schedule** (list of int, optional) - wait, warmup, active and repeat epochs. (default: [1, 1, 3, 1])
+        * **enabled** (bool, optional) - Whether to profile. (default: True)
+    """
+    def __init__(self, path: str, schedule: List[int] = [1, 1, 3, 1], enabled: bool = True):
+        assert len(schedule) == 4, 'The profile schedule is wait,warmup,active,repeat'
+        self.path = path
+        self.schedule = schedule
+        self.enabled = enabled
+        self.profiler = None
+        self.windows = 0
+
+    def _activities(self) -> list:
+        activities = [torch.profiler.ProfilerActivity.CPU]
+        if torch.cuda.is_available():
+            activities.append(torch.profiler.ProfilerActivity.CUDA)
+        return activities
+
+    def _export(self, profiler: torch.profiler.profile, name: str):
+        os.makedirs(self.path, exist_ok=True)
+        profiler.export_chrome_trace(os.path.join(self.path, name + '.json'))
+        sort_by = 'self_cuda_time_total' if torch.cuda.is_available() else 'self_cpu_time_total'
+        with open(os.path.join(self.path, name + '_top_ops.txt'), 'w') as file:
+            file.write(profiler.key_averages().table(sort_by=sort_by, row_limit=ROW_LIMIT) + '\n')
+            file.write(profiler.key_averages(group_by_input_shape=True).table(sort_by=sort_by, row_limit=ROW_LIMIT) + '\n')
+
+    def _trace_ready(self, profiler: torch.profiler.profile):
+        self._export(profiler, 'epochs_%d' % self.windows)
+        self.windows += 1
+
+    @contextmanager
+    def region(self, name: str):
+        r"""Record the block run in the :obj:`with` (outside the epochs) to :obj:`path/<name>.json`."""
+        if not self.enabled or self.profiler is not None:
+            yield
+            return
+        with torch.profiler.profile(activities=self._activities(), record_shapes=True, profile_memory=True) as profiler:
+            yield
+        self._export(profiler, name)
+
+    def start(self):
+        r"""Start the schedule, before the first epoch."""
+        if not self.enabled:
+            return
+        wait, warmup, active, repeat = self.schedule
+        self.profiler = torch.profiler.profile(activities=self._activities(), record_shapes=True, profile_memory=True,
+                                               schedule=torch.profiler.schedule(wait=wait, warmup=warmup, active=active, repeat=repeat),
+                                               on_trace_ready=self._trace_ready)
+        self.profiler.start()
+
+    def step(self):
+        r"""Mark the end of an epoch."""
+        if self.profiler is not None:
+            self.profiler.step()
+
+    def stop(self):
+        r"""Stop the schedule after the last epoch (an early stop in the middle of a window exports what was recorded)."""
+        if self.profiler is not None:
+            self.profiler.stop()
+            self.profiler = None
@@ -0,0 +1,195 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+from typing import Dict, List, Optional
+
+import numpy as np
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS trials (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    key TEXT UNIQUE NOT NULL,
+    driver TEXT NOT NULL,
+    dataset TEXT,
+    method TEXT,
+    task TEXT,
+    params TEXT NOT NULL,
+    status TEXT NOT NULL,
+    error TEXT,
+    started REAL,
+    finished REAL,
+    seconds REAL,
+    peak_rss INTEGER,
+    peak_cuda INTEGER
+);
+CREATE INDEX IF NOT EXISTS trials_lookup ON trials (dataset, method, task);
+CREATE TABLE IF NOT EXISTS metrics (
+    trial_id INTEGER NOT NULL REFERENCES trials (id) ON DELETE CASCADE,
+    split INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    value REAL,
+    PRIMARY KEY (trial_id, split, name)
+);
+CREATE TABLE IF NOT EXISTS timings (
+    trial_id INTEGER NOT NULL REFERENCES trials (id) ON DELETE CASCADE,
+    stage TEXT NOT NULL,
+    seconds REAL,
+    PRIMARY KEY (trial_id, stage)
+);
+CREATE TABLE IF NOT EXISTS memory (
+    trial_id INTEGER NOT NULL REFERENCES trials (id) ON DELETE CASCADE,
+    stage TEXT NOT NULL,
+    rss_peak INTEGER,
+    rss_growth INTEGER,
+    tracemalloc_peak INTEGER,
+    cuda_peak INTEGER,
+    PRIMARY KEY (trial_id, stage)
+);
+'''
+
+# result arrays of the drivers, one row per split: (variable, columns by number of columns)
+RESULT_ARRAYS = [
+    ('res_array', {4: ['accuracy', 'f1', 'f1_macro', 'f1_micro']}),
+    ('results', {4: ['val_acc', 'test_acc', 'val_acc_latest', 'test_acc_latest'], 2: ['split', 'test_acc']}),
+]
+
+
+def split_metrics(namespace: dict) -> Dict[int, dict]:
+    r"""The per-split metrics of a driver run, from the result array left in its :obj:`__main__` namespace.
+
+    The drivers preallocate their result array with zeros for all the splits. Those which may run some of them
+    only (e.g. :obj:`--splits` of :obj:`Edge_SigMaNet.py`) record the splits that ran in :obj:`args.splits`, whose
+    rows are kept; the other drivers run all the splits, so all the rows are kept (a split scoring 0 included).
+
+    Arg types:
+        * **namespace** (dict) - The globals of the driver, as returned by :obj:`runpy.run_path`.
+    Return types:
+        * **metrics** (dict) - {split: {metric: value}} for the splits that ran, empty if the driver left no result array.
+    """
+    for name, columns in RESULT_ARRAYS:
+        results = namespace.get(name)
+        if isinstance(results, np.ndarray) and results.ndim >= 2:
+            rows = results.reshape(results.shape[0], -1)
+            names = columns.get(rows.shape[1], ['r%d' % j for j in range(rows.shape[1])])
+            splits = getattr(namespace.get('args'), 'splits', None)
+            ran = range(len(rows)) if splits is None else sorted(set(splits))
+            return {int(split): {names[j]: float(rows[split, j]) for j in range(rows.shape[1])} for split in ran}
+    return {}
+
+
+def trial_key(driver: str, params: dict) -> str:
+    r"""The identifier of a trial: the driver script and its options, in a canonical order."""
+    text = json.dumps({'driver': os.path.basename(driver), 'params': params}, sort_keys=True, default=str)
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+class ResultsStore(object):
+    r"""SQLite store of the sweep results, indexed by dataset, method, task and hyperparameters.
+
+    Every trial (a driver with its options) has one row in :obj:`trials` with its status, duration and peak
+    memory, its per-split metrics in :obj:`metrics`, its per-stage timings in :obj:`timings` and its per-stage peak
+    memory in :obj:`memory`. A sweep skips
+    the trials already :obj:`"done"`, so an interrupted sweep resumes where it stopped.
+
+    Arg types:
+        * **path** (str) - The database file, created if it does not exist.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute('PRAGMA foreign_keys = ON')
+        self.connection.executescript(SCHEMA)
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+    def completed(self) -> set:
+        r"""The keys of the trials already done."""
+        return set(row['key'] for row in self.connection.execute("SELECT key FROM trials WHERE status = 'done'"))
+
+    def start(self, trial: dict):
+        r"""Register a trial as running (again, if it was interrupted or failed)."""
+        params = trial['params']
+        with self.connection:
+            self.connection.execute('''
+                INSERT INTO trials (key, driver, dataset, method, task, params, status, started)
+                VALUES (?, ?, ?, ?, ?, ?, 'running', ?)
+                ON CONFLICT (key) DO UPDATE SET status = 'running', error = NULL, started = excluded.started''',
+                (trial_key(trial['driver'], params), trial['driver'], params.get('dataset'),
+                 params.get('method_name', params.get('method', os.path.splitext(os.path.basename(trial['driver']))[0])),
+                 params.get('task'), json.dumps(params, sort_keys=True, default=str), time.time()))
+
+    def record(self, result: dict):
+        r"""Store the outcome of a trial returned by :obj:`run_trial`: status, metrics, timings and peak memory
+        (of the run and of every stage)."""
+        key = trial_key(result['driver'], result['params'])
+        with self.connection:
+            if self.connection.execute('SELECT id FROM trials WHERE key = ?', (key,)).fetchone() is None:
+                self.start(result)
+            trial_id = self.connection.execute('SELECT id FROM trials WHERE key = ?', (key,)).fetchone()['id']
+            self.connection.execute('''
+                UPDATE trials SET status = ?, error = ?, finished = ?, seconds = ?, peak_rss = ?, peak_cuda = ?
+                WHERE id = ?''', (result['status'], result.get('error'), time.time(), result.get('seconds'),
+                                  result.get('peak_rss'), result.get('peak_cuda'), trial_id))
+            self.connection.execute('DELETE FROM metrics WHERE trial_id = ?', (trial_id,))
+            self.connection.execute('DELETE FROM timings WHERE trial_id = ?', (trial_id,))
+            self.connection.execute('DELETE FROM memory WHERE trial_id = ?', (trial_id,))
+            self.connection.executemany('INSERT INTO metrics (trial_id, split, name, value) VALUES (?, ?, ?, ?)',
+                                        [(trial_id, split, name, value) for split, values in result.get('metrics', {}).items()
+                                         for name, value in values.items()])
+            self.connection.executemany('INSERT INTO timings (trial_id, stage, seconds) VALUES (?, ?, ?)',
+                                        [(trial_id, stage, seconds) for stage, seconds in result.get('timings', {}).items()])
+            self.connection.executemany('''
+                INSERT INTO memory (trial_id, stage, rss_peak, rss_growth, tracemalloc_peak, cuda_peak)
+                VALUES (?, ?, ?, ?, ?, ?)''', [(trial_id, stage, memory.get('rss_peak'), memory.get('rss_growth'),
+                                                memory.get('tracemalloc_peak'), memory.get('cuda_peak'))
+                                               for stage, memory in result.get('memory', {}).items()])
+
+    def _where(self, **filters):
+        clauses, values = [], []
+        for column, value in filters.items():
+            if value is not None:
+                clauses.append('t.%s = ?' % column)
+                values.append(value)
+        return (' WHERE ' + ' AND '.join(clauses)) if clauses else '', values
+
+    def trials(self, dataset: Optional[str] = None, method: Optional[str] = None, task: Optional[str] = None,
+               status: Optional[str] = None) -> List[dict]:
+        r"""The trials matching the filters, with their parameters, timings and peak memory (per stage in
+        :obj:`memory`)."""
+        where, values = self._where(dataset=dataset, method=method, task=task, status=status)
+        rows = [dict(row) for row in self.connection.execute('SELECT * FROM trials t' + where + ' ORDER BY t.id', values)]
+        for row in rows:
+            row['params'] = json.loads(row['params'])
+            row['timings'] = {r['stage']: r['seconds'] for r in
+                              self.connection.execute('SELECT stage, seconds FROM timings WHERE trial_id = ?', (row['id'],))}
+            row['memory'] = {r['stage']: {key: r[key] for key in r.keys() if key not in ('trial_id', 'stage')} for r in
+                             self.connection.execute('SELECT * FROM memory WHERE trial_id = ?', (row['id'],))}
+        return rows
+
+    def aggregate(self, dataset: Optional[str] = None, method: Optional[str] = None, task: Optional[str] = None,
+                  metric: Optional[str] = None) -> List[dict]:
+        r"""Mean and standard deviation over the splits of every metric of the completed trials.
+        Return types:
+            * **rows** (list of dict) - dataset, method, task, params, metric, mean, std and number of splits.
+        """
+        where, values = self._where(dataset=dataset, method=method, task=task, status='done')
+        if metric is not None:
+            where += (' AND ' if where else ' WHERE ') + 'm.name = ?'
+            values.append(metric)
+        query = '''
+            SELECT t.id, t.dataset, t.method, t.task, t.params, m.name AS metric,
+                   AVG(m.value) AS mean, AVG(m.value * m.value) AS mean_sq, COUNT(m.value) AS splits
+            FROM metrics m JOIN trials t ON t.id = m.trial_id''' + where + '''
+            GROUP BY t.id, m.name ORDER BY t.dataset, t.method, t.task, m.name, mean DESC'''
+        rows = []
+        for row in self.connection.execute(query, values):
+            row = dict(row)
+            row['std'] = float(np.sqrt(max(row.pop('mean_sq') - row['mean']**2, 0.0)))
+            row['params'] = json.loads(row['params'])
+            rows.append(row)
+        return rows
@@ -0,0 +1,179 @@
+import os
+import json
+import random
+import shutil
+import hashlib
+import inspect
+import functools
+import tempfile
+from collections import OrderedDict
+from typing import Callable, Optional
+
+import numpy as np
+import torch
+
+from .sweep import _fingerprint
+
+CACHE_FORMAT = 1
+
+
+def cache_dir() -> Optional[str]:
+    # the folder of the cache, given by SPLIT_CACHE: the cache is off unless it is set
+    path = os.environ.get('SPLIT_CACHE', '')
+    return path if path else None
+
+
+def default_edge_weight(data):
+    r"""Give the edges of :obj:`data` a weight of 1 if it has no :obj:`edge_weight`, as the split functions do."""
+    if getattr(data, 'edge_weight', None) is None:
+        data.edge_weight = torch.ones(data.edge_index.size(1))
+
+
+def _flatten(datasets: dict, prefix: str = ''):
+    # the tensors and arrays of nested dicts, named by their keys joined with dots, and the other values
+    arrays, values = OrderedDict(), OrderedDict()
+    for key, value in datasets.items():
+        name = prefix + str(key)
+        if isinstance(value, dict):
+            sub_arrays, sub_values = _flatten(value, name + '.')
+            arrays.update(sub_arrays)
+            values.update(sub_values)
+            values.setdefault(name, {})
+        elif torch.is_tensor(value) or isinstance(value, np.ndarray):
+            arrays[name] = value
+        else:
+            values[name] = value
+    return arrays, values
+
+
+def _unflatten(arrays: dict, values: dict) -> dict:
+    datasets = {}
+
+    def put(name, value):
+        node = datasets
+        keys = name.split('.')
+        for key in keys[:-1]:
+            key = int(key) if key.isdigit() else key
+            node = node.setdefault(key, {})
+        key = int(keys[-1]) if keys[-1].isdigit() else keys[-1]
+        if isinstance(value, dict) and isinstance(node.get(key), dict):
+            return
+        node[key] = value
+
+    for name, value in values.items():
+        put(name, value)
+    for name, value in arrays.items():
+        put(name, value)
+    return datasets
+
+
+def _save_random_state(path: str):
+    version, python, gauss = random.getstate()
+    _, keys, pos, has_gauss, cached_gaussian = np.random.get_state()
+    np.savez(path, python=np.array(python, dtype=np.uint32), numpy=keys, torch=torch.get_rng_state().numpy(),
+             scalars=np.array([version, np.nan if gauss is None else gauss, pos, has_gauss, cached_gaussian]))
+
+
+def _load_random_state(path: str):
+    state = np.load(path)
+    version, gauss, pos, has_gauss, cached_gaussian = state['scalars'].tolist()
+    random.setstate((int(version), tuple(int(item) for item in state['python']), None if np.isnan(gauss) else gauss))
+    np.random.set_state(('MT19937', state['numpy'], int(pos), int(has_gauss), cached_gaussian))
+    torch.set_rng_state(torch.from_numpy(state['torch'].copy()))
+
+
+def split_key(name: str, arguments: dict) -> Optional[str]:
+    r"""The key of the splits of the split function :obj:`name` called with :obj:`arguments` (the input graph by
+    content) in the random state of python, numpy and torch, None if an argument cannot be hashed."""
+    digest = hashlib.sha1()
+    state = (random.getstate(), np.random.get_state()[1:], torch.get_rng_state())
+    if not _fingerprint((CACHE_FORMAT, name, arguments, list(state[0][1]), state[1][0], list(state[1][1:]), state[2]), digest):
+        return None
+    return digest.hexdigest()
+
+
+def save_splits(path: str, datasets: dict):
+    r"""Write :obj:`datasets` to the folder :obj:`path`: one :obj:`.npy` file per tensor (:obj:`<split>.<set>.<name>.npy`,
+    e.g. :obj:`0.train.edges.npy`), the random state left by the split function in :obj:`random_state.npz` and
+    the layout in :obj:`meta.json`. The folder is written next to :obj:`path` and renamed, so that a concurrent
+    reader never sees a partial entry."""
+    parent = os.path.dirname(path)
+    os.makedirs(parent, exist_ok=True)
+    tmp = tempfile.mkdtemp(dir=parent, prefix='.tmp_')
+    try:
+        arrays, values = _flatten(datasets)
+        dtypes = OrderedDict()
+        for name, value in arrays.items():
+            array = value.detach().cpu().numpy() if torch.is_tensor(value) else value
+            np.save(os.path.join(tmp, name + '.npy'), np.ascontiguousarray(array))
+            dtypes[name] = 'tensor' if torch.is_tensor(value) else 'ndarray'
+        _save_random_state(os.path.join(tmp, 'random_state.npz'))
+        with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+            json.dump({'format': CACHE_FORMAT, 'arrays': dtypes, 'values': values}, f)
+        os.rename(tmp, path)
+    except (OSError, TypeError, ValueError):
+        # e.g. another process wrote the same entry first, or a value that is not JSON
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def load_splits(path: str, device: str = 'cpu', mmap_mode: Optional[str] = 'c') -> Optional[dict]:
+    r"""The datasets saved by :obj:`save_splits` in :obj:`path` (None if there are none), with the tensors on
+    :obj:`device`. On the cpu the arrays are memory-mapped (copy-on-write by default), so a split is only read when
+    it is used. The random state is moved where the split function left it.
+    """
+    try:
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if meta.get('format') != CACHE_FORMAT:
+        return None
+    arrays = OrderedDict()
+    for name, kind in meta['arrays'].items():
+        array = np.load(os.path.join(path, name + '.npy'), mmap_mode=mmap_mode)
+        arrays[name] = torch.from_numpy(array).to(device) if kind == 'tensor' else array
+    _load_random_state(os.path.join(path, 'random_state.npz'))
+    return _unflatten(arrays, meta['values'])
+
+
+def cached_split(function: Optional[Callable] = None, prepare: Optional[Callable] = None) -> Callable:
+    r"""Cache on disk the splits returned by the split function :obj:`function` (e.g. :obj:`link_class_split_new`),
+    when the environment variable :obj:`SPLIT_CACHE` gives the folder of the cache. Its entries are never evicted:
+    the folder can be removed at any time.
+
+    An entry is the folder :obj:`<cache_dir>/<function>/<key>`, whose key hashes the input graph, the other
+    arguments but :obj:`device` and the random state of python, numpy and torch at the call (on which the negative
+    edges depend). A hit loads the splits to :obj:`device` and moves the random state where the original call left
+    it, so a driver run with a warm cache is identical to a cold one. The splits of every driver run with the same
+    dataset, task, split probabilities and seeds are thus only computed once.
+
+    Arg types:
+        * **function** (callable) - The split function, whose first argument is the input graph.
+        * **prepare** (callable, optional) - Called on the input graph before the key is computed, hit or miss, for
+          the changes that the split function makes to its input (e.g. :obj:`default_edge_weight`). (default: None)
+    """
+    if function is None:
+        return functools.partial(cached_split, prepare=prepare)
+    signature = inspect.signature(function)
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        arguments = signature.bind(*args, **kwargs)
+        if prepare is not None:
+            prepare(next(iter(arguments.arguments.values())))
+        root = cache_dir()
+        if root is None:
+            return function(*args, **kwargs)
+        arguments.apply_defaults()
+        arguments = OrderedDict(arguments.arguments)
+        device = arguments.pop('device', 'cpu')
+        key = split_key(function.__name__, arguments)
+        if key is None:
+            return function(*args, **kwargs)
+        path = os.path.join(root, function.__name__, key)
+        datasets = load_splits(path, device)
+        if datasets is None:
+            datasets = function(*args, **kwargs)
+            save_splits(path, datasets)
+        return datasets
+    return wrapper
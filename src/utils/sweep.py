@@ -0,0 +1,415 @@
+import os
+import sys
+import copy
+import time
+import runpy
+import random
+import shlex
+import pickle
+import hashlib
+import itertools
+import importlib
+import resource
+import traceback
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Iterable, Iterator, List, Optional, Union
+
+import numpy as np
+import scipy.sparse as sp
+import torch
+
+from .results_store import ResultsStore, split_metrics, trial_key
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+ROOT_DIR = os.path.dirname(SRC_DIR)
+DEFAULT_STORE = os.path.join(ROOT_DIR, 'results.db')
+
+# functions whose output is kept warm in the workers: (module, name, depends on the random state, stage)
+WARM_FUNCTIONS = [
+    # datasets
+    ('torch_geometric_signed_directed.data', 'load_directed_real_data', True, 'dataset'),
+    ('torch_geometric_signed_directed.data', 'load_signed_real_data', True, 'dataset'),
+    ('torch_geometric_signed_directed.data.signed', 'load_signed_real_data', True, 'dataset'),
+    ('utils.edge_data', 'load_signed_real_data_no_negative', True, 'dataset'),
+    ('utils.edge_data', 'load_signed_real_data_also_negative', True, 'dataset'),
+    # splits
+    ('torch_geometric_signed_directed', 'node_class_split', True, 'split'),
+    ('utils.edge_data', 'link_class_split', True, 'split'),
+    ('utils.edge_data_new', 'link_class_split_new', True, 'split'),
+    # laplacians
+    ('utils.edge_data', 'get_appr_directed_adj', False, 'laplacian'),
+    ('utils.edge_data', 'get_second_directed_adj', False, 'laplacian'),
+    ('utils.hermitian', 'hermitian_decomp_sparse', False, 'laplacian'),
+    ('utils.hermitian', 'cheb_poly_sparse', False, 'laplacian'),
+    ('layer.src2.laplacian', 'process_magnetic_laplacian', False, 'laplacian'),
+    ('layer.src2.quaternion_laplacian', 'process_quaternion_laplacian', False, 'laplacian'),
+]
+
+
+def _fingerprint(obj, digest):
+    # feed a deterministic description of obj to digest, False if obj cannot be part of a key
+    if obj is None or isinstance(obj, (bool, int, float, str, bytes)):
+        digest.update(repr((type(obj).__name__, obj)).encode())
+    elif isinstance(obj, (list, tuple)):
+        digest.update(('%s%d' % (type(obj).__name__, len(obj))).encode())
+        return all(_fingerprint(item, digest) for item in obj)
+    elif isinstance(obj, dict):
+        digest.update(('dict%d' % len(obj)).encode())
+        return all(_fingerprint(key, digest) and _fingerprint(obj[key], digest) for key in sorted(obj, key=repr))
+    elif torch.is_tensor(obj):
+        if obj.is_sparse:
+            obj = obj.coalesce()
+            return _fingerprint(('sparse', obj.indices(), obj.values(), tuple(obj.shape)), digest)
+        obj = obj.detach().cpu().contiguous()
+        digest.update(repr(('tensor', str(obj.dtype), tuple(obj.shape))).encode())
+        digest.update(obj.view(-1).view(torch.uint8).numpy().tobytes() if obj.numel() > 0 else b'')
+    elif isinstance(obj, np.ndarray):
+        digest.update(repr(('ndarray', str(obj.dtype), obj.shape)).encode())
+        digest.update(np.ascontiguousarray(obj).tobytes())
+    elif sp.issparse(obj):
+        obj = obj.tocoo()
+        return _fingerprint(('scipy', obj.row, obj.col, obj.data, obj.shape), digest)
+    elif hasattr(obj, 'to_dict'):
+        # torch_geometric Data
+        digest.update(type(obj).__name__.encode())
+        return _fingerprint(obj.to_dict(), digest)
+    else:
+        return False
+    return True
+
+
+def _leaves(obj, tensors, arrays):
+    # collect the tensors and the numpy or scipy arrays of obj, walked as in _fingerprint
+    if torch.is_tensor(obj):
+        tensors.append(obj)
+    elif isinstance(obj, np.ndarray) or sp.issparse(obj):
+        arrays.append(obj)
+    elif isinstance(obj, (list, tuple)):
+        for item in obj:
+            _leaves(item, tensors, arrays)
+    elif isinstance(obj, dict):
+        for item in obj.values():
+            _leaves(item, tensors, arrays)
+    elif hasattr(obj, 'to_dict'):
+        _leaves(obj.to_dict(), tensors, arrays)
+
+
+def _nbytes(tensors, arrays) -> int:
+    # the memory held by the tensors (their storages, counted once) and the arrays
+    storages = {tensor.untyped_storage().data_ptr(): tensor.untyped_storage().nbytes() for tensor in tensors}
+    total = sum(storages.values())
+    for array in arrays:
+        if sp.issparse(array):
+            total += sum(getattr(array, name).nbytes for name in ['data', 'indices', 'indptr', 'row', 'col'] if hasattr(array, name))
+        else:
+            total += array.nbytes
+    return total
+
+
+def _random_state():
+    return random.getstate(), np.random.get_state(), torch.get_rng_state()
+
+
+def _set_random_state(state):
+    random.setstate(state[0])
+    np.random.set_state(state[1])
+    torch.set_rng_state(state[2])
+
+
+class WarmCache(object):
+    r"""Process-wide memoization of the dataset loaders, split generators and Laplacian builders.
+
+    A call is identified by the function, its arguments (tensors and arrays by content) and, for the
+    functions that draw random numbers, the random state of python, numpy and torch. A hit returns a copy of
+    the stored output and moves the random state where the original call left it, so a driver run with a
+    warm cache is identical to a cold one.
+
+    An output is stored once, as the function returned it. Every call (the first one included) gets a copy of its
+    containers and arrays that shares its tensors, which are not copied. The version counters of the shared tensors
+    are recorded, so an entry whose tensors were modified in place by a trial is dropped and computed again.
+
+    Arg types:
+        * **max_entries** (int, optional) - The number of outputs kept, least recently used first out. (default: 64)
+        * **max_megabytes** (int, optional) - The memory held by the outputs kept, least recently used first out. (default: 1024)
+    """
+    def __init__(self, max_entries: int = 64, max_megabytes: int = 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_megabytes * 2**20
+        self.bytes = 0
+        self.entries = OrderedDict()
+        self.hits, self.misses = 0, 0
+        self.timings = {}
+
+    def wrap(self, name: str, function, uses_random_state: bool, stage: str):
+        def cached(*args, **kwargs):
+            start = time.time()
+            try:
+                return lookup(*args, **kwargs)
+            finally:
+                self.timings[stage] = self.timings.get(stage, 0.0) + time.time() - start
+
+        def lookup(*args, **kwargs):
+            digest = hashlib.sha1(name.encode())
+            if not _fingerprint((args, kwargs), digest):
+                return function(*args, **kwargs)
+            if uses_random_state:
+                digest.update(pickle.dumps((random.getstate(), np.random.get_state())))
+                digest.update(torch.get_rng_state().numpy().tobytes())
+            key = digest.hexdigest()
+            if key in self.entries and all(tensor._version == version for tensor, version in self.entries[key]['versions']):
+                self.entries.move_to_end(key)
+                self.hits += 1
+                entry = self.entries[key]
+                if entry['state'] is not None:
+                    _set_random_state(entry['state'])
+                return self._copy(entry)
+            if key in self.entries:
+                self.bytes -= self.entries.pop(key)['bytes']
+            self.misses += 1
+            out = function(*args, **kwargs)
+            tensors, arrays = [], []
+            _leaves(out, tensors, arrays)
+            entry = {'out': out, 'state': _random_state() if uses_random_state else None, 'bytes': _nbytes(tensors, arrays),
+                     'versions': [(tensor, tensor._version) for tensor in tensors]}
+            copied = self._copy(entry)
+            if entry['bytes'] <= self.max_bytes:
+                self.entries[key] = entry
+                self.bytes += entry['bytes']
+            while len(self.entries) > self.max_entries or self.bytes > self.max_bytes:
+                self.bytes -= self.entries.popitem(last=False)[1]['bytes']
+            return copied
+        cached.__wrapped__ = function
+        cached.warm_cache = self
+        return cached
+
+    @staticmethod
+    def _copy(entry: dict):
+        # a copy of the output of the entry sharing its tensors
+        return copy.deepcopy(entry['out'], {id(tensor): tensor for tensor, _ in entry['versions']})
+
+    def install(self):
+        r"""Replace the :obj:`WARM_FUNCTIONS` in their modules (also under the :obj:`src.` package of the root scripts)."""
+        for module_name, name, uses_random_state, stage in WARM_FUNCTIONS:
+            for prefix in ['', 'src.']:
+                if prefix and module_name.split('.')[0] not in ['utils', 'layer']:
+                    continue
+                try:
+                    module = importlib.import_module(prefix + module_name)
+                except ImportError:
+                    continue
+                function = getattr(module, name, None)
+                if function is None or hasattr(function, 'warm_cache'):
+                    continue
+                setattr(module, name, self.wrap(prefix + module_name + '.' + name, function, uses_random_state, stage))
+
+
+_warm_cache = None
+
+# the drivers import utils.instrument and the root scripts src.utils.instrument: both can be loaded in a worker
+INSTRUMENT_MODULES = ['utils.instrument', 'src.utils.instrument']
+
+
+def _recorders():
+    return [sys.modules[name].RECORDER for name in INSTRUMENT_MODULES if name in sys.modules]
+
+
+def _init_worker(num_threads: int, max_entries: int, max_megabytes: int):
+    global _warm_cache
+    for path in [ROOT_DIR, SRC_DIR]:
+        if path not in sys.path:
+            sys.path.append(path)
+    torch.set_num_threads(num_threads)
+    _warm_cache = WarmCache(max_entries, max_megabytes)
+    _warm_cache.install()
+
+
+def parse_argv(argv: List[str]) -> dict:
+    r"""The options of a driver command line, e.g. ['--lr=1e-3', '--method', 'SGCN', '-a'] -> {'lr': '1e-3', 'method': 'SGCN', 'a': True}."""
+    params, i = OrderedDict(), 0
+    while i < len(argv):
+        token = argv[i]
+        key = token.lstrip('-')
+        if '=' in key:
+            key, value = key.split('=', 1)
+        elif token.startswith('--') and i + 1 < len(argv) and not argv[i+1].startswith('-'):
+            value = argv[i+1]
+            i += 1
+        else:
+            value = True
+        params[key] = value
+        i += 1
+    return params
+
+
+def make_trial(driver: str, params: dict) -> dict:
+    r"""A trial running :obj:`driver` with the options :obj:`params` (True for a flag, False or None to omit it)."""
+    argv = []
+    for key, value in params.items():
+        if value is None or value is False:
+            continue
+        option = ('-' if len(key) == 1 else '--') + key
+        argv.append(option if value is True else option + '=' + str(value))
+    return {'driver': driver, 'argv': argv, 'params': parse_argv(argv)}
+
+
+def trial_from_command(command: str) -> dict:
+    r"""A trial from a command line such as :obj:`'python3 src/Edge_sparseMagnet.py --q=0.1 -a'`."""
+    tokens = shlex.split(command)
+    while len(tokens) > 0 and not tokens[0].endswith('.py'):
+        tokens = tokens[1:]
+    assert len(tokens) > 0, 'No python script in %s' % command
+    return {'driver': tokens[0], 'argv': tokens[1:], 'params': parse_argv(tokens[1:])}
+
+
+def expand_grid(spec: Union[dict, List[dict]]) -> List[dict]:
+    r"""Expand a declarative grid in a list of trials.
+    Arg types:
+        * **spec** (dict or list of dict) - :obj:`{"driver": "src/Edge_sparseMagnet.py", "args": {"K": 1, "noisy": true},
+            "grid": {"dataset": [...], "q": [0.05, 0.1]}}`: every combination of the :obj:`grid` values is a trial,
+            together with the fixed :obj:`args`. A list of such blocks is expanded block by block.
+    Return types:
+        * **trials** (list of dict) - The trials, in the order of the grid.
+    """
+    if isinstance(spec, (list, tuple)):
+        return [trial for block in spec for trial in expand_grid(block)]
+    grid = spec.get('grid', {})
+    names = list(grid.keys())
+    trials = []
+    for values in itertools.product(*[grid[name] if isinstance(grid[name], (list, tuple)) else [grid[name]] for name in names]):
+        params = OrderedDict(spec.get('args', {}))
+        params.update(zip(names, values))
+        trials.append(make_trial(spec['driver'], params))
+    return trials
+
+
+def run_trial(trial: dict) -> dict:
+    r"""Run the :obj:`__main__` of a driver in the current process, as :obj:`python3 <driver> <argv>` would.
+    The result holds the status, the per-split metrics of the result array of the driver, the time spent in
+    each stage (loading the dataset, splitting and building the Laplacians, plus the forward, backward, step and
+    evaluation of the drivers instrumented with :obj:`utils.instrument`, the rest of the trial being :obj:`other`)
+    and the peak memory (the peak resident size of the worker so far and the peak CUDA allocation of the trial,
+    plus the peaks of every instrumented stage in :obj:`memory`).
+    """
+    path = os.path.realpath(trial['driver'])
+    old_argv, old_path = sys.argv, list(sys.path)
+    sys.argv = [path] + list(trial['argv'])
+    sys.path.insert(0, os.path.dirname(path))
+    if _warm_cache is not None:
+        _warm_cache.timings = {}
+    for recorder in _recorders():
+        recorder.reset()
+    if torch.cuda.is_available():
+        torch.cuda.reset_peak_memory_stats()
+    start = time.time()
+    status, error, namespace = 'done', None, {}
+    try:
+        namespace = runpy.run_path(path, run_name='__main__')
+    except SystemExit as exit:
+        if exit.code not in (None, 0):
+            status, error = 'failed', 'exit code %s' % exit.code
+    except Exception:
+        status, error = 'failed', traceback.format_exc()
+    finally:
+        sys.argv = old_argv
+        sys.path[:] = old_path
+    seconds = time.time() - start
+    timings = dict(_warm_cache.timings) if _warm_cache is not None else {}
+    # the stages timed by the driver replace those seen by the warm cache (which only sees the cached functions)
+    instrumented = {}
+    for recorder in _recorders():
+        for stage, value in recorder.totals().items():
+            instrumented[stage] = instrumented.get(stage, 0.0) + value
+    timings.update(instrumented)
+    timings['other'] = seconds - sum(timings.values())
+    memory = {}
+    for recorder in _recorders():
+        for stage, peaks in recorder.memory_peaks().items():
+            merged = memory.setdefault(stage, dict(peaks))
+            for field, value in peaks.items():
+                if value is not None:
+                    merged[field] = value if merged[field] is None else max(merged[field], value)
+    # the stages reset the CUDA peak of the allocator, which then only covers the end of the trial
+    peak_cuda = None
+    if torch.cuda.is_available():
+        peak_cuda = max([torch.cuda.max_memory_allocated()] +
+                        [peaks['cuda_peak'] for peaks in memory.values() if peaks['cuda_peak'] is not None])
+    out = dict(trial, status=status, error=error, seconds=seconds, pid=os.getpid(), metrics=split_metrics(namespace),
+               timings=timings, memory=memory, peak_rss=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+               peak_cuda=peak_cuda)
+    if _warm_cache is not None:
+        out.update(cache_hits=_warm_cache.hits, cache_misses=_warm_cache.misses)
+    return out
+
+
+def _execute(trials: List[dict], num_workers: Optional[int], max_entries: int, max_megabytes: int) -> Iterator[dict]:
+    if num_workers is None:
+        num_workers = os.cpu_count()
+    if num_workers == 0:
+        _init_worker(torch.get_num_threads(), max_entries, max_megabytes)
+        for trial in trials:
+            yield run_trial(trial)
+        return
+    num_workers = max(1, min(num_workers, len(trials)))
+    num_threads = max(1, (os.cpu_count() or 1) // num_workers)
+    # fork when available: the sweep scripts build their commands at module level and must not be re-run by the workers
+    method = 'fork' if 'fork' in multiprocessing.get_all_start_methods() else 'spawn'
+    with ProcessPoolExecutor(max_workers=num_workers, mp_context=multiprocessing.get_context(method),
+                             initializer=_init_worker, initargs=(num_threads, max_entries, max_megabytes)) as executor:
+        futures = [executor.submit(run_trial, trial) for trial in trials]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def run_sweep(trials: Iterable[dict], num_workers: Optional[int] = None, max_entries: int = 64,
+              store: Optional[str] = None, rerun: bool = False, max_megabytes: int = 1024) -> Iterator[dict]:
+    r"""Execute the trials in a persistent pool of worker processes.
+
+    The workers import torch and the drivers once and keep the datasets, the splits and the Laplacians of
+    the previous trials in a :obj:`WarmCache`, so only the training is repeated. The trials are yielded as
+    they complete (not in order) with their status, error, duration, metrics, timings and peak memory.
+
+    Arg types:
+        * **trials** (iterable of dict) - Trials from :obj:`expand_grid`, :obj:`make_trial` or :obj:`trial_from_command`.
+        * **num_workers** (int, optional) - The number of processes, all the cores if None; 0 runs the trials
+            in the calling process. (default: None)
+        * **max_entries** (int, optional) - The size of the warm cache of each worker. (default: 64)
+        * **store** (str, optional) - A :obj:`ResultsStore` database recording the trials: the trials already
+            done are skipped, so an interrupted sweep resumes. (default: None)
+        * **rerun** (bool, optional) - Whether to run again the trials already done in the store. (default: False)
+        * **max_megabytes** (int, optional) - The memory of the warm cache of each worker. (default: 1024)
+    """
+    trials = list(trials)
+    if store is None:
+        yield from _execute(trials, num_workers, max_entries, max_megabytes)
+        return
+
+    store = ResultsStore(store)
+    try:
+        if not rerun:
+            completed = store.completed()
+            skipped = [trial for trial in trials if trial_key(trial['driver'], trial['params']) in completed]
+            trials = [trial for trial in trials if trial_key(trial['driver'], trial['params']) not in completed]
+            if len(skipped) > 0:
+                print('%d trials already done in %s, %d to run' % (len(skipped), store.path, len(trials)))
+        for trial in trials:
+            store.start(trial)
+        # only this process writes to the database
+        for result in _execute(trials, num_workers, max_entries, max_megabytes):
+            store.record(result)
+            yield result
+    finally:
+        store.close()
+
+
+def run_commands(commands: Iterable[str], num_workers: Optional[int] = None, store: Optional[str] = DEFAULT_STORE) -> List[dict]:
+    r"""Run the command lines of a sweep script with :obj:`run_sweep` instead of one :obj:`os.system` per command.
+    The results are recorded in :obj:`store` and the commands already done there are skipped."""
+    results = []
+    for result in run_sweep([trial_from_command(command) for command in commands], num_workers, store=store):
+        print('[%s] %.1fs %s %s' % (result['status'], result['seconds'], result['driver'], ' '.join(result['argv'])))
+        if result['error'] is not None:
+            print(result['error'])
+        results.append(result)
+    return results
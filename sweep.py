@@ -0,0 +1,42 @@
+import sys, json, argparse
+
+from src.utils.sweep import expand_grid, trial_from_command, run_sweep, DEFAULT_STORE
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="hyperparameter sweep in a persistent pool of workers")
+    parser.add_argument('grid', type=str, nargs='?', default=None, help='json file of the grid, e.g. {"driver": "src/Edge_sparseMagnet.py", "args": {"K": 1}, "grid": {"q": [0.05, 0.1]}}')
+    parser.add_argument('--commands', type=str, default=None, help='file with one driver command per line (- for stdin), e.g. the output of the sweep scripts')
+    parser.add_argument('--num_workers', type=int, default=None, help='number of worker processes, all the cores by default (0 to run in this process)')
+    parser.add_argument('--max_entries', type=int, default=64, help='datasets, splits and laplacians kept warm by each worker')
+    parser.add_argument('--max_megabytes', type=int, default=1024, help='memory of the datasets, splits and laplacians kept warm by each worker')
+    parser.add_argument('--store', type=str, default=DEFAULT_STORE, help='sqlite results store, the trials already done there are skipped (empty to disable)')
+    parser.add_argument('--rerun', action='store_true', help='run again the trials already done in the store')
+    parser.add_argument('--dry_run', action='store_true', help='only print the trials')
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    trials = []
+    if args.grid is not None:
+        with open(args.grid) as f:
+            trials += expand_grid(json.load(f))
+    if args.commands is not None:
+        f = sys.stdin if args.commands == '-' else open(args.commands)
+        trials += [trial_from_command(line) for line in f if line.strip() and not line.strip().startswith('#')]
+    assert len(trials) > 0, 'No trials: give a grid or --commands'
+
+    if args.dry_run:
+        for trial in trials:
+            print('python3 ' + trial['driver'] + ' ' + ' '.join(trial['argv']))
+        sys.exit(0)
+
+    failed = 0
+    for result in run_sweep(trials, args.num_workers, args.max_entries, store=args.store or None, rerun=args.rerun,
+                            max_megabytes=args.max_megabytes):
+        print('[%s] %.1fs %s %s' % (result['status'], result['seconds'], result['driver'], ' '.join(result['argv'])))
+        if result['error'] is not None:
+            failed += 1
+            print(result['error'])
+    print('%d trials, %d failed' % (len(trials), failed))